@@ -1,9 +1,11 @@
 from fastapi import APIRouter
 from .auth import router as auth_router
 from .system import router as system_router
+from .blobs import router as blobs_router
 
 router = APIRouter()
 
 # Include sub-routers
 router.include_router(auth_router, prefix="/auth", tags=["Authentication"])
-router.include_router(system_router, prefix="/system", tags=["System"])
\ No newline at end of file
+router.include_router(system_router, prefix="/system", tags=["System"])
+router.include_router(blobs_router, prefix="/blobs", tags=["Blobs"])
\ No newline at end of file
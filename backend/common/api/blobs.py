@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from sqlalchemy.orm import Session
+from .auth import get_current_user_id
+from ..storage.artifacts import ArtifactError, artifact_response, resolve_artifact_path
+from ..storage.blobstore import BlobError, blob_store
+from database.edgeai.database import get_db
+
+router = APIRouter()
+
+# 客户端按清单只下载本地没有的块，再按顺序拼接并校验整体 SHA-256
+
+@router.get("/stats")
+async def get_blob_stats(db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
+    """
+    存储统计：逻辑大小、实际存储大小和去重比
+    """
+    return blob_store.stats(db)
+
+@router.get("/{digest}")
+async def get_blob_manifest(digest: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
+    """
+    获取对象的块清单
+    """
+    try:
+        blob = blob_store.get(db, digest)
+    except BlobError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "digest": blob.digest,
+        "size": blob.size,
+        "chunks": [{"hash": chunk_hash, "size": size} for chunk_hash, size in blob.chunks or []]
+    }
+
+@router.get("/chunks/{chunk_hash}")
+async def get_blob_chunk(chunk_hash: str, request: Request, current_user_id: int = Depends(get_current_user_id)):
+    """
+    下载单个块（内容不可变，可长期缓存）
+    """
+    try:
+        path = resolve_artifact_path(str(blob_store.chunk_path(chunk_hash)), root=blob_store.chunk_dir)
+    except ArtifactError:
+        raise HTTPException(status_code=404, detail="Chunk not found")
+    response = artifact_response(request, path, sha256=chunk_hash, root=blob_store.chunk_dir)
+    response.headers["cache-control"] = "private, max-age=31536000, immutable"
+    return response
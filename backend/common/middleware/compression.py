@@ -0,0 +1,244 @@
+"""
+响应压缩中间件
+根据 Accept-Encoding 协商 br / zstd / gzip，支持流式响应（每个分块压缩后立即刷新输出），
+小于阈值的完整响应、已压缩的内容类型和已设置 Content-Encoding 的响应保持原样
+"""
+
+import os
+import zlib
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+# 小于该大小的完整响应不压缩（字节）
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("EDGEAI_COMPRESSION_MINIMUM_SIZE", 1024))
+
+# 服务端偏好顺序，同等 q 值时靠前的优先
+DEFAULT_ENCODINGS = ("br", "zstd", "gzip")
+
+# 本身已压缩或不适合再压缩的内容类型
+_SKIP_CONTENT_TYPES = (
+    "application/gzip",
+    "application/zstd",
+    "application/zip",
+    "application/octet-stream",
+    "application/vnd.apache.parquet",
+    "application/vnd.apache.arrow",
+    "application/x-msgpack",
+    "image/",
+    "video/",
+    "audio/",
+    "text/event-stream",
+)
+
+
+class _Compressor:
+    """统一 gzip / br / zstd 的增量压缩接口"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            # 动态响应使用较低的质量等级，压缩率与 CPU 开销更平衡
+            self._compressor = brotli.Compressor(quality=4)
+        elif encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        """压缩一个分块；flush=True 时把已缓冲的数据全部输出（流式分块之间使用）"""
+        if self.encoding == "gzip":
+            output = self._compressor.compress(data)
+            if flush:
+                output += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            return output
+        if self.encoding == "br":
+            output = self._compressor.process(data)
+            if flush:
+                output += self._compressor.flush()
+            return output
+        output = self._compressor.compress(data)
+        if flush:
+            output += self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return output
+
+    def finish(self) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.flush()
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def available_encodings(preferred=DEFAULT_ENCODINGS) -> Tuple[str, ...]:
+    available = []
+    for encoding in preferred:
+        if encoding == "br" and brotli is None:
+            continue
+        if encoding == "zstd" and zstandard is None:
+            continue
+        available.append(encoding)
+    return tuple(available)
+
+
+def negotiate_encoding(accept_encoding: str, supported: Tuple[str, ...]) -> Optional[str]:
+    """
+    解析 Accept-Encoding（含 q 值），返回最合适的编码，不可压缩时返回 None
+    q 值相同按服务端偏好顺序选择
+    """
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[name] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in supported:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    协商压缩的 ASGI 中间件
+    - 完整响应: 小于 minimum_size 时不压缩，否则整体压缩并重写 Content-Length
+    - 流式响应: 去掉 Content-Length，逐块压缩并刷新，保证客户端能及时收到数据
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        encodings: Tuple[str, ...] = DEFAULT_ENCODINGS
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(encodings)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        # None: 尚未决定；True: 压缩；False: 原样透传
+        self.active: Optional[bool] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _should_skip(self, headers: Headers) -> bool:
+        status = self.start_message["status"]
+        if status < 200 or status in (204, 206, 304):
+            return True
+        if "content-encoding" in headers or "content-range" in headers:
+            return True
+        content_type = headers.get("content-type", "").lower()
+        return any(content_type.startswith(prefix) for prefix in _SKIP_CONTENT_TYPES)
+
+    async def send_with_compression(self, message: Message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # 等到第一个 body 分块再决定是否压缩（需要知道大小和是否为流式）
+            self.start_message = message
+            return
+
+        if message_type != "http.response.body":
+            if self.active is None and self.start_message is not None:
+                # 其他响应消息（如 http.response.zerocopysend）不经过压缩，之前必须先发出原样的响应头
+                self.active = False
+                await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        if self.active is False:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            headers = MutableHeaders(raw=list(self.start_message["headers"]))
+            self.start_message["headers"] = headers.raw
+            if self._should_skip(headers) or (not more_body and len(body) < self.minimum_size):
+                self.active = False
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.active = True
+            self.compressor = _Compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # 编码后的字节不同，强 ETag 降级为弱 ETag
+                headers["ETag"] = f"W/{etag}"
+
+            if more_body:
+                if "content-length" in headers:
+                    del headers["content-length"]
+                await self.send(self.start_message)
+            else:
+                compressed = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(compressed))
+                await self.send(self.start_message)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+
+        if more_body:
+            data = self.compressor.compress(body, flush=True)
+            if data:
+                await self.send({"type": "http.response.body", "body": data, "more_body": True})
+        else:
+            data = self.compressor.compress(body) + self.compressor.finish()
+            await self.send({"type": "http.response.body", "body": data})
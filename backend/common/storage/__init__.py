@@ -0,0 +1 @@
+# Shared storage utilities
@@ -0,0 +1,419 @@
+"""
+模型等大文件的下载服务
+- artifact_response: 支持 Range / If-Range 断点续传、强 ETag、If-None-Match
+- 服务器支持 ASGI zerocopysend 扩展时使用 sendfile 零拷贝发送，否则在线程中按块 pread
+- 设置 EDGEAI_ARTIFACT_ACCEL_PREFIX 时交给前置 Nginx（X-Accel-Redirect）直接发送文件
+- ChecksumWorker: 在后台线程中计算 SHA-256，只在登记文件时计算一次
+- SegmentsResponse: 按顺序发送文件中的多个字节区间（如数据集分片），不复制数据
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from email.utils import formatdate
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Optional, Tuple, Union
+from urllib.parse import quote
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# 允许下载的文件根目录，登记的相对路径相对于该目录解析
+ARTIFACT_ROOT = Path(os.getenv("EDGEAI_ARTIFACT_ROOT", "storage/artifacts"))
+# 前置 Nginx 的 internal location 前缀（为空时由应用自己发送文件）
+ARTIFACT_ACCEL_PREFIX = os.getenv("EDGEAI_ARTIFACT_ACCEL_PREFIX", "")
+# 非零拷贝路径每次读取的块大小
+ARTIFACT_CHUNK_SIZE = int(os.getenv("EDGEAI_ARTIFACT_CHUNK_SIZE", 1024 * 1024))
+# 计算校验和的后台线程数
+ARTIFACT_HASH_WORKERS = int(os.getenv("EDGEAI_ARTIFACT_HASH_WORKERS", 2))
+
+
+class ArtifactError(Exception):
+    """文件路径不合法或文件不存在"""
+
+
+def resolve_artifact_path(file_path: str, root: Path = ARTIFACT_ROOT) -> Path:
+    """
+    把登记的路径解析为 ARTIFACT_ROOT 下的真实文件路径
+    拒绝指向根目录之外的路径（包括符号链接）
+    """
+    if not file_path:
+        raise ArtifactError("Artifact path is empty")
+    root = root.resolve()
+    path = Path(file_path)
+    if not path.is_absolute():
+        path = root / path
+    path = path.resolve()
+    if path != root and root not in path.parents:
+        raise ArtifactError("Artifact path is outside the artifact root")
+    if not path.is_file():
+        raise ArtifactError("Artifact file not found")
+    return path
+
+
+def sha256_file(path: Path, chunk_size: int = ARTIFACT_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class ChecksumResult:
+    sha256: str
+    size: int
+    mtime: float
+
+
+class ChecksumWorker:
+    """后台线程计算文件校验和，同一个 key 同时只计算一次"""
+
+    def __init__(self, max_workers: int = ARTIFACT_HASH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="artifact-checksum")
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def is_pending(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def submit(self, key: Hashable, path: Path, on_done: Callable[[ChecksumResult], None]) -> Future:
+        """
+        提交计算任务；计算期间文件被修改时放弃结果
+        on_done 在后台线程中调用
+        """
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            future = self._executor.submit(self._run, key, path, on_done)
+            self._pending[key] = future
+            return future
+
+    def _run(self, key: Hashable, path: Path, on_done: Callable[[ChecksumResult], None]) -> Optional[ChecksumResult]:
+        try:
+            before = path.stat()
+            sha256 = sha256_file(path)
+            after = path.stat()
+            if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+                logger.warning(f"Artifact {path} changed while hashing, checksum discarded")
+                return None
+            result = ChecksumResult(sha256=sha256, size=after.st_size, mtime=after.st_mtime)
+            on_done(result)
+            logger.info(f"Computed checksum for artifact {path}: {sha256}")
+            return result
+        except Exception as e:
+            logger.error(f"Failed to compute checksum for artifact {path}: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局校验和计算实例
+checksum_worker = ChecksumWorker()
+
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def parse_range(range_header: str, size: int) -> Union[None, str, Tuple[int, int]]:
+    """
+    解析单个字节范围，返回 (start, end)（包含 end）
+    格式不支持或包含多个范围时返回 None（按完整响应处理），无法满足时返回 "unsatisfiable"
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start_text == "":
+            # bytes=-N: 最后 N 个字节
+            suffix = int(end_text)
+            if suffix <= 0:
+                return "unsatisfiable"
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class _RangeResponse(Response, ABC):
+    """发送内容的一个字节范围，子类实现 read(offset, size)（在线程中调用）"""
+
+    def __init__(self, start: int, end: int, status_code: int, headers: Dict[str, str]):
+        super().__init__(status_code=status_code, headers=headers, media_type="application/octet-stream")
+        self.start = start
+        self.length = end - start + 1
+        self.headers["content-length"] = str(self.length)
+
+    @abstractmethod
+    def read(self, offset: int, size: int) -> bytes:
+        """读取 [offset, offset + size) 的内容，到达末尾时返回空字节串"""
+
+    async def send_body(self, scope: Scope, send: Send):
+        offset, remaining = self.start, self.length
+        while remaining > 0:
+            chunk = await anyio.to_thread.run_sync(self.read, offset, min(ARTIFACT_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            offset += len(chunk)
+            remaining -= len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self.send_body(scope, send)
+
+
+class _FileRangeResponse(_RangeResponse):
+    """发送文件的一个字节范围"""
+
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: Dict[str, str]):
+        super().__init__(start, end, status_code, headers)
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def read(self, offset: int, size: int) -> bytes:
+        return os.pread(self._fd, size, offset)
+
+    async def send_body(self, scope: Scope, send: Send):
+        self._fd = os.open(self.path, os.O_RDONLY)
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                # 服务器支持时由内核直接发送（sendfile）
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": self._fd,
+                    "offset": self.start,
+                    "count": self.length
+                })
+                return
+            await super().send_body(scope, send)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class _ReaderRangeResponse(_RangeResponse):
+    """从任意支持 read(offset, size) 的对象（如内容寻址存储中的对象）发送一个字节范围"""
+
+    def __init__(self, reader, start: int, end: int, status_code: int, headers: Dict[str, str]):
+        super().__init__(start, end, status_code, headers)
+        self.reader = reader
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self.reader.read(offset, size)
+
+
+class SegmentsResponse(Response):
+    """
+    按顺序发送文件（或内容寻址对象）中的多个字节区间，不复制底层数据
+    区间足够大且服务器支持 zerocopysend 时逐段由内核发送，否则在线程中把小区间合并成约 ARTIFACT_CHUNK_SIZE 的块读取
+    """
+    # 平均区间长度不小于该值时才使用零拷贝（每段一次 send 调用）
+    zerocopy_min_segment = 64 * 1024
+
+    def __init__(
+        self,
+        source,
+        offsets,
+        lengths,
+        filename: str,
+        suffix: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+        media_type: str = "application/octet-stream"
+    ):
+        super().__init__(status_code=200, headers=headers, media_type=media_type)
+        self.source = source
+        self.offsets = [int(offset) for offset in offsets]
+        self.lengths = [int(length) for length in lengths]
+        self.suffix = suffix
+        self.length = sum(self.lengths) + len(suffix)
+        self.headers["content-length"] = str(self.length)
+        self.headers["content-disposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        self._fd: Optional[int] = None
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._fd is not None:
+            return os.pread(self._fd, size, offset)
+        return self.source.read(offset, size)
+
+    def _read_batch(self, index: int, position: int) -> Tuple[bytes, int, int]:
+        """从第 index 个区间的 position 处开始读取，最多 ARTIFACT_CHUNK_SIZE 字节，返回 (数据, 下一个 index, 下一个 position)"""
+        parts, total = [], 0
+        while index < len(self.offsets) and total < ARTIFACT_CHUNK_SIZE:
+            size = min(self.lengths[index] - position, ARTIFACT_CHUNK_SIZE - total)
+            data = self._read(self.offsets[index] + position, size)
+            if len(data) != size:
+                raise OSError("Source is shorter than the requested segment")
+            parts.append(data)
+            total += size
+            position += size
+            if position >= self.lengths[index]:
+                index, position = index + 1, 0
+        return b"".join(parts), index, position
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if isinstance(self.source, Path):
+            self._fd = os.open(self.source, os.O_RDONLY)
+        try:
+            zerocopy = (
+                self._fd is not None
+                and "http.response.zerocopysend" in scope.get("extensions", {})
+                and self.offsets
+                and sum(self.lengths) >= self.zerocopy_min_segment * len(self.offsets)
+            )
+            if zerocopy:
+                for offset, length in zip(self.offsets, self.lengths):
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": self._fd,
+                        "offset": offset,
+                        "count": length,
+                        "more_body": True
+                    })
+            else:
+                index, position = 0, 0
+                while index < len(self.offsets):
+                    chunk, index, position = await anyio.to_thread.run_sync(self._read_batch, index, position)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": self.suffix})
+        finally:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+
+def artifact_etag(stat: os.stat_result) -> str:
+    """
+    强 ETag：由文件大小和修改时间（纳秒）生成
+    不依赖校验和，后台校验和计算完成前后 ETag 保持不变，断点续传的 If-Range 不会失效
+    """
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _download_headers(etag: str, last_modified: Optional[str], filename: str, sha256: Optional[str]) -> Dict[str, str]:
+    headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "content-disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+        "cache-control": "private, no-cache"
+    }
+    if last_modified:
+        headers["last-modified"] = last_modified
+    if sha256:
+        headers["x-checksum-sha256"] = sha256
+    return headers
+
+
+def _evaluate_request(
+    request: Request,
+    size: int,
+    etag: str,
+    last_modified: Optional[str],
+    headers: Dict[str, str]
+) -> Union[Response, Tuple[int, int, int]]:
+    """
+    处理 If-None-Match / Range / If-Range
+    返回需要直接发送的响应（304 / 416），或 (start, end, status_code)
+    """
+    request_headers = Headers(scope=request.scope)
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (_strip_weak(tag.strip()) for tag in if_none_match.split(","))):
+        keep = ("etag", "last-modified", "cache-control")
+        return Response(status_code=304, headers={key: headers[key] for key in keep if key in headers})
+
+    byte_range = None
+    range_header = request_headers.get("range")
+    if range_header:
+        # If-Range 只接受强 ETag 或完全一致的 Last-Modified，不匹配时返回完整内容
+        if_range = request_headers.get("if-range")
+        if if_range is None or if_range.strip() in (etag, last_modified):
+            byte_range = parse_range(range_header, size)
+
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}", "accept-ranges": "bytes", "etag": etag})
+
+    if byte_range is None:
+        return 0, size - 1, 200
+
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return start, end, 206
+
+
+def artifact_response(
+    request: Request,
+    path: Path,
+    filename: Optional[str] = None,
+    sha256: Optional[str] = None,
+    root: Path = ARTIFACT_ROOT
+) -> Response:
+    """
+    构造文件下载响应
+    sha256 为已登记且与当前文件一致的校验和（没有时不返回校验和头）
+    """
+    stat = path.stat()
+    etag = artifact_etag(stat)
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = _download_headers(etag, last_modified, filename or path.name, sha256)
+
+    if ARTIFACT_ACCEL_PREFIX and not request.headers.get("if-none-match"):
+        # Nginx 直接发送文件并处理 Range
+        relative = path.relative_to(root.resolve()).as_posix()
+        headers["x-accel-redirect"] = f"{ARTIFACT_ACCEL_PREFIX.rstrip('/')}/{quote(relative)}"
+        return Response(status_code=200, headers=headers, media_type="application/octet-stream")
+
+    result = _evaluate_request(request, stat.st_size, etag, last_modified, headers)
+    if isinstance(result, Response):
+        return result
+    start, end, status_code = result
+    return _FileRangeResponse(path, start, end, status_code, headers)
+
+
+def reader_response(request: Request, reader, size: int, digest: str, filename: str) -> Response:
+    """
+    构造内容寻址对象的下载响应
+    digest 为内容的 SHA-256，内容不可变，直接用作强 ETag
+    """
+    etag = f'"{digest}"'
+    headers = _download_headers(etag, None, filename, digest)
+    result = _evaluate_request(request, size, etag, None, headers)
+    if isinstance(result, Response):
+        return result
+    start, end, status_code = result
+    return _ReaderRangeResponse(reader, start, end, status_code, headers)
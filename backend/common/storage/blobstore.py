@@ -0,0 +1,495 @@
+"""
+内容寻址的去重存储（模型文件、数据集共用）
+- 文件按内容切块（默认内容定义切块 CDC，也可固定大小），块以 SHA-256 命名，相同的块只保存一份
+- 对象（整个文件）以 SHA-256 标识，数据库中保存块清单和引用计数
+- 记录通过 "blob:<sha256>" 引用对象；引用计数归零后，不再被任何对象引用的块由垃圾回收删除
+- 引用计数通过带条件的 UPDATE 原子地增减，多个进程共用数据库时同样正确
+"""
+
+import bisect
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database.edgeai import BlobObject, BlobChunk
+
+logger = logging.getLogger(__name__)
+
+# 块文件根目录
+BLOB_ROOT = Path(os.getenv("EDGEAI_BLOB_ROOT", "storage/blobs"))
+# 切块方式：cdc（内容定义切块，插入/删除数据后未改动的块仍可复用）或 fixed（固定大小）
+BLOB_CHUNKING = os.getenv("EDGEAI_BLOB_CHUNKING", "cdc")
+# 块大小：CDC 的最小/平均/最大块大小，fixed 模式使用平均块大小
+BLOB_CHUNK_MIN = int(os.getenv("EDGEAI_BLOB_CHUNK_MIN", 256 * 1024))
+BLOB_CHUNK_AVG = int(os.getenv("EDGEAI_BLOB_CHUNK_AVG", 1024 * 1024))
+BLOB_CHUNK_MAX = int(os.getenv("EDGEAI_BLOB_CHUNK_MAX", 4 * 1024 * 1024))
+# 每次从源文件读取的字节数
+BLOB_READ_SIZE = int(os.getenv("EDGEAI_BLOB_READ_SIZE", 4 * 1024 * 1024))
+# 引用计数为 0 的块至少闲置该秒数后才删除，避免删除正在写入的对象刚复用的块
+BLOB_GC_GRACE = int(os.getenv("EDGEAI_BLOB_GC_GRACE", 3600))
+# 垃圾回收间隔（秒），<= 0 时不启动定期回收
+BLOB_GC_INTERVAL = int(os.getenv("EDGEAI_BLOB_GC_INTERVAL", 3600))
+# 后台导入文件的线程数
+BLOB_INGEST_WORKERS = int(os.getenv("EDGEAI_BLOB_INGEST_WORKERS", 2))
+# 登记对象时与其他进程并发插入同一对象或块的重试次数
+BLOB_REGISTER_RETRIES = 3
+
+BLOB_REF_PREFIX = "blob:"
+
+# CDC 滚动哈希的窗口长度；每个字节映射为固定的随机 32 位数，窗口内求和（按 2^32 回绕）
+_CDC_WINDOW = 48
+_CDC_GEAR = np.random.default_rng(0x5EED).integers(0, 2 ** 32, size=256, dtype=np.uint32)
+# 超过最小块大小后，每个位置成为切点的概率为 1 / 2^bits，使平均块大小约为 BLOB_CHUNK_AVG
+_CDC_MASK = np.uint32((1 << max((BLOB_CHUNK_AVG - BLOB_CHUNK_MIN).bit_length() - 1, 1)) - 1)
+
+
+class BlobError(Exception):
+    """对象或块不存在，或导入时源文件被修改"""
+
+
+def blob_ref(digest: str) -> str:
+    return f"{BLOB_REF_PREFIX}{digest}"
+
+
+def parse_blob_ref(file_path: Optional[str]) -> Optional[str]:
+    """file_path 为对象引用时返回 digest，否则返回 None"""
+    if file_path and file_path.startswith(BLOB_REF_PREFIX):
+        return file_path[len(BLOB_REF_PREFIX):]
+    return None
+
+
+def _cut_points(data: memoryview, final: bool) -> List[int]:
+    """
+    计算 data 中的切点（块结束位置）
+    data 总是从一个块的起点开始；final 为 False 时，末尾尚不能确定的部分不切，留到下一次读取
+    """
+    n = len(data)
+    if n == 0:
+        return []
+
+    if BLOB_CHUNKING == "fixed":
+        cuts = list(range(BLOB_CHUNK_AVG, n + 1, BLOB_CHUNK_AVG))
+        if final and (not cuts or cuts[-1] != n):
+            cuts.append(n)
+        return cuts
+
+    # 一次性计算所有位置的窗口哈希：h[i] 为以 i 结尾的窗口内字节映射值之和
+    values = _CDC_GEAR[np.frombuffer(data, dtype=np.uint8)]
+    sums = np.cumsum(values, dtype=np.uint32)
+    sums[_CDC_WINDOW:] -= sums[:-_CDC_WINDOW].copy()
+    candidates = np.flatnonzero((sums & _CDC_MASK) == 0) + 1
+
+    cuts: List[int] = []
+    last = 0
+    while last < n:
+        i = int(np.searchsorted(candidates, last + BLOB_CHUNK_MIN))
+        if i < len(candidates) and candidates[i] <= last + BLOB_CHUNK_MAX:
+            cut = int(candidates[i])
+        elif last + BLOB_CHUNK_MAX <= n:
+            cut = last + BLOB_CHUNK_MAX
+        elif final:
+            cut = n
+        else:
+            break
+        cuts.append(cut)
+        last = cut
+    return cuts
+
+
+@dataclass
+class BlobManifest:
+    """store_file 的结果：整个文件的 SHA-256、大小和块清单"""
+    digest: str
+    size: int
+    chunks: List[Tuple[str, int]] = field(default_factory=list)
+    new_bytes: int = 0  # 本次实际写入磁盘的字节数（其余块已存在）
+
+
+def chunk_path(chunk_dir: Path, chunk_hash: str) -> Path:
+    return chunk_dir / chunk_hash[:2] / chunk_hash
+
+
+class BlobReader:
+    """
+    按偏移读取对象内容，供 Range 下载使用
+    只保存块目录和块清单，可以传给子进程
+    """
+
+    def __init__(self, chunk_dir: Path, chunks: List[Tuple[str, int]]):
+        self.chunk_dir = chunk_dir
+        self.chunks = [(chunk_hash, int(size)) for chunk_hash, size in chunks]
+        self.offsets = [0]
+        for _, size in self.chunks:
+            self.offsets.append(self.offsets[-1] + size)
+
+    @property
+    def size(self) -> int:
+        return self.offsets[-1]
+
+    def read(self, offset: int, size: int) -> bytes:
+        parts = []
+        index = bisect.bisect_right(self.offsets, offset) - 1
+        while size > 0 and 0 <= index < len(self.chunks):
+            chunk_hash, chunk_size = self.chunks[index]
+            start = offset - self.offsets[index]
+            length = min(chunk_size - start, size)
+            try:
+                with open(chunk_path(self.chunk_dir, chunk_hash), "rb") as f:
+                    f.seek(start)
+                    data = f.read(length)
+            except FileNotFoundError:
+                raise BlobError(f"Chunk {chunk_hash} is missing")
+            parts.append(data)
+            offset += len(data)
+            size -= len(data)
+            index += 1
+        return b"".join(parts)
+
+    def open(self) -> io.BufferedReader:
+        """返回可 seek 的只读文件对象（供 pandas / pyarrow 读取）"""
+        return io.BufferedReader(_BlobRawIO(self), buffer_size=BLOB_READ_SIZE)
+
+
+class _BlobRawIO(io.RawIOBase):
+
+    def __init__(self, reader: BlobReader):
+        self.reader = reader
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.reader.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        data = self.reader.read(self.position, len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class BlobStore:
+
+    def __init__(self, root: Path = BLOB_ROOT, max_workers: int = BLOB_INGEST_WORKERS):
+        self.root = root
+        # 进程内串行化引用计数的修改和垃圾回收
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-ingest")
+        self._pending: Dict[Hashable, Future] = {}
+        self._pending_lock = threading.Lock()
+
+    @property
+    def chunk_dir(self) -> Path:
+        return self.root / "chunks"
+
+    def chunk_path(self, chunk_hash: str) -> Path:
+        return chunk_path(self.chunk_dir, chunk_hash)
+
+    # ---------- 写入 ----------
+
+    def _put_chunk(self, data: memoryview) -> Tuple[str, int, bool]:
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(chunk_hash)
+        if path.exists():
+            # 更新修改时间，垃圾回收不会删除刚被复用的块
+            os.utime(path)
+            return chunk_hash, len(data), False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{chunk_hash}.{uuid.uuid4().hex}")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return chunk_hash, len(data), True
+
+    def store_file(self, path: Path) -> BlobManifest:
+        """
+        切块并写入尚不存在的块（不访问数据库，可在线程中调用）
+        读取期间文件被修改时抛出 BlobError
+        """
+        before = path.stat()
+        file_hash = hashlib.sha256()
+        chunks: List[Tuple[str, int]] = []
+        new_bytes = 0
+        carry = b""
+
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(BLOB_READ_SIZE)
+                final = not block
+                file_hash.update(block)
+                data = memoryview(carry + block if carry else block)
+                start = 0
+                for cut in _cut_points(data, final):
+                    chunk_hash, size, written = self._put_chunk(data[start:cut])
+                    chunks.append((chunk_hash, size))
+                    if written:
+                        new_bytes += size
+                    start = cut
+                carry = bytes(data[start:])
+                if final:
+                    break
+
+        after = path.stat()
+        if (before.st_size, before.st_mtime_ns) != (after.st_size, after.st_mtime_ns):
+            raise BlobError(f"{path} changed while being stored")
+
+        return BlobManifest(digest=file_hash.hexdigest(), size=after.st_size, chunks=chunks, new_bytes=new_bytes)
+
+    # 引用计数都通过带条件的 UPDATE 在数据库中原子地增减并检查影响的行数，
+    # self._lock 只串行化本进程内的修改，多个进程共用数据库时同样正确
+
+    def _increment(self, db: Session, digest: str, size: Optional[int] = None) -> bool:
+        """引用计数大于 0 的对象引用计数加一（不提交）；对象不存在或正在被删除时返回 False"""
+        query = update(BlobObject).where(BlobObject.digest == digest, BlobObject.refcount > 0)
+        if size is not None:
+            query = query.where(BlobObject.size == size)
+        result = db.execute(
+            query.values(refcount=BlobObject.refcount + 1).execution_options(synchronize_session=False)
+        )
+        return result.rowcount > 0
+
+    def _register(self, db: Session, manifest: BlobManifest) -> BlobObject:
+        if self._increment(db, manifest.digest):
+            db.commit()
+            return db.get(BlobObject, manifest.digest)
+
+        counts = Counter(chunk_hash for chunk_hash, _ in manifest.chunks)
+        sizes = dict(manifest.chunks)
+        for chunk_hash, count in counts.items():
+            updated = db.execute(
+                update(BlobChunk)
+                .where(BlobChunk.hash == chunk_hash)
+                .values(refcount=BlobChunk.refcount + count)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                db.add(BlobChunk(hash=chunk_hash, size=sizes[chunk_hash], refcount=count))
+
+        blob = BlobObject(
+            digest=manifest.digest,
+            size=manifest.size,
+            chunks=[[chunk_hash, size] for chunk_hash, size in manifest.chunks],
+            refcount=1
+        )
+        db.add(blob)
+        db.commit()
+        return blob
+
+    def register(self, db: Session, manifest: BlobManifest) -> BlobObject:
+        """登记 store_file 的结果，对象引用计数加一；与其他进程同时插入同一对象或块时重试"""
+        for attempt in range(BLOB_REGISTER_RETRIES):
+            with self._lock:
+                try:
+                    return self._register(db, manifest)
+                except IntegrityError:
+                    db.rollback()
+                    if attempt == BLOB_REGISTER_RETRIES - 1:
+                        raise
+
+    def add_ref(self, db: Session, digest: str, size: Optional[int] = None, commit: bool = True) -> Optional[BlobObject]:
+        """
+        对象已存在（且大小一致）时引用计数加一并返回，否则返回 None
+        commit 为 False 时不提交，由调用方与引用该对象的记录在同一事务中提交（回滚时引用计数一并撤销）
+        """
+        with self._lock:
+            if not self._increment(db, digest, size):
+                return None
+            if commit:
+                db.commit()
+            return db.get(BlobObject, digest)
+
+    def ingest(self, db: Session, path: Path, known_digest: Optional[str] = None) -> BlobObject:
+        """导入文件；已知 SHA-256 且对象已存在时不读取文件"""
+        if known_digest:
+            blob = self.add_ref(db, known_digest, path.stat().st_size)
+            if blob is not None:
+                return blob
+        return self.register(db, self.store_file(path))
+
+    def release(self, db: Session, digest: str):
+        """
+        对象引用计数减一；归零时在同一事务中删除对象记录并减少块的引用计数（块文件由垃圾回收删除）
+        """
+        with self._lock:
+            released = db.execute(
+                update(BlobObject)
+                .where(BlobObject.digest == digest, BlobObject.refcount > 0)
+                .values(refcount=BlobObject.refcount - 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if released:
+                chunks = db.execute(
+                    select(BlobObject.chunks).where(BlobObject.digest == digest, BlobObject.refcount <= 0)
+                ).scalar()
+                # fetch：会话中已加载的对象记录同时标记为已删除
+                deleted = db.execute(
+                    delete(BlobObject)
+                    .where(BlobObject.digest == digest, BlobObject.refcount <= 0)
+                    .execution_options(synchronize_session="fetch")
+                ).rowcount
+                if deleted:
+                    counts = Counter(chunk_hash for chunk_hash, _ in chunks or [])
+                    for chunk_hash, count in counts.items():
+                        db.execute(
+                            update(BlobChunk)
+                            .where(BlobChunk.hash == chunk_hash)
+                            .values(refcount=BlobChunk.refcount - count)
+                            .execution_options(synchronize_session=False)
+                        )
+            db.commit()
+
+    def submit_ingest(self, key: Hashable, path: Path, on_done: Callable[[BlobManifest], None]) -> Future:
+        """
+        在后台线程中切块写入，完成后在该线程中调用 on_done(manifest)（由调用方登记并更新记录）
+        同一个 key 同时只处理一次
+        """
+        with self._pending_lock:
+            if key in self._pending:
+                return self._pending[key]
+            future = self._executor.submit(self._run_ingest, key, path, on_done)
+            self._pending[key] = future
+            return future
+
+    def _run_ingest(self, key: Hashable, path: Path, on_done: Callable[[BlobManifest], None]) -> Optional[BlobManifest]:
+        try:
+            manifest = self.store_file(path)
+            on_done(manifest)
+            logger.info(
+                f"Stored {path} as blob {manifest.digest}: {len(manifest.chunks)} chunks, "
+                f"{manifest.new_bytes}/{manifest.size} bytes new"
+            )
+            return manifest
+        except Exception as e:
+            logger.error(f"Failed to store {path} in blob store: {e}")
+            return None
+        finally:
+            with self._pending_lock:
+                self._pending.pop(key, None)
+
+    def is_pending(self, key: Hashable) -> bool:
+        with self._pending_lock:
+            return key in self._pending
+
+    # ---------- 读取 ----------
+
+    def get(self, db: Session, digest: str) -> BlobObject:
+        blob = db.get(BlobObject, digest)
+        if blob is None or blob.refcount <= 0:
+            raise BlobError(f"Blob {digest} not found")
+        return blob
+
+    def open(self, db: Session, digest: str) -> BlobReader:
+        return BlobReader(self.chunk_dir, self.get(db, digest).chunks or [])
+
+    # ---------- 回收 ----------
+
+    def collect_garbage(self, db: Session, grace_seconds: int = BLOB_GC_GRACE) -> Dict[str, int]:
+        """
+        删除引用计数为 0 的块，以及数据库中没有记录的孤立块文件（导入中断时留下）
+        闲置时间不足 grace_seconds 的块保留
+        """
+        deadline = time.time() - grace_seconds
+        removed_chunks = 0
+        freed_bytes = 0
+
+        def expired(path: Path) -> bool:
+            try:
+                return path.stat().st_mtime < deadline
+            except FileNotFoundError:
+                return True
+
+        with self._lock:
+            for chunk_hash, size in db.query(BlobChunk.hash, BlobChunk.size).filter(BlobChunk.refcount <= 0).all():
+                path = self.chunk_path(chunk_hash)
+                if not expired(path):
+                    continue
+                # 只有删除记录时引用计数仍为 0（没有被其他进程重新引用）才删除文件
+                deleted = db.execute(
+                    delete(BlobChunk)
+                    .where(BlobChunk.hash == chunk_hash, BlobChunk.refcount <= 0)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.commit()
+                if not deleted:
+                    continue
+                try:
+                    os.remove(path)
+                    freed_bytes += size
+                except FileNotFoundError:
+                    pass
+                removed_chunks += 1
+
+            if self.chunk_dir.is_dir():
+                for prefix in os.scandir(self.chunk_dir):
+                    if not prefix.is_dir():
+                        continue
+                    names = [entry.name for entry in os.scandir(prefix.path) if entry.is_file()]
+                    known = set()
+                    hashes = [name for name in names if not name.startswith(".")]
+                    for i in range(0, len(hashes), 500):
+                        known.update(row[0] for row in db.query(BlobChunk.hash).filter(BlobChunk.hash.in_(hashes[i:i + 500])))
+                    for name in names:
+                        path = Path(prefix.path) / name
+                        if name in known or not expired(path):
+                            continue
+                        try:
+                            freed_bytes += path.stat().st_size
+                            os.remove(path)
+                            removed_chunks += 1
+                        except FileNotFoundError:
+                            pass
+
+        if removed_chunks:
+            logger.info(f"Blob garbage collection removed {removed_chunks} chunks ({freed_bytes} bytes)")
+        return {"removed_chunks": removed_chunks, "freed_bytes": freed_bytes}
+
+    def stats(self, db: Session) -> Dict[str, float]:
+        """逻辑大小（所有引用的文件大小之和）与实际存储的块大小"""
+        objects, logical = db.query(
+            func.count(BlobObject.digest), func.coalesce(func.sum(BlobObject.size * BlobObject.refcount), 0)
+        ).filter(BlobObject.refcount > 0).one()
+        chunks, stored = db.query(
+            func.count(BlobChunk.hash), func.coalesce(func.sum(BlobChunk.size), 0)
+        ).filter(BlobChunk.refcount > 0).one()
+        unreferenced = db.query(func.count(BlobChunk.hash)).filter(BlobChunk.refcount <= 0).scalar()
+        return {
+            "objects": objects,
+            "chunks": chunks,
+            "unreferenced_chunks": unreferenced,
+            "logical_bytes": int(logical),
+            "stored_bytes": int(stored),
+            "dedup_ratio": round(int(logical) / int(stored), 3) if stored else 1.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全局内容寻址存储实例
+blob_store = BlobStore()
@@ -0,0 +1,70 @@
+"""
+时间序列降采样
+- lttb: Largest-Triangle-Three-Buckets，保留曲线形状，适合折线图
+- minmax: 每个桶保留最小值和最大值，保证尖峰不丢失
+输入为按 x 升序排列的一维数组，输出点数不超过 threshold
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """LTTB 降采样，首尾点始终保留"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # 中间 n-2 个点分成 threshold-2 个桶
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # 每个桶的平均点（作为下一个桶选点时的第三个顶点）
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[previous], y[previous]
+        bx, by = x[start:end], y[start:end]
+        # 三角形面积（省略常数 1/2）
+        areas = np.abs((ax - avg_x[i + 1]) * (by - ay) - (ax - bx) * (avg_y[i + 1] - ay))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return x[selected], y[selected]
+
+
+def minmax(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """每个桶保留最小值和最大值（按原顺序输出），桶数为 threshold // 2"""
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return x, y
+
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    min_index = np.empty(buckets, dtype=np.int64)
+    max_index = np.empty(buckets, dtype=np.int64)
+    for i in range(buckets):
+        start, end = edges[i], edges[i + 1]
+        min_index[i] = start + int(np.argmin(y[start:end]))
+        max_index[i] = start + int(np.argmax(y[start:end]))
+
+    selected = np.unique(np.concatenate([min_index, max_index]))
+    return x[selected], y[selected]
+
+
+def downsample(x: np.ndarray, y: np.ndarray, threshold: int, method: str = "lttb") -> Tuple[np.ndarray, np.ndarray]:
+    if method == "lttb":
+        return lttb(x, y, threshold)
+    if method == "minmax":
+        return minmax(x, y, threshold)
+    raise ValueError(f"Unsupported downsample method: {method}")
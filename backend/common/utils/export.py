@@ -0,0 +1,304 @@
+"""
+流式导出工具
+将逐行产生的记录编码为 NDJSON / CSV / Parquet 字节流，并可选 gzip / zstd 压缩，
+配合 StreamingResponse 使用，内存占用只与批大小有关，与导出总量无关
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+    pq = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+
+# 导出格式: format -> (media_type, 文件扩展名)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# 压缩方式: compression -> (Content-Encoding, 文件扩展名)
+EXPORT_COMPRESSIONS = {
+    "none": (None, None),
+    "gzip": ("gzip", "gz"),
+    "zstd": ("zstd", "zst"),
+}
+
+# 列类型 -> pyarrow 类型名
+_ARROW_TYPES = {
+    "string": "string",
+    "int": "int64",
+    "float": "float64",
+    "timestamp": "timestamp",
+}
+
+# 输出缓冲阈值，避免向客户端发送过多小块
+DEFAULT_FLUSH_BYTES = 64 * 1024
+
+
+class ExportError(ValueError):
+    """导出参数无效或依赖缺失"""
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """每行一个 JSON 对象"""
+    for row in rows:
+        yield json.dumps(row, default=_json_default, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[bytes]:
+    """带表头的 CSV，字段按 RFC 4180 转义"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(row.get(column)) for column in columns])
+        # 每行取出已写入的内容，StringIO 不会无限增长
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    remaining = buffer.getvalue()
+    if remaining:
+        yield remaining.encode("utf-8")
+
+
+class _DrainableSink:
+    """
+    供 ParquetWriter 写入的文件对象
+    每写完一个 row group 就把累计的字节取走，避免整个文件留在内存中
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema(schema: Dict[str, str]):
+    fields = []
+    for name, kind in schema.items():
+        arrow_type = _ARROW_TYPES.get(kind, "string")
+        if arrow_type == "timestamp":
+            fields.append(pa.field(name, pa.timestamp("us")))
+        else:
+            fields.append(pa.field(name, pa.type_for_alias(arrow_type)))
+    return pa.schema(fields)
+
+
+def _arrow_value(value: Any, kind: str) -> Any:
+    if value is None:
+        return None
+    if kind == "timestamp":
+        # Parquet 时间列统一为无时区的微秒时间戳
+        return value.replace(tzinfo=None) if isinstance(value, datetime) else value
+    if kind == "float":
+        return float(value)
+    if kind == "int":
+        return int(value)
+    return str(value)
+
+
+def iter_parquet(
+    rows: Iterable[Dict[str, Any]],
+    schema: Dict[str, str],
+    row_group_size: int = 10000,
+) -> Iterator[bytes]:
+    """
+    按 row group 增量写出 Parquet 文件
+    每个 row group 写完后立即输出，内存中最多保留一个 row group
+    """
+    if pa is None:
+        raise ExportError("Parquet export requires pyarrow to be installed")
+
+    arrow_schema = _arrow_schema(schema)
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, arrow_schema, compression="snappy")
+
+    columns: Dict[str, List[Any]] = {name: [] for name in schema}
+    pending = 0
+    try:
+        for row in rows:
+            for name, kind in schema.items():
+                columns[name].append(_arrow_value(row.get(name), kind))
+            pending += 1
+
+            if pending >= row_group_size:
+                writer.write_table(pa.table(columns, schema=arrow_schema))
+                columns = {name: [] for name in schema}
+                pending = 0
+                data = sink.drain()
+                if data:
+                    yield data
+
+        if pending:
+            writer.write_table(pa.table(columns, schema=arrow_schema))
+    finally:
+        writer.close()
+
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def compress_stream(chunks: Iterable[bytes], compression: str = "none") -> Iterator[bytes]:
+    """对字节流做增量压缩"""
+    if compression in (None, "", "none"):
+        yield from chunks
+        return
+
+    if compression == "gzip":
+        # wbits=31 生成带 gzip 头的流
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+        return
+
+    if compression == "zstd":
+        if zstandard is None:
+            raise ExportError("zstd compression requires zstandard to be installed")
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+        return
+
+    raise ExportError(f"Unsupported compression: {compression}")
+
+
+def coalesce(chunks: Iterable[bytes], flush_bytes: int = DEFAULT_FLUSH_BYTES) -> Iterator[bytes]:
+    """把小块合并到 flush_bytes 左右再输出"""
+    buffer: List[bytes] = []
+    size = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= flush_bytes:
+            yield b"".join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def validate_export_options(fmt: str, compression: str) -> None:
+    """在开始流式输出前检查参数，保证错误能以正常的 HTTP 状态码返回"""
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format: {fmt}. Must be one of: {', '.join(EXPORT_FORMATS)}")
+    if compression not in EXPORT_COMPRESSIONS:
+        raise ExportError(f"Unsupported compression: {compression}. Must be one of: {', '.join(EXPORT_COMPRESSIONS)}")
+    if fmt == "parquet" and pa is None:
+        raise ExportError("Parquet export requires pyarrow to be installed")
+    if compression == "zstd" and zstandard is None:
+        raise ExportError("zstd compression requires zstandard to be installed")
+
+
+def stream_export(
+    rows: Iterable[Dict[str, Any]],
+    schema: Dict[str, str],
+    fmt: str = "ndjson",
+    compression: str = "none",
+    row_group_size: int = 10000,
+) -> Iterator[bytes]:
+    """
+    将记录流编码并压缩为可直接交给 StreamingResponse 的字节迭代器
+
+    Args:
+        rows: 逐行产生的字典记录（通常来自服务端游标）
+        schema: 列名 -> 列类型 (string / int / float / timestamp)，决定列顺序
+        fmt: ndjson / csv / parquet
+        compression: none / gzip / zstd
+        row_group_size: Parquet 每个 row group 的行数
+    """
+    validate_export_options(fmt, compression)
+
+    if fmt == "csv":
+        encoded = iter_csv(rows, list(schema))
+    elif fmt == "parquet":
+        encoded = iter_parquet(rows, schema, row_group_size)
+    else:
+        encoded = iter_ndjson(rows)
+
+    return compress_stream(coalesce(encoded), compression)
+
+
+def export_headers(prefix: str, fmt: str, compression: str) -> Dict[str, str]:
+    """构造下载文件名等响应头"""
+    _, extension = EXPORT_FORMATS[fmt]
+    _, compressed_extension = EXPORT_COMPRESSIONS[compression]
+
+    filename = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    if compressed_extension:
+        filename = f"{filename}.{compressed_extension}"
+
+    # 压缩后的文件作为附件下载，不设置 Content-Encoding 以免客户端自动解压
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+
+def export_media_type(fmt: str, compression: str) -> str:
+    if compression == "gzip":
+        return "application/gzip"
+    if compression == "zstd":
+        return "application/zstd"
+    return EXPORT_FORMATS[fmt][0]
@@ -0,0 +1,131 @@
+"""
+快速 JSON 序列化
+- FastJSONResponse: 使用 orjson 编码普通 dict/list 响应
+- model_response: 对已经构造好的 Pydantic 模型列表直接用 pydantic-core 序列化，
+  跳过 FastAPI 对 response_model 的二次校验和 jsonable_encoder
+- dumps / send_json / receive_json: WebSocket 帧共用的编解码；连接时带 ?encoding=msgpack 的客户端
+  收发 msgpack 二进制帧，其余客户端收发 JSON 文本帧
+
+输出与 FastAPI 默认的 JSONResponse 保持一致（紧凑分隔符、非 ASCII 字符不转义、
+Decimal 按 jsonable_encoder 规则转为 int/float）。
+默认使用标准库 json；设置 EDGEAI_FAST_JSON=1 且已安装 orjson 时启用 orjson。
+"""
+
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Any
+
+from fastapi import WebSocket, WebSocketDisconnect
+from fastapi.encoders import decimal_encoder, jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+FAST_JSON_ENABLED = os.getenv("EDGEAI_FAST_JSON", "0") == "1" and orjson is not None
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _orjson_default(value: Any) -> Any:
+    """orjson 不直接支持的类型"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Decimal):
+        return decimal_encoder(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """编码为 UTF-8 JSON 字节"""
+    if FAST_JSON_ENABLED:
+        return orjson.dumps(content, default=_orjson_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 编码的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=128)
+def _type_adapter(model_type: Any) -> TypeAdapter:
+    return TypeAdapter(model_type)
+
+
+def model_response(content: Any, model_type: Any, status_code: int = 200) -> Response:
+    """
+    直接序列化已经通过 Pydantic 构造的数据（如 List[NodeResponse]）
+    不再做一次 response_model 校验；路由上的 response_model 仍用于生成 OpenAPI 文档
+    """
+    body = _type_adapter(model_type).dump_json(content, by_alias=True)
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return _orjson_default(value)
+
+
+def packb(content: Any) -> bytes:
+    """编码为 msgpack 二进制"""
+    return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+
+def websocket_encoding(websocket: WebSocket) -> str:
+    """客户端通过连接参数 encoding=msgpack 选择二进制帧，默认 JSON"""
+    if msgpack is not None and websocket.query_params.get("encoding") == "msgpack":
+        return "msgpack"
+    return "json"
+
+
+async def send_json(websocket: WebSocket, data: Any):
+    """
+    WebSocket 发送一条消息
+    按连接协商的编码发送 JSON 文本帧或 msgpack 二进制帧
+    """
+    if websocket_encoding(websocket) == "msgpack":
+        await websocket.send_bytes(packb(data))
+    else:
+        await websocket.send_text(dumps(data).decode("utf-8"))
+
+
+async def receive_json(websocket: WebSocket) -> Any:
+    """
+    WebSocket 接收一条消息
+    二进制帧按 msgpack 解码，文本帧按 JSON 解码；连接断开时抛出 WebSocketDisconnect
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.unpackb(message["bytes"], raw=False)
+    return json.loads(message.get("text") or "null")
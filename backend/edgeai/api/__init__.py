@@ -6,8 +6,10 @@ from .performance import router as performance_router
 from .logs import router as logs_router
 from .tasks import router as tasks_router
 from .models import router as models_router
+from .evaluation import router as evaluation_router
 from .real_data import router as real_data_router
 from .clusters import router as clusters_router
+from .realtime import router as realtime_router
 
 router = APIRouter()
 
@@ -19,5 +21,7 @@ router.include_router(performance_router, prefix="/performance", tags=["Performa
 router.include_router(logs_router, prefix="/logs", tags=["Logs"])
 router.include_router(tasks_router, prefix="/tasks", tags=["Tasks"])
 router.include_router(models_router, prefix="/models", tags=["Models"])
+router.include_router(evaluation_router, prefix="/evaluations", tags=["Evaluations"])
 router.include_router(real_data_router, prefix="/real-data", tags=["Real Data"])
 router.include_router(clusters_router, prefix="/clusters", tags=["Clusters"])
+router.include_router(realtime_router, prefix="/realtime", tags=["Realtime"])
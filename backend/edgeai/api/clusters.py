@@ -20,6 +20,8 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(ROOT_DIR))
 from config.remote_api import REMOTE_API_CONFIG, get_remote_api_url
+from p2pai.federated.aggregation import AggregationError
+from p2pai.federated.mpc import MPCConfig, mpc_manager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -448,6 +450,63 @@ async def start_cluster(cluster_id: str, db: Session = Depends(get_db)):
             detail=f"Failed to start cluster: {str(e)}"
         )
 
+def _mpc_session_id(cluster_id: int) -> str:
+    return f"cluster_{cluster_id}"
+
+@router.post("/{cluster_id}/mpc", response_model=BaseResponse)
+async def start_cluster_mpc(cluster_id: str, mpc_config: dict = None, db: Session = Depends(get_db)):
+    """
+    在本地模拟运行集群的 MPC 训练轮次
+    mpc 类型节点作为计算方（持有 Shamir 份额），training 类型节点作为数据方；
+    份额分发、计算、重构三个阶段按轮次流水线执行，mpc_config 为 MPCConfig 选项（如 rounds、pipeline_depth、threshold）
+    """
+    try:
+        cluster_id_int = int(cluster_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cluster ID format")
+
+    cluster = db.query(Cluster).filter(Cluster.id == cluster_id_int).first()
+    if not cluster:
+        raise HTTPException(status_code=404, detail=f"Cluster {cluster_id} not found")
+
+    nodes = db.query(Node).filter(Node.cluster_id == cluster_id_int).all()
+    _, train_nodes, mpc_nodes = classify_nodes_by_type(nodes)
+    if not mpc_nodes:
+        return BaseResponse(
+            success=False,
+            message="Cannot start MPC: No mpc nodes in this cluster"
+        )
+
+    options = dict(mpc_config or {})
+    options.setdefault("threshold", len(mpc_nodes) // 2 + 1)
+    try:
+        config = MPCConfig.from_dict(options)
+        session = mpc_manager.create(_mpc_session_id(cluster_id_int), mpc_nodes, train_nodes, config)
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    logger.info(f"Started MPC session {session.session_id} for cluster {cluster_id}: {len(mpc_nodes)} parties, {len(session.clients)} data owners")
+    return BaseResponse(
+        success=True,
+        message=f"MPC training started for cluster '{cluster.name}' with {len(mpc_nodes)} MPC nodes",
+        data={"session_id": session.session_id, "scheme": session.scheme.config()}
+    )
+
+@router.get("/{cluster_id}/mpc")
+async def get_cluster_mpc(cluster_id: str, timeline: bool = False):
+    """
+    集群 MPC 会话状态：进度、指标和各阶段耗时
+    """
+    try:
+        cluster_id_int = int(cluster_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cluster ID format")
+
+    session = mpc_manager.get(_mpc_session_id(cluster_id_int))
+    if session is None:
+        raise HTTPException(status_code=404, detail="No MPC session for this cluster")
+    return session.snapshot(timeline)
+
 @router.post("/{cluster_id}/stop", response_model=BaseResponse)
 async def stop_cluster(cluster_id: str, db: Session = Depends(get_db)):
     """
@@ -0,0 +1,220 @@
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..schemas.edgeai import ModelEvaluationRequest
+from ..serving.evaluation import (
+    EVAL_FORMATS,
+    EvaluationError,
+    EvaluationJob,
+    EvaluationSpec,
+    evaluation_runner,
+    file_key,
+    materialize_dataset
+)
+from ..serving.checkpoints import CheckpointError, base_model, checkpoint_digest, materialize_checkpoint
+from ..serving.inference import InferenceError
+from ..serving.registry import model_registry
+from common.api.auth import get_current_user_id
+from common.storage.artifacts import ArtifactError, resolve_artifact_path
+from common.storage.blobstore import BlobError, blob_store, parse_blob_ref
+from common.utils.serialization import dumps
+from database.edgeai import get_db, Model, Project
+from database.edgeai.database import SessionLocal
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 单次请求最多评估的模型数
+EVAL_MAX_MODELS = 100
+# SSE 保活间隔（秒）
+EVAL_SSE_KEEPALIVE = 15
+
+_SUFFIX_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".json": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet", ".pq": "parquet"}
+
+
+def _dataset_source(dataset_path: str, fmt: Optional[str]):
+    """返回 (缓存键, 打开函数, 格式)；在线程中调用"""
+    digest = parse_blob_ref(dataset_path)
+    if digest:
+        if not fmt:
+            raise EvaluationError(400, "format is required for blob datasets")
+
+        def open_blob():
+            db = SessionLocal()
+            try:
+                return blob_store.open(db, digest).open()
+            except BlobError as e:
+                raise EvaluationError(404, f"Dataset blob not available: {e}")
+            finally:
+                db.close()
+
+        return digest, open_blob, fmt
+
+    try:
+        path = resolve_artifact_path(dataset_path)
+    except ArtifactError as e:
+        raise EvaluationError(404, str(e))
+    fmt = fmt or _SUFFIX_FORMATS.get(path.suffix.lower())
+    return file_key(path), lambda: open(path, "rb"), fmt
+
+
+def _prepare(body: ModelEvaluationRequest, digest: Optional[str], base: str):
+    """数据集转换为 Arrow IPC 文件；模型有登记的制品时解压为检查点目录，否则使用项目的基础模型"""
+    def prepare():
+        key, open_source, fmt = _dataset_source(body.dataset_path, body.format)
+        data_path = materialize_dataset(key, open_source, fmt)
+        if not digest:
+            return data_path, base
+        try:
+            return data_path, str(materialize_checkpoint(digest))
+        except CheckpointError as e:
+            raise EvaluationError(e.status_code, e.detail)
+    return prepare
+
+
+def _save_metrics(job: EvaluationJob):
+    """把评估结果写回模型和它的当前版本（准确率按百分比保存）"""
+    metrics = job.metrics()
+    db = SessionLocal()
+    try:
+        db.query(Model).filter(Model.id == job.model_id).update({
+            Model.accuracy: round(min(metrics["accuracy"] * 100, 100.0), 2),
+            Model.loss: round(min(metrics["loss"], 999999.99), 2)
+        }, synchronize_session=False)
+        db.commit()
+        model_registry.record_metrics(db, job.model_id, {**metrics, "accuracy": metrics["accuracy"] * 100})
+    finally:
+        db.close()
+
+
+def _get_job(job_id: str, user_id: int) -> EvaluationJob:
+    """获取当前用户的评估任务，其他用户的任务同样返回 404"""
+    job = evaluation_runner.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Evaluation job not found")
+    return job
+
+
+@router.post("/", status_code=202)
+async def start_evaluation(
+    body: ModelEvaluationRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    创建评估任务：每个模型一个任务，在共享进程池中并行评估留出集，完成后写回模型的准确率和损失
+    """
+    if not body.model_ids:
+        raise HTTPException(status_code=400, detail="model_ids must not be empty")
+    if len(body.model_ids) > EVAL_MAX_MODELS:
+        raise HTTPException(status_code=400, detail=f"At most {EVAL_MAX_MODELS} models per request")
+    if not 0 < body.test_fraction <= 1:
+        raise HTTPException(status_code=400, detail="test_fraction must be in (0, 1]")
+    if body.batch_size < 1 or (body.max_samples is not None and body.max_samples < 1):
+        raise HTTPException(status_code=400, detail="batch_size and max_samples must be positive")
+    if body.format and body.format not in EVAL_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EVAL_FORMATS)}")
+
+    models = db.query(Model).filter(Model.id.in_(body.model_ids), Model.user_id == current_user_id).all()
+    found = {model.id: model for model in models}
+    missing = [str(model_id) for model_id in body.model_ids if model_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Models not found: {', '.join(missing)}")
+
+    spec = EvaluationSpec(
+        text_column=body.text_column,
+        label_column=body.label_column,
+        test_fraction=body.test_fraction,
+        seed=body.seed,
+        max_samples=body.max_samples,
+        batch_size=body.batch_size,
+        backend=body.backend,
+        options=body.backend_options
+    )
+    projects = {project.id: project for project in db.query(Project).filter(Project.id.in_({m.project_id for m in models if m.project_id}))}
+    sources = {}
+    for model_id in dict.fromkeys(body.model_ids):
+        model = found[model_id]
+        try:
+            digest = checkpoint_digest(db, model)
+        except CheckpointError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        sources[model_id] = _prepare(body, digest, base_model(projects.get(model.project_id)))
+
+    try:
+        jobs = [evaluation_runner.submit(model_id, current_user_id, spec, prepare, _save_metrics) for model_id, prepare in sources.items()]
+    except (EvaluationError, InferenceError) as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    return {"jobs": [job.snapshot() for job in jobs]}
+
+@router.get("/")
+async def list_evaluations(
+    model_id: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    列出当前用户的评估任务（最新的在前）
+    """
+    return {"jobs": [job.snapshot() for job in evaluation_runner.list(model_id, current_user_id)[:limit]]}
+
+@router.get("/{job_id}")
+async def get_evaluation(
+    job_id: str,
+    since_version: Optional[int] = Query(None, ge=0, description="长轮询：客户端已知的版本号"),
+    wait: float = Query(30, ge=0, le=60, description="长轮询最长等待秒数"),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    评估任务状态；指定 since_version 时等待版本号变化或超时后返回
+    """
+    job = _get_job(job_id, current_user_id)
+    if since_version is not None and not job.finished:
+        await job.wait(since_version, wait)
+    return job.snapshot()
+
+@router.get("/{job_id}/stream")
+async def stream_evaluation(job_id: str, request: Request, current_user_id: int = Depends(get_current_user_id)):
+    """
+    评估进度 SSE 流：版本号变化时推送 progress 事件，任务结束后推送最后一次快照并关闭
+    """
+    job = _get_job(job_id, current_user_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    since_version = int(last_event_id) if last_event_id.isdigit() else -1
+
+    async def event_stream():
+        version = since_version
+        while True:
+            if await job.wait(version, EVAL_SSE_KEEPALIVE):
+                snapshot = job.snapshot()
+                version = snapshot["version"]
+                yield f"id: {version}\nevent: progress\ndata: {dumps(snapshot).decode('utf-8')}\n\n"
+                if job.finished:
+                    return
+            else:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.delete("/{job_id}")
+async def cancel_evaluation(job_id: str, current_user_id: int = Depends(get_current_user_id)):
+    """
+    取消评估任务
+    """
+    job = _get_job(job_id, current_user_id)
+    if not evaluation_runner.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Evaluation job is already {job.status}")
+    return {"job_id": job_id, "cancelled": True}
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭事件 - 停止评估进程池"""
+    evaluation_runner.shutdown()
@@ -1,414 +1,370 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
 from typing import List, Optional
-from ..schemas.edgeai import LogEntry
+from ..schemas.edgeai import LogCreateRequest, LogEntry
 from common.schemas.common import PaginatedResponse
+from common.utils.export import (
+    ExportError,
+    stream_export,
+    validate_export_options,
+    export_headers,
+    export_media_type
+)
+from database.edgeai import Log, get_db
+from database.edgeai.database import SessionLocal
+from ..archive import log_archive
 from datetime import datetime, timedelta
-import random
+from sqlalchemy import func
 
 router = APIRouter()
 
-# Mock logs database
-mock_logs = []
-
-# Generate some mock log data
-log_levels = ["INFO", "WARNING", "ERROR", "DEBUG"]
-log_messages = [
-    "Node connected successfully",
-    "Training started",
-    "Training completed",
-    "High CPU usage detected",
-    "Memory usage exceeded threshold",
-    "Model saved successfully",
-    "Connection lost",
-    "Node restarted",
-    "Error in training process",
-    "Data validation failed"
-]
-
-def generate_dynamic_logs():
-    """Generate 500 realistic log entries with diverse scenarios"""
-    detailed_log_scenarios = [
-        # Training and Model Operations
-        {"level": "INFO", "message": "Model training initialized for {project}", "category": "training"},
-        {"level": "INFO", "message": "Training epoch {epoch}/100 completed - Loss: {loss:.4f}", "category": "training"},
-        {"level": "INFO", "message": "Model checkpoint saved successfully", "category": "training"},
-        {"level": "WARNING", "message": "Training convergence slower than expected", "category": "training"},
-        {"level": "ERROR", "message": "Training interrupted due to insufficient memory", "category": "training"},
-        {"level": "INFO", "message": "Model validation completed - Accuracy: {accuracy:.2f}%", "category": "training"},
-
-        # Node Operations
-        {"level": "INFO", "message": "Edge node successfully connected to cluster", "category": "node"},
-        {"level": "INFO", "message": "Node health check completed - All systems operational", "category": "node"},
-        {"level": "WARNING", "message": "Node CPU usage reached 85% - Scaling recommended", "category": "node"},
-        {"level": "WARNING", "message": "Network latency increased to {latency}ms", "category": "node"},
-        {"level": "ERROR", "message": "Node connection lost - Attempting reconnection", "category": "node"},
-        {"level": "INFO", "message": "Node firmware updated to version {version}", "category": "node"},
-        {"level": "CRITICAL", "message": "Node temperature exceeded safe threshold: {temp}°C", "category": "node"},
-
-        # Data Processing
-        {"level": "INFO", "message": "Data preprocessing completed for {dataset} samples", "category": "data"},
-        {"level": "INFO", "message": "Feature extraction completed in {time:.2f}s", "category": "data"},
-        {"level": "WARNING", "message": "Data quality check found {issues} anomalies", "category": "data"},
-        {"level": "ERROR", "message": "Data validation failed - Schema mismatch detected", "category": "data"},
-        {"level": "INFO", "message": "Dataset synchronization completed", "category": "data"},
-
-        # Inference and Deployment
-        {"level": "INFO", "message": "Model deployed to edge device successfully", "category": "inference"},
-        {"level": "INFO", "message": "Inference request processed in {time}ms", "category": "inference"},
-        {"level": "WARNING", "message": "Inference queue backlog reached {count} requests", "category": "inference"},
-        {"level": "ERROR", "message": "Model inference failed - Input tensor size mismatch", "category": "inference"},
-        {"level": "INFO", "message": "Batch inference completed - {count} predictions generated", "category": "inference"},
-
-        # System Monitoring
-        {"level": "INFO", "message": "System monitoring dashboard updated", "category": "system"},
-        {"level": "WARNING", "message": "Disk usage reached 90% capacity", "category": "system"},
-        {"level": "WARNING", "message": "Memory usage spike detected: {usage}%", "category": "system"},
-        {"level": "ERROR", "message": "Database connection pool exhausted", "category": "system"},
-        {"level": "CRITICAL", "message": "System backup failed - Manual intervention required", "category": "system"},
-        {"level": "INFO", "message": "Security scan completed - No vulnerabilities found", "category": "system"},
-
-        # Performance and Optimization
-        {"level": "INFO", "message": "Performance optimization completed - {improvement}% faster", "category": "performance"},
-        {"level": "WARNING", "message": "Model performance degradation detected", "category": "performance"},
-        {"level": "INFO", "message": "Auto-scaling triggered - Adding {count} instances", "category": "performance"},
-        {"level": "ERROR", "message": "Performance benchmark failed to meet SLA requirements", "category": "performance"},
-
-        # Network and Communication
-        {"level": "INFO", "message": "WebSocket connection established with client", "category": "network"},
-        {"level": "WARNING", "message": "API rate limit exceeded for endpoint {endpoint}", "category": "network"},
-        {"level": "ERROR", "message": "Network timeout occurred during data transfer", "category": "network"},
-        {"level": "INFO", "message": "SSL certificate renewed successfully", "category": "network"},
-
-        # Configuration and Setup
-        {"level": "INFO", "message": "Configuration updated for {component}", "category": "config"},
-        {"level": "WARNING", "message": "Deprecated configuration parameter detected", "category": "config"},
-        {"level": "ERROR", "message": "Configuration validation failed - Invalid format", "category": "config"},
-
-        # User Actions
-        {"level": "INFO", "message": "User {user} logged in successfully", "category": "user"},
-        {"level": "INFO", "message": "Project {project} created by user {user}", "category": "user"},
-        {"level": "WARNING", "message": "Multiple failed login attempts detected", "category": "user"},
-        {"level": "ERROR", "message": "Unauthorized access attempt blocked", "category": "user"}
-    ]
+# 日志级别
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+# 单次写入的最大日志条数
+LOG_INGEST_MAX_BATCH = 1000
 
-    projects = ["Smart Manufacturing", "Healthcare Analytics", "Autonomous Driving", "IoT Sensors", "Financial Risk", "Retail Optimization", "Energy Management", "Security Monitoring", "Agricultural AI", "Traffic Control"]
-    nodes = [f"edge-{i:02d}" for i in range(1, 21)]
-    project_ids = [f"proj-{i:03d}" for i in range(1, 11)]
-    users = ["admin", "researcher", "engineer", "analyst", "operator"]
 
+def _filter_logs(
+    query,
+    level: Optional[str] = None,
+    node_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    since: Optional[datetime] = None
+):
+    """所有日志接口共用的过滤条件"""
+    if level:
+        query = query.filter(Log.level == level.upper())
+    if node_id:
+        query = query.filter(Log.node_id == node_id)
+    if project_id:
+        query = query.filter(Log.project_id == project_id)
+    if since:
+        query = query.filter(Log.timestamp >= since)
+    return query
+
+
+@router.post("/", status_code=201)
+async def create_logs(entries: List[LogCreateRequest], db: Session = Depends(get_db)):
+    """
+    写入日志（节点和训练任务上报），单次最多 LOG_INGEST_MAX_BATCH 条
+    """
+    if len(entries) > LOG_INGEST_MAX_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {LOG_INGEST_MAX_BATCH} logs per request")
     logs = []
-    for i in range(50):
-        scenario = random.choice(detailed_log_scenarios)
-        message = scenario["message"]
-
-        # Format message with dynamic values
-        if "{project}" in message:
-            message = message.replace("{project}", random.choice(projects))
-        if "{epoch}" in message:
-            message = message.replace("{epoch}", str(random.randint(1, 100)))
-        if "{loss}" in message:
-            message = message.replace("{loss}", str(random.uniform(0.001, 0.5)))
-        if "{accuracy}" in message:
-            message = message.replace("{accuracy}", str(random.uniform(75, 99)))
-        if "{latency}" in message:
-            message = message.replace("{latency}", str(random.randint(50, 500)))
-        if "{version}" in message:
-            message = message.replace("{version}", f"{random.randint(1,3)}.{random.randint(0,9)}.{random.randint(0,9)}")
-        if "{temp}" in message:
-            message = message.replace("{temp}", str(random.randint(75, 95)))
-        if "{dataset}" in message:
-            message = message.replace("{dataset}", str(random.randint(1000, 50000)))
-        if "{time}" in message:
-            if "ms" in message:
-                message = message.replace("{time}", str(random.randint(10, 1000)))
-            else:
-                message = message.replace("{time}", str(random.uniform(0.5, 30)))
-        if "{issues}" in message:
-            message = message.replace("{issues}", str(random.randint(1, 20)))
-        if "{count}" in message:
-            message = message.replace("{count}", str(random.randint(1, 100)))
-        if "{usage}" in message:
-            message = message.replace("{usage}", str(random.randint(80, 95)))
-        if "{improvement}" in message:
-            message = message.replace("{improvement}", str(random.randint(10, 50)))
-        if "{endpoint}" in message:
-            endpoints = ["/api/models", "/api/training", "/api/inference", "/api/data"]
-            message = message.replace("{endpoint}", random.choice(endpoints))
-        if "{component}" in message:
-            components = ["model", "node", "database", "monitoring", "scheduler"]
-            message = message.replace("{component}", random.choice(components))
-        if "{user}" in message:
-            message = message.replace("{user}", random.choice(users))
-
-        # Create timestamp with more realistic distribution
-        # More recent logs are more frequent
-        hours_ago = random.choices(
-            range(0, 168),  # 7 days
-            weights=[max(1, 168-h) for h in range(168)]  # Weight recent logs more heavily
-        )[0]
-
-        logs.append({
-            "id": f"log-{i:03d}",
-            "level": scenario["level"],
-            "message": message,
-            "timestamp": datetime.now() - timedelta(hours=hours_ago, minutes=random.randint(0, 59)),
-            "node_id": random.choice(nodes),
-            "project_id": random.choice(project_ids),
-            "category": scenario["category"]
-        })
-
-    return sorted(logs, key=lambda x: x["timestamp"], reverse=True)
-
-# Generate comprehensive mock logs
-mock_logs = generate_dynamic_logs()
+    for entry in entries:
+        level = entry.level.upper()
+        if level not in LOG_LEVELS:
+            raise HTTPException(status_code=400, detail=f"level must be one of {', '.join(LOG_LEVELS)}")
+        log = Log(
+            level=level,
+            message=entry.message,
+            category=entry.category,
+            node_id=entry.node_id,
+            project_id=entry.project_id
+        )
+        if entry.timestamp is not None:
+            log.timestamp = entry.timestamp
+        logs.append(log)
+    db.add_all(logs)
+    db.commit()
+    return {"created": len(logs), "ids": [str(log.id) for log in logs]}
 
 @router.get("/", response_model=PaginatedResponse)
 async def get_logs(
     level: Optional[str] = None,
     node_id: Optional[str] = None,
     project_id: Optional[str] = None,
-    page: int = 1,
-    size: int = 20,
-    hours: int = 24
+    page: int = Query(1, ge=1),
+    size: int = Query(20, ge=1, le=500),
+    hours: int = 24,
+    db: Session = Depends(get_db)
 ):
     """
     获取日志列表
     支持按级别、节点ID、项目ID过滤和分页
     """
-    filtered_logs = mock_logs
-    
-    # 按级别过滤
-    if level:
-        filtered_logs = [log for log in filtered_logs if log["level"] == level.upper()]
-    
-    # 按节点ID过滤
-    if node_id:
-        filtered_logs = [log for log in filtered_logs if log["node_id"] == node_id]
-    
-    # 按项目ID过滤
-    if project_id:
-        filtered_logs = [log for log in filtered_logs if log["project_id"] == project_id]
-    
-    # 按时间过滤
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    filtered_logs = [log for log in filtered_logs if log["timestamp"] >= cutoff_time]
-    
-    # 按时间排序（最新的在前）
-    filtered_logs.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    # 分页
-    start = (page - 1) * size
-    end = start + size
-    paginated_logs = filtered_logs[start:end]
-    
+    query = _filter_logs(db.query(Log), level, node_id, project_id, cutoff_time)
+    total = query.count()
+
+    # 按时间排序（最新的在前）后分页
+    logs = query.order_by(Log.timestamp.desc(), Log.id.desc()).offset((page - 1) * size).limit(size).all()
+
     return PaginatedResponse(
-        items=[LogEntry(**log) for log in paginated_logs],
-        total=len(filtered_logs),
+        items=[LogEntry(**_log_to_dict(log)) for log in logs],
+        total=total,
         page=page,
         size=size,
-        pages=(len(filtered_logs) + size - 1) // size
+        pages=(total + size - 1) // size
     )
 
-@router.get("/{log_id}", response_model=LogEntry)
-async def get_log(log_id: str):
-    """
-    获取特定日志详情
-    """
-    for log in mock_logs:
-        if log["id"] == log_id:
-            return LogEntry(**log)
-    
-    raise HTTPException(status_code=404, detail="Log not found")
-
 @router.get("/stats/summary")
 async def get_log_stats(
     hours: int = 24,
     node_id: Optional[str] = None,
-    project_id: Optional[str] = None
+    project_id: Optional[str] = None,
+    db: Session = Depends(get_db)
 ):
     """
     获取日志统计摘要
     """
-    filtered_logs = mock_logs
-    
-    # 按节点ID过滤
-    if node_id:
-        filtered_logs = [log for log in filtered_logs if log["node_id"] == node_id]
-    
-    # 按项目ID过滤
-    if project_id:
-        filtered_logs = [log for log in filtered_logs if log["project_id"] == project_id]
-    
-    # 按时间过滤
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    filtered_logs = [log for log in filtered_logs if log["timestamp"] >= cutoff_time]
-    
-    # 统计各级别日志数量
-    level_counts = {}
-    for log in filtered_logs:
-        level_counts[log["level"]] = level_counts.get(log["level"], 0) + 1
-    
-    # 统计各节点日志数量
-    node_counts = {}
-    for log in filtered_logs:
-        node_counts[log["node_id"]] = node_counts.get(log["node_id"], 0) + 1
-    
-    # 统计各项目日志数量
-    project_counts = {}
-    for log in filtered_logs:
-        project_counts[log["project_id"]] = project_counts.get(log["project_id"], 0) + 1
-    
+
+    def distribution(column):
+        query = _filter_logs(db.query(column, func.count(Log.id)), node_id=node_id, project_id=project_id, since=cutoff_time)
+        return {key: count for key, count in query.group_by(column).all()}
+
+    level_counts = distribution(Log.level)
+    total_logs = sum(level_counts.values())
+
     return {
         "period_hours": hours,
-        "total_logs": len(filtered_logs),
+        "total_logs": total_logs,
         "level_distribution": level_counts,
-        "node_distribution": node_counts,
-        "project_distribution": project_counts,
-        "error_rate": round(level_counts.get("ERROR", 0) / len(filtered_logs) * 100, 2) if filtered_logs else 0
+        "node_distribution": distribution(Log.node_id),
+        "project_distribution": distribution(Log.project_id),
+        "error_rate": round(level_counts.get("ERROR", 0) / total_logs * 100, 2) if total_logs else 0
     }
 
+def _log_to_dict(log: Log) -> dict:
+    return {
+        "id": str(log.id),
+        "level": log.level,
+        "message": log.message or "",
+        "timestamp": log.timestamp,
+        "node_id": log.node_id,
+        "project_id": log.project_id,
+        "category": log.category
+    }
+
+
 @router.get("/search")
 async def search_logs(
     query: str,
     level: Optional[str] = None,
     node_id: Optional[str] = None,
     project_id: Optional[str] = None,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
     page: int = 1,
-    size: int = 20
+    size: int = 20,
+    db: Session = Depends(get_db)
 ):
     """
     搜索日志
+    先查询热表；指定了时间范围且与归档段重叠时，继续通过内存映射扫描归档段
     """
-    filtered_logs = mock_logs
-    
-    # 按级别过滤
-    if level:
-        filtered_logs = [log for log in filtered_logs if log["level"] == level.upper()]
-    
-    # 按节点ID过滤
-    if node_id:
-        filtered_logs = [log for log in filtered_logs if log["node_id"] == node_id]
-    
-    # 按项目ID过滤
-    if project_id:
-        filtered_logs = [log for log in filtered_logs if log["project_id"] == project_id]
-    
-    # 按查询字符串过滤
-    query_lower = query.lower()
-    filtered_logs = [
-        log for log in filtered_logs 
-        if query_lower in log["message"].lower()
+    level = level.upper() if level else None
+
+    hot_query = db.query(Log).filter(Log.message.icontains(query, autoescape=True))
+    hot_query = _filter_logs(hot_query, level, node_id, project_id, start_time)
+    if end_time:
+        hot_query = hot_query.filter(Log.timestamp <= end_time)
+
+    # 热表中的日志都比归档段新，结果按 热表 -> 归档段 的顺序分页
+    offset = (page - 1) * size
+    hot_total = hot_query.count()
+    results = [
+        _log_to_dict(log)
+        for log in hot_query.order_by(Log.timestamp.desc()).offset(offset).limit(size).all()
     ]
-    
-    # 按时间排序（最新的在前）
-    filtered_logs.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    # 分页
-    start = (page - 1) * size
-    end = start + size
-    paginated_logs = filtered_logs[start:end]
-    
+
+    archive_total = 0
+    segments = []
+    if (start_time or end_time) and log_archive.pa is not None:
+        segments = log_archive.find_segments(db, start_time, end_time, node_id)
+
+    if segments:
+        archive_offset = max(offset - hot_total, 0)
+        archive_limit = size - len(results)
+        archive_total, archived = await run_in_threadpool(
+            log_archive.search_segments,
+            segments,
+            archive_offset,
+            archive_limit,
+            start_time=start_time,
+            end_time=end_time,
+            query=query,
+            level=level,
+            node_id=node_id,
+            project_id=project_id
+        )
+        for row in archived:
+            row["id"] = str(row["id"])
+        results.extend(archived)
+
+    total = hot_total + archive_total
     return {
         "query": query,
-        "results": [LogEntry(**log) for log in paginated_logs],
-        "total": len(filtered_logs),
+        "results": [LogEntry(**log) for log in results],
+        "total": total,
         "page": page,
         "size": size,
-        "pages": (len(filtered_logs) + size - 1) // size
+        "pages": (total + size - 1) // size,
+        "archived_segments_scanned": len(segments)
     }
 
+# 导出列定义 (列名 -> 类型)，同时决定 CSV / Parquet 的列顺序
+LOG_EXPORT_SCHEMA = {
+    "id": "int",
+    "timestamp": "timestamp",
+    "level": "string",
+    "category": "string",
+    "node_id": "string",
+    "project_id": "string",
+    "message": "string",
+}
+
+# 服务端游标每批拉取的行数
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_log_rows(
+    level: Optional[str],
+    node_id: Optional[str],
+    project_id: Optional[str],
+    cutoff_time: datetime
+):
+    """
+    通过服务端游标逐批读取日志
+    使用独立的数据库会话，保证在响应流式输出期间会话一直有效
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(
+            Log.id, Log.timestamp, Log.level, Log.category,
+            Log.node_id, Log.project_id, Log.message
+        )
+        query = _filter_logs(query, level, node_id, project_id, cutoff_time)
+        query = query.order_by(Log.timestamp.desc()).yield_per(EXPORT_BATCH_SIZE)
+
+        for row in query:
+            yield row._asdict()
+    finally:
+        db.close()
+
+
 @router.get("/export")
 async def export_logs(
     level: Optional[str] = None,
     node_id: Optional[str] = None,
     project_id: Optional[str] = None,
     hours: int = 24,
-    format: str = "json"
+    format: str = "ndjson",
+    compression: str = "none"
 ):
     """
     导出日志
+    以流的形式输出 NDJSON / CSV / Parquet，可选 gzip / zstd 压缩
     """
-    filtered_logs = mock_logs
-    
-    # 应用过滤条件
-    if level:
-        filtered_logs = [log for log in filtered_logs if log["level"] == level.upper()]
-    
-    if node_id:
-        filtered_logs = [log for log in filtered_logs if log["node_id"] == node_id]
-    
-    if project_id:
-        filtered_logs = [log for log in filtered_logs if log["project_id"] == project_id]
-    
-    # 按时间过滤
+    # 兼容旧的 json 参数
+    export_format = "ndjson" if format == "json" else format
+
+    try:
+        validate_export_options(export_format, compression)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     cutoff_time = datetime.now() - timedelta(hours=hours)
-    filtered_logs = [log for log in filtered_logs if log["timestamp"] >= cutoff_time]
-    
-    # 按时间排序
-    filtered_logs.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    if format == "csv":
-        # 模拟CSV导出
-        csv_content = "timestamp,level,message,node_id,project_id\n"
-        for log in filtered_logs:
-            csv_content += f"{log['timestamp'].isoformat()},{log['level']},{log['message']},{log['node_id']},{log['project_id']}\n"
-        
-        return {
-            "format": "csv",
-            "content": csv_content,
-            "filename": f"logs_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        }
-    else:
-        # JSON格式
-        return {
-            "format": "json",
-            "logs": [LogEntry(**log) for log in filtered_logs],
-            "total": len(filtered_logs),
-            "exported_at": datetime.now().isoformat()
-        }
+    rows = iter_log_rows(level, node_id, project_id, cutoff_time)
+
+    return StreamingResponse(
+        stream_export(rows, LOG_EXPORT_SCHEMA, export_format, compression),
+        media_type=export_media_type(export_format, compression),
+        headers=export_headers("logs_export", export_format, compression)
+    )
 
 @router.delete("/cleanup")
 async def cleanup_logs(
     older_than_hours: int = 168,  # 默认清理7天前的日志
-    dry_run: bool = True
+    dry_run: bool = True,
+    archive: bool = True,
+    db: Session = Depends(get_db)
 ):
     """
     清理旧日志
+    archive=True 时按天把旧日志归档为列式段文件后再从热表删除（只处理完整的天），
+    archive=False 时直接删除
     """
-    global mock_logs
     cutoff_time = datetime.now() - timedelta(hours=older_than_hours)
-    
-    logs_to_delete = [log for log in mock_logs if log["timestamp"] < cutoff_time]
-    
+
+    if archive:
+        if log_archive.pa is None:
+            raise HTTPException(status_code=400, detail="Log archival requires pyarrow to be installed")
+
+        boundary = datetime(cutoff_time.year, cutoff_time.month, cutoff_time.day)
+        if dry_run:
+            partitions = log_archive.plan_partitions(db, boundary)
+            logs_to_archive = sum(count for _, count in partitions)
+            return {
+                "dry_run": True,
+                "archive": True,
+                "logs_to_archive": logs_to_archive,
+                "partitions": [{"partition_date": day.isoformat(), "row_count": count} for day, count in partitions],
+                "cutoff_time": boundary.isoformat(),
+                "message": f"Would archive {logs_to_archive} logs in {len(partitions)} daily partitions before {boundary.date().isoformat()}"
+            }
+
+        try:
+            result = await run_in_threadpool(log_archive.archive_logs_before, boundary)
+        except log_archive.ArchiveError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return {
+            "dry_run": False,
+            "archive": True,
+            "archived_logs": result["archived_logs"],
+            "segments": result["segments"],
+            "remaining_logs": db.query(Log.id).count(),
+            "cutoff_time": result["boundary"],
+            "message": f"Archived {result['archived_logs']} logs into {len(result['segments'])} segments"
+        }
+
+    old_logs = db.query(Log).filter(Log.timestamp < cutoff_time)
+
     if dry_run:
+        logs_to_delete = old_logs.count()
         return {
             "dry_run": True,
-            "logs_to_delete": len(logs_to_delete),
+            "archive": False,
+            "logs_to_delete": logs_to_delete,
             "cutoff_time": cutoff_time.isoformat(),
-            "message": f"Would delete {len(logs_to_delete)} logs older than {older_than_hours} hours"
-        }
-    else:
-        # 实际删除日志
-        original_logs = mock_logs
-        mock_logs = [log for log in original_logs if log["timestamp"] >= cutoff_time]
-        
-        return {
-            "dry_run": False,
-            "deleted_logs": len(logs_to_delete),
-            "remaining_logs": len(mock_logs),
-            "message": f"Deleted {len(logs_to_delete)} logs older than {older_than_hours} hours"
+            "message": f"Would delete {logs_to_delete} logs older than {older_than_hours} hours"
         }
 
+    # 实际删除日志
+    deleted = old_logs.delete(synchronize_session=False)
+    db.commit()
+
+    return {
+        "dry_run": False,
+        "archive": False,
+        "deleted_logs": deleted,
+        "remaining_logs": db.query(Log.id).count(),
+        "message": f"Deleted {deleted} logs older than {older_than_hours} hours"
+    }
+
 @router.get("/realtime")
-async def get_realtime_logs(limit: int = 50):
+async def get_realtime_logs(limit: int = Query(50, ge=1, le=500), db: Session = Depends(get_db)):
     """
     获取实时日志（最新的日志）
     """
-    # 获取最新的日志
-    recent_logs = sorted(mock_logs, key=lambda x: x["timestamp"], reverse=True)[:limit]
-    
+    recent_logs = db.query(Log).order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit).all()
+
     return {
-        "logs": [LogEntry(**log) for log in recent_logs],
+        "logs": [LogEntry(**_log_to_dict(log)) for log in recent_logs],
         "total": len(recent_logs),
         "timestamp": datetime.now().isoformat()
     }
+
+@router.get("/{log_id}", response_model=LogEntry)
+async def get_log(log_id: str, db: Session = Depends(get_db)):
+    """
+    获取特定日志详情
+    """
+    log = db.query(Log).filter(Log.id == int(log_id)).first() if log_id.isdigit() else None
+    if log is None:
+        raise HTTPException(status_code=404, detail="Log not found")
+    return LogEntry(**_log_to_dict(log))
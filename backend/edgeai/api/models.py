@@ -1,16 +1,40 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from ..schemas.edgeai import (
     ProjectCreateRequest,
     ProjectResponse,
-    SystemStats
+    SystemStats,
+    ModelArtifactRequest,
+    ModelPredictRequest,
+    ModelRollbackRequest,
+    ModelVersionCreateRequest
 )
 from common.schemas.common import BaseResponse
 from common.api.auth import get_current_user_id
+from common.storage.artifacts import (
+    ARTIFACT_ROOT,
+    ArtifactError,
+    ChecksumResult,
+    artifact_response,
+    checksum_worker,
+    reader_response,
+    resolve_artifact_path
+)
+from common.storage.blobstore import BlobError, BlobManifest, blob_store, blob_ref, parse_blob_ref
 from database.edgeai import get_db, User, Project, Model, Node
+from database.edgeai.database import SessionLocal
+from ..serving.evaluation import evaluation_runner
+from ..serving.checkpoints import CheckpointError, base_model, checkpoint_digest, materialize_checkpoint
+from ..serving.inference import InferenceError, ServingConfig, inference_manager
+from ..serving.registry import RegistryError, model_registry, version_dict
+from pathlib import Path
+import asyncio
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 # Database-backed models API
@@ -219,6 +243,12 @@ async def get_model_performance(model_id: str, db: Session = Depends(get_db)):
             }
         }
 
+        # 最近一次离线评估（包括进行中的任务）
+        evaluations = evaluation_runner.list(model.id, model.user_id)
+        performance_data["accuracy"] = float(model.accuracy) if model.accuracy else 0.0
+        performance_data["loss"] = float(model.loss) if model.loss else 0.0
+        performance_data["latest_evaluation"] = evaluations[0].snapshot() if evaluations else None
+
         return performance_data
     except Exception as e:
         print(f"Error in get_model_performance: {e}")
@@ -226,19 +256,26 @@ async def get_model_performance(model_id: str, db: Session = Depends(get_db)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# 客户端断开检测的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.05
+
+
+def _serving_key(model: Model) -> str:
+    return f"edgeai:{model.id}"
+
+
 @router.post("/{model_id}/deploy", response_model=BaseResponse)
-async def deploy_model(model_id: str, deployment_config: dict = None, db: Session = Depends(get_db)):
+async def deploy_model(
+    model_id: str,
+    deployment_config: dict = None,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
-    部署模型
+    部署模型：启动本地推理工作进程并加载模型当前版本的制品（没有制品时加载项目的基础模型）
+    deployment_config 可指定 backend（已注册的后端名称）、max_batch_size、max_wait_ms、num_workers 等
     """
-    try:
-        model_id_int = int(model_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid model ID format")
-
-    model = db.query(Model).filter(Model.id == model_id_int).first()
-    if not model:
-        raise HTTPException(status_code=404, detail="Model not found")
+    model = _get_user_model(db, model_id, current_user_id)
 
     if model.status == "error":
         return BaseResponse(
@@ -246,7 +283,21 @@ async def deploy_model(model_id: str, deployment_config: dict = None, db: Sessio
             error="Cannot deploy model with error status. Please fix issues first."
         )
 
-    # Update model status to deployed
+    project = db.query(Project).filter(Project.id == model.project_id).first() if model.project_id else None
+    try:
+        config = ServingConfig.from_dict(deployment_config)
+        digest = checkpoint_digest(db, model)
+        if digest:
+            # 当前版本的制品，解压为模型目录
+            config.model_name_or_path = str(await asyncio.to_thread(materialize_checkpoint, digest))
+        else:
+            config.model_name_or_path = base_model(project)
+        server = await inference_manager.deploy(_serving_key(model), config)
+    except (InferenceError, CheckpointError) as e:
+        if e.status_code >= 500:
+            logger.error(f"Failed to deploy model {model_id}: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
     model.status = "deployed"
     db.commit()
 
@@ -254,42 +305,493 @@ async def deploy_model(model_id: str, deployment_config: dict = None, db: Sessio
         success=True,
         message=f"Model {model.name} deployed successfully",
         data={
-            "deployment_id": f"deploy-{uuid.uuid4().hex[:8]}",
+            "deployment_id": server.deployment_id,
             "model_id": model_id,
             "status": "deployed",
+            "config": server.status()["config"],
             "endpoints": [
-                f"https://api.edgeai.com/models/{model_id}/predict",
-                f"https://api.edgeai.com/models/{model_id}/batch-predict"
+                f"/api/edgeai/models/{model_id}/predict",
+                f"/api/edgeai/models/{model_id}/serving/metrics"
             ]
         }
     )
 
-@router.get("/{model_id}/download")
-async def download_model(model_id: str, db: Session = Depends(get_db)):
+@router.post("/{model_id}/undeploy", response_model=BaseResponse)
+async def undeploy_model(
+    model_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
-    下载模型文件
+    取消部署：停止推理工作进程，排队中的请求返回 503
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+
+    stopped = await inference_manager.undeploy(_serving_key(model))
+    if model.status == "deployed":
+        model.status = "trained"
+        db.commit()
+
+    return BaseResponse(
+        success=True,
+        message=f"Model {model.name} undeployed successfully",
+        data={"model_id": model_id, "status": model.status, "stopped_workers": stopped}
+    )
+
+def _get_server(db: Session, model_id: str, user_id: int):
+    """当前用户的模型对应的推理服务"""
+    model = _get_user_model(db, model_id, user_id)
+    # 推理可能排队较久，先归还数据库连接
+    db.close()
+    server = inference_manager.get(_serving_key(model))
+    if server is None:
+        raise HTTPException(status_code=503, detail="Model is not being served. Deploy it first.")
+    return server
+
+async def _predict_until_disconnect(request: Request, server, item, parameters: dict, request_id: str, timeout: Optional[float]):
+    """等待推理结果；客户端断开时取消尚未发送的请求"""
+    task = asyncio.ensure_future(server.predict(item, parameters, request_id=request_id, timeout=timeout))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            server.cancel(request_id)
+
+@router.post("/{model_id}/predict")
+async def predict(
+    model_id: str,
+    body: ModelPredictRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
     """
+    推理：每个输入进入部署的请求队列，与并发请求合并为一批计算
+    """
+    server = _get_server(db, model_id, current_user_id)
+    batched = isinstance(body.inputs, list)
+    items = body.inputs if batched else [body.inputs]
+    if not items:
+        raise HTTPException(status_code=400, detail="inputs must not be empty")
+    if len(items) > server.config.max_queue_size:
+        raise HTTPException(status_code=400, detail=f"At most {server.config.max_queue_size} inputs per request")
+
+    base_id = body.request_id or uuid.uuid4().hex[:12]
+    request_ids = [f"{base_id}-{index}" for index in range(len(items))] if batched else [base_id]
+    started = asyncio.get_running_loop().time()
+    try:
+        outputs = await asyncio.gather(*(
+            _predict_until_disconnect(request, server, item, body.parameters, request_id, body.timeout)
+            for item, request_id in zip(items, request_ids)
+        ))
+    except InferenceError as e:
+        for request_id in request_ids:
+            server.cancel(request_id)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    return {
+        "request_id": base_id,
+        "model_id": model_id,
+        "outputs": outputs if batched else outputs[0],
+        "latency_ms": round((asyncio.get_running_loop().time() - started) * 1000, 2)
+    }
+
+@router.delete("/{model_id}/predict/{request_id}", response_model=BaseResponse)
+async def cancel_prediction(
+    model_id: str,
+    request_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    取消排队中的推理请求（输入为列表时取消所有 request_id-N）
+    """
+    server = _get_server(db, model_id, current_user_id)
+    cancelled = server.cancel(request_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="No pending request with this ID")
+    return BaseResponse(success=True, message="Request cancelled", data={"request_id": request_id, "cancelled": cancelled})
+
+@router.get("/{model_id}/serving/metrics")
+async def get_serving_metrics(
+    model_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    推理服务指标：吞吐量、延迟分位数、排队时间和批大小分布
+    """
+    return _get_server(db, model_id, current_user_id).status()
+
+def _get_user_model(db: Session, model_id: str, user_id: int) -> Model:
     try:
         model_id_int = int(model_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid model ID format")
 
-    model = db.query(Model).filter(Model.id == model_id_int).first()
+    model = db.query(Model).filter(Model.id == model_id_int, Model.user_id == user_id).first()
     if not model:
         raise HTTPException(status_code=404, detail="Model not found")
+    return model
 
-    # 模拟文件下载响应
-    download_info = {
-        "model_id": model_id,
-        "model_name": model.name,
-        "download_url": f"https://cdn.edgeai.com/models/{model_id}/download",
-        "file_size": f"{model.size} MB",
-        "format": "zip",
-        "expires_at": "2024-01-16T10:30:00Z",
-        "checksum": f"sha256:{uuid.uuid4().hex}",
-        "download_instructions": "Use the provided URL to download the model package. The download link expires in 24 hours."
+
+def _fresh_checksum(model: Model, size: int, mtime: float) -> Optional[str]:
+    """已登记的校验和仍与当前文件一致时返回，文件被替换过则返回 None"""
+    if model.sha256 and model.artifact_size == size and model.artifact_mtime is not None and abs(model.artifact_mtime - mtime) < 1e-6:
+        return model.sha256
+    return None
+
+
+def _schedule_checksum(model_id: int, path):
+    """在后台线程中计算模型文件的 SHA-256 并写入数据库"""
+    def store(result: ChecksumResult):
+        db = SessionLocal()
+        try:
+            db.query(Model).filter(Model.id == model_id).update({
+                Model.sha256: result.sha256,
+                Model.artifact_size: result.size,
+                Model.artifact_mtime: result.mtime
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    checksum_worker.submit(("model", model_id), path, store)
+
+
+def _staging_dir(user_id: int) -> Path:
+    """用户自己的暂存目录：只有这里的文件可以在导入后删除（EDGEAI_ARTIFACT_ROOT 由所有用户共享）"""
+    return ARTIFACT_ROOT.resolve() / "staging" / str(user_id)
+
+
+def _schedule_ingest(model_id: int, path, file_path: str, keep_source: bool):
+    """
+    在后台线程中把模型文件导入内容寻址存储（同时得到 SHA-256）
+    完成后模型改为引用 blob:<sha256>；keep_source 为 False 且没有其他模型登记同一文件时删除原文件
+    """
+    def store(manifest: BlobManifest):
+        db = SessionLocal()
+        try:
+            blob_store.register(db, manifest)
+            updated = db.query(Model).filter(Model.id == model_id, Model.file_path == file_path).update({
+                Model.file_path: blob_ref(manifest.digest),
+                Model.sha256: manifest.digest,
+                Model.artifact_size: manifest.size,
+                Model.artifact_mtime: None
+            }, synchronize_session=False)
+            db.commit()
+            if not updated:
+                # 导入期间模型被删除或重新登记了其他文件
+                blob_store.release(db, manifest.digest)
+                return
+            if keep_source or db.query(Model.id).filter(Model.file_path == file_path).first() is not None:
+                return
+        finally:
+            db.close()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    blob_store.submit_ingest(("model", model_id), path, store)
+
+
+def _release_blob(db: Session, model: Model):
+    digest = parse_blob_ref(model.file_path)
+    if digest:
+        blob_store.release(db, digest)
+
+
+def _blob_info(db: Session, model: Model, digest: str) -> dict:
+    try:
+        blob = blob_store.get(db, digest)
+    except BlobError as e:
+        raise HTTPException(status_code=404, detail=f"Model artifact not available: {e}")
+    return {
+        "model_id": str(model.id),
+        "file_path": model.file_path,
+        "size_bytes": blob.size,
+        "sha256": digest,
+        "checksum_status": "ready",
+        "storage": "blob",
+        "chunks": len(blob.chunks or []),
+        "manifest_url": f"/api/common/blobs/{digest}",
+        "download_url": f"/api/edgeai/models/{model.id}/download"
+    }
+
+
+def _artifact_info(model: Model, path) -> dict:
+    stat = path.stat()
+    sha256 = _fresh_checksum(model, stat.st_size, stat.st_mtime)
+    if sha256:
+        checksum_status = "ready"
+    elif checksum_worker.is_pending(("model", model.id)):
+        checksum_status = "pending"
+    elif blob_store.is_pending(("model", model.id)):
+        checksum_status = "storing"
+    else:
+        checksum_status = "stale" if model.sha256 else "missing"
+    return {
+        "model_id": str(model.id),
+        "file_path": model.file_path,
+        "size_bytes": stat.st_size,
+        "sha256": sha256,
+        "checksum_status": checksum_status,
+        "storage": "file",
+        "download_url": f"/api/edgeai/models/{model.id}/download"
+    }
+
+
+@router.post("/{model_id}/artifact", response_model=BaseResponse)
+async def register_model_artifact(
+    model_id: str,
+    artifact: ModelArtifactRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    登记模型文件
+    文件必须位于 EDGEAI_ARTIFACT_ROOT 下；后台线程把文件导入内容寻址存储，
+    与已有模型相同的块不再重复保存，SHA-256 在导入时一并计算
+    默认保留原文件，keep_source 为 False 时只允许登记当前用户暂存目录（staging/<用户 ID>/）中的文件
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    try:
+        path = resolve_artifact_path(artifact.file_path)
+    except ArtifactError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not artifact.keep_source and _staging_dir(current_user_id) not in path.parents:
+        raise HTTPException(status_code=400, detail=f"keep_source=false is only allowed for files under staging/{current_user_id}/")
+
+    _release_blob(db, model)
+    model.file_path = artifact.file_path
+    model.size = round(path.stat().st_size / (1024 * 1024), 2)
+    model.sha256 = None
+    model.artifact_size = None
+    model.artifact_mtime = None
+    db.commit()
+
+    _schedule_ingest(model.id, path, artifact.file_path, artifact.keep_source)
+
+    return BaseResponse(
+        success=True,
+        message=f"Artifact registered for {model.name}, it is being stored",
+        data=_artifact_info(model, path)
+    )
+
+@router.get("/{model_id}/artifact")
+async def get_model_artifact(
+    model_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    获取模型文件信息（大小、SHA-256 及其计算状态）
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    digest = parse_blob_ref(model.file_path)
+    if digest:
+        return _blob_info(db, model, digest)
+    try:
+        path = resolve_artifact_path(model.file_path)
+    except ArtifactError as e:
+        raise HTTPException(status_code=404, detail=f"Model artifact not available: {e}")
+    return _artifact_info(model, path)
+
+@router.get("/{model_id}/download")
+async def download_model(
+    model_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    下载模型文件
+    支持 Range / If-Range 断点续传；ETag 为强 ETag，X-Checksum-SHA256 为登记时计算的校验和
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    digest = parse_blob_ref(model.file_path)
+    if digest:
+        try:
+            reader = blob_store.open(db, digest)
+        except BlobError as e:
+            raise HTTPException(status_code=404, detail=f"Model artifact not available: {e}")
+        return reader_response(request, reader, reader.size, digest, filename=f"{model.name}-{model.version}")
+
+    try:
+        path = resolve_artifact_path(model.file_path)
+    except ArtifactError as e:
+        raise HTTPException(status_code=404, detail=f"Model artifact not available: {e}")
+
+    stat = path.stat()
+    sha256 = _fresh_checksum(model, stat.st_size, stat.st_mtime)
+    if sha256 is None:
+        # 文件登记后被替换或尚未计算，后台重新计算，本次下载不带校验和
+        _schedule_checksum(model.id, path)
+
+    suffix = path.suffix or ""
+    return artifact_response(request, path, filename=f"{model.name}-{model.version}{suffix}", sha256=sha256)
+
+@router.get("/{model_id}/versions")
+async def list_model_versions(
+    model_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[int] = Query(None, description="分页游标：上一页最后一个版本号"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    版本列表（按版本号倒序，只读元数据，不访问制品）
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    versions = model_registry.list_versions(db, model.id, limit, before)
+    return {
+        "model_id": model.id,
+        "current_version_id": model.current_version_id,
+        "total": model_registry.count(db, model.id),
+        "versions": [version_dict(version, model.current_version_id) for version in versions],
+        "next_before": versions[-1].version if len(versions) == limit else None
+    }
+
+@router.post("/{model_id}/versions", status_code=201)
+async def create_model_version(
+    model_id: str,
+    body: ModelVersionCreateRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    把模型当前的制品和指标登记为新版本
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    try:
+        version = model_registry.create_version(
+            db, model,
+            metrics=body.metrics,
+            description=body.description,
+            parent_version=body.parent_version,
+            parent_id=body.parent_id,
+            set_current=body.set_current
+        )
+    except RegistryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return version_dict(version, model.current_version_id)
+
+@router.get("/{model_id}/versions/latest")
+async def get_latest_model_version(
+    model_id: str,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    最新登记的版本
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    version = model_registry.latest(db, model.id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Model has no versions")
+    return version_dict(version, model.current_version_id)
+
+@router.get("/{model_id}/versions/best")
+async def get_best_model_version(
+    model_id: str,
+    metric: str = Query("accuracy", description="accuracy（越大越好）或 loss（越小越好）"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    指定指标最优的版本
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    try:
+        version = model_registry.best(db, model.id, metric)
+    except RegistryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if version is None:
+        raise HTTPException(status_code=404, detail=f"No version has {metric} recorded")
+    return version_dict(version, model.current_version_id)
+
+def _get_version(db: Session, model: Model, version: int):
+    try:
+        return model_registry.get(db, model.id, version)
+    except RegistryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.get("/{model_id}/versions/{version}")
+async def get_model_version(
+    model_id: str,
+    version: int,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    单个版本的元数据
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    return version_dict(_get_version(db, model, version), model.current_version_id)
+
+@router.get("/{model_id}/versions/{version}/lineage")
+async def get_model_version_lineage(
+    model_id: str,
+    version: int,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    版本血缘：沿父版本向上的祖先链（可能跨模型）以及直接派生的子版本
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    record = _get_version(db, model, version)
+    ancestors = model_registry.lineage(db, record)
+    return {
+        "version": version_dict(record, model.current_version_id),
+        "ancestors": [
+            {**version_dict(ancestor, model.current_version_id), "depth": depth}
+            for ancestor, depth in ancestors if depth > 0
+        ],
+        "children": [version_dict(child, model.current_version_id) for child in model_registry.children(db, record)]
+    }
+
+@router.get("/{model_id}/versions/{version}/download")
+async def download_model_version(
+    model_id: str,
+    version: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    下载指定版本的制品，支持 Range / If-Range
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    record = _get_version(db, model, version)
+    try:
+        reader = model_registry.open_artifact(db, record)
+    except RegistryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return reader_response(request, reader, reader.size, record.artifact_digest, filename=f"{model.name}-{record.version}")
+
+@router.post("/{model_id}/rollback")
+async def rollback_model(
+    model_id: str,
+    body: ModelRollbackRequest,
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    回滚到指定版本：只切换当前版本指针，不复制制品；已部署的模型需要重新部署才会加载新版本
+    """
+    model = _get_user_model(db, model_id, current_user_id)
+    try:
+        version = model_registry.rollback(db, model, body.version)
+    except RegistryError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return {
+        "model_id": model.id,
+        "current_version": version_dict(version, model.current_version_id),
+        "redeploy_required": model.status == "deployed"
     }
-    return download_info
 
 @router.post("/{model_id}/export", response_model=BaseResponse)
 async def export_model(model_id: str, export_config: dict = None, db: Session = Depends(get_db)):
@@ -355,10 +857,19 @@ async def delete_model(
         )
 
     # Delete the model
+    _release_blob(db, model)
+    model_registry.release_artifacts(db, model)
     db.delete(model)
     db.commit()
 
     return BaseResponse(
         success=True,
         message="Model deleted successfully"
-    )
\ No newline at end of file
+    )
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭事件 - 停止推理服务、校验和与导入后台线程"""
+    await inference_manager.shutdown()
+    checksum_worker.shutdown()
+    blob_store.shutdown()
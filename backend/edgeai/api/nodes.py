@@ -11,9 +11,8 @@ from ..schemas.edgeai import (
 from pydantic import BaseModel
 from common.schemas.common import BaseResponse
 from common.api.auth import get_current_user_id
-from database.edgeai import get_db, User, Project, Model, Node, Cluster
+from database.edgeai import get_db, User, Node, Cluster
 import asyncio
-import json
 import random
 from datetime import datetime, timedelta
 import httpx
@@ -25,6 +24,9 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(ROOT_DIR))
 from config.remote_api import REMOTE_API_CONFIG, get_remote_api_url
+from common.utils.serialization import model_response, send_json
+from ..cache.response_cache import response_cache
+from ..visualization.topology import load_project_topology, node_role
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -206,7 +208,8 @@ async def get_nodes(
         )
         result.append(node_response)
 
-    return result
+    # 节点数据已由 NodeResponse 构造校验，直接序列化，跳过 response_model 的二次校验
+    return model_response(result, List[NodeResponse])
 
 @router.get("/{node_id}", response_model=NodeResponse)
 async def get_node(
@@ -550,18 +553,19 @@ async def get_node_metrics(
 async def node_websocket(websocket: WebSocket, node_id: str):
     """
     节点实时监控WebSocket
+    连接参数 encoding=msgpack 时发送 msgpack 二进制帧，否则发送 JSON 文本帧
     """
     await websocket.accept()
     
     try:
         node_id_int = int(node_id)
     except ValueError:
-        await websocket.send_text(json.dumps({
+        await send_json(websocket, {
             "type": "error",
             "payload": {
                 "message": "Invalid node ID format"
             }
-        }))
+        })
         await websocket.close()
         return
     
@@ -575,12 +579,12 @@ async def node_websocket(websocket: WebSocket, node_id: str):
                 node = db.query(Node).filter(Node.id == node_id_int).first()
                 
                 if not node:
-                    await websocket.send_text(json.dumps({
+                    await send_json(websocket, {
                         "type": "error",
                         "payload": {
                             "message": "Node not found"
                         }
-                    }))
+                    })
                     break
                 
                 # 计算最后在线时间
@@ -599,7 +603,7 @@ async def node_websocket(websocket: WebSocket, node_id: str):
                 
                 # 发送更新数据，检查连接状态
                 try:
-                    await websocket.send_text(json.dumps({
+                    await send_json(websocket, {
                         "type": "node_update",
                         "payload": {
                             "id": node_id,
@@ -612,7 +616,7 @@ async def node_websocket(websocket: WebSocket, node_id: str):
                             "total_epochs": None,    # 暂时设为None，后续可以从训练信息中获取
                             "last_seen": last_seen
                         }
-                    }))
+                    })
                 except Exception:
                     # WebSocket已关闭，退出循环
                     break
@@ -883,44 +887,39 @@ async def delete_node(
 
 @router.get("/visualization/{project_id}/")
 async def get_visualization_nodes(
-    project_id: str, 
+    project_id: str,
+    request: Request,
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
     """
     获取特定项目的可视化节点数据（从数据库获取真实数据）
-    只能访问当前用户的项目
+    只能访问当前用户的项目；响应按 (用户, 项目) 缓存，相关数据变更后自动失效
     """
     try:
         project_id_int = int(project_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid project ID format")
 
+    return response_cache.respond(
+        request,
+        ("nodes.visualization", current_user_id, project_id_int),
+        project_id_int,
+        lambda: _build_visualization_nodes(project_id, project_id_int, current_user_id, db)
+    )
+
+
+def _build_visualization_nodes(project_id: str, project_id_int: int, current_user_id: int, db: Session) -> dict:
+    """构建项目可视化节点数据"""
     try:
-        # 获取项目信息
-        project = db.query(Project).filter(
-            Project.id == project_id_int,
-            Project.user_id == current_user_id
-        ).first()
-        if not project:
+        # 一次性加载项目、模型、集群和节点，节点严格限定在项目自己的集群内
+        topology = load_project_topology(db, project_id_int, current_user_id)
+        if not topology:
             raise HTTPException(status_code=404, detail="Project not found")
 
-        # 获取项目关联的真实节点数据 - 修复JOIN查询
-        project_nodes = []
-        try:
-            # 先尝试通过cluster关联查询
-            project_nodes = db.query(Node).join(Cluster).filter(Cluster.project_id == project_id_int).all()
-        except Exception:
-            # 如果JOIN失败，直接查询所有节点作为fallback
-            project_nodes = db.query(Node).all()
-
-        # 获取项目关联的模型数据
-        project_models = []
-        try:
-            project_models = db.query(Model).filter(Model.project_id == project_id_int).all()
-        except Exception:
-            # 如果模型查询失败，使用空列表
-            project_models = []
+        project = topology.project
+        project_nodes = topology.nodes
+        project_models = topology.models
 
         # 构建可视化节点数据
         visualization_nodes = []
@@ -933,7 +932,7 @@ async def get_visualization_nodes(
                     "name": node.name or f"Node {node.id}",
                     "type": "training",
                     "status": node.state or "idle",
-                    "role": node.role or "worker",
+                    "role": node_role(node),
                     "user": "EdgeAI System",
                     "ip_address": node.path_ipv4 or "Unknown",
                     "connected_nodes": f"{len(project_nodes)} nodes",
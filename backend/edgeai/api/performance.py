@@ -1,9 +1,19 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from ..schemas.edgeai import PerformanceMetrics
 from common.schemas.common import BaseResponse
+from common.utils.serialization import FastJSONResponse
+from common.utils.export import (
+    ExportError,
+    stream_export,
+    validate_export_options,
+    export_headers,
+    export_media_type
+)
 from database.edgeai import get_db, User, Project, Model, Node
+from database.edgeai.database import SessionLocal
 from datetime import datetime, timedelta
 import random
 
@@ -378,7 +388,7 @@ async def get_system_health():
     
     return health_status
 
-@router.get("/realtime")
+@router.get("/realtime", response_class=FastJSONResponse)
 async def get_realtime_performance(db: Session = Depends(get_db)):
     """
     获取实时性能数据 - 基于数据库中的真实节点
@@ -473,7 +483,8 @@ async def get_realtime_performance(db: Session = Depends(get_db)):
     else:
         avg_cpu = avg_memory = total_alerts = healthy_nodes = 0
 
-    return {
+    # 直接返回响应对象，跳过 jsonable_encoder 对整个节点列表的逐项遍历
+    return FastJSONResponse({
         "timestamp": current_time.isoformat(),
         "cluster_stats": {
             "total_nodes": len(realtime_data),
@@ -484,7 +495,82 @@ async def get_realtime_performance(db: Session = Depends(get_db)):
             "total_active_alerts": total_alerts
         },
         "nodes": realtime_data
-    }
+    })
+
+# 节点资源指标导出列定义
+METRICS_EXPORT_SCHEMA = {
+    "node_id": "int",
+    "node_name": "string",
+    "node_ip": "string",
+    "cluster_id": "int",
+    "state": "string",
+    "cpu_usage": "float",
+    "memory_usage": "float",
+    "disk_usage": "float",
+    "sent": "float",
+    "received": "float",
+    "heartbeat": "string",
+    "last_updated_time": "timestamp",
+}
+
+# 服务端游标每批拉取的行数
+EXPORT_BATCH_SIZE = 1000
+
+
+def iter_node_metric_rows(cluster_id: Optional[int], state: Optional[str]):
+    """
+    通过服务端游标逐批读取节点资源指标
+    使用独立的数据库会话，保证在响应流式输出期间会话一直有效
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(
+            Node.id.label("node_id"),
+            Node.name.label("node_name"),
+            Node.path_ipv4.label("node_ip"),
+            Node.cluster_id,
+            Node.state,
+            Node.cpu_usage,
+            Node.memory_usage,
+            Node.disk_usage,
+            Node.sent,
+            Node.received,
+            Node.heartbeat,
+            Node.last_updated_time
+        )
+
+        if cluster_id is not None:
+            query = query.filter(Node.cluster_id == cluster_id)
+        if state:
+            query = query.filter(Node.state == state)
+
+        for row in query.order_by(Node.id).yield_per(EXPORT_BATCH_SIZE):
+            yield row._asdict()
+    finally:
+        db.close()
+
+
+@router.get("/export")
+async def export_performance_metrics(
+    cluster_id: Optional[int] = None,
+    state: Optional[str] = None,
+    format: str = "ndjson",
+    compression: str = "none"
+):
+    """
+    导出节点资源指标
+    以流的形式输出 NDJSON / CSV / Parquet，可选 gzip / zstd 压缩
+    """
+    try:
+        validate_export_options(format, compression)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        stream_export(iter_node_metric_rows(cluster_id, state), METRICS_EXPORT_SCHEMA, format, compression),
+        media_type=export_media_type(format, compression),
+        headers=export_headers("metrics_export", format, compression)
+    )
 
 @router.get("/simulate")
 async def simulate_performance_event(db: Session = Depends(get_db)):
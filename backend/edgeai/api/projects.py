@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from ..schemas.edgeai import (
@@ -12,7 +12,10 @@ from ..schemas.edgeai import (
 )
 from common.schemas.common import BaseResponse, PaginatedResponse
 from common.api.auth import get_current_user_id
-from database.edgeai import get_db, User, Project, Model, Node, Cluster
+from database.edgeai import get_db, User, Project, Node, Cluster
+from common.utils.serialization import model_response
+from ..cache.response_cache import response_cache
+from ..visualization.topology import load_project_topology, node_role
 import uuid
 from datetime import datetime, timedelta
 
@@ -91,7 +94,8 @@ async def get_projects(
         )
         result.append(project_response)
 
-    return result
+    # 已由 ProjectResponse 构造校验，直接序列化，跳过 response_model 的二次校验
+    return model_response(result, List[ProjectResponse])
 
 @router.get("/{project_id}/", response_model=ProjectResponse)
 async def get_project(
@@ -472,34 +476,38 @@ async def export_project(
 
 @router.get("/{project_id}/visualization")
 async def get_project_visualization(
-    project_id: str, 
+    project_id: str,
+    request: Request,
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
     """
     获取项目的完整可视化数据，包括项目详情、关联的模型和节点
-    只能访问当前用户的项目
+    只能访问当前用户的项目；响应按 (用户, 项目) 缓存，相关数据变更后自动失效
     """
     try:
         project_id_int = int(project_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid project ID format")
 
-    project = db.query(Project).filter(
-        Project.id == project_id_int,
-        Project.user_id == current_user_id
-    ).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
+    return response_cache.respond(
+        request,
+        ("projects.visualization", current_user_id, project_id_int),
+        project_id_int,
+        lambda: _build_project_visualization(project_id_int, current_user_id, db)
+    )
 
-    # 获取关联的模型
-    models = db.query(Model).filter(Model.project_id == project.id).all()
 
-    # 获取关联的集群
-    nodes = []
-    clusters = db.query(Cluster).filter(Cluster.project_id == project.id).all()
-    for cluster in clusters:
-        nodes.extend(db.query(Node).filter(Node.cluster_id == cluster.id).all())
+def _build_project_visualization(project_id_int: int, current_user_id: int, db: Session) -> dict:
+    """构建项目完整可视化数据"""
+    # 一次性加载项目、模型、集群和节点，查询次数与集群数量无关
+    topology = load_project_topology(db, project_id_int, current_user_id)
+    if not topology:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    project = topology.project
+    models = topology.models
+    nodes = topology.nodes
 
     # 构建可视化数据
     visualization_data = {
@@ -551,7 +559,8 @@ async def get_project_visualization(
                 "name": node.name,
                 "path_ipv4": node.path_ipv4,
                 "state": node.state,
-                "role": node.role,
+                "role": node_role(node),
+                "cluster_id": str(node.cluster_id) if node.cluster_id else None,
                 "progress": node.progress,
                 "cpu": node.cpu,
                 "gpu": node.gpu,
@@ -564,8 +573,9 @@ async def get_project_visualization(
         "summary": {
             "total_models": len(models),
             "total_nodes": len(nodes),
-            "training_nodes": len([n for n in nodes if n.state == "training"]),
-            "active_models": len([m for m in models if m.status in ["training", "trained"]])
+            "total_clusters": len(topology.clusters),
+            "training_nodes": topology.training_nodes,
+            "active_models": topology.active_models
         }
     }
 
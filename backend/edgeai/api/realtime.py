@@ -0,0 +1,98 @@
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
+from common.api.auth import get_current_user_id
+from common.utils.serialization import send_json, receive_json
+from database.edgeai import User
+from database.edgeai.database import SessionLocal
+from ..realtime.hub import realtime_hub, Subscriber
+import logging
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _authenticate(token: str):
+    """WebSocket 无法携带 Authorization 头，通过 token 连接参数认证"""
+    if not token:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(User.id).filter(User.active_token == token).first()
+        return user[0] if user else None
+    finally:
+        db.close()
+
+
+@router.websocket("/ws")
+async def realtime_websocket(websocket: WebSocket):
+    """
+    多路复用的实时订阅WebSocket
+    连接参数: token=<用户token>，encoding=msgpack 时收发 msgpack 二进制帧
+    客户端消息:
+      {"op": "subscribe", "channels": ["node:1", "project:2", "logs:node:1"]}
+      {"op": "unsubscribe", "channels": [...]}
+      {"op": "resync", "channels": [...]}    序号不连续时重新获取快照
+      {"op": "ping"}
+    服务端消息: {"type": "batch", "messages": [snapshot | delta | append, ...]}，
+    每条消息带 channel 和该频道递增的 seq
+    """
+    await websocket.accept()
+
+    user_id = _authenticate(websocket.query_params.get("token", ""))
+    if user_id is None:
+        await send_json(websocket, {"type": "error", "payload": {"message": "Invalid token"}})
+        await websocket.close(code=1008)
+        return
+
+    subscriber = Subscriber(websocket, user_id)
+    realtime_hub.connect(subscriber)
+    try:
+        while True:
+            try:
+                message = await receive_json(websocket)
+            except ValueError:
+                await send_json(websocket, {"type": "error", "payload": {"message": "Invalid message"}})
+                continue
+
+            if not isinstance(message, dict):
+                await send_json(websocket, {"type": "error", "payload": {"message": "Invalid message"}})
+                continue
+
+            op = message.get("op")
+            channels = message.get("channels") or []
+            if not isinstance(channels, list) or not all(isinstance(channel, str) for channel in channels):
+                await send_json(websocket, {"type": "error", "payload": {"message": "channels must be a list of strings"}})
+                continue
+
+            if op == "subscribe":
+                rejected = await realtime_hub.subscribe(subscriber, channels)
+                if rejected:
+                    await send_json(websocket, {"type": "error", "payload": {"message": "Some channels were rejected", "channels": rejected}})
+            elif op == "unsubscribe":
+                realtime_hub.unsubscribe(subscriber, channels)
+            elif op == "resync":
+                await realtime_hub.resync(subscriber, channels)
+            elif op == "ping":
+                await send_json(websocket, {"type": "pong"})
+            else:
+                await send_json(websocket, {"type": "error", "payload": {"message": f"Unknown op: {op}"}})
+    except WebSocketDisconnect:
+        logger.info(f"Realtime WebSocket disconnected for user {user_id}")
+    except Exception as e:
+        logger.error(f"Realtime WebSocket error: {e}")
+    finally:
+        realtime_hub.disconnect(subscriber)
+
+
+@router.get("/status")
+async def get_realtime_status(current_user_id: int = Depends(get_current_user_id)):
+    """
+    获取实时订阅中心状态
+    """
+    return realtime_hub.status()
+
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭事件 - 停止实时订阅中心"""
+    await realtime_hub.stop()
@@ -1,17 +1,26 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from ..schemas.edgeai import TrainingMetrics, TrainRequest, TrainingParameters, TrainingResponse
 from common.schemas.common import BaseResponse
 from common.api.auth import get_current_user_id
-from database.edgeai import get_db, User, Project, Model, Node, TaskQueue
+from common.utils.serialization import send_json, dumps, FastJSONResponse
+from common.utils.downsample import downsample, DOWNSAMPLE_METHODS
+from database.edgeai import get_db, User, Project, Model, Node, TaskQueue, TrainingMetric
 from ..scheduler.task_scheduler import task_scheduler
+from ..monitoring.training_poller import training_poller, apply_task_status
+from ..cache.task_status_cache import task_status_cache, fetch_json, get_http_client, close_http_client
+from ..monitoring.training_metrics import record_metrics, load_series, latest_task_id
+from ..monitoring.progress_notifier import progress_notifier, metric_snapshot
 import asyncio
 import json
 import httpx
 import uuid
 from datetime import datetime, timedelta
 import logging
+import os
 import subprocess
 import sys
 
@@ -20,9 +29,6 @@ router = APIRouter()
 # Active training sessions (kept in memory for real-time tracking)
 active_training_sessions = {}
 
-# Background polling tasks
-polling_tasks = {}
-
 # Global background tasks for periodic sync
 global_sync_task = None
 
@@ -260,76 +266,6 @@ def validate_training_status(status_response):
     logger.warning(f"Unexpected status response type: {type(status_response)}, defaulting to 'running'")
     return "running"
 
-async def poll_training_status(task_id: str, project_id: str, db_session_factory):
-    """
-    Background task to poll training status and sync node data
-    """
-    logger.info(f"Starting polling for task {task_id}, project {project_id}")
-
-    while task_id in polling_tasks:
-        try:
-            # Create new database session for this background task
-            db = db_session_factory()
-
-            # Poll training status
-            status_code, status_response = await make_http_request("GET", f"{TEST_API_BASE_URL}/tasks/{task_id}")
-
-            # Validate and normalize the status
-            if status_code == 200:
-                normalized_status = validate_training_status(status_response)
-            elif status_code >= 500:
-                # TestAPI server error - keep current status or mark as failed if unknown
-                logger.warning(f"TestAPI server error (status {status_code}), keeping current project status")
-                normalized_status = None  # Don't update status on server errors
-            elif status_code == 422:
-                # Validation error - mark as failed
-                logger.warning(f"TestAPI validation error for task {task_id}")
-                normalized_status = "failed"
-            else:
-                # Other errors - mark as failed
-                logger.warning(f"TestAPI returned status {status_code} for task {task_id}")
-                normalized_status = "failed"
-
-            # Update project status in database only if we have a valid status
-            if normalized_status:
-                project = db.query(Project).filter(Project.id == int(project_id)).first()
-                if project:
-                    project.status = normalized_status
-                    # Update progress based on status
-                    if normalized_status == "completed":
-                        project.progress = round(100.0, 2)
-                    elif normalized_status == "running":
-                        project.progress = round(min(project.progress + 5.0, 95.0), 2)  # Gradual progress
-                    elif normalized_status == "failed":
-                        project.progress = round(0.0, 2)
-                    elif normalized_status == "cancelled":
-                        project.progress = round(0.0, 2)
-
-                    db.commit()
-                    logger.info(f"Updated project {project_id} status to {normalized_status}")
-
-            # Sync node data from testapi
-            await sync_nodes_from_testapi(db)
-
-            db.close()
-
-            # Check if training is completed or failed (use the normalized status)
-            if normalized_status and normalized_status in ["completed", "failed", "cancelled"]:
-                logger.info(f"Training {task_id} finished with status: {normalized_status}")
-                break
-
-            # Wait before next poll
-            await asyncio.sleep(10)  # Poll every 10 seconds
-
-        except Exception as e:
-            logger.error(f"Error in polling task {task_id}: {str(e)}")
-            await asyncio.sleep(10)  # Wait before retrying
-
-    # Cleanup
-    if task_id in polling_tasks:
-        polling_tasks.pop(task_id)
-    logger.info(f"Stopped polling for task {task_id}")
-
 async def periodic_sync_task(db_session_factory):
     """
     定期同步TestAPI数据到数据库的全局后台任务
@@ -353,32 +289,37 @@ async def periodic_sync_task(db_session_factory):
                 Project.status.in_(["training", "running"])
             ).all()
 
+            # 一次批量获取所有运行中任务的状态
+            payloads = {}
+            updates = []
+            statuses = await training_poller.fetch_statuses(
+                [project.task_id for project in running_projects if project.task_id],
+                payloads
+            )
+
             for project in running_projects:
                 if project.task_id:
                     try:
                         logger.debug(f"Checking status for project {project.id} with task_id {project.task_id}")
-                        # 获取训练状态
-                        status_code, status_response = await make_http_request(
-                            "GET", f"{TEST_API_BASE_URL}/tasks/{project.task_id}"
-                        )
+                        status_code, status_response = statuses.get(project.task_id, (502, None))
 
                         if status_code == 200:
+                            metric = None
+                            if project.task_id in payloads:
+                                metric = record_metrics(db, project.id, project.task_id, payloads[project.task_id])
+
                             normalized_status = validate_training_status(status_response)
                             if normalized_status and normalized_status != project.status:
                                 old_status = project.status
-                                project.status = normalized_status
 
                                 # 更新进度
-                                if normalized_status == "completed":
-                                    project.progress = round(100.0, 2)
-                                elif normalized_status == "running":
-                                    project.progress = round(min(project.progress + 2.0, 95.0), 2)
-                                elif normalized_status in ["failed", "cancelled"]:
-                                    project.progress = round(0.0, 2)
+                                apply_task_status(project, normalized_status, progress_step=2.0)
 
                                 logger.info(f"Updated project {project.id} status: {old_status} → {normalized_status} (progress: {project.progress}%)")
                             else:
                                 logger.debug(f"Project {project.id} status unchanged: {project.status}")
+
+                            updates.append((project.id, project.status, project.progress, metric_snapshot(metric), metric is not None))
                         else:
                             logger.warning(f"Failed to get status for project {project.id}: HTTP {status_code}")
 
@@ -389,6 +330,9 @@ async def periodic_sync_task(db_session_factory):
             db.commit()
             db.close()
 
+            for update in updates:
+                progress_notifier.publish(*update)
+
             # 等待30秒后继续下一轮同步
             await asyncio.sleep(30)
 
@@ -488,6 +432,7 @@ async def start_training_legacy(project_id: str, node_ids: List[str] = None, db:
         project.status = "training"
         project.progress = round(0.0, 2)
         db.commit()
+        progress_notifier.publish(project_id_int, "training", 0.0)
 
         session_id = f"training_{project_id}_{len(active_training_sessions)}"
 
@@ -587,10 +532,143 @@ async def get_training_metrics(project_id: str, current_user_id: int = Depends(g
         "total_epochs": latest_session["total_epochs"]
     }
 
+@router.get("/metrics/{project_id}/series", response_class=FastJSONResponse)
+async def get_training_metric_series(
+    project_id: int,
+    metric: str = Query("loss", description="指标名称，如 loss、accuracy、f1_score"),
+    width: int = Query(800, ge=3, le=10000, description="图表宽度（像素），返回的点数不超过该值"),
+    method: str = Query("lttb", description="降采样方法: lttb 或 minmax"),
+    task_id: Optional[str] = Query(None, description="训练任务ID，默认为项目最近一次训练"),
+    client_id: Optional[str] = Query(None, description="客户端ID，指定时返回该客户端的指标"),
+    x_axis: str = Query("step", description="横轴: step 或 round"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    获取持久化的训练指标曲线
+    按图表宽度降采样，长时间训练也只返回固定数量的点
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unsupported method: {method}")
+    if x_axis not in ("step", "round"):
+        raise HTTPException(status_code=400, detail=f"Unsupported x_axis: {x_axis}")
+
+    project = db.query(Project.id).filter(
+        Project.id == project_id,
+        Project.user_id == current_user_id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    task_id = task_id or latest_task_id(db, project_id)
+    if not task_id:
+        raise HTTPException(status_code=404, detail="No training metrics recorded for this project")
+
+    def build_series():
+        x, y = load_series(db, project_id, task_id, metric, x_axis=x_axis, client_id=client_id)
+        sampled_x, sampled_y = downsample(x, y, width, method)
+        return len(x), sampled_x.astype("int64").tolist(), sampled_y.tolist()
+
+    total_points, x, y = await run_in_threadpool(build_series)
+
+    return FastJSONResponse({
+        "project_id": project_id,
+        "task_id": task_id,
+        "metric": metric,
+        "client_id": client_id,
+        "x_axis": x_axis,
+        "method": method,
+        "total_points": total_points,
+        "returned_points": len(x),
+        "x": x,
+        "y": y
+    })
+
+# 长轮询最长等待时间和 SSE 保活注释间隔（秒）
+PROGRESS_LONG_POLL_MAX_WAIT = float(os.getenv("PROGRESS_LONG_POLL_MAX_WAIT", 60))
+PROGRESS_SSE_KEEPALIVE = float(os.getenv("PROGRESS_SSE_KEEPALIVE", 30))
+
+
+def _ensure_progress_snapshot(db: Session, project_id: int, user_id: int):
+    """校验项目归属；通知器中还没有该项目时（如服务刚启动）用数据库中的状态初始化"""
+    project = db.query(Project).filter(
+        Project.id == project_id,
+        Project.user_id == user_id
+    ).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    if progress_notifier.snapshot(project_id) is None:
+        latest = db.query(TrainingMetric).filter(
+            TrainingMetric.project_id == project_id
+        ).order_by(TrainingMetric.id.desc()).first()
+        progress_notifier.publish_project(project, latest)
+
+    # 等待期间不占用数据库连接
+    db.close()
+
+
+@router.get("/progress/{project_id}")
+async def poll_training_progress(
+    project_id: int,
+    since_version: int = Query(0, ge=0, description="客户端已知的版本号"),
+    wait: float = Query(30, ge=0, le=PROGRESS_LONG_POLL_MAX_WAIT, description="最长等待秒数"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    长轮询训练进度
+    项目的状态、进度或指标版本相对 since_version 发生变化时立即返回，否则最多等待 wait 秒后返回 changed=false
+    """
+    _ensure_progress_snapshot(db, project_id, current_user_id)
+    changed = await progress_notifier.wait(project_id, since_version, wait)
+    snapshot = progress_notifier.snapshot(project_id)
+    return {
+        "changed": changed,
+        "version": snapshot["version"],
+        "progress": snapshot
+    }
+
+@router.get("/progress/{project_id}/stream")
+async def stream_training_progress(
+    project_id: int,
+    request: Request,
+    since_version: Optional[int] = Query(None, ge=0, description="客户端已知的版本号，默认取 Last-Event-ID"),
+    db: Session = Depends(get_db),
+    current_user_id: int = Depends(get_current_user_id)
+):
+    """
+    训练进度 SSE 流
+    只在版本号变化时推送 progress 事件（事件 id 为版本号，断线重连时通过 Last-Event-ID 续传），
+    空闲时每 PROGRESS_SSE_KEEPALIVE 秒发送一条保活注释
+    """
+    _ensure_progress_snapshot(db, project_id, current_user_id)
+
+    if since_version is None:
+        last_event_id = request.headers.get("last-event-id", "")
+        since_version = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def event_stream():
+        version = since_version
+        while True:
+            if await progress_notifier.wait(project_id, version, PROGRESS_SSE_KEEPALIVE):
+                snapshot = progress_notifier.snapshot(project_id)
+                version = snapshot["version"]
+                yield f"id: {version}\nevent: progress\ndata: {dumps(snapshot).decode('utf-8')}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.websocket("/ws/{project_id}")
 async def training_websocket(websocket: WebSocket, project_id: str):
     """
     训练实时监控WebSocket
+    连接参数 encoding=msgpack 时发送 msgpack 二进制帧，否则发送 JSON 文本帧
     """
     await websocket.accept()
     
@@ -616,7 +694,7 @@ async def training_websocket(websocket: WebSocket, project_id: str):
                     session["metrics"]["f1_score"] = min(95.0, session["metrics"]["f1_score"] + 0.3)
                 
                 # 发送更新数据
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "training_progress",
                     "payload": {
                         "project_id": project_id,
@@ -626,16 +704,16 @@ async def training_websocket(websocket: WebSocket, project_id: str):
                         "metrics": session["metrics"],
                         "status": session["status"]
                     }
-                }))
+                })
             else:
                 # 没有活跃训练会话
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "no_training",
                     "payload": {
                         "project_id": project_id,
                         "message": "No active training session found"
                     }
-                }))
+                })
             
             await asyncio.sleep(2)  # 每2秒发送一次更新
             
@@ -849,6 +927,7 @@ async def start_training_with_api(project_id: str, db: Session = Depends(get_db)
             project.status = "training"
             project.progress = round(0.0, 2)
             db.commit()
+            progress_notifier.publish(project.id, "training", 0.0)
 
             # Store in active sessions for monitoring
             active_training_sessions[task_id] = {
@@ -859,12 +938,8 @@ async def start_training_with_api(project_id: str, db: Session = Depends(get_db)
                 "started_at": datetime.utcnow().isoformat()
             }
 
-            # Start background polling task
-            from database.edgeai.database import SessionLocal
-            polling_tasks[task_id] = asyncio.create_task(
-                poll_training_status(task_id, project_id, SessionLocal)
-            )
-            logger.info(f"Started background polling for task {task_id}")
+            # 交给共享的状态轮询器跟踪
+            training_poller.register(task_id, project_id)
 
             return TrainingResponse(
                 task_id=task_id,
@@ -889,58 +964,59 @@ async def start_training_with_api(project_id: str, db: Session = Depends(get_db)
 async def get_training_status(task_id: str, current_user_id: int = Depends(get_current_user_id)):
     """
     Get training status from test API
+    状态来自共享缓存（轮询器持续刷新），缓存过期时并发请求合并为一次远程调用；
+    Age 响应头表示状态距离从远程获取已经过去的秒数
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{TEST_API_BASE_URL}/tasks/{task_id}")
-
-            if response.status_code == 200:
-                status = response.json() if isinstance(response.json(), str) else "unknown"
-                return {"task_id": task_id, "status": status}
-            elif response.status_code == 422:
-                error_detail = response.json().get("detail", "Validation error")
-                raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
-            else:
-                raise HTTPException(status_code=500, detail=f"API error: {response.status_code}")
-
+        entry = await task_status_cache.get(
+            ("status", task_id),
+            lambda: fetch_json(f"{TEST_API_BASE_URL}/tasks/{task_id}")
+        )
     except httpx.TimeoutException:
         raise HTTPException(status_code=500, detail="API timeout")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"API connection error: {str(e)}")
 
+    if entry.status_code == 200:
+        status = entry.data if isinstance(entry.data, str) else "unknown"
+        return JSONResponse({"task_id": task_id, "status": status}, headers={"Age": str(entry.age)})
+    elif entry.status_code == 422:
+        error_detail = entry.data.get("detail", "Validation error") if isinstance(entry.data, dict) else "Validation error"
+        raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
+    else:
+        raise HTTPException(status_code=500, detail=f"API error: {entry.status_code}")
+
 @router.delete("/stop/{task_id}")
 async def stop_training_task(task_id: str, db: Session = Depends(get_db), current_user_id: int = Depends(get_current_user_id)):
     """
     Stop training task using test API
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.delete(f"{TEST_API_BASE_URL}/tasks/{task_id}")
+        response = await get_http_client().delete(f"{TEST_API_BASE_URL}/tasks/{task_id}")
 
-            if response.status_code == 200:
-                message = response.json() if isinstance(response.json(), str) else "Task stopped"
-
-                # Update local project status
-                project = db.query(Project).filter(Project.task_id == task_id).first()
-                if project:
-                    project.status = "paused"
-                    db.commit()
-
-                # Stop background polling task
-                if task_id in polling_tasks:
-                    polling_tasks[task_id].cancel()
-                    polling_tasks.pop(task_id)
-                    logger.info(f"Stopped polling task for {task_id}")
-
-                # Remove from active sessions
-                active_training_sessions.pop(task_id, None)
-
-                return {"task_id": task_id, "message": message}
-            elif response.status_code == 422:
-                error_detail = response.json().get("detail", "Validation error")
-                raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
-            else:
-                raise HTTPException(status_code=500, detail=f"API error: {response.status_code}")
+        if response.status_code == 200:
+            message = response.json() if isinstance(response.json(), str) else "Task stopped"
+            task_status_cache.invalidate(("status", task_id))
+
+            # Update local project status
+            project = db.query(Project).filter(Project.task_id == task_id).first()
+            if project:
+                project.status = "paused"
+                db.commit()
+                progress_notifier.publish_project(project)
+
+            # Stop tracking the task in the status poller
+            training_poller.unregister(task_id)
+
+            # Remove from active sessions
+            active_training_sessions.pop(task_id, None)
+
+            return {"task_id": task_id, "message": message}
+        elif response.status_code == 422:
+            error_detail = response.json().get("detail", "Validation error")
+            raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
+        else:
+            raise HTTPException(status_code=500, detail=f"API error: {response.status_code}")
 
     except httpx.TimeoutException:
         raise HTTPException(status_code=500, detail="API timeout")
@@ -967,19 +1043,14 @@ async def sync_nodes_manually(
 @router.get("/polling-status")
 async def get_polling_status(current_user_id: int = Depends(get_current_user_id)):
     """
-    Get status of all active polling tasks
+    Get status of the shared training status poller
     """
-    active_polls = []
-    for task_id, task in polling_tasks.items():
-        active_polls.append({
-            "task_id": task_id,
-            "done": task.done(),
-            "cancelled": task.cancelled()
-        })
-
+    poller_status = training_poller.status()
     return {
-        "active_polling_tasks": len(polling_tasks),
-        "details": active_polls,
+        "active_polling_tasks": poller_status["tracked_tasks"],
+        "details": poller_status["tasks"],
+        "poller": poller_status,
+        "status_cache": task_status_cache.stats(),
         "active_sessions": len(active_training_sessions)
     }
 
@@ -1013,7 +1084,7 @@ async def get_sync_status(current_user_id: int = Depends(get_current_user_id)):
     global global_sync_task
     return {
         "global_sync_active": global_sync_task is not None and not global_sync_task.done(),
-        "active_polling_tasks": len(polling_tasks),
+        "active_polling_tasks": len(training_poller.tracked_tasks),
         "active_sessions": len(active_training_sessions)
     }
 
@@ -1048,7 +1119,7 @@ async def health_check(current_user_id: int = Depends(get_current_user_id)):
             "database": {
                 "status": "healthy" if db_health else "unhealthy"
             },
-            "active_tasks": len(polling_tasks),
+            "active_tasks": len(training_poller.tracked_tasks),
             "active_sessions": len(active_training_sessions)
         }
 
@@ -1065,25 +1136,27 @@ async def health_check(current_user_id: int = Depends(get_current_user_id)):
 async def get_training_monitor(task_id: str, current_user_id: int = Depends(get_current_user_id)):
     """
     Get training progress from test API
+    与状态接口共用缓存和请求合并，Age 响应头表示数据的新鲜程度
     """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{TEST_API_BASE_URL}/monitor/{task_id}")
-
-            if response.status_code == 200:
-                monitor_data = response.json() if isinstance(response.json(), str) else "No monitor data"
-                return {"task_id": task_id, "monitor_data": monitor_data}
-            elif response.status_code == 422:
-                error_detail = response.json().get("detail", "Validation error")
-                raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
-            else:
-                raise HTTPException(status_code=500, detail=f"API error: {response.status_code}")
-
+        entry = await task_status_cache.get(
+            ("monitor", task_id),
+            lambda: fetch_json(f"{TEST_API_BASE_URL}/monitor/{task_id}")
+        )
     except httpx.TimeoutException:
         raise HTTPException(status_code=500, detail="API timeout")
     except httpx.RequestError as e:
         raise HTTPException(status_code=500, detail=f"API connection error: {str(e)}")
 
+    if entry.status_code == 200:
+        monitor_data = entry.data if isinstance(entry.data, str) else "No monitor data"
+        return JSONResponse({"task_id": task_id, "monitor_data": monitor_data}, headers={"Age": str(entry.age)})
+    elif entry.status_code == 422:
+        error_detail = entry.data.get("detail", "Validation error") if isinstance(entry.data, dict) else "Validation error"
+        raise HTTPException(status_code=422, detail=f"API validation error: {error_detail}")
+    else:
+        raise HTTPException(status_code=500, detail=f"API error: {entry.status_code}")
+
 
 # ===============================
 # 任务队列管理API接口
@@ -1290,9 +1363,11 @@ async def startup_event():
 
 @router.on_event("shutdown")
 async def shutdown_event():
-    """应用关闭事件 - 停止任务调度器"""
+    """应用关闭事件 - 停止训练状态轮询器和任务调度器"""
     try:
+        await training_poller.stop()
         await task_scheduler.stop()
+        await close_http_client()
         logger.info("Task scheduler stopped on application shutdown")
     except Exception as e:
         logger.error(f"Failed to stop task scheduler on shutdown: {e}")
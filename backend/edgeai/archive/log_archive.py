@@ -0,0 +1,333 @@
+"""
+日志归档
+将早于保留期的日志按天滚动写入本地 Arrow IPC 列式文件 (zstd 压缩)，
+在 log_segments 表中记录每个段的时间范围与节点索引，然后从热表中删除这些行。
+查询时按段索引跳过无关的段，命中的段通过内存映射读取。
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+    pc = None
+
+from database.edgeai import Log, LogSegment
+from database.edgeai.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).parent.parent.parent.parent
+
+# 归档文件目录
+LOG_ARCHIVE_DIR = Path(os.getenv("EDGEAI_LOG_ARCHIVE_DIR", str(ROOT_DIR / "data" / "log_archive")))
+# 热表保留天数，<= 0 表示不自动归档
+LOG_RETENTION_DAYS = int(os.getenv("EDGEAI_LOG_RETENTION_DAYS", 7))
+# 自动归档检查间隔（秒）
+LOG_ARCHIVE_INTERVAL = int(os.getenv("EDGEAI_LOG_ARCHIVE_INTERVAL", 3600))
+# 每个 record batch 的行数
+ARCHIVE_BATCH_SIZE = 10000
+
+# 段文件的列定义
+_SEGMENT_COLUMNS = ["id", "timestamp", "level", "category", "node_id", "project_id", "message"]
+
+
+class ArchiveError(RuntimeError):
+    """归档依赖缺失或段文件写入失败"""
+
+
+def _segment_schema():
+    return pa.schema([
+        pa.field("id", pa.int64()),
+        pa.field("timestamp", pa.timestamp("us")),
+        pa.field("level", pa.string()),
+        pa.field("category", pa.string()),
+        pa.field("node_id", pa.string()),
+        pa.field("project_id", pa.string()),
+        pa.field("message", pa.string()),
+    ])
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    """统一为本地时间的无时区 datetime，与 datetime.now() 可直接比较"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def _day_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ArchiveError("Log archival requires pyarrow to be installed")
+
+
+def plan_partitions(db: Session, boundary: datetime) -> List[Tuple[date, int]]:
+    """
+    列出 boundary 之前的所有非空日分区及其行数（一次 GROUP BY date(timestamp) 查询）
+    boundary 应当是某一天的零点，保证只归档完整的天
+    """
+    day = func.date(Log.timestamp)
+    rows = db.query(day, func.count(Log.id)) \
+        .filter(Log.timestamp < boundary) \
+        .group_by(day).order_by(day).all()
+    # SQLite 的 date() 返回字符串
+    return [(value if isinstance(value, date) else date.fromisoformat(str(value)), count) for value, count in rows]
+
+
+def _iter_partition_batches(db: Session, day_start: datetime, day_end: datetime, stats: Dict[str, Any]):
+    """通过服务端游标读取一天的日志，按 ARCHIVE_BATCH_SIZE 组装 record batch"""
+    schema = _segment_schema()
+    query = db.query(
+        Log.id, Log.timestamp, Log.level, Log.category,
+        Log.node_id, Log.project_id, Log.message
+    ).filter(
+        Log.timestamp >= day_start,
+        Log.timestamp < day_end
+    ).order_by(Log.timestamp.asc(), Log.id.asc()).yield_per(ARCHIVE_BATCH_SIZE)
+
+    columns: Dict[str, List[Any]] = {name: [] for name in _SEGMENT_COLUMNS}
+    for row in query:
+        timestamp = _naive(row.timestamp)
+        columns["id"].append(row.id)
+        columns["timestamp"].append(timestamp)
+        columns["level"].append(row.level)
+        columns["category"].append(row.category)
+        columns["node_id"].append(row.node_id)
+        columns["project_id"].append(row.project_id)
+        columns["message"].append(row.message)
+
+        stats["rows"] += 1
+        stats["max_id"] = max(stats["max_id"], row.id)
+        if stats["min_time"] is None or timestamp < stats["min_time"]:
+            stats["min_time"] = timestamp
+        if stats["max_time"] is None or timestamp > stats["max_time"]:
+            stats["max_time"] = timestamp
+        if row.node_id:
+            stats["node_ids"].add(row.node_id)
+
+        if len(columns["id"]) >= ARCHIVE_BATCH_SIZE:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {name: [] for name in _SEGMENT_COLUMNS}
+
+    if columns["id"]:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def archive_partition(db: Session, day: date) -> Optional[LogSegment]:
+    """
+    将一天的日志写入段文件并从热表删除
+    文件先写入临时路径再原子重命名；段记录与删除在同一事务中提交，失败时删除段文件
+    """
+    require_pyarrow()
+
+    day_start = datetime(day.year, day.month, day.day)
+    day_end = day_start + timedelta(days=1)
+
+    LOG_ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+    file_name = f"logs_{day.strftime('%Y%m%d')}_{datetime.now().strftime('%Y%m%d%H%M%S%f')}.arrow"
+    final_path = LOG_ARCHIVE_DIR / file_name
+    tmp_path = final_path.with_suffix(".arrow.tmp")
+
+    stats: Dict[str, Any] = {"rows": 0, "max_id": 0, "min_time": None, "max_time": None, "node_ids": set()}
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    try:
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, _segment_schema(), options=options) as writer:
+                for batch in _iter_partition_batches(db, day_start, day_end, stats):
+                    writer.write_batch(batch)
+    except Exception as e:
+        tmp_path.unlink(missing_ok=True)
+        raise ArchiveError(f"Failed to write log segment for {day.isoformat()}: {e}") from e
+
+    if stats["rows"] == 0:
+        tmp_path.unlink(missing_ok=True)
+        return None
+
+    os.replace(tmp_path, final_path)
+
+    segment = LogSegment(
+        partition_date=day.isoformat(),
+        file_path=str(final_path),
+        row_count=stats["rows"],
+        size_bytes=final_path.stat().st_size,
+        min_time=stats["min_time"],
+        max_time=stats["max_time"],
+        node_ids=sorted(stats["node_ids"])
+    )
+    try:
+        db.add(segment)
+        # 只删除已写入段文件的行，归档期间新写入的行 id 更大，不会被误删
+        db.query(Log).filter(
+            Log.timestamp >= day_start,
+            Log.timestamp < day_end,
+            Log.id <= stats["max_id"]
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        final_path.unlink(missing_ok=True)
+        raise
+
+    logger.info(f"Archived {stats['rows']} logs for {day.isoformat()} to {final_path}")
+    return segment
+
+
+def archive_logs_before(boundary: datetime) -> Dict[str, Any]:
+    """
+    归档 boundary 所在日零点之前的全部日志
+    使用独立会话，可放在线程池中执行
+    """
+    require_pyarrow()
+    boundary = _day_start(boundary)
+
+    db = SessionLocal()
+    try:
+        archived = []
+        for day, _ in plan_partitions(db, boundary):
+            segment = archive_partition(db, day)
+            if segment is not None:
+                archived.append({
+                    "partition_date": segment.partition_date,
+                    "row_count": segment.row_count,
+                    "size_bytes": segment.size_bytes,
+                    "file_path": segment.file_path
+                })
+        return {
+            "boundary": boundary.isoformat(),
+            "segments": archived,
+            "archived_logs": sum(item["row_count"] for item in archived)
+        }
+    finally:
+        db.close()
+
+
+def run_log_retention() -> Optional[Dict[str, Any]]:
+    """按 LOG_RETENTION_DAYS 执行一次归档，供后台任务调用"""
+    if LOG_RETENTION_DAYS <= 0 or pa is None:
+        return None
+    return archive_logs_before(datetime.now() - timedelta(days=LOG_RETENTION_DAYS))
+
+
+def find_segments(
+    db: Session,
+    start_time: Optional[datetime],
+    end_time: Optional[datetime],
+    node_id: Optional[str] = None
+) -> List[LogSegment]:
+    """按段索引选出与时间范围重叠、且包含指定节点的段，按时间从新到旧排列"""
+    query = db.query(LogSegment)
+    if start_time:
+        query = query.filter(LogSegment.max_time >= start_time)
+    if end_time:
+        query = query.filter(LogSegment.min_time <= end_time)
+
+    segments = query.order_by(LogSegment.max_time.desc()).all()
+    if node_id:
+        # 节点列表存为 JSON，不同数据库的 JSON 查询语法不同，在内存中过滤
+        segments = [segment for segment in segments if node_id in (segment.node_ids or [])]
+    return segments
+
+
+def _batch_mask(batch, start_time, end_time, query, level, node_id, project_id):
+    mask = None
+
+    def combine(current, condition):
+        condition = pc.fill_null(condition, False)
+        return condition if current is None else pc.and_(current, condition)
+
+    timestamp_type = pa.timestamp("us")
+    if start_time:
+        mask = combine(mask, pc.greater_equal(batch["timestamp"], pa.scalar(start_time, timestamp_type)))
+    if end_time:
+        mask = combine(mask, pc.less_equal(batch["timestamp"], pa.scalar(end_time, timestamp_type)))
+    if level:
+        mask = combine(mask, pc.equal(batch["level"], level))
+    if node_id:
+        mask = combine(mask, pc.equal(batch["node_id"], node_id))
+    if project_id:
+        mask = combine(mask, pc.equal(batch["project_id"], project_id))
+    if query:
+        mask = combine(mask, pc.match_substring(batch["message"], query, ignore_case=True))
+    return mask
+
+
+def _read_segment_matches(path: str, **filters):
+    """内存映射读取段文件并返回过滤后的表（按时间从新到旧）"""
+    with pa.memory_map(path, "r") as source:
+        reader = pa.ipc.open_file(source)
+        matched = []
+        for index in range(reader.num_record_batches):
+            batch = reader.get_batch(index)
+            mask = _batch_mask(batch, **filters)
+            if mask is not None:
+                batch = batch.filter(mask)
+            if batch.num_rows:
+                matched.append(batch)
+
+    if not matched:
+        return None
+    table = pa.Table.from_batches(matched)
+    return table.sort_by([("timestamp", "descending")])
+
+
+def search_segments(
+    segments: List[LogSegment],
+    offset: int,
+    limit: int,
+    start_time: Optional[datetime] = None,
+    end_time: Optional[datetime] = None,
+    query: Optional[str] = None,
+    level: Optional[str] = None,
+    node_id: Optional[str] = None,
+    project_id: Optional[str] = None
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    在归档段中搜索日志
+    逐段扫描以统计总数，只保留落在 [offset, offset + limit) 区间内的行，内存只与单段命中数有关
+
+    Returns:
+        (命中总数, 当前页的记录)
+    """
+    require_pyarrow()
+
+    filters = {
+        "start_time": _naive(start_time),
+        "end_time": _naive(end_time),
+        "query": query,
+        "level": level,
+        "node_id": node_id,
+        "project_id": project_id
+    }
+
+    total = 0
+    results: List[Dict[str, Any]] = []
+    for segment in segments:
+        if not os.path.exists(segment.file_path):
+            logger.warning(f"Log segment file missing: {segment.file_path}")
+            continue
+
+        table = _read_segment_matches(segment.file_path, **filters)
+        if table is None:
+            continue
+
+        # 当前段在全部命中结果中的位置区间为 [total, total + num_rows)
+        page_start = max(offset - total, 0)
+        page_end = min(offset + limit - total, table.num_rows)
+        if page_start < page_end:
+            results.extend(table.slice(page_start, page_end - page_start).to_pylist())
+        total += table.num_rows
+
+    return total, results
+
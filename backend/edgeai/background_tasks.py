@@ -1,6 +1,6 @@
 """
 后台任务管理
-定期同步远程集群状态到本地数据库
+定期同步远程集群状态到本地数据库，按保留期归档旧日志，并回收内容寻址存储中不再引用的块
 """
 import asyncio
 import logging
@@ -16,6 +16,8 @@ sys.path.insert(0, str(ROOT_DIR))
 
 from config.remote_api import REMOTE_API_CONFIG, get_remote_api_url
 from database.edgeai import get_db, Node, Cluster
+from edgeai.archive import log_archive
+from common.storage.blobstore import blob_store, BLOB_GC_INTERVAL
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +26,8 @@ logger = logging.getLogger(__name__)
 # 全局标志，用于控制后台任务的运行
 _background_task_running = False
 _background_task: Optional[asyncio.Task] = None
+_archive_task: Optional[asyncio.Task] = None
+_blob_gc_task: Optional[asyncio.Task] = None
 
 
 async def sync_cluster_status_from_remote():
@@ -127,6 +131,66 @@ async def periodic_sync_task(interval_seconds: int = 60):
     logger.info("Periodic sync task stopped")
 
 
+async def periodic_log_archive_task(interval_seconds: int = 3600):
+    """
+    定期日志归档主循环
+    归档涉及文件写入和批量删除，放在线程池中执行以免阻塞事件循环
+
+    Args:
+        interval_seconds: 检查间隔（秒），默认3600秒
+    """
+    logger.info(f"Starting periodic log archive task (retention: {log_archive.LOG_RETENTION_DAYS}d, interval: {interval_seconds}s)")
+
+    while _background_task_running:
+        try:
+            result = await asyncio.to_thread(log_archive.run_log_retention)
+            if result and result["archived_logs"]:
+                logger.info(f"Archived {result['archived_logs']} logs into {len(result['segments'])} segments")
+
+            await asyncio.sleep(interval_seconds)
+
+        except asyncio.CancelledError:
+            logger.info("Periodic log archive task cancelled")
+            break
+        except Exception as e:
+            logger.error(f"Error in periodic log archive task: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    logger.info("Periodic log archive task stopped")
+
+
+def _collect_blob_garbage():
+    db = next(get_db())
+    try:
+        return blob_store.collect_garbage(db)
+    finally:
+        db.close()
+
+
+async def periodic_blob_gc_task(interval_seconds: int = 3600):
+    """
+    定期回收内容寻址存储中引用计数为 0 的块
+    需要遍历块目录，放在线程池中执行
+
+    Args:
+        interval_seconds: 回收间隔（秒），默认3600秒
+    """
+    logger.info(f"Starting periodic blob garbage collection task (interval: {interval_seconds}s)")
+
+    while _background_task_running:
+        try:
+            await asyncio.sleep(interval_seconds)
+            await asyncio.to_thread(_collect_blob_garbage)
+
+        except asyncio.CancelledError:
+            logger.info("Periodic blob garbage collection task cancelled")
+            break
+        except Exception as e:
+            logger.error(f"Error in periodic blob garbage collection task: {e}")
+
+    logger.info("Periodic blob garbage collection task stopped")
+
+
 async def start_background_tasks(sync_interval: int = 60):
     """
     启动后台任务
@@ -134,7 +198,7 @@ async def start_background_tasks(sync_interval: int = 60):
     Args:
         sync_interval: 同步间隔（秒），默认60秒
     """
-    global _background_task, _background_task_running
+    global _background_task, _background_task_running, _archive_task, _blob_gc_task
 
     if _background_task and not _background_task.done():
         logger.warning("Background task is already running")
@@ -143,8 +207,17 @@ async def start_background_tasks(sync_interval: int = 60):
     logger.info(f"Starting background tasks with {sync_interval}s sync interval")
 
     # 创建后台任务
+    _background_task_running = True
     _background_task = asyncio.create_task(periodic_sync_task(sync_interval))
 
+    # 日志归档任务（保留天数 <= 0 或缺少 pyarrow 时不启动）
+    if log_archive.LOG_RETENTION_DAYS > 0 and log_archive.pa is not None:
+        _archive_task = asyncio.create_task(periodic_log_archive_task(log_archive.LOG_ARCHIVE_INTERVAL))
+
+    # 内容寻址存储的垃圾回收（间隔 <= 0 时不启动）
+    if BLOB_GC_INTERVAL > 0:
+        _blob_gc_task = asyncio.create_task(periodic_blob_gc_task(BLOB_GC_INTERVAL))
+
     logger.info("Background tasks started successfully")
 
 
@@ -152,18 +225,19 @@ async def stop_background_tasks():
     """
     停止后台任务
     """
-    global _background_task, _background_task_running
+    global _background_task_running
 
     logger.info("Stopping background tasks...")
 
     _background_task_running = False
 
-    if _background_task and not _background_task.done():
-        _background_task.cancel()
-        try:
-            await _background_task
-        except asyncio.CancelledError:
-            pass
+    for task in (_background_task, _archive_task, _blob_gc_task):
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
     logger.info("Background tasks stopped successfully")
 
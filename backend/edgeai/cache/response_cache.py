@@ -0,0 +1,246 @@
+"""
+响应缓存
+缓存可视化等高频轮询接口的已编码 JSON 响应体，键为 (接口, 用户, 项目)。
+通过 SQLAlchemy Session 事件在事务提交后按项目失效：flush 时收集受影响的
+Node / Cluster / Model / Project 所属项目，commit 后统一失效，rollback 时丢弃。
+命中与未命中返回完全相同的字节，并支持 ETag / If-None-Match 返回 304。
+
+注意：多进程部署时各进程的缓存相互独立，其他进程或原生 SQL 的写入无法触发失效，
+因此每个条目还带有一个较短的 TTL 作为兜底。
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from common.utils.serialization import dumps
+from database.edgeai import Project, Model, Node, Cluster
+
+logger = logging.getLogger(__name__)
+
+# 条目最长存活时间（秒），<= 0 表示只依赖事件失效
+RESPONSE_CACHE_TTL = float(os.getenv("EDGEAI_RESPONSE_CACHE_TTL", 30))
+# 最多缓存的条目数，超出后按 LRU 淘汰
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("EDGEAI_RESPONSE_CACHE_MAX_ENTRIES", 1024))
+
+# Session.info 中保存待失效项目的键
+_PENDING_KEY = "response_cache_pending"
+# 表示需要清空全部缓存（无法确定受影响项目时）
+_ALL_PROJECTS = "*"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    project_id: int
+    created_at: float
+
+
+def encode_json(data: Any) -> bytes:
+    """与 FastAPI JSONResponse 输出一致的紧凑 JSON"""
+    return dumps(data)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较（压缩中间件会把 ETag 改为 W/ 形式）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+class ResponseCache:
+    """按项目失效的响应体缓存（线程安全）"""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._project_keys: Dict[int, Set[Hashable]] = {}
+        # 每个项目的失效代数，构建期间发生失效时不写入过期的结果
+        self._generations: Dict[int, int] = {}
+        self._global_generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self, project_id: int) -> Tuple[int, int]:
+        with self._lock:
+            return self._global_generation, self._generations.get(project_id, 0)
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self.ttl > 0 and time.monotonic() - entry.created_at > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: Hashable, project_id: int, body: bytes, generation: Tuple[int, int]) -> CachedResponse:
+        entry = CachedResponse(
+            body=body,
+            etag=f'"{hashlib.sha1(body).hexdigest()}"',
+            project_id=project_id,
+            created_at=time.monotonic()
+        )
+        with self._lock:
+            current = (self._global_generation, self._generations.get(project_id, 0))
+            if current != generation:
+                # 构建期间数据已变化，本次结果只返回给当前请求
+                return entry
+
+            self._remove(key)
+            self._entries[key] = entry
+            self._project_keys.setdefault(project_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+        return entry
+
+    def invalidate_project(self, project_id: int):
+        with self._lock:
+            self._generations[project_id] = self._generations.get(project_id, 0) + 1
+            for key in self._project_keys.pop(project_id, set()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._global_generation += 1
+            self._entries.clear()
+            self._project_keys.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries
+            }
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._project_keys.get(entry.project_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._project_keys.pop(entry.project_id, None)
+
+    def respond(
+        self,
+        request: Request,
+        key: Hashable,
+        project_id: int,
+        build: Callable[[], Any]
+    ) -> Response:
+        """
+        返回缓存的响应，未命中时调用 build() 生成数据并缓存编码后的字节
+        build 抛出的异常（如 404）不会被缓存
+        """
+        entry = self.get(key)
+        cache_status = "HIT"
+        if entry is None:
+            cache_status = "MISS"
+            generation = self.generation(project_id)
+            entry = self.set(key, project_id, encode_json(build()), generation)
+
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": "private, no-cache",
+            "X-Cache": cache_status
+        }
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+# 全局响应缓存实例
+response_cache = ResponseCache()
+
+
+def _history_values(obj, attribute: str) -> Set[Any]:
+    """当前值以及本次 flush 前的旧值（用于外键变更，如节点移出集群）"""
+    state = inspect(obj)
+    values = {getattr(obj, attribute, None)}
+    history = state.attrs[attribute].history
+    values.update(history.deleted or ())
+    values.discard(None)
+    return values
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+def _collect_projects(session: Session, flush_context):
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    cluster_ids: Set[int] = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Project):
+            if obj.id is not None:
+                pending.add(obj.id)
+        elif isinstance(obj, (Model, Cluster)):
+            pending.update(_history_values(obj, "project_id"))
+        elif isinstance(obj, Node):
+            cluster_ids.update(_history_values(obj, "cluster_id"))
+
+    if cluster_ids:
+        # flush 之后数据库中的集群仍可查询；本次一并删除的集群已经在上面按自身的 project_id 处理
+        rows = session.connection().execute(
+            select(Cluster.project_id).where(Cluster.id.in_(cluster_ids))
+        )
+        pending.update(project_id for (project_id,) in rows if project_id is not None)
+
+
+def _collect_bulk(context):
+    # query.update() / query.delete() 不经过对象状态，无法确定受影响的项目，提交后清空全部缓存
+    if getattr(context.mapper, "class_", None) in (Project, Model, Node, Cluster):
+        context.session.info.setdefault(_PENDING_KEY, set()).add(_ALL_PROJECTS)
+
+
+def _apply_pending(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if _ALL_PROJECTS in pending:
+        response_cache.clear()
+        return
+    for project_id in pending:
+        response_cache.invalidate_project(project_id)
+
+
+def _discard_pending(session: Session, *args):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# 外键列默认在赋值时不加载旧值（对象已过期时历史为空），
+# 通过 active_history 保证能拿到旧的集群/项目，从而同时失效迁出的项目
+for _attribute in (Node.cluster_id, Cluster.project_id, Model.project_id):
+    event.listen(_attribute, "set", _keep_old_value, active_history=True)
+
+event.listen(Session, "after_flush", _collect_projects)
+event.listen(Session, "after_bulk_update", _collect_bulk)
+event.listen(Session, "after_bulk_delete", _collect_bulk)
+event.listen(Session, "after_commit", _apply_pending)
+event.listen(Session, "after_rollback", _discard_pending)
@@ -0,0 +1,154 @@
+"""
+远程任务状态缓存
+按 (类型, task_id) 缓存 TestAPI 返回的任务状态，短 TTL 内直接返回缓存；
+同一个键的并发请求共享同一个进行中的远程请求（single-flight）。
+训练状态轮询器每个周期把取到的状态写入缓存，用户读取状态时通常不需要访问远程。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 缓存有效期（秒），默认与训练状态轮询间隔一致
+TASK_STATUS_CACHE_TTL = float(os.getenv("TASK_STATUS_CACHE_TTL", 10))
+# 缓存的最大条目数（超出时淘汰最久未使用的条目）
+TASK_STATUS_CACHE_MAX_ENTRIES = int(os.getenv("TASK_STATUS_CACHE_MAX_ENTRIES", 1024))
+# 访问 TestAPI 的超时（秒）
+REMOTE_STATUS_TIMEOUT = float(os.getenv("REMOTE_STATUS_TIMEOUT", 10))
+
+# 共享的 HTTP 客户端（复用连接池，避免每次请求新建客户端）
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=REMOTE_STATUS_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+async def fetch_json(url: str) -> Tuple[int, Any]:
+    """GET 请求并返回 (HTTP 状态码, 解析后的响应体)"""
+    response = await get_http_client().get(url)
+    if not response.content:
+        return response.status_code, None
+    try:
+        return response.status_code, response.json()
+    except ValueError:
+        return response.status_code, response.text
+
+
+@dataclass
+class CachedStatus:
+    status_code: int
+    data: Any
+    fetched_at: float
+
+    @property
+    def age(self) -> int:
+        """距离从远程获取已经过去的秒数（用于 Age 响应头）"""
+        return max(0, int(time.monotonic() - self.fetched_at))
+
+
+class RemoteStatusCache:
+    """带 TTL 和请求合并的远程状态缓存；过期条目在读取时删除，条目数超过上限时按 LRU 淘汰"""
+
+    def __init__(self, ttl: float = TASK_STATUS_CACHE_TTL, max_entries: int = TASK_STATUS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedStatus]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _fresh(self, key: Hashable) -> Optional[CachedStatus]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.fetched_at <= self.ttl:
+            self._entries.move_to_end(key)
+            return entry
+        # 已结束的任务不会再被轮询，过期条目不删除会一直留在缓存中
+        del self._entries[key]
+        return None
+
+    def put(self, key: Hashable, status_code: int, data: Any) -> CachedStatus:
+        entry = CachedStatus(status_code=status_code, data=data, fetched_at=time.monotonic())
+        # 服务端错误不缓存，下次读取重新请求
+        if status_code < 500:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[Tuple[int, Any]]]) -> CachedStatus:
+        """
+        返回缓存的状态；过期时调用 fetch()，同一个键同时只有一个远程请求
+        fetch 抛出的异常会传递给所有等待者
+        """
+        entry = self._fresh(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            status_code, data = await fetch()
+            entry = self.put(key, status_code, data)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries
+        }
+
+
+# 全局任务状态缓存实例，键为 ("status" | "monitor", task_id)
+task_status_cache = RemoteStatusCache()
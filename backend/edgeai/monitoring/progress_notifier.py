@@ -0,0 +1,111 @@
+"""
+训练进度变更通知
+每个项目维护一个递增的版本号和最新快照（状态、进度、指标版本）。
+训练状态轮询器写库后发布变更，SSE 和长轮询接口等待版本号变化后才返回，
+没有变化时等待中的连接不产生任何服务端工作。
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+from database.edgeai import Project, TrainingMetric
+
+logger = logging.getLogger(__name__)
+
+
+def metric_snapshot(metric: Optional[TrainingMetric]) -> Optional[Dict[str, Any]]:
+    if metric is None:
+        return None
+    return {
+        "round": metric.round,
+        "step": metric.step,
+        "loss": metric.loss,
+        "accuracy": metric.accuracy,
+        **(metric.extra_metrics or {})
+    }
+
+
+class ProgressNotifier:
+    """按项目的版本号 + 事件广播"""
+
+    def __init__(self):
+        self._snapshots: Dict[int, Dict[str, Any]] = {}
+        self._events: Dict[int, asyncio.Event] = {}
+
+    def version(self, project_id: int) -> int:
+        snapshot = self._snapshots.get(project_id)
+        return snapshot["version"] if snapshot else 0
+
+    def snapshot(self, project_id: int) -> Optional[Dict[str, Any]]:
+        return self._snapshots.get(project_id)
+
+    def publish(
+        self,
+        project_id: int,
+        status: str,
+        progress: float,
+        metrics: Optional[Dict[str, Any]] = None,
+        metrics_changed: bool = False
+    ) -> int:
+        """
+        发布项目的最新状态；状态、进度和指标版本都未变化时不产生新版本
+        Returns:
+            当前版本号
+        """
+        current = self._snapshots.get(project_id)
+        metrics_version = (current["metrics_version"] if current else 0) + (1 if metrics_changed else 0)
+        progress = round(float(progress or 0), 2)
+
+        if current and (current["status"], current["progress"], current["metrics_version"]) == (status, progress, metrics_version):
+            return current["version"]
+
+        version = (current["version"] if current else 0) + 1
+        self._snapshots[project_id] = {
+            "project_id": project_id,
+            "version": version,
+            "status": status,
+            "progress": progress,
+            "metrics_version": metrics_version,
+            "metrics": metrics if metrics is not None else (current["metrics"] if current else None)
+        }
+
+        # 唤醒所有等待者，下一次等待使用新的事件
+        event = self._events.pop(project_id, None)
+        if event is not None:
+            event.set()
+        return version
+
+    def publish_project(self, project: Project, metric: Optional[TrainingMetric] = None) -> int:
+        """根据项目记录发布（metric 为本次新记录的指标时，指标版本加一）"""
+        return self.publish(
+            project.id,
+            project.status,
+            project.progress,
+            metrics=metric_snapshot(metric),
+            metrics_changed=metric is not None
+        )
+
+    async def wait(self, project_id: int, since_version: int, timeout: float) -> bool:
+        """
+        等待项目版本号超过 since_version
+        since_version 大于当前版本（例如服务重启后版本号重置）时立即返回
+        Returns:
+            超时未变化时返回 False
+        """
+        current = self.version(project_id)
+        if current != since_version:
+            return True
+
+        event = self._events.get(project_id)
+        if event is None:
+            event = self._events[project_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+# 全局训练进度通知实例
+progress_notifier = ProgressNotifier()
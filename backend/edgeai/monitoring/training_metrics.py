@@ -0,0 +1,157 @@
+"""
+训练指标持久化与曲线查询
+- extract_metrics / record_metrics: 从 TestAPI 任务状态中提取每轮/步的指标并写入 training_metrics 表
+- load_series: 按需读取一条指标曲线（只查询需要的列），配合 common.utils.downsample 降采样到图表宽度
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from database.edgeai import TrainingMetric
+
+logger = logging.getLogger(__name__)
+
+# 有独立列的指标
+COLUMN_METRICS = {
+    "loss": TrainingMetric.loss,
+    "accuracy": TrainingMetric.accuracy,
+}
+
+# TestAPI 返回中可能使用的字段名
+_ROUND_KEYS = ("round", "current_round", "epoch", "current_epoch")
+_STEP_KEYS = ("step", "global_step", "current_step")
+_ACCURACY_KEYS = ("accuracy", "acc", "eval_accuracy")
+_LOSS_KEYS = ("loss", "train_loss")
+_CLIENT_KEYS = ("clients", "client_metrics")
+
+
+def _first_number(data: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[float]:
+    for key in keys:
+        value = data.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+    return None
+
+
+def _scalar_metrics(data: Dict[str, Any]) -> Dict[str, float]:
+    return {
+        key: float(value) for key, value in data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+def extract_metrics(payload: Any) -> Optional[Dict[str, Any]]:
+    """
+    从任务状态中提取一行指标
+    支持顶层字段或嵌套在 "metrics" 中的字段；客户端指标可以是 {client_id: {...}} 或 [{"client_id": ..., ...}]
+    没有轮次/步数或没有任何指标时返回 None
+    """
+    if not isinstance(payload, dict):
+        return None
+
+    data = dict(payload)
+    if isinstance(payload.get("metrics"), dict):
+        data.update(payload["metrics"])
+
+    round_number = _first_number(data, _ROUND_KEYS)
+    step = _first_number(data, _STEP_KEYS)
+    if round_number is None and step is None:
+        return None
+
+    clients: Dict[str, Dict[str, float]] = {}
+    raw_clients = next((data[key] for key in _CLIENT_KEYS if key in data), None)
+    if isinstance(raw_clients, dict):
+        for client_id, values in raw_clients.items():
+            if isinstance(values, dict):
+                clients[str(client_id)] = _scalar_metrics(values)
+    elif isinstance(raw_clients, list):
+        for item in raw_clients:
+            if isinstance(item, dict) and item.get("client_id", item.get("id")) is not None:
+                client_id = str(item.get("client_id", item.get("id")))
+                clients[client_id] = _scalar_metrics({k: v for k, v in item.items() if k not in ("client_id", "id")})
+
+    loss = _first_number(data, _LOSS_KEYS)
+    accuracy = _first_number(data, _ACCURACY_KEYS)
+    skip = set(_ROUND_KEYS + _STEP_KEYS + _ACCURACY_KEYS + _LOSS_KEYS + ("progress",))
+    extra = {key: value for key, value in _scalar_metrics(data).items() if key not in skip}
+
+    if loss is None and accuracy is None and not extra and not clients:
+        return None
+
+    return {
+        "round": int(round_number if round_number is not None else 0),
+        "step": int(step if step is not None else round_number),
+        "loss": loss,
+        "accuracy": accuracy,
+        "extra_metrics": extra,
+        "client_metrics": clients,
+    }
+
+
+def record_metrics(db: Session, project_id: int, task_id: str, payload: Any) -> Optional[TrainingMetric]:
+    """
+    记录一行指标（同一任务的同一轮/步已存在时跳过），不提交事务
+    """
+    values = extract_metrics(payload)
+    if values is None:
+        return None
+
+    exists = db.query(TrainingMetric.id).filter(
+        TrainingMetric.task_id == task_id,
+        TrainingMetric.round == values["round"],
+        TrainingMetric.step == values["step"]
+    ).first()
+    if exists:
+        return None
+
+    metric = TrainingMetric(project_id=project_id, task_id=task_id, **values)
+    db.add(metric)
+    return metric
+
+
+def latest_task_id(db: Session, project_id: int) -> Optional[str]:
+    """项目最近一次有指标记录的训练任务"""
+    row = db.query(TrainingMetric.task_id).filter(
+        TrainingMetric.project_id == project_id
+    ).order_by(TrainingMetric.id.desc()).first()
+    return row[0] if row else None
+
+
+def load_series(
+    db: Session,
+    project_id: int,
+    task_id: str,
+    metric: str,
+    x_axis: str = "step",
+    client_id: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    读取一条指标曲线，返回按 x 升序的 (x, y) 数组，缺失值的点被跳过
+    loss/accuracy 直接查询对应列；其他指标和客户端指标从 JSON 列中读取
+    """
+    x_column = TrainingMetric.round if x_axis == "round" else TrainingMetric.step
+    query = db.query(x_column).filter(
+        TrainingMetric.project_id == project_id,
+        TrainingMetric.task_id == task_id
+    ).order_by(x_column, TrainingMetric.step)
+
+    if client_id is None and metric in COLUMN_METRICS:
+        column = COLUMN_METRICS[metric]
+        rows: List[Tuple[Any, Any]] = query.add_columns(column).filter(column.isnot(None)).all()
+    else:
+        json_column = TrainingMetric.client_metrics if client_id is not None else TrainingMetric.extra_metrics
+        rows = []
+        for x_value, values in query.add_columns(json_column).all():
+            if client_id is not None:
+                values = (values or {}).get(client_id)
+            value = (values or {}).get(metric)
+            if value is not None:
+                rows.append((x_value, value))
+
+    if not rows:
+        return np.empty(0), np.empty(0)
+    data = np.asarray(rows, dtype=np.float64)
+    return data[:, 0], data[:, 1]
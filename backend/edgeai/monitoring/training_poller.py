@@ -0,0 +1,255 @@
+"""
+训练状态轮询器
+所有运行中的训练任务共用一个轮询循环：每个周期通过 TASKS_LIST 一次取回全部任务状态
+（列表不可用或缺少某些任务时，按有限并发逐个查询），节点只同步一次，再把状态分发到各项目。
+远程调用次数与并发训练数量无关。
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database.edgeai import Project
+from database.edgeai.database import SessionLocal
+from ..cache.task_status_cache import task_status_cache
+from .training_metrics import record_metrics
+from .progress_notifier import progress_notifier, metric_snapshot
+
+logger = logging.getLogger(__name__)
+
+# 轮询间隔（秒）
+TRAINING_POLL_INTERVAL = int(os.getenv("TRAINING_POLL_INTERVAL", 10))
+# TASKS_LIST 不可用时逐个查询的最大并发数
+TRAINING_POLL_CONCURRENCY = int(os.getenv("TRAINING_POLL_CONCURRENCY", 8))
+
+# 训练结束的状态
+FINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def parse_tasks_list(data: Any, payloads: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    解析 TASKS_LIST 返回值为 {task_id: status}
+    兼容 {task_id: status}、{"tasks": [...]} 以及 [{"task_id"/"id": ..., "status": ...}] 几种格式
+    传入 payloads 时，带有其他字段（如训练指标）的任务条目原样写入 payloads[task_id]
+    """
+    if isinstance(data, dict) and isinstance(data.get("tasks"), (list, dict)):
+        data = data["tasks"]
+
+    statuses: Dict[str, Any] = {}
+    if isinstance(data, dict):
+        for task_id, value in data.items():
+            if isinstance(value, dict) and "status" in value:
+                if payloads is not None:
+                    payloads[str(task_id)] = value
+                value = value["status"]
+            statuses[str(task_id)] = value
+    elif isinstance(data, list):
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            task_id = item.get("task_id", item.get("id"))
+            if task_id is None or "status" not in item:
+                continue
+            if payloads is not None:
+                payloads[str(task_id)] = item
+            statuses[str(task_id)] = item["status"]
+    return statuses
+
+
+def apply_task_status(project: Project, status: str, progress_step: float = 5.0):
+    """把归一化后的任务状态写入项目（与原有的进度推进规则一致）"""
+    project.status = status
+    if status == "completed":
+        project.progress = round(100.0, 2)
+    elif status == "running":
+        project.progress = round(min(float(project.progress or 0) + progress_step, 95.0), 2)
+    elif status in ("failed", "cancelled"):
+        project.progress = round(0.0, 2)
+
+
+class TrainingStatusPoller:
+    """多路复用的训练状态轮询器"""
+
+    def __init__(self, interval: int = TRAINING_POLL_INTERVAL, concurrency: int = TRAINING_POLL_CONCURRENCY):
+        self.interval = interval
+        self.concurrency = concurrency
+        # task_id -> project_id
+        self._tasks: Dict[str, str] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.remote_calls = 0
+        self.last_cycle_at: Optional[datetime] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._loop_task is not None and not self._loop_task.done()
+
+    @property
+    def tracked_tasks(self) -> Dict[str, str]:
+        return dict(self._tasks)
+
+    def register(self, task_id: str, project_id: str):
+        """开始跟踪一个训练任务；轮询循环未运行时自动启动"""
+        self._tasks[task_id] = str(project_id)
+        logger.info(f"Tracking training task {task_id} for project {project_id} ({len(self._tasks)} tracked)")
+        if not self.is_running:
+            self._loop_task = asyncio.create_task(self._poll_loop())
+
+    def unregister(self, task_id: str) -> bool:
+        removed = self._tasks.pop(task_id, None) is not None
+        if removed:
+            logger.info(f"Stopped tracking training task {task_id}")
+        return removed
+
+    async def stop(self):
+        self._tasks.clear()
+        if self.is_running:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+        self._loop_task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running,
+            "tracked_tasks": len(self._tasks),
+            "tasks": [{"task_id": task_id, "project_id": project_id} for task_id, project_id in self._tasks.items()],
+            "interval": self.interval,
+            "cycles": self.cycles,
+            "remote_calls": self.remote_calls,
+            "last_cycle_at": self.last_cycle_at.isoformat() if self.last_cycle_at else None
+        }
+
+    async def _poll_loop(self):
+        logger.info("Training status poller started")
+        while self._tasks:
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in training status poller: {e}")
+
+            if not self._tasks:
+                break
+            await asyncio.sleep(self.interval)
+        logger.info("Training status poller stopped (no tracked tasks)")
+
+    async def fetch_statuses(self, task_ids: List[str], payloads: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        获取一组任务的远程状态，返回 {task_id: (http_status, 原始状态)}
+        优先一次 TASKS_LIST 调用，缺失的任务再按有限并发逐个查询，结果同时写入任务状态缓存
+        返回的任务详情（包含训练指标时）写入 payloads
+        """
+        from ..api.training import make_http_request, TEST_API_BASE_URL
+        from config.remote_api import REMOTE_API_CONFIG
+
+        results: Dict[str, Any] = {}
+        if not task_ids:
+            return results
+
+        self.remote_calls += 1
+        status_code, data = await make_http_request("GET", f"{TEST_API_BASE_URL}{REMOTE_API_CONFIG['TASKS_LIST']}")
+        if status_code == 200:
+            listed = parse_tasks_list(data, payloads)
+            for task_id in task_ids:
+                if task_id in listed:
+                    results[task_id] = (200, listed[task_id])
+        else:
+            logger.warning(f"TASKS_LIST returned HTTP {status_code}, falling back to per-task status requests")
+
+        missing = [task_id for task_id in task_ids if task_id not in results]
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def fetch_one(task_id: str):
+                async with semaphore:
+                    self.remote_calls += 1
+                    url = f"{TEST_API_BASE_URL}{REMOTE_API_CONFIG['TASK_STATUS'].format(task_id=task_id)}"
+                    status_code, data = await make_http_request("GET", url)
+                    if status_code == 200 and isinstance(data, dict) and "status" in data:
+                        if payloads is not None:
+                            payloads[task_id] = data
+                        data = data["status"]
+                    results[task_id] = (status_code, data)
+
+            await asyncio.gather(*(fetch_one(task_id) for task_id in missing))
+
+        # 写入共享状态缓存，用户读取状态时直接命中
+        for task_id, (status_code, raw_status) in results.items():
+            task_status_cache.put(("status", task_id), status_code, raw_status)
+
+        return results
+
+    async def poll_once(self):
+        """执行一个轮询周期：批量取状态 -> 同步一次节点 -> 分发到项目并记录训练指标"""
+        from ..api.training import sync_nodes_from_testapi, validate_training_status, active_training_sessions
+
+        tasks = dict(self._tasks)
+        if not tasks:
+            return
+
+        payloads: Dict[str, Any] = {}
+        statuses = await self.fetch_statuses(list(tasks), payloads)
+
+        db = SessionLocal()
+        try:
+            finished = []
+            updates = []
+            for task_id, project_id in tasks.items():
+                status_code, status_response = statuses.get(task_id, (502, None))
+
+                if status_code == 200:
+                    normalized_status = validate_training_status(status_response)
+                elif status_code >= 500:
+                    # TestAPI 服务端错误时保持当前状态
+                    logger.warning(f"TestAPI server error (status {status_code}) for task {task_id}, keeping current project status")
+                    normalized_status = None
+                else:
+                    logger.warning(f"TestAPI returned status {status_code} for task {task_id}")
+                    normalized_status = "failed"
+
+                if not normalized_status:
+                    continue
+
+                project = db.query(Project).filter(Project.id == int(project_id)).first()
+                if project:
+                    apply_task_status(project, normalized_status)
+                    metric = record_metrics(db, project.id, task_id, payloads[task_id]) if task_id in payloads else None
+                    updates.append((project.id, project.status, project.progress, metric_snapshot(metric), metric is not None))
+
+                session = active_training_sessions.get(task_id)
+                if session is not None:
+                    session["status"] = normalized_status
+                    if project is not None:
+                        session["progress"] = float(project.progress or 0)
+
+                if normalized_status in FINAL_STATUSES:
+                    logger.info(f"Training {task_id} finished with status: {normalized_status}")
+                    finished.append(task_id)
+
+            db.commit()
+
+            # 提交后再通知等待中的 SSE / 长轮询连接
+            for update in updates:
+                progress_notifier.publish(*update)
+
+            # 节点数据每个周期只同步一次，与任务数量无关
+            self.remote_calls += 1
+            await sync_nodes_from_testapi(db)
+        finally:
+            db.close()
+
+        for task_id in finished:
+            self.unregister(task_id)
+
+        self.cycles += 1
+        self.last_cycle_at = datetime.now()
+
+
+# 全局训练状态轮询器实例
+training_poller = TrainingStatusPoller()
@@ -0,0 +1,382 @@
+"""
+多路复用的实时订阅中心
+一个客户端一条 WebSocket，通过 subscribe / unsubscribe 订阅任意多个频道：
+- node:<id>            节点状态
+- project:<id>         项目训练状态和最新指标
+- logs:node:<id>       节点的新日志
+- logs:project:<id>    项目的新日志
+
+订阅时先发送快照，之后只发送字段级增量（日志频道发送新增条目）。
+每个频道有递增的序号，客户端发现序号不连续时发送 resync 获取新快照。
+所有连接共用一个刷新循环：每个周期每类频道只查询一次数据库，
+没有变化的频道不发送任何消息，一个周期内同一连接的消息合并为一帧。
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from common.utils.serialization import send_json
+from database.edgeai import Node, Project, Log
+from database.edgeai.database import SessionLocal
+from ..monitoring.progress_notifier import progress_notifier
+
+logger = logging.getLogger(__name__)
+
+# 刷新间隔（秒）
+WS_HUB_INTERVAL = float(os.getenv("EDGEAI_WS_HUB_INTERVAL", 2))
+# 日志频道快照中保留的最近日志条数
+WS_LOG_BACKLOG = int(os.getenv("EDGEAI_WS_LOG_BACKLOG", 20))
+# 单个连接最多订阅的频道数
+WS_MAX_SUBSCRIPTIONS = int(os.getenv("EDGEAI_WS_MAX_SUBSCRIPTIONS", 1000))
+
+CHANNEL_KINDS = ("node", "project", "logs:node", "logs:project")
+
+
+def parse_channel(channel: str) -> Tuple[str, str]:
+    """解析频道名为 (类型, ID)，格式不正确时抛出 ValueError"""
+    kind, _, key = channel.rpartition(":")
+    if kind not in CHANNEL_KINDS or not key.isdigit():
+        raise ValueError(f"Invalid channel: {channel}")
+    return kind, key
+
+
+def _number(value: Any) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def node_state(node: Node) -> Dict[str, Any]:
+    return {
+        "id": node.id,
+        "name": node.name,
+        "type": node.type,
+        "status": node.state,
+        "cluster_id": node.cluster_id,
+        "cpu_usage": _number(node.cpu_usage),
+        "memory_usage": _number(node.memory_usage),
+        "disk_usage": _number(node.disk_usage),
+        "progress": _number(node.progress),
+        "sent": _number(node.sent),
+        "received": _number(node.received),
+        "heartbeat": node.heartbeat or "",
+        "last_updated_time": node.last_updated_time.isoformat() if node.last_updated_time else None
+    }
+
+
+def project_state(project: Project) -> Dict[str, Any]:
+    notified = progress_notifier.snapshot(project.id) or {}
+    return {
+        "id": project.id,
+        "name": project.name,
+        "status": project.status,
+        "progress": _number(project.progress),
+        "task_id": project.task_id or "",
+        "metrics_version": notified.get("metrics_version", 0),
+        "metrics": notified.get("metrics")
+    }
+
+
+def log_item(log: Log) -> Dict[str, Any]:
+    return {
+        "id": str(log.id),
+        "level": log.level,
+        "message": log.message or "",
+        "timestamp": log.timestamp.isoformat() if log.timestamp else None,
+        "node_id": log.node_id,
+        "project_id": log.project_id,
+        "category": log.category
+    }
+
+
+def diff_state(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """字段级差异，只包含值发生变化或新增的字段"""
+    return {key: value for key, value in new.items() if key not in old or old[key] != value}
+
+
+class _ChannelState:
+    __slots__ = ("seq", "data", "subscribers", "cursor")
+
+    def __init__(self, data: Any, cursor: int = 0):
+        self.seq = 1
+        self.data = data
+        self.subscribers = 0
+        # 日志频道已发送的最大日志 ID
+        self.cursor = cursor
+
+
+class Subscriber:
+    """一个 WebSocket 连接及其订阅的频道（频道 -> 已发送的最新序号）"""
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.channels: Dict[str, int] = {}
+
+    async def send(self, messages: List[Dict[str, Any]]):
+        await send_json(self.websocket, {"type": "batch", "messages": messages})
+
+
+class RealtimeHub:
+
+    def __init__(self, interval: float = WS_HUB_INTERVAL, log_backlog: int = WS_LOG_BACKLOG):
+        self.interval = interval
+        self.log_backlog = log_backlog
+        self._subscribers: Set[Subscriber] = set()
+        self._channels: Dict[str, _ChannelState] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+        self.cycles = 0
+        self.messages_sent = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._loop_task is not None and not self._loop_task.done()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.is_running,
+            "connections": len(self._subscribers),
+            "channels": len(self._channels),
+            "interval": self.interval,
+            "cycles": self.cycles,
+            "messages_sent": self.messages_sent
+        }
+
+    # ---------- 订阅管理 ----------
+
+    def connect(self, subscriber: Subscriber):
+        self._subscribers.add(subscriber)
+
+    def disconnect(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        self._release(subscriber, list(subscriber.channels))
+
+    def _release(self, subscriber: Subscriber, channels: Iterable[str]):
+        for channel in channels:
+            if subscriber.channels.pop(channel, None) is None:
+                continue
+            state = self._channels.get(channel)
+            if state is not None:
+                state.subscribers -= 1
+                if state.subscribers <= 0:
+                    del self._channels[channel]
+
+    def _authorize(self, db: Session, user_id: int, channels: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """返回 (允许订阅的频道, {被拒绝的频道: 原因})，每类频道一次查询"""
+        parsed: Dict[str, Tuple[str, str]] = {}
+        rejected: Dict[str, str] = {}
+        for channel in channels:
+            try:
+                parsed[channel] = parse_channel(channel)
+            except ValueError:
+                rejected[channel] = "invalid channel"
+
+        node_ids = {int(key) for kind, key in parsed.values() if kind in ("node", "logs:node")}
+        project_ids = {int(key) for kind, key in parsed.values() if kind in ("project", "logs:project")}
+        owned_nodes = {row[0] for row in db.query(Node.id).filter(Node.id.in_(node_ids), Node.user_id == user_id)} if node_ids else set()
+        owned_projects = {row[0] for row in db.query(Project.id).filter(Project.id.in_(project_ids), Project.user_id == user_id)} if project_ids else set()
+
+        allowed = []
+        for channel, (kind, key) in parsed.items():
+            owned = owned_nodes if kind in ("node", "logs:node") else owned_projects
+            if int(key) in owned:
+                allowed.append(channel)
+            else:
+                rejected[channel] = "not found"
+        return allowed, rejected
+
+    def _load_states(self, db: Session, channels: Iterable[str]) -> Dict[str, Any]:
+        """加载一组频道的当前数据（节点、项目各一次查询；日志频道取最近的若干条）"""
+        by_kind: Dict[str, List[str]] = {kind: [] for kind in CHANNEL_KINDS}
+        for channel in channels:
+            kind, key = parse_channel(channel)
+            by_kind[kind].append(key)
+
+        states: Dict[str, Any] = {}
+        if by_kind["node"]:
+            ids = [int(key) for key in by_kind["node"]]
+            found = {node.id: node for node in db.query(Node).filter(Node.id.in_(ids))}
+            for node_id in ids:
+                states[f"node:{node_id}"] = node_state(found[node_id]) if node_id in found else None
+        if by_kind["project"]:
+            ids = [int(key) for key in by_kind["project"]]
+            found = {project.id: project for project in db.query(Project).filter(Project.id.in_(ids))}
+            for project_id in ids:
+                states[f"project:{project_id}"] = project_state(found[project_id]) if project_id in found else None
+        for kind, column in (("logs:node", Log.node_id), ("logs:project", Log.project_id)):
+            for key in by_kind[kind]:
+                recent = db.query(Log).filter(column == key).order_by(Log.id.desc()).limit(self.log_backlog).all()
+                states[f"{kind}:{key}"] = deque((log_item(log) for log in reversed(recent)), maxlen=self.log_backlog)
+        return states
+
+    def _snapshot_message(self, channel: str) -> Dict[str, Any]:
+        state = self._channels[channel]
+        data = list(state.data) if isinstance(state.data, deque) else state.data
+        return {"type": "snapshot", "channel": channel, "seq": state.seq, "data": data}
+
+    async def subscribe(self, subscriber: Subscriber, channels: List[str]) -> Dict[str, str]:
+        """
+        订阅频道并立即发送快照
+        Returns:
+            被拒绝的频道及原因
+        """
+        channels = [channel for channel in dict.fromkeys(channels) if channel not in subscriber.channels]
+        room = WS_MAX_SUBSCRIPTIONS - len(subscriber.channels)
+        rejected = {channel: "subscription limit reached" for channel in channels[max(room, 0):]}
+        channels = channels[:max(room, 0)]
+        if not channels:
+            return rejected
+
+        db = SessionLocal()
+        try:
+            allowed, denied = self._authorize(db, subscriber.user_id, channels)
+            rejected.update(denied)
+            missing = [channel for channel in allowed if channel not in self._channels]
+            if missing:
+                log_cursor = db.query(Log.id).order_by(Log.id.desc()).limit(1).scalar() or 0
+                for channel, data in self._load_states(db, missing).items():
+                    self._channels[channel] = _ChannelState(data, log_cursor)
+        finally:
+            db.close()
+
+        messages = []
+        for channel in allowed:
+            state = self._channels[channel]
+            state.subscribers += 1
+            subscriber.channels[channel] = state.seq
+            messages.append(self._snapshot_message(channel))
+
+        await self._deliver(subscriber, messages)
+        if not self.is_running:
+            self._loop_task = asyncio.create_task(self._run())
+        return rejected
+
+    def unsubscribe(self, subscriber: Subscriber, channels: List[str]):
+        self._release(subscriber, channels)
+
+    async def resync(self, subscriber: Subscriber, channels: List[str]):
+        """重新发送快照（客户端发现序号缺口时）"""
+        messages = []
+        for channel in channels:
+            if channel in subscriber.channels and channel in self._channels:
+                subscriber.channels[channel] = self._channels[channel].seq
+                messages.append(self._snapshot_message(channel))
+        await self._deliver(subscriber, messages)
+
+    # ---------- 刷新循环 ----------
+
+    async def _deliver(self, subscriber: Subscriber, messages: List[Dict[str, Any]]):
+        if not messages:
+            return
+        try:
+            await subscriber.send(messages)
+            self.messages_sent += len(messages)
+        except Exception as e:
+            logger.info(f"Dropping realtime subscriber after send failure: {e}")
+            self.disconnect(subscriber)
+
+    def _collect_changes(self, db: Session) -> Dict[str, Dict[str, Any]]:
+        """刷新所有活跃频道，返回本周期每个变化频道的增量消息"""
+        changes: Dict[str, Dict[str, Any]] = {}
+        record_channels = [channel for channel in self._channels if not channel.startswith("logs:")]
+        for channel, data in self._load_states(db, record_channels).items():
+            state = self._channels.get(channel)
+            if state is None:
+                continue
+            if data is None or state.data is None:
+                if data == state.data:
+                    continue
+                state.seq += 1
+                state.data = data
+                changes[channel] = {"type": "snapshot", "channel": channel, "seq": state.seq, "data": data}
+                continue
+            delta = diff_state(state.data, data)
+            if delta:
+                state.seq += 1
+                state.data = data
+                changes[channel] = {"type": "delta", "channel": channel, "seq": state.seq, "changes": delta}
+
+        log_keys = {"logs:node": set(), "logs:project": set()}
+        log_cursor = None
+        for channel, state in self._channels.items():
+            if channel.startswith("logs:"):
+                kind, key = parse_channel(channel)
+                log_keys[kind].add(key)
+                log_cursor = state.cursor if log_cursor is None else min(log_cursor, state.cursor)
+        if log_cursor is not None:
+            filters = []
+            if log_keys["logs:node"]:
+                filters.append(Log.node_id.in_(log_keys["logs:node"]))
+            if log_keys["logs:project"]:
+                filters.append(Log.project_id.in_(log_keys["logs:project"]))
+            new_logs = db.query(Log).filter(Log.id > log_cursor, or_(*filters)).order_by(Log.id).all()
+            appended: Dict[str, List[Dict[str, Any]]] = {}
+            for log in new_logs:
+                item = log_item(log)
+                for channel in (f"logs:node:{log.node_id}", f"logs:project:{log.project_id}"):
+                    state = self._channels.get(channel)
+                    if state is not None and log.id > state.cursor:
+                        appended.setdefault(channel, []).append(item)
+                        state.cursor = log.id
+            for channel, items in appended.items():
+                state = self._channels[channel]
+                state.seq += 1
+                state.data.extend(items)
+                changes[channel] = {"type": "append", "channel": channel, "seq": state.seq, "items": items}
+
+        return changes
+
+    async def refresh_once(self):
+        db = SessionLocal()
+        try:
+            changes = self._collect_changes(db)
+        finally:
+            db.close()
+
+        self.cycles += 1
+        if not changes:
+            return
+
+        sends = []
+        for subscriber in list(self._subscribers):
+            messages = []
+            for channel, last_seq in subscriber.channels.items():
+                message = changes.get(channel)
+                if message is None or message["seq"] <= last_seq:
+                    continue
+                # 增量只能接在上一次发送的序号之后，否则发送完整快照
+                messages.append(message if message["seq"] == last_seq + 1 else self._snapshot_message(channel))
+                subscriber.channels[channel] = message["seq"]
+            if messages:
+                sends.append(self._deliver(subscriber, messages))
+        await asyncio.gather(*sends)
+
+    async def _run(self):
+        logger.info("Realtime hub started")
+        while self._channels:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in realtime hub refresh: {e}")
+            await asyncio.sleep(self.interval)
+        logger.info("Realtime hub stopped (no subscriptions)")
+
+    async def stop(self):
+        if self.is_running:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+        self._loop_task = None
+
+
+# 全局实时订阅中心实例
+realtime_hub = RealtimeHub()
@@ -176,6 +176,39 @@ class ProjectImportRequest(BaseModel):
     project_data: Dict[str, Any]
     overwrite: bool = False
 
+class ModelArtifactRequest(BaseModel):
+    file_path: str  # 相对于 EDGEAI_ARTIFACT_ROOT 的路径，或该目录下的绝对路径
+    keep_source: bool = True  # 导入后是否保留原文件；只有 EDGEAI_ARTIFACT_ROOT/staging/<用户 ID>/ 下的文件可以删除
+
+class ModelPredictRequest(BaseModel):
+    inputs: Any  # 单个输入或输入列表，列表中的每一项分别排队并与其他请求合批
+    parameters: Dict[str, Any] = {}  # 生成参数，如 max_new_tokens、do_sample、temperature
+    request_id: Optional[str] = None  # 用于取消请求，输入为列表时依次加后缀 -0、-1 ...
+    timeout: Optional[float] = None
+
+class ModelVersionCreateRequest(BaseModel):
+    metrics: Dict[str, Any] = {}  # accuracy（百分比）和 loss 单独建索引，其余指标原样保存
+    description: str = ""
+    parent_version: Optional[int] = None  # 同一模型的父版本号，默认为当前版本
+    parent_id: Optional[int] = None  # 或其他模型的版本 ID（跨模型派生，如微调）
+    set_current: bool = True
+
+class ModelRollbackRequest(BaseModel):
+    version: int
+
+class ModelEvaluationRequest(BaseModel):
+    model_ids: List[int]  # 每个模型一个评估任务，并行执行
+    dataset_path: str  # 相对于 EDGEAI_ARTIFACT_ROOT 的 CSV / JSONL / Parquet 文件，或 blob:<sha256>
+    format: Optional[str] = None  # 默认按扩展名判断
+    text_column: str = "text"
+    label_column: Optional[str] = None  # 指定时只对目标列计分，否则按语言模型对整段文本计分
+    test_fraction: float = 0.1  # 留出集比例，1.0 表示整个文件
+    seed: int = 42
+    max_samples: Optional[int] = None
+    batch_size: int = 32
+    backend: str = "causal-lm"
+    backend_options: Dict[str, Any] = {}
+
 class ProjectExportRequest(BaseModel):
     include_models: bool = True
     include_data: bool = False
@@ -199,6 +232,14 @@ class LogEntry(BaseModel):
     node_id: Optional[str] = None
     project_id: Optional[str] = None
 
+class LogCreateRequest(BaseModel):
+    level: str = "INFO"
+    message: str
+    category: str = ""
+    node_id: Optional[str] = None
+    project_id: Optional[str] = None
+    timestamp: Optional[datetime] = None  # 默认为写入时间
+
 class TaskRequest(BaseModel):
     project_id: str
     task_type: str
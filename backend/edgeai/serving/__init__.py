@@ -0,0 +1 @@
+# Serving Module
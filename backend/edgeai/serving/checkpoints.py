@@ -0,0 +1,150 @@
+"""
+部署和评估加载的模型检查点
+- 模型登记的制品（blob:<sha256>）是模型目录（如 save_pretrained 的输出）的 tar / zip 归档，
+  使用前解压为 EDGEAI_CHECKPOINT_DIR/<sha256>/ 目录交给后端的 from_pretrained，同一对象只解压一次
+- models.file_path 始终引用当前版本的制品（登记新版本和回滚时同步），因此部署和评估加载的就是当前版本
+- 模型没有登记制品时使用项目的基础模型；请求不能指定任意的模型名称或路径
+"""
+
+import logging
+import os
+import shutil
+import stat
+import tarfile
+import threading
+import uuid
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from common.storage.blobstore import BlobError, blob_store, parse_blob_ref
+from database.edgeai import Model, ModelVersion, Project
+from database.edgeai.database import SessionLocal
+
+from .inference import DEFAULT_SERVING_MODEL
+
+logger = logging.getLogger(__name__)
+
+# 解压后的检查点目录
+CHECKPOINT_DIR = Path(os.getenv("EDGEAI_CHECKPOINT_DIR", "storage/checkpoints"))
+# 单个检查点解压后的大小上限（字节）
+CHECKPOINT_MAX_BYTES = int(os.getenv("EDGEAI_CHECKPOINT_MAX_BYTES", 20 * 1024 ** 3))
+
+
+class CheckpointError(Exception):
+    """检查点不可用或格式不支持，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def checkpoint_digest(db: Session, model: Model) -> Optional[str]:
+    """模型当前制品的 SHA-256；没有登记制品时返回 None"""
+    if model.file_path:
+        digest = parse_blob_ref(model.file_path)
+        if digest is None:
+            raise CheckpointError(409, "Model artifact is still being imported into blob storage")
+        return digest
+    if model.current_version_id is not None:
+        return db.query(ModelVersion.artifact_digest).filter(ModelVersion.id == model.current_version_id).scalar()
+    return None
+
+
+def base_model(project: Optional[Project]) -> str:
+    """没有登记制品时加载的项目基础模型"""
+    return (project.model_name_or_path if project else None) or DEFAULT_SERVING_MODEL
+
+
+# ===============================
+# 解压
+# ===============================
+
+_UNSUPPORTED = "Model artifact must be a tar or zip archive of a model directory"
+
+
+def _check_member(name: str, size: int, total: int) -> int:
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        raise CheckpointError(422, f"Unsafe path in checkpoint archive: {name}")
+    total += size
+    if total > CHECKPOINT_MAX_BYTES:
+        raise CheckpointError(422, f"Checkpoint is larger than {CHECKPOINT_MAX_BYTES} bytes")
+    return total
+
+
+def _extract_zip(source: BinaryIO, target: Path):
+    with zipfile.ZipFile(source) as archive:
+        total = 0
+        for info in archive.infolist():
+            if stat.S_ISLNK(info.external_attr >> 16):
+                raise CheckpointError(422, f"Links are not allowed in checkpoint archives: {info.filename}")
+            total = _check_member(info.filename, info.file_size, total)
+        archive.extractall(target)
+
+
+def _extract_tar(source: BinaryIO, target: Path):
+    try:
+        archive = tarfile.open(fileobj=source, mode="r:*")
+    except tarfile.TarError:
+        raise CheckpointError(422, _UNSUPPORTED)
+    with archive:
+        members, total = archive.getmembers(), 0
+        for member in members:
+            if not (member.isfile() or member.isdir()):
+                raise CheckpointError(422, f"Links and special files are not allowed in checkpoint archives: {member.name}")
+            total = _check_member(member.name, member.size, total)
+        archive.extractall(target, members=members)
+
+
+def _model_dir(path: Path) -> Path:
+    """归档只包含一个顶层目录时（如 tar -czf model.tgz model/）返回该目录"""
+    entries = list(path.iterdir())
+    if len(entries) == 1 and entries[0].is_dir():
+        return entries[0]
+    return path
+
+
+_extract_locks: Dict[str, threading.Lock] = {}
+_extract_guard = threading.Lock()
+
+
+def materialize_checkpoint(digest: str) -> Path:
+    """
+    把内容寻址存储中的检查点归档解压为目录，返回可直接 from_pretrained 的路径
+    同一对象只解压一次；在线程中调用
+    """
+    path = CHECKPOINT_DIR / digest
+    with _extract_guard:
+        lock = _extract_locks.setdefault(digest, threading.Lock())
+    with lock:
+        if path.is_dir():
+            return _model_dir(path)
+        db = SessionLocal()
+        try:
+            source = blob_store.open(db, digest).open()
+        except BlobError as e:
+            raise CheckpointError(404, f"Model checkpoint not available: {e}")
+        finally:
+            db.close()
+
+        staging = CHECKPOINT_DIR / f".{digest}.{uuid.uuid4().hex[:8]}"
+        staging.mkdir(parents=True)
+        try:
+            with source:
+                if zipfile.is_zipfile(source):
+                    source.seek(0)
+                    _extract_zip(source, staging)
+                else:
+                    source.seek(0)
+                    _extract_tar(source, staging)
+            if not any(staging.iterdir()):
+                raise CheckpointError(422, "Checkpoint archive is empty")
+            os.rename(staging, path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        logger.info(f"Extracted checkpoint {digest} to {path}")
+        return _model_dir(path)
@@ -0,0 +1,403 @@
+"""
+离线模型评估任务
+- 评估数据（CSV / JSONL / Parquet）只转换一次为未压缩的 Arrow IPC 文件，工作进程内存映射后按行号取批
+- 留出集按 seed 从全部行中抽取 test_fraction，同一数据集和 seed 得到相同的划分
+- 所有评估任务共用一个进程池：每个任务把留出集切成若干块提交，多个模型的评估并行进行
+- 工作进程按 (后端, 检查点) 缓存已加载的模型，同一模型的后续块不重复加载
+- 任务进度以递增版本号发布，轮询和 SSE 接口在版本变化时返回；完成后由回调写回模型指标
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.json as pa_json
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+
+from .inference import backend_class
+
+logger = logging.getLogger(__name__)
+
+# 评估进程池大小
+EVAL_WORKERS = int(os.getenv("EDGEAI_EVAL_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+# 转换后的评估数据目录
+EVAL_DATA_DIR = Path(os.getenv("EDGEAI_EVAL_DATA_DIR", "storage/evaluation"))
+# 每个进程池任务处理的批数（越大调度开销越小，进度更新越稀疏）
+EVAL_CHUNK_BATCHES = int(os.getenv("EDGEAI_EVAL_CHUNK_BATCHES", 4))
+# 每个工作进程缓存的模型数
+EVAL_MODEL_CACHE = int(os.getenv("EDGEAI_EVAL_MODEL_CACHE", 2))
+# 内存中保留的任务数（超出时丢弃最早结束的任务）
+EVAL_MAX_JOBS = int(os.getenv("EDGEAI_EVAL_MAX_JOBS", 500))
+
+EVAL_FORMATS = ("csv", "jsonl", "parquet")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class EvaluationError(Exception):
+    """评估任务无法创建或执行，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# ===============================
+# 工作进程
+# ===============================
+
+_worker_models: "OrderedDict[tuple, Any]" = OrderedDict()
+_worker_tables: Dict[str, "pa.Table"] = {}
+
+
+def _load_backend(backend: type, checkpoint: str, options: Dict[str, Any]):
+    # backend 为服务进程按名称查到的类（按引用序列化），工作进程不再解析名称
+    key = (backend, checkpoint, json.dumps(options, sort_keys=True))
+    model = _worker_models.get(key)
+    if model is None:
+        while len(_worker_models) >= EVAL_MODEL_CACHE:
+            _worker_models.popitem(last=False)
+        model = _worker_models[key] = backend(checkpoint, options)
+    _worker_models.move_to_end(key)
+    return model
+
+
+def _load_table(path: str) -> "pa.Table":
+    table = _worker_tables.get(path)
+    if table is None:
+        _worker_tables.clear()
+        table = _worker_tables[path] = pa_ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table
+
+
+def _score_chunk(backend: type, checkpoint: str, options: Dict[str, Any], data_path: str, text_column: str,
+                 label_column: Optional[str], indices: np.ndarray, batch_size: int) -> Dict[str, float]:
+    """评估留出集的一块，返回累加的统计量"""
+    model = _load_backend(backend, checkpoint, options)
+    table = _load_table(data_path)
+    totals = {"samples": 0.0, "count": 0.0, "loss_sum": 0.0, "correct": 0.0}
+    for start in range(0, len(indices), batch_size):
+        rows = table.take(pa.array(indices[start:start + batch_size]))
+        inputs = rows.column(text_column).to_pylist()
+        targets = rows.column(label_column).to_pylist() if label_column else None
+        for key, value in model.score(inputs, targets).items():
+            totals[key] = totals.get(key, 0.0) + float(value)
+        totals["samples"] += len(inputs)
+    return totals
+
+
+# ===============================
+# 数据
+# ===============================
+
+def _batches(source: BinaryIO, fmt: str):
+    if fmt == "csv":
+        yield from pa_csv.open_csv(source, parse_options=pa_csv.ParseOptions(newlines_in_values=True))
+    elif fmt == "jsonl":
+        yield from pa_json.read_json(source).to_batches()
+    else:
+        yield from pq.ParquetFile(source).iter_batches()
+
+
+_materialize_locks: Dict[str, threading.Lock] = {}
+_materialize_guard = threading.Lock()
+
+
+def _atomic_write(path: Path, write: Callable[[Path], None]):
+    """写入临时文件后原子替换，并发的相同写入只执行一次"""
+    with _materialize_guard:
+        lock = _materialize_locks.setdefault(str(path), threading.Lock())
+    with lock:
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        staging = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+        try:
+            write(staging)
+            os.replace(staging, path)
+        finally:
+            staging.unlink(missing_ok=True)
+
+
+def materialize_dataset(key: str, open_source: Callable[[], BinaryIO], fmt: str) -> Path:
+    """
+    把评估数据转换为 Arrow IPC 文件（key 相同的数据只转换一次）
+    在线程中调用
+    """
+    if pa is None:
+        raise EvaluationError(501, "Evaluation requires pyarrow")
+    if fmt not in EVAL_FORMATS:
+        raise EvaluationError(400, f"Unsupported dataset format: {fmt}")
+    path = EVAL_DATA_DIR / "datasets" / f"{key}.arrow"
+
+    def write(staging: Path):
+        writer = None
+        try:
+            with open_source() as source:
+                for batch in _batches(source, fmt):
+                    if writer is None:
+                        writer = pa_ipc.new_file(str(staging), batch.schema)
+                    writer.write_batch(batch)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError) as e:
+            raise EvaluationError(400, f"Failed to read dataset: {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise EvaluationError(400, "Dataset is empty")
+
+    _atomic_write(path, write)
+    return path
+
+
+def file_key(path: Path) -> str:
+    """本地文件的缓存键：路径、大小和修改时间（文件被替换后重新转换）"""
+    stat = path.stat()
+    return hashlib.sha256(f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def _table_info(path: Path):
+    table = pa_ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return table.schema, table.num_rows
+
+
+def holdout_indices(num_rows: int, test_fraction: float, seed: int, max_samples: Optional[int] = None) -> np.ndarray:
+    """按 seed 抽取留出集的行号（升序，便于顺序读取）"""
+    size = num_rows if test_fraction >= 1 else max(1, int(round(num_rows * test_fraction)))
+    indices = np.random.default_rng(seed).permutation(num_rows)[:size]
+    if max_samples:
+        indices = indices[:max_samples]
+    return np.sort(indices)
+
+
+# ===============================
+# 任务
+# ===============================
+
+@dataclass
+class EvaluationSpec:
+    text_column: str = "text"
+    label_column: Optional[str] = None
+    test_fraction: float = 0.1
+    seed: int = 42
+    max_samples: Optional[int] = None
+    batch_size: int = 32
+    backend: str = "causal-lm"
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+class EvaluationJob:
+    """一个模型的评估任务，状态变化时版本号加一；只有创建任务的用户可以查看和取消"""
+
+    def __init__(self, model_id: int, user_id: int, spec: EvaluationSpec, backend: type):
+        self.id = f"eval-{uuid.uuid4().hex[:12]}"
+        self.model_id = model_id
+        self.user_id = user_id
+        self.backend = backend
+        self.checkpoint: Optional[str] = None
+        self.spec = spec
+        self.status = "queued"
+        self.total_samples = 0
+        self.totals: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self._event = asyncio.Event()
+        self._futures: List[asyncio.Future] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        count = self.totals.get("count", 0.0)
+        return {
+            "accuracy": self.totals["correct"] / count if count else None,
+            "loss": self.totals["loss_sum"] / count if count else None,
+            "samples": int(self.totals.get("samples", 0)),
+            "scored_units": int(count)
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = self.totals.get("samples", 0.0)
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "model_id": self.model_id,
+            "version": self.version,
+            "status": self.status,
+            "progress": round(100 * samples / self.total_samples, 2) if self.total_samples else 0.0,
+            "total_samples": self.total_samples,
+            "metrics": self.metrics(),
+            "error": self.error,
+            "checkpoint": self.checkpoint,
+            "spec": asdict(self.spec),
+            "created_at": self.created_at,
+            "elapsed_seconds": round(elapsed, 2),
+            "samples_per_second": round(samples / elapsed, 2) if elapsed else None
+        }
+
+    def publish(self, status: Optional[str] = None):
+        if status is not None:
+            self.status = status
+        self.version += 1
+        # 唤醒所有等待者，下一次等待使用新的事件
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self, since_version: int, timeout: float) -> bool:
+        """等待版本号超过 since_version，超时未变化时返回 False"""
+        if self.version != since_version:
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class EvaluationRunner:
+    """评估任务调度：所有任务共用一个 spawn 进程池"""
+
+    def __init__(self, max_workers: int = EVAL_WORKERS):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, EvaluationJob]" = OrderedDict()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def submit(self, model_id: int, user_id: int, spec: EvaluationSpec, prepare: Callable[[], Tuple[Path, str]],
+               on_complete: Callable[[EvaluationJob], None]) -> EvaluationJob:
+        """
+        创建并启动评估任务
+        prepare 在线程中调用，返回 (Arrow IPC 数据文件, 检查点路径或名称)；on_complete 在任务成功结束后在线程中调用
+        后端只能是已注册的名称，未注册时抛出 InferenceError(400)
+        """
+        backend = backend_class(spec.backend)
+        reason = backend.unavailable_reason()
+        if reason:
+            raise EvaluationError(501, reason)
+        job = EvaluationJob(model_id, user_id, spec, backend)
+        self._jobs[job.id] = job
+        self._prune()
+        job._task = asyncio.create_task(self._run(job, prepare, on_complete))
+        return job
+
+    async def _run(self, job: EvaluationJob, prepare: Callable[[], Tuple[Path, str]], on_complete: Callable[[EvaluationJob], None]):
+        loop = asyncio.get_running_loop()
+        spec = job.spec
+        try:
+            path, job.checkpoint = await asyncio.to_thread(prepare)
+            schema, num_rows = await asyncio.to_thread(_table_info, path)
+            for column in filter(None, (spec.text_column, spec.label_column)):
+                if column not in schema.names:
+                    raise EvaluationError(400, f"Column {column} not found in dataset")
+            if num_rows == 0:
+                raise EvaluationError(400, "Dataset is empty")
+            indices = holdout_indices(num_rows, spec.test_fraction, spec.seed, spec.max_samples)
+            job.total_samples = len(indices)
+            job.started_at = time.time()
+            job.publish("running")
+
+            chunk_size = spec.batch_size * EVAL_CHUNK_BATCHES
+            executor = self._executor()
+            job._futures = [
+                loop.run_in_executor(
+                    executor, _score_chunk, job.backend, job.checkpoint, spec.options, str(path),
+                    spec.text_column, spec.label_column, indices[start:start + chunk_size], spec.batch_size
+                )
+                for start in range(0, len(indices), chunk_size)
+            ]
+            for future in asyncio.as_completed(job._futures):
+                for key, value in (await future).items():
+                    job.totals[key] = job.totals.get(key, 0.0) + value
+                job.publish()
+
+            if not job.totals.get("count"):
+                raise EvaluationError(400, "No samples could be scored")
+            await asyncio.to_thread(on_complete, job)
+            job.finished_at = time.time()
+            job.publish("completed")
+            metrics = job.metrics()
+            logger.info(
+                f"Evaluated model {job.model_id} on {metrics['samples']} samples in "
+                f"{job.finished_at - job.started_at:.2f}s: accuracy={metrics['accuracy']:.4f} loss={metrics['loss']:.4f}"
+            )
+        except asyncio.CancelledError:
+            for future in job._futures:
+                future.cancel()
+            job.finished_at = time.time()
+            job.publish("cancelled")
+        except Exception as e:
+            for future in job._futures:
+                future.cancel()
+            job.error = e.detail if isinstance(e, EvaluationError) else f"{type(e).__name__}: {e}"
+            job.finished_at = time.time()
+            job.publish("failed")
+            logger.error(f"Evaluation {job.id} of model {job.model_id} failed: {job.error}")
+        finally:
+            job._futures = []
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(self._jobs) - EVAL_MAX_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str, user_id: Optional[int] = None) -> Optional[EvaluationJob]:
+        """指定 user_id 时只返回该用户的任务"""
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    def list(self, model_id: Optional[int] = None, user_id: Optional[int] = None) -> List[EvaluationJob]:
+        return [
+            job for job in reversed(self._jobs.values())
+            if (model_id is None or job.model_id == model_id) and (user_id is None or job.user_id == user_id)
+        ]
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：尚未开始的块不再执行，正在执行的块结果被丢弃"""
+        job = self._jobs.get(job_id)
+        if job is None or job.finished or job._task is None:
+            return False
+        job._task.cancel()
+        return True
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            if job._task is not None and not job.finished:
+                job._task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 全局评估任务实例
+evaluation_runner = EvaluationRunner()
@@ -0,0 +1,594 @@
+"""
+已部署模型的本地 CPU 推理服务
+- 每个部署启动 num_workers 个工作进程，模型在进程启动时加载一次
+- 请求进入异步队列，批处理循环在有空闲工作进程时取出请求组成一批：
+  凑满 max_batch_size 或最早的请求已等待 max_wait_ms 时立即发送，多个并发调用共享一次前向计算
+- 请求在发送前可以取消（客户端断开、超时或显式取消），已取消的请求不占用批次
+- 记录吞吐量、端到端延迟、排队时间和批大小分布
+"""
+
+import asyncio
+import inspect
+import logging
+import math
+import multiprocessing
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+except ImportError:  # pragma: no cover - 可选依赖
+    torch = None
+
+logger = logging.getLogger(__name__)
+
+# 默认部署参数
+SERVING_MAX_BATCH_SIZE = int(os.getenv("EDGEAI_SERVING_MAX_BATCH_SIZE", 16))
+SERVING_MAX_WAIT_MS = float(os.getenv("EDGEAI_SERVING_MAX_WAIT_MS", 10))
+SERVING_WORKERS = int(os.getenv("EDGEAI_SERVING_WORKERS", 1))
+SERVING_MAX_QUEUE = int(os.getenv("EDGEAI_SERVING_MAX_QUEUE", 1024))
+SERVING_TIMEOUT = float(os.getenv("EDGEAI_SERVING_TIMEOUT", 60))
+# 单个部署可申请的上限：工作进程数默认不超过 CPU 核数
+SERVING_WORKERS_LIMIT = int(os.getenv("EDGEAI_SERVING_WORKERS_LIMIT", os.cpu_count() or 1))
+SERVING_BATCH_SIZE_LIMIT = int(os.getenv("EDGEAI_SERVING_BATCH_SIZE_LIMIT", 256))
+SERVING_QUEUE_LIMIT = int(os.getenv("EDGEAI_SERVING_QUEUE_LIMIT", 65536))
+# 工作进程加载模型的超时（秒）
+SERVING_LOAD_TIMEOUT = float(os.getenv("EDGEAI_SERVING_LOAD_TIMEOUT", 300))
+# 延迟统计保留的最近请求数 / 吞吐量统计窗口（秒）
+SERVING_METRICS_WINDOW = 2048
+SERVING_THROUGHPUT_WINDOW = 60.0
+
+DEFAULT_SERVING_MODEL = "sshleifer/tiny-gpt2"
+
+
+class InferenceError(Exception):
+    """推理请求失败，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# ===============================
+# 模型后端（在工作进程中运行）
+# ===============================
+
+class InferenceBackend(ABC):
+    """模型后端：在工作进程中构造一次，predict 对一批输入做一次前向计算，score 用于离线评估"""
+
+    def __init__(self, model_name_or_path: str, options: Dict[str, Any]):
+        self.model_name_or_path = model_name_or_path
+        self.options = options
+
+    @classmethod
+    def unavailable_reason(cls) -> Optional[str]:
+        """缺少依赖时返回原因（在服务进程中检查，避免工作进程启动失败只报进程池异常）"""
+        return None
+
+    @abstractmethod
+    def predict(self, inputs: List[Any], params: List[Dict[str, Any]]) -> List[Any]:
+        """对一批输入做推理，params 为每条输入的生成参数"""
+
+    @abstractmethod
+    def score(self, inputs: List[Any], targets: Optional[List[Any]]) -> Dict[str, float]:
+        """
+        评估一批样本，返回可跨批累加的统计量：
+        count（计分单位数）、loss_sum（损失之和）、correct（预测正确的单位数）
+        """
+
+
+class CausalLMBackend(InferenceBackend):
+    """transformers 因果语言模型的文本生成（如 sshleifer/tiny-gpt2），左侧填充后整批 generate"""
+
+    @classmethod
+    def unavailable_reason(cls):
+        return None if torch is not None else "The causal-lm backend requires torch and transformers"
+
+    def __init__(self, model_name_or_path: str, options: Dict[str, Any]):
+        super().__init__(model_name_or_path, options)
+        if options.get("threads"):
+            torch.set_num_threads(int(options["threads"]))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_name_or_path)
+        self.model.eval()
+        self.max_input_length = int(options.get("max_input_length", 512))
+
+    def predict(self, inputs, params):
+        results: List[Any] = [None] * len(inputs)
+        # 采样参数不同的请求分开生成，max_new_tokens 取组内最大值后按各自的值截断
+        groups: Dict[Tuple, List[int]] = {}
+        for index, item in enumerate(params):
+            key = (bool(item.get("do_sample", False)), float(item.get("temperature", 1.0)), float(item.get("top_p", 1.0)))
+            groups.setdefault(key, []).append(index)
+
+        for (do_sample, temperature, top_p), indices in groups.items():
+            texts = [str(inputs[index]) for index in indices]
+            max_new_tokens = [int(params[index].get("max_new_tokens", 32)) for index in indices]
+            encoded = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_input_length)
+            generate_kwargs = {"max_new_tokens": max(max_new_tokens), "do_sample": do_sample, "pad_token_id": self.tokenizer.pad_token_id}
+            if do_sample:
+                generate_kwargs.update(temperature=temperature, top_p=top_p)
+            with torch.inference_mode():
+                output = self.model.generate(**encoded, **generate_kwargs)
+            prompt_length = encoded["input_ids"].shape[1]
+            for row, index in enumerate(indices):
+                tokens = output[row, prompt_length:prompt_length + max_new_tokens[row]]
+                results[index] = {
+                    "generated_text": self.tokenizer.decode(tokens, skip_special_tokens=True),
+                    "num_tokens": int(tokens.shape[0])
+                }
+        return results
+
+    def score(self, inputs, targets):
+        # 逐条编码后右侧填充；有 targets 时只对目标部分计分，否则按语言模型对整段文本计分
+        sequences, labels = [], []
+        for index, text in enumerate(inputs):
+            prompt = self.tokenizer(str(text))["input_ids"]
+            if targets is not None:
+                completion = self.tokenizer(str(targets[index]), add_special_tokens=False)["input_ids"]
+                ids, label = prompt + completion, [-100] * len(prompt) + completion
+            else:
+                ids, label = prompt, list(prompt)
+            sequences.append(ids[:self.max_input_length])
+            labels.append(label[:self.max_input_length])
+
+        length = max(len(ids) for ids in sequences)
+        input_ids = torch.full((len(sequences), length), self.tokenizer.pad_token_id, dtype=torch.long)
+        label_ids = torch.full((len(sequences), length), -100, dtype=torch.long)
+        attention_mask = torch.zeros((len(sequences), length), dtype=torch.long)
+        for row, (ids, label) in enumerate(zip(sequences, labels)):
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            label_ids[row, :len(label)] = torch.tensor(label)
+            attention_mask[row, :len(ids)] = 1
+
+        with torch.inference_mode():
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask).logits[:, :-1].float()
+        label_ids = label_ids[:, 1:]
+        mask = label_ids != -100
+        loss_sum = torch.nn.functional.cross_entropy(
+            logits.reshape(-1, logits.shape[-1]), label_ids.reshape(-1), ignore_index=-100, reduction="sum"
+        )
+        correct = ((logits.argmax(dim=-1) == label_ids) & mask).sum()
+        return {"count": float(mask.sum()), "loss_sum": float(loss_sum), "correct": float(correct)}
+
+
+INFERENCE_BACKENDS = {
+    "causal-lm": CausalLMBackend
+}
+
+
+def register_backend(name: str, backend: type):
+    """注册后端（只能在代码中调用，请求只能按名称选择已注册的后端）"""
+    if not (isinstance(backend, type) and issubclass(backend, InferenceBackend)):
+        raise TypeError(f"{backend!r} is not an InferenceBackend subclass")
+    if inspect.isabstract(backend):
+        raise TypeError(f"{backend.__name__} does not implement {', '.join(sorted(backend.__abstractmethods__))}")
+    INFERENCE_BACKENDS[name] = backend
+
+
+def backend_class(name: str):
+    """按名称查找已注册的后端"""
+    backend = INFERENCE_BACKENDS.get(name)
+    if backend is None:
+        raise InferenceError(400, f"Unknown inference backend: {name}. Available: {', '.join(sorted(INFERENCE_BACKENDS))}")
+    return backend
+
+
+# 工作进程中的后端实例
+_worker_backend: Optional[InferenceBackend] = None
+
+
+def _init_worker(backend: type, model_name_or_path: str, options: Dict[str, Any]):
+    # backend 为服务进程按名称查到的类（按引用序列化），工作进程不再解析名称
+    global _worker_backend
+    _worker_backend = backend(model_name_or_path, options)
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _predict_batch(inputs: List[Any], params: List[Dict[str, Any]]) -> Tuple[List[Any], float]:
+    started = time.perf_counter()
+    outputs = _worker_backend.predict(inputs, params)
+    if len(outputs) != len(inputs):
+        raise RuntimeError(f"Backend returned {len(outputs)} outputs for {len(inputs)} inputs")
+    return outputs, time.perf_counter() - started
+
+
+# ===============================
+# 指标
+# ===============================
+
+class ServingMetrics:
+    """吞吐量、延迟和批大小统计"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.compute_seconds = 0.0
+        self._latencies: Deque[Tuple[float, float, float]] = deque(maxlen=SERVING_METRICS_WINDOW)  # (完成时间, 总延迟, 排队时间)
+        self._batch_sizes: Deque[int] = deque(maxlen=SERVING_METRICS_WINDOW)
+        self._completions: Deque[float] = deque()
+
+    def record_batch(self, size: int, compute_seconds: float):
+        self.batches += 1
+        self.batched_requests += size
+        self.compute_seconds += compute_seconds
+        self._batch_sizes.append(size)
+
+    def record_completion(self, latency: float, queue_wait: float):
+        now = time.time()
+        self.completed += 1
+        self._latencies.append((now, latency, queue_wait))
+        self._completions.append(now)
+        while self._completions and self._completions[0] < now - SERVING_THROUGHPUT_WINDOW:
+            self._completions.popleft()
+
+    @staticmethod
+    def _percentiles(values: np.ndarray) -> Dict[str, Optional[float]]:
+        if not len(values):
+            return {"p50": None, "p95": None, "p99": None, "mean": None}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+        return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2), "mean": round(float(values.mean()) * 1000, 2)}
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        while self._completions and self._completions[0] < now - SERVING_THROUGHPUT_WINDOW:
+            self._completions.popleft()
+        window = min(SERVING_THROUGHPUT_WINDOW, max(now - self.started_at, 1e-6))
+        latencies = np.array([item[1] for item in self._latencies])
+        waits = np.array([item[2] for item in self._latencies])
+        batch_sizes = np.array(self._batch_sizes)
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "throughput_rps": round(len(self._completions) / window, 2),
+            "latency_ms": self._percentiles(latencies),
+            "queue_wait_ms": self._percentiles(waits),
+            "batch_size": {
+                "mean": round(float(batch_sizes.mean()), 2) if len(batch_sizes) else None,
+                "max": int(batch_sizes.max()) if len(batch_sizes) else None,
+                "histogram": {str(size): int(count) for size, count in zip(*np.unique(batch_sizes, return_counts=True))}
+            },
+            "compute_seconds": round(self.compute_seconds, 3),
+            "uptime_seconds": round(now - self.started_at, 1)
+        }
+
+
+# ===============================
+# 部署
+# ===============================
+
+@dataclass
+class ServingConfig:
+    model_name_or_path: str = DEFAULT_SERVING_MODEL
+    backend: str = "causal-lm"
+    max_batch_size: int = SERVING_MAX_BATCH_SIZE
+    max_wait_ms: float = SERVING_MAX_WAIT_MS
+    num_workers: int = SERVING_WORKERS
+    max_queue_size: int = SERVING_MAX_QUEUE
+    timeout: float = SERVING_TIMEOUT
+    # 传给后端的参数（如 threads、max_input_length）
+    options: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict[str, Any]]) -> "ServingConfig":
+        """
+        校验请求中的部署参数；加载的检查点由调用方按模型登记的制品设置，请求不能指定
+        """
+        config = dict(config or {})
+        if "model_name_or_path" in config:
+            raise InferenceError(400, "model_name_or_path cannot be set, deployments load the model's registered artifact")
+        names = {field.name for field in fields(cls)}
+        unknown = set(config) - names
+        if unknown:
+            raise InferenceError(400, f"Unknown deployment options: {', '.join(sorted(unknown))}")
+        try:
+            serving = cls(**config)
+            serving.max_batch_size = int(serving.max_batch_size)
+            serving.max_wait_ms = float(serving.max_wait_ms)
+            serving.num_workers = int(serving.num_workers)
+            serving.max_queue_size = int(serving.max_queue_size)
+            serving.timeout = float(serving.timeout)
+        except (TypeError, ValueError) as e:
+            raise InferenceError(400, f"Invalid deployment options: {e}")
+        if serving.max_batch_size < 1 or serving.num_workers < 1 or serving.max_queue_size < 1:
+            raise InferenceError(400, "max_batch_size, num_workers and max_queue_size must be positive")
+        if serving.num_workers > SERVING_WORKERS_LIMIT:
+            raise InferenceError(400, f"num_workers must not exceed {SERVING_WORKERS_LIMIT}")
+        if serving.max_batch_size > SERVING_BATCH_SIZE_LIMIT:
+            raise InferenceError(400, f"max_batch_size must not exceed {SERVING_BATCH_SIZE_LIMIT}")
+        if serving.max_queue_size > SERVING_QUEUE_LIMIT:
+            raise InferenceError(400, f"max_queue_size must not exceed {SERVING_QUEUE_LIMIT}")
+        if not isinstance(serving.backend, str):
+            raise InferenceError(400, "backend must be a string")
+        if serving.options is not None and not isinstance(serving.options, dict):
+            raise InferenceError(400, "options must be an object")
+        backend_class(serving.backend)
+        if not (math.isfinite(serving.max_wait_ms) and math.isfinite(serving.timeout)):
+            raise InferenceError(400, "max_wait_ms and timeout must be finite")
+        if serving.max_wait_ms < 0 or serving.timeout <= 0:
+            raise InferenceError(400, "max_wait_ms must not be negative and timeout must be positive")
+        serving.options = dict(serving.options or {})
+        return serving
+
+
+@dataclass
+class _PendingRequest:
+    id: str
+    input: Any
+    params: Dict[str, Any]
+    future: asyncio.Future
+    enqueued_at: float
+    dispatched_at: Optional[float] = None
+
+
+class ModelServer:
+    """一个部署：请求队列、批处理循环和工作进程"""
+
+    def __init__(self, key: str, config: ServingConfig):
+        self.key = key
+        self.config = config
+        self.deployment_id = f"deploy-{uuid.uuid4().hex[:8]}"
+        self.metrics = ServingMetrics()
+        self.deployed_at = datetime.now(timezone.utc).isoformat()
+        self._workers: List[ProcessPoolExecutor] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Dict[str, _PendingRequest] = {}
+        self._tasks: set = set()
+        self._loop_task: Optional[asyncio.Task] = None
+
+    def _new_worker(self) -> ProcessPoolExecutor:
+        # 每个工作进程一个单进程执行器，便于按空闲进程分配批次；spawn 不复制服务进程的线程和连接
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(backend_class(self.config.backend), self.config.model_name_or_path, self.config.options)
+        )
+
+    async def start(self):
+        """启动工作进程并等待模型加载完成"""
+        reason = backend_class(self.config.backend).unavailable_reason()
+        if reason:
+            raise InferenceError(501, reason)
+        loop = asyncio.get_running_loop()
+        self._workers = [self._new_worker() for _ in range(self.config.num_workers)]
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(loop.run_in_executor(worker, _worker_ready) for worker in self._workers)),
+                SERVING_LOAD_TIMEOUT
+            )
+        except Exception as e:
+            self._shutdown_workers()
+            if isinstance(e, asyncio.TimeoutError):
+                raise InferenceError(504, "Timed out loading the model")
+            raise InferenceError(500, f"Failed to load model {self.config.model_name_or_path}: {e}")
+        for index in range(len(self._workers)):
+            self._idle.put_nowait(index)
+        self._loop_task = asyncio.create_task(self._batch_loop())
+        logger.info(f"Serving {self.config.model_name_or_path} as {self.key} with {len(self._workers)} workers")
+
+    # ---------- 请求 ----------
+
+    async def predict(self, item: Any, params: Optional[Dict[str, Any]] = None, request_id: Optional[str] = None,
+                      timeout: Optional[float] = None) -> Any:
+        """提交一个输入并等待结果；队列已满时拒绝"""
+        if self._loop_task is None or self._loop_task.done():
+            raise InferenceError(503, "Model server is not running")
+        if self._queue.qsize() >= self.config.max_queue_size:
+            self.metrics.rejected += 1
+            raise InferenceError(503, "Inference queue is full")
+        loop = asyncio.get_running_loop()
+        request = _PendingRequest(request_id or uuid.uuid4().hex[:12], item, dict(params or {}), loop.create_future(), loop.time())
+        if request.id in self._pending:
+            raise InferenceError(409, f"Request {request.id} is already pending")
+        self.metrics.requests += 1
+        self._pending[request.id] = request
+        self._queue.put_nowait(request)
+        try:
+            result = await asyncio.wait_for(request.future, timeout or self.config.timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise InferenceError(504, "Inference request timed out")
+        except asyncio.CancelledError:
+            # 调用方被取消（如客户端断开），未发送的请求不再计算
+            request.future.cancel()
+            self.metrics.cancelled += 1
+            raise
+        except InferenceError as e:
+            if e.status_code == 499:
+                self.metrics.cancelled += 1
+            else:
+                self.metrics.failed += 1
+            raise
+        finally:
+            self._pending.pop(request.id, None)
+        now = loop.time()
+        self.metrics.record_completion(now - request.enqueued_at, (request.dispatched_at or now) - request.enqueued_at)
+        return result
+
+    def cancel(self, request_id: str) -> int:
+        """取消尚未完成的请求（包括同一调用拆分出的 request_id-N），返回取消的数量；已发送给工作进程的请求结果会被丢弃"""
+        prefix = f"{request_id}-"
+        cancelled = 0
+        for key, request in list(self._pending.items()):
+            if (key == request_id or key.startswith(prefix)) and not request.future.done():
+                request.future.set_exception(InferenceError(499, "Request cancelled"))
+                cancelled += 1
+        return cancelled
+
+    # ---------- 批处理 ----------
+
+    async def _next_request(self) -> _PendingRequest:
+        while True:
+            request = await self._queue.get()
+            if not request.future.done():
+                return request
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        max_wait = self.config.max_wait_ms / 1000
+        while True:
+            # 先等空闲的工作进程：工作进程都在忙时请求在队列中累积，下一批自然更大
+            worker = await self._idle.get()
+            first = await self._next_request()
+            batch = [first]
+            deadline = first.enqueued_at + max_wait
+            while len(batch) < self.config.max_batch_size:
+                remaining = deadline - loop.time()
+                try:
+                    request = self._queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(self._queue.get(), remaining)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if not request.future.done():
+                    batch.append(request)
+
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                self._idle.put_nowait(worker)
+                continue
+            task = asyncio.create_task(self._dispatch(worker, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, worker: int, batch: List[_PendingRequest]):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        for request in batch:
+            request.dispatched_at = now
+        try:
+            outputs, compute_seconds = await loop.run_in_executor(
+                self._workers[worker], _predict_batch, [request.input for request in batch], [request.params for request in batch]
+            )
+            self.metrics.record_batch(len(batch), compute_seconds)
+            for request, output in zip(batch, outputs):
+                if not request.future.done():
+                    request.future.set_result(output)
+        except BrokenProcessPool:
+            logger.error(f"Inference worker {worker} of {self.key} crashed, restarting")
+            self._workers[worker].shutdown(wait=False, cancel_futures=True)
+            self._workers[worker] = self._new_worker()
+            self._fail(batch, InferenceError(500, "Inference worker crashed"))
+        except Exception as e:
+            if len(batch) > 1:
+                # 一个输入出错不影响同批的其他请求：逐个重试以定位失败的请求
+                for request in batch:
+                    await self._dispatch_single(worker, request)
+            else:
+                self._fail(batch, InferenceError(500, f"Inference failed: {e}"))
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def _dispatch_single(self, worker: int, request: _PendingRequest):
+        if request.future.done():
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            outputs, compute_seconds = await loop.run_in_executor(self._workers[worker], _predict_batch, [request.input], [request.params])
+            self.metrics.record_batch(1, compute_seconds)
+            if not request.future.done():
+                request.future.set_result(outputs[0])
+        except Exception as e:
+            self._fail([request], InferenceError(500, f"Inference failed: {e}"))
+
+    @staticmethod
+    def _fail(batch: List[_PendingRequest], error: InferenceError):
+        for request in batch:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    # ---------- 状态 ----------
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "deployment_id": self.deployment_id,
+            "key": self.key,
+            "deployed_at": self.deployed_at,
+            "config": asdict(self.config),
+            "queue_depth": self._queue.qsize(),
+            "pending_requests": len(self._pending),
+            "busy_workers": len(self._workers) - self._idle.qsize(),
+            "metrics": self.metrics.snapshot()
+        }
+
+    def _shutdown_workers(self):
+        for worker in self._workers:
+            worker.shutdown(wait=False, cancel_futures=True)
+        self._workers = []
+
+    async def stop(self):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        for request in list(self._pending.values()):
+            if not request.future.done():
+                request.future.set_exception(InferenceError(503, "Model was undeployed"))
+        self._shutdown_workers()
+
+
+class InferenceManager:
+    """按部署键（如 edgeai:<model_id>）管理运行中的模型服务"""
+
+    def __init__(self):
+        self._servers: Dict[str, ModelServer] = {}
+        self._lock = asyncio.Lock()
+
+    def get(self, key: str) -> Optional[ModelServer]:
+        return self._servers.get(key)
+
+    async def deploy(self, key: str, config: ServingConfig) -> ModelServer:
+        """启动部署；已有部署时先停止旧的，新部署加载成功后才替换"""
+        async with self._lock:
+            server = ModelServer(key, config)
+            await server.start()
+            previous = self._servers.get(key)
+            self._servers[key] = server
+        if previous is not None:
+            await previous.stop()
+        return server
+
+    async def undeploy(self, key: str) -> bool:
+        server = self._servers.pop(key, None)
+        if server is None:
+            return False
+        await server.stop()
+        return True
+
+    async def shutdown(self):
+        for key in list(self._servers):
+            await self.undeploy(key)
+
+
+# 全局推理服务实例
+inference_manager = InferenceManager()
@@ -0,0 +1,250 @@
+"""
+模型版本注册表
+- 每个版本是 model_versions 中的一行：版本号在模型内递增，parent_id 记录派生来源（可以是其他模型的版本），
+  artifact_digest 引用内容寻址存储中的对象
+- models.current_version_id 指向当前版本；回滚只修改这个指针，并把版本的制品引用和指标同步到模型记录，
+  已有的下载、评估和部署接口因此始终作用于当前版本，不复制任何文件
+- 列表、最新版本、最优版本和血缘查询只读版本表的元数据列（都有索引），不访问制品存储；
+  只有下载某个版本时才打开对象
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from common.storage.blobstore import BlobError, BlobReader, blob_ref, blob_store, parse_blob_ref
+from database.edgeai import Model, ModelVersion
+
+logger = logging.getLogger(__name__)
+
+# 血缘查询的最大深度
+REGISTRY_MAX_LINEAGE = 1000
+
+# 可用于选择最优版本的指标：列和方向（True 表示越大越好）
+VERSION_METRICS = {
+    "accuracy": (ModelVersion.accuracy, True),
+    "loss": (ModelVersion.loss, False)
+}
+
+
+class RegistryError(Exception):
+    """版本操作失败，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def version_dict(version: ModelVersion, current_version_id: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        "id": version.id,
+        "model_id": version.model_id,
+        "version": version.version,
+        "parent_id": version.parent_id,
+        "artifact_digest": version.artifact_digest,
+        "artifact_size": version.artifact_size,
+        "accuracy": version.accuracy,
+        "loss": version.loss,
+        "metrics": version.metrics or {},
+        "description": version.description or "",
+        "created_time": version.created_time.isoformat() if version.created_time else None,
+        "is_current": version.id == current_version_id
+    }
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ModelRegistry:
+    """模型版本的登记、查询和回滚"""
+
+    def get(self, db: Session, model_id: int, version: int) -> ModelVersion:
+        record = db.query(ModelVersion).filter(ModelVersion.model_id == model_id, ModelVersion.version == version).first()
+        if record is None:
+            raise RegistryError(404, f"Version {version} not found")
+        return record
+
+    def list_versions(self, db: Session, model_id: int, limit: int = 50, before: Optional[int] = None) -> List[ModelVersion]:
+        """按版本号倒序分页（before 为上一页最后一个版本号）"""
+        query = db.query(ModelVersion).filter(ModelVersion.model_id == model_id)
+        if before is not None:
+            query = query.filter(ModelVersion.version < before)
+        return query.order_by(ModelVersion.version.desc()).limit(limit).all()
+
+    def count(self, db: Session, model_id: int) -> int:
+        return db.query(func.count(ModelVersion.id)).filter(ModelVersion.model_id == model_id).scalar() or 0
+
+    def latest(self, db: Session, model_id: int) -> Optional[ModelVersion]:
+        return db.query(ModelVersion).filter(ModelVersion.model_id == model_id).order_by(ModelVersion.version.desc()).first()
+
+    def best(self, db: Session, model_id: int, metric: str) -> Optional[ModelVersion]:
+        """指标最优的版本（相同时取较新的版本）"""
+        if metric not in VERSION_METRICS:
+            raise RegistryError(400, f"metric must be one of {', '.join(VERSION_METRICS)}")
+        column, higher_is_better = VERSION_METRICS[metric]
+        return db.query(ModelVersion).filter(
+            ModelVersion.model_id == model_id, column.isnot(None)
+        ).order_by(
+            column.desc() if higher_is_better else column.asc(), ModelVersion.version.desc()
+        ).first()
+
+    def lineage(self, db: Session, version: ModelVersion) -> List[Tuple[ModelVersion, int]]:
+        """从该版本沿 parent_id 向上的祖先链（递归 CTE 一次查询），返回 (版本, 深度)"""
+        anchor = select(
+            ModelVersion.id.label("id"), ModelVersion.parent_id.label("parent_id"), literal(0).label("depth")
+        ).where(ModelVersion.id == version.id).cte("lineage", recursive=True)
+        parent = aliased(ModelVersion)
+        lineage = anchor.union_all(
+            select(parent.id, parent.parent_id, anchor.c.depth + 1).where(
+                parent.id == anchor.c.parent_id, anchor.c.depth < REGISTRY_MAX_LINEAGE
+            )
+        )
+        return db.query(ModelVersion, lineage.c.depth).join(lineage, ModelVersion.id == lineage.c.id).order_by(lineage.c.depth).all()
+
+    def children(self, db: Session, version: ModelVersion) -> List[ModelVersion]:
+        return db.query(ModelVersion).filter(ModelVersion.parent_id == version.id).order_by(ModelVersion.id).all()
+
+    def create_version(
+        self,
+        db: Session,
+        model: Model,
+        metrics: Optional[Dict[str, Any]] = None,
+        description: str = "",
+        parent_version: Optional[int] = None,
+        parent_id: Optional[int] = None,
+        set_current: bool = True
+    ) -> ModelVersion:
+        """
+        把模型当前登记的制品登记为新版本（持有一个对象引用）
+        未指定来源时以当前版本为父版本；指标缺省时取模型记录上的 accuracy / loss
+        """
+        digest = parse_blob_ref(model.file_path)
+        if model.file_path and not digest:
+            raise RegistryError(409, "Model artifact is still being imported into blob storage")
+
+        if parent_version is not None:
+            parent_id = self.get(db, model.id, parent_version).id
+        elif parent_id is not None:
+            if db.query(ModelVersion.id).filter(ModelVersion.id == parent_id).first() is None:
+                raise RegistryError(404, f"Parent version {parent_id} not found")
+        else:
+            parent_id = model.current_version_id
+
+        metrics = dict(metrics or {})
+        accuracy = _number(metrics.pop("accuracy", None))
+        loss = _number(metrics.pop("loss", None))
+        if accuracy is None and model.accuracy:
+            accuracy = float(model.accuracy)
+        if loss is None and model.loss:
+            loss = float(model.loss)
+
+        # 版本号取当前最大值加一；并发登记撞上唯一约束时重试
+        # 对象引用与版本记录在同一事务中提交，回滚时引用计数一并撤销
+        for _ in range(3):
+            size = None
+            if digest:
+                blob = blob_store.add_ref(db, digest, commit=False)
+                if blob is None:
+                    db.rollback()
+                    raise RegistryError(404, "Model artifact is not in blob storage")
+                size = blob.size
+            number = (db.query(func.max(ModelVersion.version)).filter(ModelVersion.model_id == model.id).scalar() or 0) + 1
+            record = ModelVersion(
+                model_id=model.id,
+                version=number,
+                parent_id=parent_id,
+                artifact_digest=digest,
+                artifact_size=size,
+                accuracy=accuracy,
+                loss=loss,
+                metrics=metrics,
+                description=description or ""
+            )
+            db.add(record)
+            try:
+                db.flush()
+                break
+            except IntegrityError:
+                db.rollback()
+                model = db.merge(model)
+        else:
+            raise RegistryError(409, "Concurrent version registration, please retry")
+
+        if set_current:
+            model.current_version_id = record.id
+            model.version = str(record.version)
+        db.commit()
+        db.refresh(record)
+        logger.info(f"Registered version {record.version} of model {model.id}")
+        return record
+
+    def rollback(self, db: Session, model: Model, version: int) -> ModelVersion:
+        """
+        切换当前版本：修改 current_version_id，并把该版本的制品引用和指标同步到模型记录
+        模型记录对制品的引用随之转移（新对象引用加一，旧对象引用减一）
+        """
+        record = self.get(db, model.id, version)
+        new_digest = record.artifact_digest
+        old_digest = parse_blob_ref(model.file_path)
+        if new_digest != old_digest and new_digest:
+            # 与模型记录的修改一起提交
+            if blob_store.add_ref(db, new_digest, commit=False) is None:
+                db.rollback()
+                raise RegistryError(410, f"Artifact of version {version} is no longer stored")
+
+        model.current_version_id = record.id
+        model.version = str(record.version)
+        model.file_path = blob_ref(new_digest) if new_digest else ""
+        model.sha256 = new_digest
+        model.artifact_size = record.artifact_size
+        model.artifact_mtime = None
+        if record.accuracy is not None:
+            model.accuracy = round(min(record.accuracy, 100.0), 2)
+        if record.loss is not None:
+            model.loss = round(record.loss, 2)
+        db.commit()
+
+        if new_digest != old_digest and old_digest:
+            blob_store.release(db, old_digest)
+        logger.info(f"Model {model.id} rolled back to version {record.version}")
+        return record
+
+    def record_metrics(self, db: Session, model_id: int, metrics: Dict[str, Any]):
+        """把评估结果写入模型当前版本（模型还没有版本时忽略）"""
+        current = db.query(Model.current_version_id).filter(Model.id == model_id).scalar()
+        if current is None:
+            return
+        record = db.get(ModelVersion, current)
+        record.accuracy = _number(metrics.get("accuracy", record.accuracy))
+        record.loss = _number(metrics.get("loss", record.loss))
+        record.metrics = {**(record.metrics or {}), **{key: value for key, value in metrics.items() if key not in ("accuracy", "loss")}}
+        db.commit()
+
+    def open_artifact(self, db: Session, record: ModelVersion) -> BlobReader:
+        """打开版本的制品（只有下载时才访问制品存储）"""
+        if not record.artifact_digest:
+            raise RegistryError(404, f"Version {record.version} has no artifact")
+        try:
+            return blob_store.open(db, record.artifact_digest)
+        except BlobError as e:
+            raise RegistryError(410, f"Artifact of version {record.version} is not available: {e}")
+
+    def release_artifacts(self, db: Session, model: Model):
+        """删除模型前释放所有版本持有的对象引用"""
+        digests = [digest for (digest,) in db.query(ModelVersion.artifact_digest).filter(
+            ModelVersion.model_id == model.id, ModelVersion.artifact_digest.isnot(None)
+        )]
+        for digest in digests:
+            blob_store.release(db, digest)
+
+
+# 全局模型版本注册表实例
+model_registry = ModelRegistry()
@@ -0,0 +1 @@
+# Visualization Module
@@ -0,0 +1,79 @@
+"""
+项目拓扑加载
+一次性加载项目及其模型、集群、节点（selectinload，查询次数固定，与集群数量无关），
+并预先计算可视化接口需要的分组与统计
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session, selectinload
+
+from database.edgeai import Project, Model, Node, Cluster
+
+# 节点类型 -> 拓扑中的角色（与集群启动时的 head/train/mpc 分类一致）
+NODE_ROLES = {
+    "center": "head",
+    "training": "worker",
+    "mpc": "mpc",
+}
+
+# 视为活跃的模型状态
+ACTIVE_MODEL_STATES = ("training", "trained")
+
+
+def node_role(node: Node) -> str:
+    node_type = node.type.lower() if node.type else ""
+    return NODE_ROLES.get(node_type, node_type or "worker")
+
+
+@dataclass
+class ProjectTopology:
+    """项目拓扑快照"""
+    project: Project
+    models: List[Model]
+    clusters: List[Cluster]
+    nodes: List[Node]
+    nodes_by_cluster: Dict[int, List[Node]] = field(default_factory=dict)
+    training_nodes: int = 0
+    active_models: int = 0
+
+
+def load_project_topology(db: Session, project_id: int, user_id: int) -> Optional[ProjectTopology]:
+    """
+    加载当前用户项目的完整拓扑
+    节点只通过项目自己的集群获取，不存在回退到全部节点的路径
+
+    Returns:
+        项目不存在或不属于该用户时返回 None
+    """
+    project = db.query(Project).options(
+        selectinload(Project.models),
+        selectinload(Project.clusters).selectinload(Cluster.nodes)
+    ).filter(
+        Project.id == project_id,
+        Project.user_id == user_id
+    ).first()
+
+    if not project:
+        return None
+
+    models = sorted(project.models, key=lambda model: model.id)
+    clusters = sorted(project.clusters, key=lambda cluster: cluster.id)
+
+    nodes: List[Node] = []
+    nodes_by_cluster: Dict[int, List[Node]] = {}
+    for cluster in clusters:
+        cluster_nodes = sorted(cluster.nodes, key=lambda node: node.id)
+        nodes_by_cluster[cluster.id] = cluster_nodes
+        nodes.extend(cluster_nodes)
+
+    return ProjectTopology(
+        project=project,
+        models=models,
+        clusters=clusters,
+        nodes=nodes,
+        nodes_by_cluster=nodes_by_cluster,
+        training_nodes=sum(1 for node in nodes if node.state == "training"),
+        active_models=sum(1 for model in models if model.status in ACTIVE_MODEL_STATES)
+    )
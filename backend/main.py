@@ -23,6 +23,9 @@ from edgeai.api import router as edgeai_router
 from database.edgeai.database import create_tables, get_database_info
 from database.edgeai.init_db import init_database
 
+# Import middleware
+from common.middleware.compression import CompressionMiddleware
+
 # Import background tasks
 from edgeai.background_tasks import start_background_tasks, stop_background_tasks
 
@@ -51,6 +54,9 @@ app.add_middleware(
     allowed_hosts=["localhost", "127.0.0.1", "0.0.0.0"]
 )
 
+# Response compression middleware (br / zstd / gzip negotiated via Accept-Encoding)
+app.add_middleware(CompressionMiddleware)
+
 # Include routers
 app.include_router(common_router, prefix="/api/common", tags=["Common"])
 app.include_router(p2pai_router, prefix="/api/p2pai", tags=["P2P AI"])
@@ -119,5 +125,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        ws_per_message_deflate=True  # 客户端支持时协商 WebSocket permessage-deflate 压缩
     )
\ No newline at end of file
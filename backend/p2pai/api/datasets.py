@@ -1,121 +1,245 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Request, Response, Query
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
-from ..schemas.training import DatasetUploadRequest
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+from ..schemas.training import DatasetUploadRequest, DatasetValidationRequest, DatasetShardingRequest, DatasetTokenizeRequest
+from ..storage.uploads import (
+    upload_manager,
+    parse_upload_metadata,
+    UploadError,
+    TUS_VERSION,
+    TUS_EXTENSIONS,
+    UPLOAD_MAX_SIZE,
+    DATASET_STORAGE_DIR
+)
+from ..storage.validation import validation_manager, DatasetValidationError
+from ..storage.sharding import shard_manager, dataset_source, ShardingError
+from ..storage.arrow_store import (
+    ARROW_MAX_ROWS,
+    arrow_store,
+    ArrowStoreError,
+    select_columns,
+    slice_rows,
+    take_rows,
+    sample_rows,
+    to_ipc_bytes
+)
+from ..storage.tokenization import TOKENIZED_MAX_ROWS, tokenization_manager, TokenizationError
 from common.schemas.common import BaseResponse
+from common.utils.serialization import dumps, FastJSONResponse
+from common.storage.artifacts import ArtifactError, SegmentsResponse, artifact_response, reader_response, resolve_artifact_path
+from common.storage.blobstore import BlobError, blob_store, parse_blob_ref
+from database.p2pai import get_db, Dataset
+from urllib.parse import quote
+import os
+import shutil
 import uuid
 
 router = APIRouter()
 
-# Mock datasets database
-mock_datasets = [
-    {
-        "id": "dataset-001",
-        "name": "CIFAR-10 Training Set",
-        "description": "Standard CIFAR-10 dataset for image classification",
-        "type": "image_classification",
-        "size": 50000,
-        "format": "hdf5",
-        "privacy_level": "public",
-        "project_id": "federated-1",
-        "uploaded_at": "2024-01-15T10:30:00Z",
-        "file_path": "/datasets/cifar10_train.h5"
-    },
-    {
-        "id": "dataset-002",
-        "name": "Medical Images Dataset",
-        "description": "Private medical imaging dataset for diagnosis",
-        "type": "medical_imaging",
-        "size": 15000,
-        "format": "dicom",
-        "privacy_level": "private",
-        "project_id": "mpc-1",
-        "uploaded_at": "2024-01-18T14:20:00Z",
-        "file_path": "/datasets/medical_images.dicom"
-    },
-    {
-        "id": "dataset-003",
-        "name": "Financial Transaction Data",
-        "description": "Encrypted financial transaction dataset for fraud detection",
-        "type": "tabular",
-        "size": 100000,
-        "format": "csv",
-        "privacy_level": "encrypted",
-        "project_id": "local-1",
-        "uploaded_at": "2024-01-10T09:15:00Z",
-        "file_path": "/datasets/financial_encrypted.csv"
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION}
+
+# 校验进度 SSE 的保活间隔（秒）
+VALIDATION_SSE_KEEPALIVE = int(os.getenv("P2PAI_VALIDATION_SSE_KEEPALIVE", 15))
+
+
+def _dataset_to_dict(dataset: Dataset) -> dict:
+    return {
+        "id": dataset.id,
+        "name": dataset.name,
+        "description": dataset.description,
+        "type": dataset.type,
+        "size": dataset.size or 0,
+        "format": dataset.format,
+        "privacy_level": dataset.privacy_level,
+        "project_id": dataset.project_id,
+        "status": dataset.status,
+        "sha256": dataset.sha256,
+        "uploaded_at": dataset.uploaded_at.isoformat() if dataset.uploaded_at else None,
+        "validated_at": dataset.validated_at.isoformat() if dataset.validated_at else None,
+        "file_path": dataset.file_path
     }
-]
+
+
+def _get_dataset(db: Session, dataset_id: str) -> Dataset:
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return dataset
+
+
+def _upload_http_error(e: UploadError) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers=TUS_HEADERS)
+
 
 @router.get("/", response_model=List[dict])
 async def get_datasets(
     project_id: Optional[str] = None,
     privacy_level: Optional[str] = None,
-    dataset_type: Optional[str] = None
+    dataset_type: Optional[str] = None,
+    db: Session = Depends(get_db)
 ):
     """
     获取数据集列表
     支持按项目、隐私级别和类型过滤
     """
-    filtered_datasets = mock_datasets
-    
+    query = db.query(Dataset)
+
     if project_id:
-        filtered_datasets = [d for d in filtered_datasets if d["project_id"] == project_id]
-    
+        query = query.filter(Dataset.project_id == project_id)
+
     if privacy_level:
-        filtered_datasets = [d for d in filtered_datasets if d["privacy_level"] == privacy_level]
-    
+        query = query.filter(Dataset.privacy_level == privacy_level)
+
     if dataset_type:
-        filtered_datasets = [d for d in filtered_datasets if d["type"] == dataset_type]
-    
-    return filtered_datasets
+        query = query.filter(Dataset.type == dataset_type)
+
+    return [_dataset_to_dict(dataset) for dataset in query.order_by(Dataset.created_time).all()]
+
+# ===============================
+# 断点续传上传（tus 1.0）
+# ===============================
+
+@router.options("/uploads")
+async def get_upload_options():
+    """
+    tus 能力发现
+    """
+    return Response(status_code=204, headers={
+        **TUS_HEADERS,
+        "Tus-Version": TUS_VERSION,
+        "Tus-Extension": TUS_EXTENSIONS,
+        "Tus-Max-Size": str(UPLOAD_MAX_SIZE)
+    })
+
+@router.post("/uploads", status_code=201)
+async def create_upload(request: Request, db: Session = Depends(get_db)):
+    """
+    创建上传
+    请求头: Upload-Length（总字节数），Upload-Metadata（filename、name、project_id、privacy_level、type，值为 base64）
+    响应的 Location 为后续 HEAD / PATCH 的地址；内容在上传完成后按服务端计算的 SHA-256 去重
+    """
+    try:
+        length = int(request.headers.get("upload-length", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Length header is required", headers=TUS_HEADERS)
+
+    try:
+        metadata = parse_upload_metadata(request.headers.get("upload-metadata"))
+        upload = upload_manager.create(db, length, metadata)
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+    return Response(status_code=201, headers={
+        **TUS_HEADERS,
+        "Location": str(request.url_for("get_upload_offset", upload_id=upload.id)),
+        "Upload-Offset": str(upload.offset),
+        "X-Dataset-Id": upload.dataset_id
+    })
+
+@router.head("/uploads/{upload_id}", name="get_upload_offset")
+async def get_upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    """
+    查询已确认的上传进度（断线后从 Upload-Offset 继续上传）
+    """
+    try:
+        upload = upload_manager.get(db, upload_id)
+    except UploadError as e:
+        raise _upload_http_error(e)
+
+    return Response(status_code=200, headers={
+        **TUS_HEADERS,
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.length),
+        "Cache-Control": "no-store"
+    })
+
+@router.patch("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    从 Upload-Offset 处追加数据
+    请求体以流的方式写入磁盘并增量计算 SHA-256；上传完成时数据集状态变为 ready
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream", headers=TUS_HEADERS)
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Upload-Offset header is required", headers=TUS_HEADERS)
+
+    try:
+        upload = upload_manager.get(db, upload_id)
+        new_offset = await upload_manager.write(db, upload, offset, request.stream())
+    except UploadError as e:
+        raise _upload_http_error(e)
+    except ClientDisconnect:
+        # 已收到的数据已经确认，客户端重连后通过 HEAD 获取 offset
+        return Response(status_code=400, headers=TUS_HEADERS)
+
+    headers = {**TUS_HEADERS, "Upload-Offset": str(new_offset)}
+    if upload.completed_at is not None:
+        headers["X-Dataset-Sha256"] = upload.dataset.sha256 or ""
+    return Response(status_code=204, headers=headers)
+
+@router.delete("/uploads/{upload_id}")
+async def terminate_upload(upload_id: str, db: Session = Depends(get_db)):
+    """
+    终止未完成的上传
+    """
+    try:
+        upload = upload_manager.get(db, upload_id)
+        upload_manager.terminate(db, upload)
+    except UploadError as e:
+        raise _upload_http_error(e)
+    return Response(status_code=204, headers=TUS_HEADERS)
 
 @router.get("/{dataset_id}", response_model=dict)
-async def get_dataset(dataset_id: str):
+async def get_dataset(dataset_id: str, db: Session = Depends(get_db)):
     """
     获取特定数据集详情
     """
-    for dataset in mock_datasets:
-        if dataset["id"] == dataset_id:
-            return dataset
-    
-    raise HTTPException(status_code=404, detail="Dataset not found")
+    return _dataset_to_dict(_get_dataset(db, dataset_id))
 
 @router.post("/upload", response_model=BaseResponse)
 async def upload_dataset(
     file: UploadFile = File(...),
     project_id: str = None,
     dataset_name: str = None,
-    privacy_level: str = "private"
+    privacy_level: str = "private",
+    db: Session = Depends(get_db)
 ):
     """
-    上传数据集
+    上传数据集（单次 multipart 上传）
+    大文件建议使用 /uploads 断点续传接口
     """
     try:
-        # 生成数据集ID
-        dataset_id = f"dataset-{uuid.uuid4().hex[:8]}"
-        
-        # 模拟文件保存
-        file_path = f"/datasets/{dataset_id}_{file.filename}"
-        
-        # 创建数据集记录
-        new_dataset = {
-            "id": dataset_id,
-            "name": dataset_name or file.filename,
-            "description": f"Uploaded dataset: {file.filename}",
-            "type": "custom",
-            "size": file.size,
-            "format": file.filename.split('.')[-1],
-            "privacy_level": privacy_level,
-            "project_id": project_id,
-            "uploaded_at": "2024-01-15T10:30:00Z",
-            "file_path": file_path
-        }
-        
-        mock_datasets.append(new_dataset)
-        
+        file.file.seek(0, os.SEEK_END)
+        length = file.file.tell()
+        file.file.seek(0)
+
+        upload = upload_manager.create(db, length, {
+            "filename": file.filename or "",
+            "name": dataset_name or file.filename or "",
+            "project_id": project_id or "",
+            "privacy_level": privacy_level
+        })
+
+        async def chunks():
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+
+        if upload.completed_at is None:
+            await upload_manager.write(db, upload, 0, chunks())
+
         return BaseResponse(
             success=True,
-            message=f"Dataset uploaded successfully: {dataset_id}"
+            message=f"Dataset uploaded successfully: {upload.dataset_id}",
+            data=_dataset_to_dict(upload.dataset)
         )
     except Exception as e:
         return BaseResponse(
@@ -124,87 +248,130 @@ async def upload_dataset(
         )
 
 @router.post("/", response_model=BaseResponse)
-async def create_dataset(request: DatasetUploadRequest):
+async def create_dataset(request: DatasetUploadRequest, db: Session = Depends(get_db)):
     """
     创建数据集记录
+    文件可以随后通过 /uploads 上传
     """
     try:
         dataset_id = f"dataset-{uuid.uuid4().hex[:8]}"
-        
-        new_dataset = {
-            "id": dataset_id,
-            "name": request.dataset_name,
-            "description": request.description or f"Dataset: {request.dataset_name}",
-            "type": request.dataset_type,
-            "size": 0,  # 将在实际上传时更新
-            "format": "unknown",
-            "privacy_level": request.privacy_level,
-            "project_id": request.project_id,
-            "uploaded_at": "2024-01-15T10:30:00Z",
-            "file_path": ""
-        }
-        
-        mock_datasets.append(new_dataset)
-        
+
+        dataset = Dataset(
+            id=dataset_id,
+            name=request.dataset_name,
+            description=request.description or f"Dataset: {request.dataset_name}",
+            type=request.dataset_type,
+            size=0,  # 将在实际上传时更新
+            format="unknown",
+            privacy_level=request.privacy_level,
+            project_id=request.project_id,
+            status="created"
+        )
+        db.add(dataset)
+        db.commit()
+
         return BaseResponse(
             success=True,
-            message=f"Dataset created successfully: {dataset_id}"
+            message=f"Dataset created successfully: {dataset_id}",
+            data={"id": dataset_id}
         )
     except Exception as e:
+        db.rollback()
         return BaseResponse(
             success=False,
             error=str(e)
         )
 
 @router.delete("/{dataset_id}", response_model=BaseResponse)
-async def delete_dataset(dataset_id: str):
+async def delete_dataset(dataset_id: str, db: Session = Depends(get_db)):
     """
     删除数据集
     """
-    global mock_datasets
-    original_count = len(mock_datasets)
-    mock_datasets = [d for d in mock_datasets if d["id"] != dataset_id]
-    
-    if len(mock_datasets) < original_count:
-        return BaseResponse(
-            success=True,
-            message="Dataset deleted successfully"
-        )
+    dataset = _get_dataset(db, dataset_id)
+    validation_manager.cancel(dataset.id)
+    shard_manager.remove_dataset(dataset.id)
+    shared = dataset.sha256 and db.query(Dataset).filter(Dataset.sha256 == dataset.sha256, Dataset.id != dataset.id).first()
+    arrow_store.evict(dataset, remove_file=not shared)
+
+    for upload in dataset.upload_sessions:
+        if upload.completed_at is None:
+            try:
+                os.remove(upload.temp_path)
+            except FileNotFoundError:
+                pass
+    digest = parse_blob_ref(dataset.file_path)
+    if digest:
+        blob_store.release(db, digest)
     else:
-        raise HTTPException(status_code=404, detail="Dataset not found")
+        shutil.rmtree(DATASET_STORAGE_DIR / dataset.id, ignore_errors=True)
+
+    db.delete(dataset)
+    db.commit()
+
+    return BaseResponse(
+        success=True,
+        message="Dataset deleted successfully"
+    )
 
 @router.get("/{dataset_id}/download")
-async def download_dataset(dataset_id: str):
+async def download_dataset(dataset_id: str, db: Session = Depends(get_db)):
     """
     下载数据集
     """
-    for dataset in mock_datasets:
-        if dataset["id"] == dataset_id:
-            # 模拟文件下载
-            return {
-                "dataset_id": dataset_id,
-                "download_url": f"/api/p2pai/datasets/{dataset_id}/file",
-                "filename": dataset["name"],
-                "size": dataset["size"]
-            }
-    
-    raise HTTPException(status_code=404, detail="Dataset not found")
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
+    return {
+        "dataset_id": dataset_id,
+        "download_url": f"/api/p2pai/datasets/{dataset_id}/file",
+        "filename": dataset.name,
+        "size": dataset.size,
+        "sha256": dataset.sha256
+    }
+
+@router.get("/{dataset_id}/file")
+async def get_dataset_file(dataset_id: str, request: Request, db: Session = Depends(get_db)):
+    """
+    下载数据集文件，支持 Range 断点续传
+    """
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
+    digest = parse_blob_ref(dataset.file_path)
+    if digest:
+        try:
+            reader = blob_store.open(db, digest)
+        except BlobError as e:
+            raise HTTPException(status_code=404, detail=f"Dataset file not available: {e}")
+        completed = [upload for upload in dataset.upload_sessions if upload.completed_at is not None]
+        filename = completed[-1].filename if completed else dataset.name
+        return reader_response(request, reader, reader.size, digest, filename=filename)
+
+    try:
+        path = resolve_artifact_path(dataset.file_path, root=DATASET_STORAGE_DIR)
+    except ArtifactError as e:
+        raise HTTPException(status_code=404, detail=f"Dataset file not available: {e}")
+
+    return artifact_response(request, path, sha256=dataset.sha256, root=DATASET_STORAGE_DIR)
 
 @router.get("/stats/overview")
-async def get_dataset_stats():
+async def get_dataset_stats(db: Session = Depends(get_db)):
     """
     获取数据集统计信息
     """
-    total_datasets = len(mock_datasets)
-    total_size = sum(d["size"] for d in mock_datasets)
-    
+    datasets = db.query(Dataset.size, Dataset.privacy_level, Dataset.type).all()
+    total_datasets = len(datasets)
+    total_size = sum(size or 0 for size, _, _ in datasets)
+
     privacy_levels = {}
     dataset_types = {}
-    
-    for dataset in mock_datasets:
-        privacy_levels[dataset["privacy_level"]] = privacy_levels.get(dataset["privacy_level"], 0) + 1
-        dataset_types[dataset["type"]] = dataset_types.get(dataset["type"], 0) + 1
-    
+
+    for _, privacy_level, dataset_type in datasets:
+        privacy_levels[privacy_level] = privacy_levels.get(privacy_level, 0) + 1
+        dataset_types[dataset_type] = dataset_types.get(dataset_type, 0) + 1
+
     return {
         "total_datasets": total_datasets,
         "total_size": total_size,
@@ -213,25 +380,363 @@ async def get_dataset_stats():
         "avg_size": total_size / total_datasets if total_datasets > 0 else 0
     }
 
+def _validation_urls(dataset_id: str) -> dict:
+    return {
+        "status_url": f"/api/p2pai/datasets/{dataset_id}/validation",
+        "stream_url": f"/api/p2pai/datasets/{dataset_id}/validation/stream"
+    }
+
+def _stored_validation(dataset: Dataset) -> dict:
+    return {
+        "dataset_id": dataset.id,
+        "status": "completed",
+        "progress": 100.0,
+        "finished_at": dataset.validated_at.isoformat() if dataset.validated_at else None,
+        "result": dataset.validation_result
+    }
+
 @router.post("/{dataset_id}/validate")
-async def validate_dataset(dataset_id: str):
-    """
-    验证数据集
-    """
-    for dataset in mock_datasets:
-        if dataset["id"] == dataset_id:
-            # 模拟数据集验证
-            return {
-                "dataset_id": dataset_id,
-                "valid": True,
-                "validation_results": {
-                    "format_valid": True,
-                    "data_integrity": True,
-                    "privacy_compliance": True,
-                    "size_verified": True
-                },
-                "issues": []
-            }
-    
-    raise HTTPException(status_code=404, detail="Dataset not found")
-# dewdwe
\ No newline at end of file
+async def validate_dataset(
+    dataset_id: str,
+    options: Optional[DatasetValidationRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    启动数据集校验与画像
+    文件按块交给进程池解析（CSV / JSONL / Parquet），计算 schema 符合度、空值、行数、重复行和列统计；
+    立即返回任务状态，进度和阶段性结果通过 /validation 查询或 /validation/stream 订阅
+    """
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
+    try:
+        job = validation_manager.start(db, dataset, (options or DatasetValidationRequest()).model_dump())
+    except DatasetValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {**job.snapshot, **_validation_urls(dataset_id)}
+
+@router.get("/{dataset_id}/validation")
+async def get_dataset_validation(dataset_id: str, db: Session = Depends(get_db)):
+    """
+    获取进行中的校验任务状态，没有进行中的任务时返回最近一次的校验结果
+    """
+    job = validation_manager.active_job(dataset_id)
+    if job is not None:
+        return {**job.snapshot, **_validation_urls(dataset_id)}
+
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.validation_result is None:
+        raise HTTPException(status_code=404, detail="Dataset has not been validated")
+    return _stored_validation(dataset)
+
+@router.get("/{dataset_id}/validation/stream")
+async def stream_dataset_validation(
+    dataset_id: str,
+    since_version: int = Query(0, ge=0, description="客户端已知的版本号"),
+    db: Session = Depends(get_db)
+):
+    """
+    校验进度 SSE 流
+    每处理完一批数据块推送一次 progress 事件（包含阶段性的列统计），结束时推送 result 事件后关闭；
+    没有进行中的任务时直接推送最近一次的结果
+    """
+    job = validation_manager.active_job(dataset_id)
+    stored = None
+    if job is None:
+        dataset = _get_dataset(db, dataset_id)
+        if dataset.validation_result is None:
+            raise HTTPException(status_code=404, detail="Dataset has not been validated")
+        stored = _stored_validation(dataset)
+    # 推送期间不占用数据库连接
+    db.close()
+
+    async def event_stream():
+        if job is None:
+            yield f"event: result\ndata: {dumps(stored).decode('utf-8')}\n\n"
+            return
+        version = since_version
+        while True:
+            if await job.wait(version, VALIDATION_SSE_KEEPALIVE):
+                snapshot = job.snapshot
+                version = snapshot["version"]
+                event = "result" if job.done else "progress"
+                yield f"id: {version}\nevent: {event}\ndata: {dumps(snapshot).decode('utf-8')}\n\n"
+                if job.done:
+                    return
+            else:
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sharding_to_dict(dataset_id: str, meta: dict) -> dict:
+    return {
+        **meta,
+        "client_url": f"/api/p2pai/datasets/{dataset_id}/shards/{meta['key']}/clients/{{client}}"
+    }
+
+@router.post("/{dataset_id}/shards")
+async def create_dataset_sharding(
+    dataset_id: str,
+    options: DatasetShardingRequest,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    把数据集划分给 num_clients 个联邦学习客户端（iid / dirichlet / quantity）
+    只生成索引文件，不复制数据；相同数据集、参数和 seed 的索引已存在时直接返回（200），新建时返回 201
+    """
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+
+    try:
+        index, created = await run_in_threadpool(shard_manager.build, db, dataset, options.model_dump())
+    except ShardingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    response.status_code = 201 if created else 200
+    return _sharding_to_dict(dataset_id, index.meta)
+
+@router.get("/{dataset_id}/shards")
+async def list_dataset_shardings(dataset_id: str, db: Session = Depends(get_db)):
+    """
+    列出数据集已构建的分片索引
+    """
+    _get_dataset(db, dataset_id)
+    return [_sharding_to_dict(dataset_id, meta) for meta in shard_manager.list_shardings(dataset_id)]
+
+@router.get("/{dataset_id}/shards/{shard_key}")
+async def get_dataset_sharding(dataset_id: str, shard_key: str):
+    """
+    获取分片索引的参数和每个客户端的记录数、标签分布
+    """
+    try:
+        index = shard_manager.get(dataset_id, shard_key)
+    except ShardingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return _sharding_to_dict(dataset_id, index.meta)
+
+@router.get("/{dataset_id}/shards/{shard_key}/clients/{client}")
+async def get_client_shard(dataset_id: str, shard_key: str, client: int, db: Session = Depends(get_db)):
+    """
+    下载一个客户端的分片
+    CSV / JSONL 按索引中的区间直接从数据集文件发送（CSV 带表头），Parquet 取出对应行写成新的 Parquet 文件
+    """
+    dataset = _get_dataset(db, dataset_id)
+    try:
+        index = shard_manager.get(dataset_id, shard_key)
+        if index.meta["dataset_sha256"] != dataset.sha256:
+            raise ShardingError(409, "Dataset changed since the sharding was built")
+        source = dataset_source(db, dataset)
+        name, ext = os.path.splitext(dataset.name or dataset_id)
+        filename = f"{name}.client{client}{ext or '.' + (dataset.format or 'bin')}"
+        if index.meta["format"] == "parquet":
+            content = await run_in_threadpool(index.client_parquet, client, source)
+            return Response(
+                content=content,
+                media_type="application/octet-stream",
+                headers={
+                    "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+                    "X-Shard-Records": str(len(index.client_rows(client)))
+                }
+            )
+        offsets, lengths, suffix = index.client_segments(client)
+    except ShardingError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    return SegmentsResponse(
+        source,
+        offsets,
+        lengths,
+        filename=filename,
+        suffix=suffix,
+        headers={"X-Shard-Records": str(len(index.client_rows(client)))}
+    )
+
+# ===============================
+# Arrow 本地数据集（内存映射随机访问）
+# ===============================
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _ready_dataset(db: Session, dataset_id: str) -> Dataset:
+    dataset = _get_dataset(db, dataset_id)
+    if dataset.status != "ready":
+        raise HTTPException(status_code=409, detail=f"Dataset is not ready (status: {dataset.status})")
+    return dataset
+
+async def _open_table(db: Session, dataset: Dataset):
+    try:
+        return await run_in_threadpool(arrow_store.open, db, dataset)
+    except ArrowStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def _parse_columns(columns: Optional[str]) -> Optional[List[str]]:
+    return [column.strip() for column in columns.split(",") if column.strip()] if columns else None
+
+def _table_response(table, output_format: str, extra: dict) -> Response:
+    if output_format == "arrow":
+        return Response(content=to_ipc_bytes(table), media_type=ARROW_STREAM_MEDIA_TYPE)
+    return FastJSONResponse({**extra, "num_rows": table.num_rows, "rows": table.to_pylist()})
+
+@router.post("/{dataset_id}/arrow")
+async def materialize_dataset(dataset_id: str, db: Session = Depends(get_db)):
+    """
+    把数据集转换为 Arrow IPC 文件（只转换一次，内容相同的数据集共用）
+    读取接口在首次访问时也会自动转换
+    """
+    dataset = _ready_dataset(db, dataset_id)
+    try:
+        return await run_in_threadpool(arrow_store.info, db, dataset)
+    except ArrowStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+@router.get("/{dataset_id}/preview")
+async def preview_dataset(
+    dataset_id: str,
+    rows: int = Query(20, ge=0, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    数据集预览：schema、总行数和前若干行
+    """
+    dataset = _ready_dataset(db, dataset_id)
+    table = await _open_table(db, dataset)
+    return FastJSONResponse({
+        "dataset_id": dataset_id,
+        "total_rows": table.num_rows,
+        "schema": [{"name": field.name, "type": str(field.type)} for field in table.schema],
+        "rows": table.slice(0, rows).to_pylist()
+    })
+
+@router.get("/{dataset_id}/rows")
+async def read_dataset_rows(
+    dataset_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=ARROW_MAX_ROWS),
+    indices: Optional[str] = Query(None, description="逗号分隔的行号，指定时忽略 offset / limit"),
+    columns: Optional[str] = Query(None, description="逗号分隔的列名"),
+    format: str = Query("json", pattern="^(json|arrow)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    按行范围或行号随机读取数据集（format=arrow 时返回 Arrow IPC 流）
+    """
+    dataset = _ready_dataset(db, dataset_id)
+    table = await _open_table(db, dataset)
+    try:
+        table = select_columns(table, _parse_columns(columns))
+        if indices:
+            try:
+                row_ids = [int(value) for value in indices.split(",") if value.strip()]
+            except ValueError:
+                raise HTTPException(status_code=400, detail="indices must be comma-separated integers")
+            result = take_rows(table, row_ids)
+        else:
+            result = slice_rows(table, offset, limit)
+    except ArrowStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return _table_response(result, format, {"dataset_id": dataset_id, "total_rows": table.num_rows, "offset": offset})
+
+@router.get("/{dataset_id}/sample")
+async def sample_dataset(
+    dataset_id: str,
+    n: int = Query(50, ge=0, le=ARROW_MAX_ROWS, description="抽取的行数，对应项目的 dataset_sample"),
+    seed: Optional[int] = None,
+    columns: Optional[str] = Query(None, description="逗号分隔的列名"),
+    format: str = Query("json", pattern="^(json|arrow)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    不放回随机抽样，相同 seed 返回相同的行
+    """
+    dataset = _ready_dataset(db, dataset_id)
+    table = await _open_table(db, dataset)
+    try:
+        result = sample_rows(select_columns(table, _parse_columns(columns)), n, seed)
+    except ArrowStoreError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return _table_response(result, format, {"dataset_id": dataset_id, "total_rows": table.num_rows, "seed": seed})
+
+# ===============================
+# 分词预处理缓存
+# ===============================
+
+def _tokenized_urls(dataset_id: str, key: str) -> dict:
+    return {
+        "status_url": f"/api/p2pai/datasets/{dataset_id}/tokenized/{key}",
+        "rows_url": f"/api/p2pai/datasets/{dataset_id}/tokenized/{key}/rows"
+    }
+
+@router.post("/{dataset_id}/tokenize")
+async def tokenize_dataset(
+    dataset_id: str,
+    options: DatasetTokenizeRequest,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    对数据集分词并缓存 token id（键为数据集内容、分词器和参数的哈希）
+    缓存命中时直接返回（200，cache_hit 为 true），否则在进程池中分词并返回 202
+    """
+    dataset = _ready_dataset(db, dataset_id)
+    try:
+        status = await tokenization_manager.prepare(db, dataset, options.model_dump())
+    except TokenizationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    response.status_code = 200 if status["status"] == "completed" else 202
+    return {**status, **_tokenized_urls(dataset_id, status["key"])}
+
+@router.get("/{dataset_id}/tokenized/{key}")
+async def get_tokenized_dataset(dataset_id: str, key: str, db: Session = Depends(get_db)):
+    """
+    获取分词任务进度或已缓存结果的信息
+    """
+    dataset = _get_dataset(db, dataset_id)
+    try:
+        status = tokenization_manager.status(key)
+    except TokenizationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if not tokenization_manager.belongs_to(status, dataset):
+        raise HTTPException(status_code=404, detail="Tokenized dataset not found")
+    return {**status, **_tokenized_urls(dataset_id, key)}
+
+@router.get("/{dataset_id}/tokenized/{key}/rows")
+async def read_tokenized_rows(
+    dataset_id: str,
+    key: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=0, le=TOKENIZED_MAX_ROWS),
+    format: str = Query("json", pattern="^(json|arrow)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    按行读取 token id（format=arrow 时返回 list<uint32> 列 input_ids 的 Arrow IPC 流）
+    """
+    dataset = _get_dataset(db, dataset_id)
+    tokenized = tokenization_manager.lookup(key)
+    if tokenized is None or not tokenization_manager.belongs_to(tokenized.meta, dataset):
+        raise HTTPException(status_code=404, detail="Tokenized dataset not found")
+    table = await run_in_threadpool(tokenized.slice_table, offset, limit)
+    if format == "arrow":
+        return Response(content=to_ipc_bytes(table), media_type=ARROW_STREAM_MEDIA_TYPE)
+    return FastJSONResponse({
+        "key": key,
+        "total_rows": len(tokenized),
+        "offset": offset,
+        "num_rows": table.num_rows,
+        "input_ids": table.column("input_ids").to_pylist()
+    })
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭事件 - 停止校验、分词任务和进程池"""
+    validation_manager.shutdown()
+    tokenization_manager.shutdown()
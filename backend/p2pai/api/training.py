@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, UploadFile, File, Form, Request, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from typing import List, Dict, Any, Optional
 from ..schemas.training import (
     TrainingStartRequest,
     TrainingStopRequest,
@@ -8,9 +11,21 @@ from ..schemas.training import (
     MPCTrainingRequest,
     TrainingMetrics
 )
+from ..federated.aggregation import aggregation_engine, AggregationError, open_update
+from ..federated.compression import CompressionConfig, decode_delta, encode_delta, read_delta_header
+from ..federated.mpc import MPCConfig, mpc_manager
+from ..federated.secure_aggregation import ShamirScheme
+from ..storage.tokenization import tokenization_manager, TokenizationError
 from common.schemas.common import BaseResponse
+from common.storage.artifacts import artifact_response
+from common.utils.serialization import send_json
+from database.p2pai import get_db, Dataset
+from sqlalchemy.orm import Session
 import asyncio
-import json
+import math
+import os
+import uuid
+from pathlib import Path
 
 router = APIRouter()
 
@@ -76,14 +91,33 @@ async def stop_training(request: TrainingStopRequest):
             error=str(e)
         )
 
+async def _prepare_tokenized_data(db: Session, dataset_config: Dict[str, Any]):
+    """
+    dataset_config 指定 dataset_id 和 tokenizer 时准备分词缓存
+    命中缓存时训练可以立即读取，否则返回进行中的分词任务状态
+    """
+    if not dataset_config.get("dataset_id") or not dataset_config.get("tokenizer"):
+        return None
+    dataset = db.query(Dataset).filter(Dataset.id == dataset_config["dataset_id"]).first()
+    if dataset is None or dataset.status != "ready":
+        raise TokenizationError(404, "Dataset not found or not ready")
+    status = await tokenization_manager.prepare(db, dataset, dataset_config)
+    return {
+        **{key: status.get(key) for key in ("key", "status", "cache_hit", "rows", "tokens", "progress")},
+        "rows_url": f"/api/p2pai/datasets/{dataset.id}/tokenized/{status['key']}/rows"
+    }
+
 @router.post("/local", response_model=BaseResponse)
-async def start_local_training(request: LocalTrainingRequest):
+async def start_local_training(request: LocalTrainingRequest, db: Session = Depends(get_db)):
     """
     开始本地训练
+    dataset_config 包含 dataset_id 和 tokenizer（及 max_length、text_columns）时使用分词缓存，
+    相同数据集和分词参数不会重复分词
     """
     try:
         # 模拟本地训练
         session_id = f"local_{request.project_id}"
+        preprocessing = await _prepare_tokenized_data(db, request.dataset_config)
         
         active_training_sessions[session_id] = {
             "project_id": request.project_id,
@@ -98,12 +132,19 @@ async def start_local_training(request: LocalTrainingRequest):
                 "f1_score": 0.0
             },
             "config": request.training_config,
-            "dataset_config": request.dataset_config
+            "dataset_config": request.dataset_config,
+            "preprocessing": preprocessing
         }
         
         return BaseResponse(
             success=True,
-            message="Local training started successfully"
+            message="Local training started successfully",
+            data={"session_id": session_id, "preprocessing": preprocessing}
+        )
+    except TokenizationError as e:
+        return BaseResponse(
+            success=False,
+            error=e.detail
         )
     except Exception as e:
         return BaseResponse(
@@ -115,29 +156,47 @@ async def start_local_training(request: LocalTrainingRequest):
 async def start_federated_training(request: TrainingStartRequest):
     """
     开始联邦学习训练
+    config: algorithm（fedavg / fedprox / fedadam，默认 fedavg）、total_rounds、min_clients（收到该数量的更新后自动聚合）
+    及服务端优化器参数（server_lr、mu、beta1、beta2、tau）
+    secure_aggregation 为 shamir_threshold 时按 num_computers / threshold 返回客户端拆分份额所需的参数
     """
     try:
         session_id = f"federated_{request.project_id}"
-        
+        config = request.config or {}
+        secure = None
+        if config.get("secure_aggregation") == "shamir_threshold":
+            secure = ShamirScheme(int(config.get("num_computers", 3)), int(config.get("threshold", 2))).config()
+        aggregation = aggregation_engine.create_session(session_id, config)
+        status = aggregation.status()
+        if secure:
+            status["secure_aggregation"] = secure
+
         active_training_sessions[session_id] = {
             "project_id": request.project_id,
             "training_type": "federated",
             "status": "running",
             "progress": 0.0,
             "current_round": 0,
-            "total_rounds": 10,
+            "total_rounds": status["total_rounds"],
             "participants": [],
             "metrics": {
                 "global_accuracy": 0.0,
                 "local_accuracies": {},
                 "loss": 1.0
             },
-            "config": request.config or {}
+            "aggregation": {key: status[key] for key in ("algorithm", "server_lr", "min_clients")},
+            "config": config
         }
         
         return BaseResponse(
             success=True,
-            message="Federated training started successfully"
+            message="Federated training started successfully",
+            data=status
+        )
+    except AggregationError as e:
+        return BaseResponse(
+            success=False,
+            error=e.detail
         )
     except Exception as e:
         return BaseResponse(
@@ -145,40 +204,335 @@ async def start_federated_training(request: TrainingStartRequest):
             error=str(e)
         )
 
+# ===============================
+# 联邦聚合
+# ===============================
+
+def _get_aggregation(project_id: str):
+    try:
+        return aggregation_engine.get(f"federated_{project_id}")
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+async def _save_upload(aggregation, file: UploadFile) -> Path:
+    """把上传的张量文件按块写入会话目录"""
+    path = aggregation.incoming_dir / f"{uuid.uuid4().hex}-{os.path.basename(file.filename or 'update')}"
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(4 * 1024 * 1024)
+            if not chunk:
+                break
+            await run_in_threadpool(f.write, chunk)
+    return path
+
+def _record_round(project_id: str, aggregation, result: Dict[str, Any]):
+    session = active_training_sessions.get(f"federated_{project_id}")
+    if session is None:
+        return
+    session["current_round"] = aggregation.round
+    session["progress"] = round(min(aggregation.round / max(aggregation.total_rounds, 1), 1.0) * 100, 2)
+    session["participants"] = sorted(set(session["participants"]) | set(result["clients"]))
+    if aggregation.round >= aggregation.total_rounds:
+        session["status"] = "completed"
+
+@router.post("/federated/{project_id}/model")
+async def upload_initial_model(project_id: str, file: UploadFile = File(...)):
+    """
+    上传初始全局模型（safetensors 或 .npy，第一轮之前）
+    """
+    aggregation = _get_aggregation(project_id)
+    path = await _save_upload(aggregation, file)
+    try:
+        return await run_in_threadpool(aggregation.set_initial_model, path)
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        path.unlink(missing_ok=True)
+
+def _check_num_samples(num_samples: float):
+    """在保存和解码上传文件之前检查权重（NaN / inf 会使整轮的加权平均失效）"""
+    if not (math.isfinite(num_samples) and num_samples > 0):
+        raise HTTPException(status_code=400, detail="num_samples must be a positive finite number")
+
+async def _accumulate(project_id: str, aggregation, path: Path, num_samples: float, client_id: str) -> Dict[str, Any]:
+    """累加一个完整的更新文件；达到 min_clients 时自动聚合（并发的提交只有一个会执行聚合）"""
+    status = await run_in_threadpool(aggregation.submit, path, num_samples, client_id)
+    result = await run_in_threadpool(aggregation.aggregate_if_ready)
+    if result is not None:
+        _record_round(project_id, aggregation, result)
+        status = {**aggregation.status(), "aggregated": result}
+    return status
+
+@router.post("/federated/{project_id}/updates")
+async def submit_client_update(
+    project_id: str,
+    file: UploadFile = File(...),
+    client_id: str = Form(...),
+    num_samples: float = Form(...)
+):
+    """
+    提交客户端本轮的模型参数（safetensors 或 .npy 扁平浮点张量）
+    到达后立即按 num_samples 加权累加，文件随后删除；达到 min_clients 时自动聚合
+    """
+    _check_num_samples(num_samples)
+    aggregation = _get_aggregation(project_id)
+    path = await _save_upload(aggregation, file)
+    try:
+        size = path.stat().st_size
+        status = await _accumulate(project_id, aggregation, path, num_samples, client_id)
+        aggregation.record_transfer("uplink", size, size)
+        return status
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        path.unlink(missing_ok=True)
+
+# ===============================
+# 压缩传输
+# ===============================
+
+def _compression_headers(stats: Dict[str, Any]) -> Dict[str, str]:
+    headers = {"X-Base-Round": str(stats["base_round"])}
+    if "compression_ratio" in stats:
+        headers["X-Compression-Ratio"] = str(stats["compression_ratio"])
+        headers["X-Relative-Error"] = str(stats["relative_error"])
+    return headers
+
+def _temporary_file_response(path: Path, filename: str, headers: Dict[str, str]) -> FileResponse:
+    return FileResponse(
+        path,
+        media_type="application/octet-stream",
+        filename=filename,
+        headers=headers,
+        background=BackgroundTask(path.unlink, missing_ok=True)
+    )
+
+def _decode_update(aggregation, path: Path, out_path: Path) -> Dict[str, Any]:
+    header = read_delta_header(path)
+    base = aggregation.open_global_model(header["base_round"])
+    return decode_delta(path, base, out_path)
+
+def _encode(aggregation, update, base_round: int, config: CompressionConfig, out_path: Path, residual_name: Optional[str]):
+    base = aggregation.open_global_model(base_round)
+    residual = aggregation.residual(residual_name) if residual_name and config.error_feedback else None
+    try:
+        return encode_delta(update, base, out_path, config, base_round, residual)
+    finally:
+        if residual is not None:
+            residual.flush()
+
+@router.post("/federated/{project_id}/updates/compressed")
+async def submit_compressed_update(
+    project_id: str,
+    file: UploadFile = File(...),
+    client_id: str = Form(...),
+    num_samples: float = Form(...)
+):
+    """
+    提交压缩的客户端更新（相对某一轮全局模型的增量，见 p2pai.federated.compression）
+    服务端加回基准模型后按完整更新累加
+    """
+    _check_num_samples(num_samples)
+    aggregation = _get_aggregation(project_id)
+    path = await _save_upload(aggregation, file)
+    decoded = aggregation.incoming_dir / f"{uuid.uuid4().hex}.decoded"
+    try:
+        stats = await run_in_threadpool(_decode_update, aggregation, path, decoded)
+        status = await _accumulate(project_id, aggregation, decoded, num_samples, client_id)
+        aggregation.record_transfer("uplink", stats["parameters"] * 4, stats["encoded_bytes"])
+        return {**status, "compression": stats}
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        path.unlink(missing_ok=True)
+        decoded.unlink(missing_ok=True)
+
+@router.get("/federated/{project_id}/model/delta")
+async def download_global_delta(
+    project_id: str,
+    base_round: int,
+    quantization: str = "none",
+    topk_ratio: float = 1.0,
+    error_feedback: bool = True,
+    client_id: Optional[str] = None
+):
+    """
+    下载当前全局模型相对 base_round 全局模型的压缩增量
+    指定 client_id 且启用误差反馈时，服务端为该客户端保存下行残差。残差只在以下条件下正确：
+    base_round 是该客户端上一次下载增量时的当前轮次，且客户端把增量加到自己的模型上（不要用 /delta/decode 加回精确的基准模型）；
+    跳过轮次或改用其他基准时应关闭 error_feedback
+    压缩率和重构误差在 X-Compression-Ratio / X-Relative-Error 响应头中返回
+    """
+    aggregation = _get_aggregation(project_id)
+    out_path = aggregation.incoming_dir / f"{uuid.uuid4().hex}.p2pd"
+    try:
+        config = CompressionConfig.from_dict({"quantization": quantization, "topk_ratio": topk_ratio, "error_feedback": error_feedback})
+        current = await run_in_threadpool(aggregation.open_global_model)
+        stats = await run_in_threadpool(
+            _encode, aggregation, current, base_round, config, out_path, f"downlink:{client_id}" if client_id else None
+        )
+    except AggregationError as e:
+        out_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    aggregation.record_transfer("downlink", stats["raw_bytes"], stats["encoded_bytes"])
+    return _temporary_file_response(out_path, f"delta_{base_round}_{aggregation.round}.p2pd", _compression_headers(stats))
+
+@router.post("/federated/{project_id}/delta/encode")
+async def encode_model_delta(
+    project_id: str,
+    file: UploadFile = File(...),
+    base_round: int = Form(...),
+    quantization: str = Form("none"),
+    topk_ratio: float = Form(1.0),
+    error_feedback: bool = Form(True),
+    client_id: Optional[str] = Form(None)
+):
+    """
+    把完整的模型文件编码为相对 base_round 全局模型的压缩增量（供无法本地编码的客户端使用）
+    指定 client_id 且启用误差反馈时，服务端为该客户端保存上行残差
+    """
+    aggregation = _get_aggregation(project_id)
+    path = await _save_upload(aggregation, file)
+    out_path = aggregation.incoming_dir / f"{uuid.uuid4().hex}.p2pd"
+    try:
+        config = CompressionConfig.from_dict({"quantization": quantization, "topk_ratio": topk_ratio, "error_feedback": error_feedback})
+        update = await run_in_threadpool(open_update, path)
+        stats = await run_in_threadpool(
+            _encode, aggregation, update, base_round, config, out_path, f"uplink:{client_id}" if client_id else None
+        )
+    except AggregationError as e:
+        out_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        path.unlink(missing_ok=True)
+    return _temporary_file_response(out_path, f"update_{base_round}.p2pd", _compression_headers(stats))
+
+@router.post("/federated/{project_id}/delta/decode")
+async def decode_model_delta(project_id: str, file: UploadFile = File(...)):
+    """
+    把压缩增量加回其基准全局模型，返回完整的模型文件
+    """
+    aggregation = _get_aggregation(project_id)
+    path = await _save_upload(aggregation, file)
+    out_path = aggregation.incoming_dir / f"{uuid.uuid4().hex}.decoded"
+    try:
+        stats = await run_in_threadpool(_decode_update, aggregation, path, out_path)
+    except AggregationError as e:
+        out_path.unlink(missing_ok=True)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    finally:
+        path.unlink(missing_ok=True)
+    suffix = "npy" if aggregation.format == "npy" else "safetensors"
+    return _temporary_file_response(out_path, f"model_{stats['base_round']}.{suffix}", _compression_headers(stats))
+
+@router.post("/federated/{project_id}/aggregate")
+async def aggregate_round(project_id: str):
+    """
+    结束本轮并计算新的全局模型
+    """
+    aggregation = _get_aggregation(project_id)
+    try:
+        result = await run_in_threadpool(aggregation.aggregate)
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    _record_round(project_id, aggregation, result)
+    return {**aggregation.status(), "aggregated": result}
+
+@router.get("/federated/{project_id}/round")
+async def get_federated_round(project_id: str):
+    """
+    获取聚合状态：当前轮次、已提交的客户端、下发给客户端的本轮配置
+    """
+    return _get_aggregation(project_id).status()
+
+@router.get("/federated/{project_id}/model")
+async def download_global_model(project_id: str, request: Request):
+    """
+    下载当前全局模型，支持 Range 断点续传
+    """
+    aggregation = _get_aggregation(project_id)
+    if aggregation.global_path is None:
+        raise HTTPException(status_code=404, detail="No global model yet")
+    response = artifact_response(request, aggregation.global_path.resolve(), root=aggregation.directory)
+    if response.status_code == 200 and request.method == "GET":
+        size = aggregation.global_path.stat().st_size
+        aggregation.record_transfer("downlink", size, size)
+    return response
+
+def _sync_mpc_session(session, entry: Optional[Dict[str, Any]] = None):
+    """每轮结束后同步训练会话列表中的状态、进度和指标"""
+    record = active_training_sessions.get(session.session_id)
+    if record is None:
+        return
+    record["status"] = session.status
+    record["progress"] = session.version / session.config.rounds
+    record["metrics"].update({
+        "accuracy": session.metrics["accuracy"],
+        "loss": session.metrics["loss"],
+        "communication_rounds": session.version
+    })
+
 @router.post("/mpc/start", response_model=BaseResponse)
 async def start_mpc_training(request: MPCTrainingRequest):
     """
     开始MPC训练
+    participants 为计算方（Shamir 份额的持有者），data_owners 为数据方；在本进程内模拟各方，
+    份额分发、计算、重构三个阶段按轮次流水线执行
     """
+    session_id = f"mpc_{request.project_id}"
     try:
-        session_id = f"mpc_{request.project_id}"
-        
-        active_training_sessions[session_id] = {
-            "project_id": request.project_id,
-            "training_type": "mpc",
-            "status": "running",
-            "progress": 0.0,
-            "participants": request.participants,
-            "privacy_level": request.privacy_level,
-            "encryption_method": request.encryption_method,
-            "threshold": request.threshold,
-            "metrics": {
-                "accuracy": 0.0,
-                "privacy_loss": 0.0,
-                "communication_rounds": 0
-            },
-            "config": {}
-        }
-        
-        return BaseResponse(
-            success=True,
-            message="MPC training started successfully"
-        )
-    except Exception as e:
-        return BaseResponse(
-            success=False,
-            error=str(e)
-        )
+        config = MPCConfig.from_dict({"threshold": request.threshold, **request.config})
+        session = mpc_manager.create(session_id, request.participants, request.data_owners, config, _sync_mpc_session)
+    except AggregationError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    active_training_sessions[session_id] = {
+        "project_id": request.project_id,
+        "training_type": "mpc",
+        "status": "running",
+        "progress": 0.0,
+        "participants": request.participants,
+        "privacy_level": request.privacy_level,
+        "encryption_method": request.encryption_method,
+        "threshold": config.threshold,
+        "metrics": {
+            "accuracy": 0.0,
+            "privacy_loss": 0.0,
+            "communication_rounds": 0
+        },
+        "config": dict(request.config)
+    }
+    _sync_mpc_session(session)
+
+    return BaseResponse(
+        success=True,
+        message="MPC training started successfully",
+        data={"session_id": session_id, "status_url": f"/api/p2pai/training/mpc/{session_id}", "scheme": session.scheme.config()}
+    )
+
+@router.get("/mpc/{session_id}")
+async def get_mpc_session(session_id: str, timeline: bool = False):
+    """
+    MPC 会话状态：进度、指标、各阶段累计 / 平均耗时、流水线重叠度和收发字节数；timeline 为 true 时附带逐轮时间线
+    """
+    session = mpc_manager.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="MPC session not found")
+    return session.snapshot(timeline)
+
+@router.post("/mpc/{session_id}/stop", response_model=BaseResponse)
+async def stop_mpc_session(session_id: str):
+    """
+    停止 MPC 会话（已应用的轮次保留）
+    """
+    session = mpc_manager.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="MPC session not found")
+    if not mpc_manager.stop(session_id):
+        raise HTTPException(status_code=409, detail=f"MPC session is already {session.status}")
+    if session_id in active_training_sessions:
+        active_training_sessions[session_id]["status"] = "stopped"
+    return BaseResponse(success=True, message=f"MPC session {session_id} stopped")
 
 @router.get("/sessions")
 async def get_training_sessions():
@@ -231,6 +585,7 @@ async def get_training_metrics(project_id: str):
 async def training_websocket(websocket: WebSocket, project_id: str):
     """
     训练实时监控WebSocket
+    连接参数 encoding=msgpack 时发送 msgpack 二进制帧，否则发送 JSON 文本帧
     """
     await websocket.accept()
     
@@ -256,7 +611,7 @@ async def training_websocket(websocket: WebSocket, project_id: str):
                     session["metrics"]["f1_score"] = min(95.0, session["metrics"]["f1_score"] + 0.3)
                 
                 # 发送更新数据
-                await websocket.send_text(json.dumps({
+                await send_json(websocket, {
                     "type": "training_progress",
                     "payload": {
                         "project_id": project_id,
@@ -266,7 +621,7 @@ async def training_websocket(websocket: WebSocket, project_id: str):
                         "metrics": session["metrics"],
                         "status": session["status"]
                     }
-                }))
+                })
             
             await asyncio.sleep(2)  # 每2秒发送一次更新
             
@@ -275,3 +630,8 @@ async def training_websocket(websocket: WebSocket, project_id: str):
     except Exception as e:
         print(f"WebSocket error: {e}")
         await websocket.close()
+
+@router.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭事件 - 停止 MPC 会话"""
+    mpc_manager.shutdown()
@@ -0,0 +1 @@
+# Federated learning server-side components
@@ -0,0 +1,572 @@
+"""
+联邦学习服务端聚合
+- 客户端更新为扁平的浮点张量文件（safetensors 或 NumPy .npy），以内存映射方式读取，不整体载入内存
+- 每个更新到达时按样本数加权累加到磁盘上的累加器（float32 内存映射），逐块调用 NumPy 向量运算，
+  临时缓冲区复用且不超过 CPU 缓存，聚合耗时取决于内存带宽而不是 Python 循环
+- 轮次结束时由可替换的服务端优化器（FedAvg / FedProx / FedAdam）根据加权平均和上一轮全局模型计算新的全局模型
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 聚合会话的工作目录（累加器、优化器状态、各轮全局模型）
+FEDERATED_DIR = Path(os.getenv("P2PAI_FEDERATED_DIR", "storage/federated"))
+# 每次向量运算处理的元素数（默认 1M 个 float32 = 4MB，临时缓冲区可留在缓存中）
+AGGREGATION_CHUNK = int(os.getenv("P2PAI_AGGREGATION_CHUNK", 1 << 20))
+# 保留的全局模型轮数
+FEDERATED_KEEP_ROUNDS = int(os.getenv("P2PAI_FEDERATED_KEEP_ROUNDS", 2))
+
+_SAFETENSORS_DTYPES = {"F16": np.float16, "F32": np.float32, "F64": np.float64}
+_SAFETENSORS_MAX_HEADER = 100 * 1024 * 1024
+_NPY_MAGIC = b"\x93NUMPY"
+
+
+class AggregationError(Exception):
+    """聚合请求不合法，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# ===============================
+# 张量文件
+# ===============================
+
+@dataclass(frozen=True)
+class TensorSpec:
+    name: str
+    shape: Tuple[int, ...]
+    offset: int  # 在扁平向量中的起始元素
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64))
+
+
+Layout = Tuple[TensorSpec, ...]
+
+
+def _layout_size(layout: Layout) -> int:
+    return layout[-1].offset + layout[-1].size if layout else 0
+
+
+@dataclass
+class ModelUpdate:
+    """内存映射的张量文件：name -> (一维数组, 原始形状)"""
+    format: str  # safetensors | npy
+    tensors: Dict[str, Tuple[np.ndarray, Tuple[int, ...]]]
+
+    def layout(self) -> Layout:
+        specs, offset = [], 0
+        for name in sorted(self.tensors):
+            spec = TensorSpec(name, self.tensors[name][1], offset)
+            specs.append(spec)
+            offset += spec.size
+        return tuple(specs)
+
+
+def _read_safetensors_header(f) -> Tuple[Dict[str, Any], int]:
+    raw = f.read(8)
+    if len(raw) != 8:
+        raise AggregationError(400, "Invalid safetensors file")
+    header_size = struct.unpack("<Q", raw)[0]
+    if header_size > _SAFETENSORS_MAX_HEADER:
+        raise AggregationError(400, "safetensors header is too large")
+    try:
+        header = json.loads(f.read(header_size))
+    except ValueError:
+        raise AggregationError(400, "Invalid safetensors header")
+    if not isinstance(header, dict):
+        raise AggregationError(400, "Invalid safetensors header")
+    return header, 8 + header_size
+
+
+def open_update(path: Path) -> ModelUpdate:
+    """以只读内存映射方式打开 safetensors / .npy 文件"""
+    with open(path, "rb") as f:
+        magic = f.read(len(_NPY_MAGIC))
+        if magic == _NPY_MAGIC:
+            array = np.load(path, mmap_mode="r")
+            if not array.flags.c_contiguous:
+                raise AggregationError(400, "Only C-ordered .npy arrays are supported")
+            if array.dtype not in (np.float16, np.float32, np.float64):
+                raise AggregationError(400, f"Unsupported dtype {array.dtype}")
+            return ModelUpdate("npy", {"weights": (array.reshape(-1), tuple(array.shape))})
+
+        f.seek(0)
+        header, data_start = _read_safetensors_header(f)
+
+    tensors = {}
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=data_start) if os.path.getsize(path) > data_start else np.empty(0, np.uint8)
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        try:
+            dtype = _SAFETENSORS_DTYPES.get(info["dtype"])
+            start, end = (int(value) for value in info["data_offsets"])
+            shape = tuple(int(dim) for dim in info["shape"])
+        except (KeyError, TypeError, ValueError):
+            raise AggregationError(400, f"Invalid safetensors entry for tensor {name}")
+        if dtype is None:
+            raise AggregationError(400, f"Unsupported dtype {info['dtype']} for tensor {name}")
+        if not 0 <= start <= end <= len(data) or (end - start) % np.dtype(dtype).itemsize:
+            raise AggregationError(400, f"Invalid data offsets for tensor {name}")
+        array = data[start:end].view(dtype)
+        if array.size != int(np.prod(shape, dtype=np.int64)):
+            raise AggregationError(400, f"Tensor {name} size does not match its shape")
+        tensors[name] = (array, shape)
+    return ModelUpdate("safetensors", tensors)
+
+
+def create_model_file(path: Path, layout: Layout, fmt: str) -> np.ndarray:
+    """创建 float32 模型文件，返回可写的扁平内存映射（按 layout 顺序连续存放）"""
+    total = _layout_size(layout)
+    if fmt == "npy":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=layout[0].shape).reshape(-1)
+
+    header = {
+        spec.name: {"dtype": "F32", "shape": list(spec.shape), "data_offsets": [spec.offset * 4, (spec.offset + spec.size) * 4]}
+        for spec in layout
+    }
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    # 数据区按 8 字节对齐
+    encoded += b" " * (-len(encoded) % 8)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        f.truncate(8 + len(encoded) + total * 4)
+    return np.memmap(path, dtype=np.float32, mode="r+", offset=8 + len(encoded), shape=(total,))
+
+
+def open_model_flat(path: Path, fmt: str) -> np.ndarray:
+    """只读打开由 create_model_file 写入的模型文件的扁平视图"""
+    if fmt == "npy":
+        return np.load(path, mmap_mode="r").reshape(-1)
+    with open(path, "rb") as f:
+        header, data_start = _read_safetensors_header(f)
+    total = sum(int(np.prod(info["shape"], dtype=np.int64)) for name, info in header.items() if name != "__metadata__")
+    return np.memmap(path, dtype=np.float32, mode="r", offset=data_start, shape=(total,))
+
+
+def _state_memmap(path: Path, total: int) -> np.ndarray:
+    """优化器状态 / 累加器：原始 float32 文件，不存在时创建为全 0"""
+    mode = "r+" if path.exists() else "w+"
+    return np.memmap(path, dtype=np.float32, mode=mode, shape=(total,))
+
+
+def _chunks(total: int):
+    for start in range(0, total, AGGREGATION_CHUNK):
+        yield start, min(start + AGGREGATION_CHUNK, total)
+
+
+# ===============================
+# 服务端优化器
+# ===============================
+
+class ServerOptimizer:
+    """
+    服务端优化器：根据本轮加权平均和上一轮全局模型计算新的全局模型
+    step 对一个分块调用，所有运算写入给定的输出和临时缓冲区
+    """
+    name = "fedavg"
+    state_names: Tuple[str, ...] = ()
+
+    def __init__(self, server_lr: float = 1.0, **_):
+        self.server_lr = float(server_lr)
+
+    def client_config(self) -> Dict[str, Any]:
+        """下发给客户端的本轮训练参数"""
+        return {}
+
+    def config(self) -> Dict[str, Any]:
+        return {"algorithm": self.name, "server_lr": self.server_lr}
+
+    def step(
+        self,
+        previous: Optional[np.ndarray],
+        average: np.ndarray,
+        out: np.ndarray,
+        state: Dict[str, np.ndarray],
+        scratch: List[np.ndarray]
+    ):
+        """out = previous + server_lr * (average - previous)；没有上一轮模型时 out = average"""
+        if previous is None or self.server_lr == 1.0:
+            np.copyto(out, average)
+            return
+        delta = scratch[0]
+        np.subtract(average, previous, out=delta)
+        delta *= self.server_lr
+        np.add(previous, delta, out=out)
+
+
+class FedAvg(ServerOptimizer):
+    """按样本数加权平均（McMahan et al.）"""
+    name = "fedavg"
+
+
+class FedProx(ServerOptimizer):
+    """
+    FedProx（Li et al.）：近端项 mu/2 * ||w - w_global||^2 加在客户端本地训练的损失上，
+    服务端聚合与 FedAvg 相同，mu 随轮次配置下发给客户端
+    """
+    name = "fedprox"
+
+    def __init__(self, server_lr: float = 1.0, mu: float = 0.01, **_):
+        super().__init__(server_lr)
+        self.mu = float(mu)
+
+    def client_config(self) -> Dict[str, Any]:
+        return {"proximal_mu": self.mu}
+
+    def config(self) -> Dict[str, Any]:
+        return {**super().config(), "mu": self.mu}
+
+
+class FedAdam(ServerOptimizer):
+    """
+    FedAdam（Reddi et al., Adaptive Federated Optimization）：
+    以 delta = average - previous 作为伪梯度，服务端维护一阶矩 m 和二阶矩 v
+    """
+    name = "fedadam"
+    state_names = ("m", "v")
+
+    def __init__(self, server_lr: float = 0.01, beta1: float = 0.9, beta2: float = 0.99, tau: float = 1e-3, **_):
+        super().__init__(server_lr)
+        self.beta1 = float(beta1)
+        self.beta2 = float(beta2)
+        self.tau = float(tau)
+
+    def config(self) -> Dict[str, Any]:
+        return {**super().config(), "beta1": self.beta1, "beta2": self.beta2, "tau": self.tau}
+
+    def step(self, previous, average, out, state, scratch):
+        if previous is None:
+            np.copyto(out, average)
+            return
+        delta, buffer = scratch
+        m, v = state["m"], state["v"]
+
+        np.subtract(average, previous, out=delta)
+        # m += (1 - beta1) * (delta - m)
+        np.subtract(delta, m, out=buffer)
+        buffer *= 1 - self.beta1
+        m += buffer
+        # v += (1 - beta2) * (delta^2 - v)
+        np.square(delta, out=delta)
+        delta -= v
+        delta *= 1 - self.beta2
+        v += delta
+        # out = previous + lr * m / (sqrt(v) + tau)
+        np.sqrt(v, out=buffer)
+        buffer += self.tau
+        np.divide(m, buffer, out=buffer)
+        buffer *= self.server_lr
+        np.add(previous, buffer, out=out)
+
+
+SERVER_OPTIMIZERS = {
+    FedAvg.name: FedAvg,
+    FedProx.name: FedProx,
+    FedAdam.name: FedAdam
+}
+
+
+def create_optimizer(algorithm: str, params: Optional[Dict[str, Any]] = None) -> ServerOptimizer:
+    optimizer_class = SERVER_OPTIMIZERS.get((algorithm or "fedavg").lower())
+    if optimizer_class is None:
+        raise AggregationError(400, f"Unsupported aggregation algorithm: {algorithm}")
+    try:
+        return optimizer_class(**(params or {}))
+    except (TypeError, ValueError) as e:
+        raise AggregationError(400, f"Invalid optimizer parameters: {e}")
+
+
+# ===============================
+# 聚合会话
+# ===============================
+
+class AggregationSession:
+    """一个联邦训练任务的聚合状态；同一会话的提交和聚合串行执行"""
+
+    def __init__(self, session_id: str, optimizer: ServerOptimizer, directory: Path, total_rounds: int, min_clients: int = 0):
+        self.session_id = session_id
+        self.optimizer = optimizer
+        self.directory = directory
+        self.total_rounds = total_rounds
+        self.min_clients = min_clients
+        self.round = 0
+        self.layout: Optional[Layout] = None
+        self.format: Optional[str] = None
+        self.global_path: Optional[Path] = None
+        self.clients: Dict[str, float] = {}
+        self.total_weight = 0.0
+        self.history: List[Dict[str, Any]] = []
+        # 本轮传输的字节数（未压缩的等价字节数和实际字节数）
+        self.transfer = self._empty_transfer()
+        self.lock = threading.Lock()
+        self._accumulator: Optional[np.ndarray] = None
+        directory.mkdir(parents=True, exist_ok=True)
+        self.incoming_dir.mkdir(exist_ok=True)
+
+    @property
+    def incoming_dir(self) -> Path:
+        return self.directory / "incoming"
+
+    @property
+    def accumulator_path(self) -> Path:
+        return self.directory / "accumulator.f32"
+
+    @property
+    def total_size(self) -> int:
+        return _layout_size(self.layout) if self.layout else 0
+
+    def _check_layout(self, update: ModelUpdate):
+        layout = update.layout()
+        if not layout or _layout_size(layout) == 0:
+            raise AggregationError(400, "Model update is empty")
+        if self.layout is None:
+            self.layout = layout
+            self.format = update.format
+        elif layout != self.layout:
+            raise AggregationError(400, "Model update does not match the global model layout")
+
+    def set_initial_model(self, path: Path) -> Dict[str, Any]:
+        """设置初始全局模型（第一轮之前）"""
+        update = open_update(path)
+        with self.lock:
+            if self.round > 0 or self.clients:
+                raise AggregationError(409, "Initial model can only be set before the first update")
+            self.layout = None
+            self._check_layout(update)
+            self.global_path = self._global_path(0)
+            out = create_model_file(self.global_path, self.layout, self.format)
+            for spec in self.layout:
+                source = update.tensors[spec.name][0]
+                for start, end in _chunks(spec.size):
+                    np.copyto(out[spec.offset + start:spec.offset + end], source[start:end], casting="same_kind")
+            out.flush()
+            del out
+        return self.status()
+
+    def submit(self, path: Path, num_samples: float, client_id: str) -> Dict[str, Any]:
+        """
+        累加一个客户端更新：accumulator += num_samples * update
+        更新文件只顺序读取一次，调用方可以在返回后删除
+        """
+        if not (math.isfinite(num_samples) and num_samples > 0):
+            raise AggregationError(400, "num_samples must be a positive finite number")
+        update = open_update(path)
+        with self.lock:
+            if client_id in self.clients:
+                raise AggregationError(409, f"Client {client_id} already submitted an update for round {self.round + 1}")
+            self._check_layout(update)
+
+            started = time.perf_counter()
+            if self._accumulator is None:
+                self._accumulator = _state_memmap(self.accumulator_path, self.total_size)
+            first = not self.clients
+            weight = np.float32(num_samples)
+            scratch = np.empty(min(AGGREGATION_CHUNK, self.total_size), dtype=np.float32)
+
+            for spec in self.layout:
+                source = update.tensors[spec.name][0]
+                target = self._accumulator[spec.offset:spec.offset + spec.size]
+                for start, end in _chunks(spec.size):
+                    if first:
+                        np.multiply(source[start:end], weight, out=target[start:end], casting="same_kind")
+                    else:
+                        buffer = scratch[:end - start]
+                        np.multiply(source[start:end], weight, out=buffer, casting="same_kind")
+                        np.add(target[start:end], buffer, out=target[start:end])
+
+            self.clients[client_id] = float(num_samples)
+            self.total_weight += float(num_samples)
+            elapsed = time.perf_counter() - started
+
+        logger.info(f"Accumulated update from {client_id} for {self.session_id} round {self.round + 1} in {elapsed:.3f}s")
+        return {**self.status(), "accumulate_seconds": round(elapsed, 4)}
+
+    @staticmethod
+    def _empty_transfer() -> Dict[str, int]:
+        return {"uplink_raw_bytes": 0, "uplink_bytes": 0, "downlink_raw_bytes": 0, "downlink_bytes": 0}
+
+    def record_transfer(self, direction: str, raw_bytes: int, encoded_bytes: int):
+        """记录一次上行（uplink）或下行（downlink）传输"""
+        with self.lock:
+            self.transfer[f"{direction}_raw_bytes"] += int(raw_bytes)
+            self.transfer[f"{direction}_bytes"] += int(encoded_bytes)
+
+    def open_global_model(self, round_index: Optional[int] = None) -> ModelUpdate:
+        """内存映射打开某一轮的全局模型（默认当前轮）；文件被清理后已打开的映射仍然可读"""
+        round_index = self.round if round_index is None else round_index
+        with self.lock:
+            if self.global_path is None:
+                raise AggregationError(404, "No global model yet")
+            if not 0 <= round_index <= self.round:
+                raise AggregationError(404, f"Round {round_index} has no global model")
+            path = self._global_path(round_index)
+            if not path.exists():
+                raise AggregationError(410, f"Global model of round {round_index} is no longer kept")
+            return open_update(path)
+
+    def residual(self, name: str) -> np.ndarray:
+        """误差反馈残差（float32 扁平数组，会话内持久保存，按名称区分方向和客户端）"""
+        if self.layout is None:
+            raise AggregationError(409, "The model layout is not known yet")
+        directory = self.directory / "residuals"
+        directory.mkdir(exist_ok=True)
+        return _state_memmap(directory / f"{hashlib.sha256(name.encode('utf-8')).hexdigest()[:32]}.f32", self.total_size)
+
+    def ready(self) -> bool:
+        """已收到足够的客户端更新，可以自动聚合"""
+        return self.min_clients > 0 and len(self.clients) >= self.min_clients
+
+    def _global_path(self, round_index: int) -> Path:
+        suffix = "npy" if self.format == "npy" else "safetensors"
+        return self.directory / f"global_round_{round_index}.{suffix}"
+
+    def aggregate(self) -> Dict[str, Any]:
+        """结束本轮：加权平均后由服务端优化器计算新的全局模型"""
+        with self.lock:
+            return self._aggregate()
+
+    def aggregate_if_ready(self) -> Optional[Dict[str, Any]]:
+        """
+        已收到足够的客户端更新时结束本轮，否则返回 None
+        判断和聚合在同一次加锁内完成，并发的提交中只有一个会执行聚合
+        """
+        with self.lock:
+            return self._aggregate() if self.ready() else None
+
+    def _aggregate(self) -> Dict[str, Any]:
+        # 调用方持有 self.lock
+        if not self.clients:
+            raise AggregationError(409, "No client updates received in this round")
+
+        started = time.perf_counter()
+        total = self.total_size
+        accumulator = self._accumulator
+        previous = open_model_flat(self.global_path, self.format) if self.global_path else None
+        new_path = self._global_path(self.round + 1)
+        out = create_model_file(new_path, self.layout, self.format)
+        state = {name: _state_memmap(self.directory / f"state_{name}.f32", total) for name in self.optimizer.state_names}
+        chunk = min(AGGREGATION_CHUNK, total)
+        scratch = [np.empty(chunk, dtype=np.float32), np.empty(chunk, dtype=np.float32)]
+        scale = np.float32(1.0 / self.total_weight)
+
+        for start, end in _chunks(total):
+            average = accumulator[start:end]
+            average *= scale
+            self.optimizer.step(
+                previous[start:end] if previous is not None else None,
+                average,
+                out[start:end],
+                {name: values[start:end] for name, values in state.items()},
+                [buffer[:end - start] for buffer in scratch]
+            )
+
+        out.flush()
+        for values in state.values():
+            values.flush()
+        del out, previous, state, accumulator
+        self._accumulator = None
+        self.accumulator_path.unlink(missing_ok=True)
+
+        self.round += 1
+        self.global_path = new_path
+        elapsed = time.perf_counter() - started
+        record = {
+            "round": self.round,
+            "clients": sorted(self.clients),
+            "num_samples": self.total_weight,
+            "parameters": total,
+            "aggregate_seconds": round(elapsed, 4),
+            "transfer": self.transfer
+        }
+        self.history.append(record)
+        self.transfer = self._empty_transfer()
+        self.clients = {}
+        self.total_weight = 0.0
+
+        stale = self._global_path(self.round - FEDERATED_KEEP_ROUNDS)
+        if self.round - FEDERATED_KEEP_ROUNDS >= 0:
+            stale.unlink(missing_ok=True)
+
+        logger.info(f"Aggregated {self.session_id} round {self.round} with {self.optimizer.name} in {elapsed:.3f}s")
+        return record
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            **self.optimizer.config(),
+            "current_round": self.round,
+            "total_rounds": self.total_rounds,
+            "pending_clients": sorted(self.clients),
+            "pending_samples": self.total_weight,
+            "min_clients": self.min_clients,
+            "parameters": self.total_size,
+            "format": self.format,
+            "has_global_model": self.global_path is not None,
+            "client_config": {"round": self.round + 1, **self.optimizer.client_config()},
+            "transfer": self.transfer,
+            "history": self.history[-10:]
+        }
+
+
+class AggregationEngine:
+    """进程内的聚合会话管理"""
+
+    def __init__(self, root: Path = FEDERATED_DIR):
+        self.root = root
+        self._sessions: Dict[str, AggregationSession] = {}
+        self._lock = threading.Lock()
+
+    def create_session(self, session_id: str, config: Optional[Dict[str, Any]] = None) -> AggregationSession:
+        """
+        创建（或重新创建）聚合会话
+        config: algorithm（fedavg / fedprox / fedadam）、total_rounds、min_clients 及优化器参数
+        """
+        config = dict(config or {})
+        algorithm = config.pop("algorithm", None) or config.pop("fed_alg", None) or "fedavg"
+        total_rounds = int(config.pop("total_rounds", 10))
+        min_clients = int(config.pop("min_clients", 0))
+        optimizer = create_optimizer(algorithm, config)
+
+        directory = self.root / session_id
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            shutil.rmtree(directory, ignore_errors=True)
+            session = AggregationSession(session_id, optimizer, directory, total_rounds, min_clients)
+            self._sessions[session_id] = session
+        return session
+
+    def get(self, session_id: str) -> AggregationSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise AggregationError(404, "Federated session not found")
+        return session
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            shutil.rmtree(self.root / session_id, ignore_errors=True)
+
+
+# 全局聚合引擎实例
+aggregation_engine = AggregationEngine()
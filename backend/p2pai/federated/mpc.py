@@ -0,0 +1,622 @@
+"""
+MPC 训练会话（Shamir 门限秘密共享，计算方和数据方均在本进程内模拟）
+- 每轮分三个阶段：
+  1. 份额分发：每个数据方在本地小批量上计算梯度，量化后拆成份额，第 j 份发给第 j 台计算方
+  2. 计算：每台计算方把本轮收到的份额逐元素相加（只看到份额，看不到任何数据方的梯度）
+  3. 重构：任意 threshold 台计算方的份额和重构出梯度之和，取平均后更新全局模型
+- 三个阶段各由一个线程按轮次顺序执行，用队列连接成流水线：第 k 轮重构时第 k + 1 轮的份额已经在分发
+  后一轮的梯度依赖前一轮的模型，因此流水线以有界延迟换吞吐：pipeline_depth = d 时第 k 轮使用
+  第 k - 1 - d 轮结束后的模型（d = 0 即逐轮同步）
+- 每轮记录各阶段的起止时间、使用的模型版本和收发字节数；latency_ms / bandwidth_mbps 模拟计算方之间的网络
+- 份额的随机系数总是取自密码学安全随机源；seed 只决定模拟的数据（基准测试用它复现结果），
+  重构是精确的，所以固定 seed 时训练结果同样可复现
+
+运行 python -m p2pai.federated.mpc 可比较不同流水线深度和网络延迟下的轮次吞吐量
+"""
+
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Callable, Dict, List, Optional, Sequence, get_args
+
+import numpy as np
+
+from .aggregation import AggregationError
+from .secure_aggregation import SECURE_AGG_CLIP, PartyAccumulator, ShamirScheme
+
+logger = logging.getLogger(__name__)
+
+# 每个会话用于数据方 / 计算方并行工作的线程数
+MPC_WORKERS = int(os.getenv("P2PAI_MPC_WORKERS", 8))
+# 同时运行的会话数上限
+MPC_MAX_SESSIONS = int(os.getenv("P2PAI_MPC_MAX_SESSIONS", 4))
+# 状态中保留的最近轮次时间线条数
+MPC_TIMELINE_ROUNDS = int(os.getenv("P2PAI_MPC_TIMELINE_ROUNDS", 200))
+# 单个会话可申请的上限（轮数、特征数、小批量、数据方数、评估样本数、流水线深度、模拟延迟）
+MPC_MAX_ROUNDS = int(os.getenv("P2PAI_MPC_MAX_ROUNDS", 10000))
+MPC_MAX_FEATURES = int(os.getenv("P2PAI_MPC_MAX_FEATURES", 4096))
+MPC_MAX_BATCH_SIZE = int(os.getenv("P2PAI_MPC_MAX_BATCH_SIZE", 65536))
+MPC_MAX_CLIENTS = int(os.getenv("P2PAI_MPC_MAX_CLIENTS", 64))
+MPC_MAX_EVAL_SAMPLES = int(os.getenv("P2PAI_MPC_MAX_EVAL_SAMPLES", 100000))
+MPC_MAX_PIPELINE_DEPTH = int(os.getenv("P2PAI_MPC_MAX_PIPELINE_DEPTH", 16))
+MPC_MAX_LATENCY_MS = float(os.getenv("P2PAI_MPC_MAX_LATENCY_MS", 10000))
+
+MPC_PHASES = ("share", "compute", "reconstruct")
+
+_STOP = object()
+
+
+@dataclass
+class MPCConfig:
+    rounds: int = 20
+    pipeline_depth: int = 1  # 额外允许在途的轮数，0 为逐轮同步
+    threshold: int = 2
+    learning_rate: float = 0.5
+    l2: float = 0.0
+    batch_size: int = 256  # 每个数据方每轮的小批量
+    num_features: int = 32
+    num_clients: int = 3  # 未指定数据方名单时模拟的数据方数
+    eval_samples: int = 1024
+    clip: float = SECURE_AGG_CLIP
+    latency_ms: float = 0.0  # 模拟的单程网络延迟
+    bandwidth_mbps: float = 0.0  # 模拟的每条链路带宽，0 为不限
+    seed: Optional[int] = None  # 模拟数据的随机种子，为空时每个会话随机；不影响份额
+
+    @classmethod
+    def from_dict(cls, config: Optional[Dict[str, Any]]) -> "MPCConfig":
+        """按字段类型转换请求中的值（如 "20" -> 20），无法转换时返回 400"""
+        config = dict(config or {})
+        types = {field.name: field.type for field in fields(cls)}
+        unknown = sorted(set(config) - set(types))
+        if unknown:
+            raise AggregationError(400, f"Unknown MPC options: {', '.join(unknown)}")
+        values = {}
+        for name, value in config.items():
+            try:
+                values[name] = _coerce(types[name], value)
+            except (TypeError, ValueError, OverflowError):
+                raise AggregationError(400, f"Invalid value for {name}: {value!r}")
+        result = cls(**values)
+        result.validate()
+        return result
+
+    def validate(self):
+        limits = {
+            "rounds": MPC_MAX_ROUNDS,
+            "num_features": MPC_MAX_FEATURES,
+            "batch_size": MPC_MAX_BATCH_SIZE,
+            "num_clients": MPC_MAX_CLIENTS,
+            "eval_samples": MPC_MAX_EVAL_SAMPLES
+        }
+        for name, limit in limits.items():
+            if not 1 <= getattr(self, name) <= limit:
+                raise AggregationError(400, f"{name} must be between 1 and {limit}")
+        if not 0 <= self.pipeline_depth <= MPC_MAX_PIPELINE_DEPTH:
+            raise AggregationError(400, f"pipeline_depth must be between 0 and {MPC_MAX_PIPELINE_DEPTH}")
+        if not all(math.isfinite(value) for value in (self.learning_rate, self.l2, self.clip, self.latency_ms, self.bandwidth_mbps)):
+            raise AggregationError(400, "learning_rate, l2, clip, latency_ms and bandwidth_mbps must be finite")
+        if self.learning_rate <= 0 or self.l2 < 0 or self.clip <= 0:
+            raise AggregationError(400, "learning_rate and clip must be positive and l2 must not be negative")
+        if not 0 <= self.latency_ms <= MPC_MAX_LATENCY_MS or self.bandwidth_mbps < 0:
+            raise AggregationError(400, f"latency_ms must be between 0 and {MPC_MAX_LATENCY_MS} and bandwidth_mbps must not be negative")
+        if self.seed is not None and self.seed < 0:
+            raise AggregationError(400, "seed must not be negative")
+
+
+def _coerce(field_type, value):
+    """把 JSON / 表单中的值转换为 int、float 或 Optional[int]；布尔值和带小数的整数视为无效"""
+    if value is None and type(None) in get_args(field_type):
+        return None
+    target = next((arg for arg in get_args(field_type) if arg is not type(None)), field_type)
+    if isinstance(value, bool):
+        raise TypeError(f"expected {target.__name__}")
+    if target is int:
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError("expected an integer")
+        return int(value)
+    return target(value)
+
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 0.5 * (1.0 + np.tanh(0.5 * values))
+
+
+# ===============================
+# 模拟的参与方
+# ===============================
+
+class SimulatedClient:
+    """
+    数据方：本地数据是由固定真实权重生成的逻辑回归样本流，每轮按 (种子, 轮次) 生成一个小批量，不常驻内存
+    份额的随机系数不使用该种子，而由 ShamirScheme 从密码学安全随机源抽取
+    """
+
+    def __init__(self, name: str, index: int, true_weights: np.ndarray, config: MPCConfig, seed: int):
+        self.name = name
+        self.index = index
+        self.true_weights = true_weights
+        self.config = config
+        self._seed = (seed, index)
+
+    def batch(self, round_index: int):
+        rng = np.random.default_rng((*self._seed, 0, round_index))
+        features = rng.standard_normal((self.config.batch_size, self.config.num_features), dtype=np.float32)
+        logits = features @ self.true_weights[:-1] + self.true_weights[-1]
+        labels = (rng.random(self.config.batch_size, dtype=np.float32) < _sigmoid(logits)).astype(np.float32)
+        return features, labels
+
+    def gradient(self, round_index: int, weights: np.ndarray) -> np.ndarray:
+        """逻辑回归在本地小批量上的平均梯度（最后一维为偏置）"""
+        features, labels = self.batch(round_index)
+        error = _sigmoid(features @ weights[:-1] + weights[-1]) - labels
+        gradient = np.empty_like(weights)
+        gradient[:-1] = features.T @ error / len(labels) + self.config.l2 * weights[:-1]
+        gradient[-1] = error.mean()
+        return gradient
+
+    def share(self, scheme: ShamirScheme, round_index: int, weights: np.ndarray) -> np.ndarray:
+        return scheme.share_update(self.gradient(round_index, weights))
+
+
+class SimulatedParty:
+    """计算方：按轮次保存份额累加器，只能看到份额"""
+
+    def __init__(self, name: str, party_id: int, size: int):
+        self.name = name
+        self.party_id = party_id
+        self.size = size
+        self._lock = threading.Lock()
+        self._rounds: Dict[int, List] = {}
+
+    def receive(self, round_index: int, client: str, share: np.ndarray):
+        with self._lock:
+            self._rounds.setdefault(round_index, []).append((client, share))
+
+    def compute(self, round_index: int) -> np.ndarray:
+        with self._lock:
+            received = self._rounds.pop(round_index, [])
+        accumulator = PartyAccumulator(self.party_id, self.size)
+        for client, share in received:
+            accumulator.add(client, share)
+        return accumulator.total
+
+
+# ===============================
+# 会话
+# ===============================
+
+class MPCSession:
+    """一次 MPC 训练：三个阶段线程组成流水线，按轮次顺序处理"""
+
+    def __init__(
+        self,
+        session_id: str,
+        parties: Sequence[str],
+        clients: Sequence[str],
+        config: MPCConfig,
+        on_round: Optional[Callable[["MPCSession", Dict[str, Any]], None]] = None
+    ):
+        if len(set(parties)) != len(parties) or len(set(clients)) != len(clients):
+            raise AggregationError(400, "Duplicate participant")
+        self.session_id = session_id
+        self.config = config
+        self.scheme = ShamirScheme(len(parties), config.threshold, clip=config.clip)
+        if len(clients) > MPC_MAX_CLIENTS:
+            raise AggregationError(400, f"At most {MPC_MAX_CLIENTS} data owners per session")
+        if len(clients) > self.scheme.max_clients:
+            raise AggregationError(400, f"At most {self.scheme.max_clients} data owners fit the field")
+
+        size = config.num_features + 1
+        seed = config.seed if config.seed is not None else int.from_bytes(os.urandom(4), "little")
+        rng = np.random.default_rng(seed)
+        true_weights = rng.standard_normal(size).astype(np.float32)
+        self.clients = [SimulatedClient(name, index, true_weights, config, seed) for index, name in enumerate(clients)]
+        self.parties = [SimulatedParty(name, party_id, size) for party_id, name in enumerate(parties, start=1)]
+        eval_rng = np.random.default_rng((seed, 2))
+        self._eval_features = eval_rng.standard_normal((config.eval_samples, config.num_features), dtype=np.float32)
+        self._eval_labels = (self._eval_features @ true_weights[:-1] + true_weights[-1] > 0).astype(np.float32)
+
+        self.weights = np.zeros(size, dtype=np.float32)
+        self.version = 0  # 已应用的轮数
+        self.status = "pending"
+        self.error: Optional[str] = None
+        self.metrics: Dict[str, Optional[float]] = {"loss": None, "accuracy": None}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.timeline: List[Dict[str, Any]] = []
+        self._totals = {phase: 0.0 for phase in MPC_PHASES}
+        self._bytes = {phase: 0 for phase in MPC_PHASES}
+        self._max_staleness = 0
+        self._elapsed = 0.0
+        self._on_round = on_round
+        self._clock = time.perf_counter()
+        self._rounds: Dict[int, Dict[str, Any]] = {}
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._queues = [queue.Queue(), queue.Queue()]
+        self._threads: List[threading.Thread] = []
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self.evaluate()
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        self.status = "running"
+        self.started_at = time.time()
+        self._clock = time.perf_counter()
+        # 分发和计算阶段各用一个线程池，避免相邻两轮的任务互相排队
+        self._executors = {
+            "share": ThreadPoolExecutor(max(1, min(MPC_WORKERS, len(self.clients))), f"mpc-{self.session_id}-share"),
+            "compute": ThreadPoolExecutor(max(1, min(MPC_WORKERS, len(self.parties))), f"mpc-{self.session_id}-compute")
+        }
+        stages = [
+            ("share", self._run_share),
+            ("compute", self._run_compute),
+            ("reconstruct", self._run_reconstruct)
+        ]
+        self._threads = [
+            threading.Thread(target=self._guard, args=(target,), name=f"mpc-{self.session_id}-{name}", daemon=True)
+            for name, target in stages
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(
+            f"MPC session {self.session_id} started: {len(self.parties)} parties (t={self.config.threshold}), "
+            f"{len(self.clients)} data owners, depth {self.config.pipeline_depth}"
+        )
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def run(self) -> Dict[str, Any]:
+        """在当前线程中运行到结束（基准测试用）"""
+        self.start()
+        self.join()
+        return self.snapshot()
+
+    def stop(self) -> bool:
+        if self.finished:
+            return False
+        self._fail("stopped", None)
+        return True
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "stopped")
+
+    def _fail(self, status: str, error: Optional[str]):
+        with self._condition:
+            if self.finished:
+                return
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            self._stopped.set()
+            self._condition.notify_all()
+        for stage_queue in self._queues:
+            stage_queue.put(_STOP)
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _guard(self, target: Callable[[], None]):
+        try:
+            target()
+        except Exception as e:
+            if not self._stopped.is_set():
+                logger.exception(f"MPC session {self.session_id} failed")
+                self._fail("failed", str(e))
+
+    # ---------- 阶段 ----------
+
+    def _now(self) -> float:
+        return time.perf_counter() - self._clock
+
+    def _transfer(self, num_bytes: int):
+        """模拟一次点对点传输的耗时"""
+        seconds = self.config.latency_ms / 1000.0
+        if self.config.bandwidth_mbps:
+            seconds += num_bytes * 8 / (self.config.bandwidth_mbps * 1e6)
+        if seconds > 0:
+            self._stopped.wait(seconds)
+
+    def _record(self, round_index: int, phase: str, started: float, num_bytes: int):
+        ended = self._now()
+        entry = self._rounds[round_index]
+        entry[phase] = {"start": round(started, 6), "end": round(ended, 6), "seconds": round(ended - started, 6)}
+        entry["bytes"][phase] = num_bytes
+        self._totals[phase] += ended - started
+        self._bytes[phase] += num_bytes
+
+    def _run_share(self):
+        depth = self.config.pipeline_depth
+        for round_index in range(self.config.rounds):
+            with self._condition:
+                # 第 k 轮最多落后 depth 轮：等待第 k - 1 - depth 轮应用完毕
+                while self.version < round_index - depth and not self._stopped.is_set():
+                    self._condition.wait()
+                if self._stopped.is_set():
+                    return
+                weights = self.weights.copy()
+                base_version = self.version
+            started = self._now()
+            self._rounds[round_index] = {
+                "round": round_index,
+                "model_version": base_version,
+                "staleness": round_index - base_version,
+                "bytes": {}
+            }
+            share_bytes = self.scheme.num_parties * weights.size * 8
+
+            def distribute(client: SimulatedClient):
+                shares = client.share(self.scheme, round_index, weights)
+                # 到各计算方的链路并行传输
+                self._transfer(weights.size * 8)
+                for party in self.parties:
+                    party.receive(round_index, client.name, shares[party.party_id - 1])
+
+            list(self._executors["share"].map(distribute, self.clients))
+            self._record(round_index, "share", started, share_bytes * len(self.clients))
+            self._queues[0].put(round_index)
+
+    def _run_compute(self):
+        while True:
+            round_index = self._queues[0].get()
+            if round_index is _STOP:
+                self._queues[1].put(_STOP)
+                return
+            started = self._now()
+            sums = dict(zip(
+                (party.party_id for party in self.parties),
+                self._executors["compute"].map(lambda party: party.compute(round_index), self.parties)
+            ))
+            self._rounds[round_index]["party_sums"] = sums
+            self._record(round_index, "compute", started, 0)
+            self._queues[1].put(round_index)
+
+    def _run_reconstruct(self):
+        while True:
+            round_index = self._queues[1].get()
+            if round_index is _STOP:
+                return
+            started = self._now()
+            entry = self._rounds[round_index]
+            sums = entry.pop("party_sums")
+            # 取编号最小的 threshold 台计算方，各自把份额和发给协调方
+            chosen = {party_id: sums[party_id] for party_id in sorted(sums)[:self.scheme.threshold]}
+            self._transfer(self.weights.size * 8)
+            gradient = self.scheme.reconstruct_sum(chosen, divisor=len(self.clients))
+            with self._condition:
+                self.weights -= self.config.learning_rate * gradient
+                self.version += 1
+                self._condition.notify_all()
+            self._record(round_index, "reconstruct", started, len(chosen) * self.weights.size * 8)
+            self._elapsed = self._now()
+            self._finish_round(round_index)
+
+    def _finish_round(self, round_index: int):
+        entry = self._rounds.pop(round_index)
+        entry.update(self.evaluate())
+        self._max_staleness = max(self._max_staleness, entry["staleness"])
+        self.timeline.append(entry)
+        del self.timeline[:-MPC_TIMELINE_ROUNDS]
+        completed = self.version >= self.config.rounds
+        if completed:
+            with self._condition:
+                self.status = "completed"
+                self.finished_at = time.time()
+                self._stopped.set()
+                self._condition.notify_all()
+        if self._on_round is not None:
+            try:
+                self._on_round(self, entry)
+            except Exception:
+                logger.exception(f"MPC session {self.session_id} round callback failed")
+        if completed:
+            self._queues[0].put(_STOP)
+            for executor in self._executors.values():
+                executor.shutdown(wait=False)
+            logger.info(f"MPC session {self.session_id} completed {self.version} rounds, loss {self.metrics['loss']}")
+
+    def evaluate(self) -> Dict[str, float]:
+        """在模拟的留出集上计算对数损失和准确率"""
+        weights = self.weights
+        probabilities = _sigmoid(self._eval_features @ weights[:-1] + weights[-1])
+        probabilities = np.clip(probabilities, 1e-7, 1 - 1e-7)
+        labels = self._eval_labels
+        loss = float(-np.mean(labels * np.log(probabilities) + (1 - labels) * np.log(1 - probabilities)))
+        accuracy = float(np.mean((probabilities > 0.5) == labels))
+        self.metrics = {"loss": round(loss, 6), "accuracy": round(accuracy, 6)}
+        return dict(self.metrics)
+
+    # ---------- 状态 ----------
+
+    def summary(self) -> Dict[str, Any]:
+        """各阶段累计耗时与流水线重叠度（阶段耗时之和 / 墙钟时间，逐轮同步时接近 1）"""
+        wall = self._elapsed
+        phase_seconds = sum(self._totals.values())
+        return {
+            "rounds_completed": self.version,
+            "wall_seconds": round(wall, 6),
+            "rounds_per_second": round(self.version / wall, 3) if wall > 0 else None,
+            "phase_seconds": {phase: round(seconds, 6) for phase, seconds in self._totals.items()},
+            "phase_mean_seconds": {
+                phase: round(seconds / self.version, 6) if self.version else None
+                for phase, seconds in self._totals.items()
+            },
+            "overlap": round(phase_seconds / wall, 3) if wall > 0 else None,
+            "bytes": dict(self._bytes),
+            "max_staleness": self._max_staleness
+        }
+
+    def snapshot(self, timeline: bool = False) -> Dict[str, Any]:
+        result = {
+            "session_id": self.session_id,
+            "status": self.status,
+            "error": self.error,
+            "scheme": self.scheme.config(),
+            "parties": [party.name for party in self.parties],
+            "clients": [client.name for client in self.clients],
+            "config": asdict(self.config),
+            "progress": round(self.version / self.config.rounds, 4),
+            "metrics": dict(self.metrics),
+            "summary": self.summary(),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if timeline:
+            result["timeline"] = list(self.timeline)
+        return result
+
+
+class MPCSessionManager:
+    """按会话 ID 管理进行中的 MPC 会话"""
+
+    def __init__(self, max_sessions: int = MPC_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, MPCSession] = {}
+        self._lock = threading.Lock()
+
+    def create(
+        self,
+        session_id: Optional[str],
+        parties: Sequence[str],
+        clients: Sequence[str],
+        config: MPCConfig,
+        on_round: Optional[Callable[[MPCSession, Dict[str, Any]], None]] = None
+    ) -> MPCSession:
+        """创建并启动会话；同名会话仍在运行时返回 409"""
+        session_id = session_id or f"mpc-{uuid.uuid4().hex[:12]}"
+        clients = list(clients) or [f"client-{index + 1}" for index in range(config.num_clients)]
+        session = MPCSession(session_id, list(parties), clients, config, on_round)
+        with self._lock:
+            existing = self._sessions.get(session_id)
+            if existing is not None and not existing.finished:
+                raise AggregationError(409, f"MPC session {session_id} is already running")
+            running = sum(1 for item in self._sessions.values() if not item.finished)
+            if running >= self.max_sessions:
+                raise AggregationError(503, f"At most {self.max_sessions} MPC sessions can run at once")
+            self._sessions[session_id] = session
+        session.start()
+        return session
+
+    def get(self, session_id: str) -> Optional[MPCSession]:
+        return self._sessions.get(session_id)
+
+    def list(self) -> List[MPCSession]:
+        return sorted(self._sessions.values(), key=lambda session: session.created_at, reverse=True)
+
+    def stop(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        return session.stop() if session is not None else False
+
+    def shutdown(self):
+        for session in list(self._sessions.values()):
+            session.stop()
+
+
+# 全局 MPC 会话管理器实例
+mpc_manager = MPCSessionManager()
+
+
+# ===============================
+# 吞吐量测试
+# ===============================
+
+def benchmark(
+    depths: Sequence[int] = (0, 1, 2),
+    latencies_ms: Sequence[float] = (0.0, 20.0, 50.0),
+    num_parties: int = 5,
+    threshold: int = 3,
+    num_clients: int = 8,
+    num_features: int = 1024,
+    rounds: int = 30,
+    batch_size: int = 128,
+    bandwidth_mbps: float = 0.0
+) -> List[Dict[str, Any]]:
+    """对每个网络延迟比较不同流水线深度的轮次吞吐量和最终损失，speedup 相对于同一延迟下的 depth 0"""
+    results = []
+    for latency in latencies_ms:
+        baseline = None
+        for depth in depths:
+            config = MPCConfig(
+                rounds=rounds,
+                pipeline_depth=depth,
+                threshold=threshold,
+                batch_size=batch_size,
+                num_features=num_features,
+                latency_ms=latency,
+                bandwidth_mbps=bandwidth_mbps,
+                seed=0  # 各配置使用相同的模拟数据，损失可以直接比较
+            )
+            session = MPCSession(
+                f"bench-{latency}-{depth}",
+                [f"party-{index + 1}" for index in range(num_parties)],
+                [f"client-{index + 1}" for index in range(num_clients)],
+                config
+            )
+            snapshot = session.run()
+            if snapshot["status"] != "completed":
+                raise RuntimeError(f"Benchmark session failed: {snapshot['error']}")
+            summary = snapshot["summary"]
+            baseline = baseline or summary["wall_seconds"]
+            results.append({
+                "latency_ms": latency,
+                "pipeline_depth": depth,
+                "wall_seconds": summary["wall_seconds"],
+                "rounds_per_second": summary["rounds_per_second"],
+                "speedup": round(baseline / summary["wall_seconds"], 2),
+                "overlap": summary["overlap"],
+                **{f"{phase}_ms": round(seconds * 1000, 2) for phase, seconds in summary["phase_mean_seconds"].items()},
+                "loss": snapshot["metrics"]["loss"],
+                "accuracy": snapshot["metrics"]["accuracy"]
+            })
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pipelined MPC training round benchmark")
+    parser.add_argument("--depths", default="0,1,2", help="Comma-separated pipeline depths")
+    parser.add_argument("--latencies", default="0,20,50", help="Comma-separated simulated latencies (ms)")
+    parser.add_argument("--parties", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--features", type=int, default=1024)
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--bandwidth", type=float, default=0.0, help="Simulated link bandwidth in Mbit/s (0 = unlimited)")
+    args = parser.parse_args()
+
+    rows = benchmark(
+        depths=[int(item) for item in args.depths.split(",") if item.strip()],
+        latencies_ms=[float(item) for item in args.latencies.split(",") if item.strip()],
+        num_parties=args.parties,
+        threshold=args.threshold,
+        num_clients=args.clients,
+        num_features=args.features,
+        rounds=args.rounds,
+        batch_size=args.batch_size,
+        bandwidth_mbps=args.bandwidth
+    )
+    print(
+        f"{'lat ms':>7} {'depth':>5} {'wall s':>8} {'rounds/s':>9} {'speedup':>8} {'overlap':>8} "
+        f"{'share ms':>9} {'compute ms':>11} {'recon ms':>9} {'loss':>8} {'acc':>6}"
+    )
+    for row in rows:
+        print(
+            f"{row['latency_ms']:>7} {row['pipeline_depth']:>5} {row['wall_seconds']:>8.3f} {row['rounds_per_second']:>9} "
+            f"{row['speedup']:>8} {row['overlap']:>8} {row['share_ms']:>9} {row['compute_ms']:>11} "
+            f"{row['reconstruct_ms']:>9} {row['loss']:>8.4f} {row['accuracy']:>6.3f}"
+        )
@@ -83,6 +83,8 @@ class MPCTrainingRequest(BaseModel):
     privacy_level: str
     encryption_method: str
     threshold: int
+    data_owners: List[str] = []  # 持有数据的参与方，participants 为计算方；为空时按 config.num_clients 模拟
+    config: Dict[str, Any] = {}  # MPCConfig 选项，如 rounds、pipeline_depth、learning_rate、latency_ms
 
 class LocalTrainingRequest(BaseModel):
     project_id: str
@@ -105,6 +107,30 @@ class DatasetUploadRequest(BaseModel):
     privacy_level: str
     description: Optional[str] = None
 
+class DatasetValidationRequest(BaseModel):
+    # 期望的列类型 {列名: integer | number | boolean | string | datetime}
+    columns: Optional[Dict[str, str]] = None
+    allow_extra_columns: bool = True
+    check_duplicates: bool = True
+
+class DatasetShardingRequest(BaseModel):
+    num_clients: int = 10
+    strategy: str = "iid"  # iid, dirichlet, quantity
+    seed: int = 42
+    # dirichlet / quantity 的浓度参数，越小越不均衡
+    alpha: float = 0.5
+    label_column: Optional[str] = None
+    min_samples: int = 0
+
+class DatasetTokenizeRequest(BaseModel):
+    # Hugging Face 分词器名称（可带 @revision）或本地目录，"bytes" 为内置的 UTF-8 字节级分词器
+    tokenizer: str
+    max_length: int = 512
+    # 参与分词的文本列（多列用 separator 连接），为空时使用 text 列或所有字符串列
+    text_columns: Optional[List[str]] = None
+    separator: str = "\n"
+    add_special_tokens: bool = True
+
 class ModelExportRequest(BaseModel):
     project_id: str
     format: str = "pytorch"  # pytorch, onnx, tensorflow
@@ -0,0 +1,237 @@
+"""
+本地 Arrow 数据集存储
+- 上传的 CSV / JSONL / Parquet 只转换一次，按批流式写成未压缩的 Arrow IPC 文件（按内容 SHA-256 命名，内容相同的数据集共用一份）
+- 读取时用内存映射打开 IPC 文件，切片、按行号取行、抽样直接引用映射的内存，不再解析原文件
+- 已打开的表按 LRU 缓存，多个项目重复读取同一数据集时不重复打开
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.json as pa_json
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+
+from common.storage.artifacts import ArtifactError, resolve_artifact_path
+from common.storage.blobstore import BlobError, blob_store, parse_blob_ref
+from database.p2pai import Dataset
+from .uploads import DATASET_STORAGE_DIR
+from .validation import DATASET_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Arrow IPC 文件目录
+ARROW_STORE_DIR = Path(os.getenv("P2PAI_ARROW_DIR", "storage/arrow"))
+# 转换时每批读取的字节数（CSV / JSONL 的类型推断也基于第一批）
+ARROW_BLOCK_SIZE = int(os.getenv("P2PAI_ARROW_BLOCK_SIZE", 16 * 1024 * 1024))
+# 缓存的已打开表数量
+ARROW_CACHE_SIZE = int(os.getenv("P2PAI_ARROW_CACHE_SIZE", 16))
+# 单次读取返回的最大行数
+ARROW_MAX_ROWS = int(os.getenv("P2PAI_ARROW_MAX_ROWS", 10000))
+
+
+class ArrowStoreError(Exception):
+    """数据集无法转换或读取，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _batches(source, fmt: str, sep: Optional[str]):
+    """按批读取原始数据集，产生 RecordBatch"""
+    if fmt == "csv":
+        reader = pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE),
+            parse_options=pa_csv.ParseOptions(delimiter=sep, newlines_in_values=True)
+        )
+        yield from reader
+    elif fmt == "jsonl":
+        read_options = pa_json.ReadOptions(block_size=ARROW_BLOCK_SIZE)
+        if hasattr(pa_json, "open_json"):
+            yield from pa_json.open_json(source, read_options=read_options)
+        else:
+            # 旧版 pyarrow 没有流式 JSON 读取
+            yield from pa_json.read_json(source, read_options=read_options).to_batches()
+    else:
+        yield from pq.ParquetFile(source).iter_batches(batch_size=64 * 1024)
+
+
+def _schema_to_dict(schema: "pa.Schema") -> List[Dict[str, Any]]:
+    return [{"name": field.name, "type": str(field.type), "nullable": field.nullable} for field in schema]
+
+
+class ArrowDatasetStore:
+    """Arrow IPC 文件的转换、打开和缓存"""
+
+    def __init__(self, root: Path = ARROW_STORE_DIR, cache_size: int = ARROW_CACHE_SIZE):
+        self.root = root
+        self.cache_size = cache_size
+        self._tables: "OrderedDict[str, pa.Table]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def key(dataset: Dataset) -> str:
+        return dataset.sha256 or dataset.id
+
+    def path(self, dataset: Dataset) -> Path:
+        return self.root / f"{self.key(dataset)}.arrow"
+
+    def _build_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def materialize(self, db: Session, dataset: Dataset) -> Path:
+        """
+        把数据集转换为 Arrow IPC 文件，已转换时直接返回路径
+        在线程中调用（读取整个数据集）
+        """
+        if pa is None:
+            raise ArrowStoreError(501, "The Arrow dataset store requires pyarrow")
+        path = self.path(dataset)
+        if path.exists():
+            return path
+
+        fmt, sep = DATASET_FORMATS.get((dataset.format or "").lower(), (None, None))
+        if fmt is None:
+            raise ArrowStoreError(400, f"Unsupported dataset format: {dataset.format}")
+
+        with self._build_lock(self.key(dataset)):
+            if path.exists():
+                return path
+            digest = parse_blob_ref(dataset.file_path)
+            try:
+                source = blob_store.open(db, digest).open() if digest else open(resolve_artifact_path(dataset.file_path, root=DATASET_STORAGE_DIR), "rb")
+            except (BlobError, ArtifactError) as e:
+                raise ArrowStoreError(404, f"Dataset file not available: {e}")
+
+            started = time.time()
+            self.root.mkdir(parents=True, exist_ok=True)
+            staging = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+            rows = 0
+            try:
+                with source:
+                    writer = None
+                    try:
+                        for batch in _batches(source, fmt, sep):
+                            if writer is None:
+                                writer = pa_ipc.new_file(str(staging), batch.schema)
+                            writer.write_batch(batch)
+                            rows += batch.num_rows
+                        if writer is None:
+                            raise ArrowStoreError(400, "Dataset is empty")
+                    finally:
+                        if writer is not None:
+                            writer.close()
+                os.replace(staging, path)
+            except ArrowStoreError:
+                staging.unlink(missing_ok=True)
+                raise
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError) as e:
+                staging.unlink(missing_ok=True)
+                raise ArrowStoreError(400, f"Failed to convert dataset to Arrow: {e}")
+            except BaseException:
+                staging.unlink(missing_ok=True)
+                raise
+            logger.info(f"Converted dataset {dataset.id} to Arrow: {rows} rows in {time.time() - started:.2f}s")
+            return path
+
+    def open(self, db: Session, dataset: Dataset) -> "pa.Table":
+        """内存映射打开数据集的 Arrow 表（必要时先转换）"""
+        key = self.key(dataset)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+                return table
+
+        path = self.materialize(db, dataset)
+        # 未压缩的 IPC 文件读出的表直接引用映射的内存
+        table = pa_ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.cache_size:
+                self._tables.popitem(last=False)
+        return table
+
+    def info(self, db: Session, dataset: Dataset) -> Dict[str, Any]:
+        table = self.open(db, dataset)
+        return {
+            "dataset_id": dataset.id,
+            "num_rows": table.num_rows,
+            "num_columns": table.num_columns,
+            "schema": _schema_to_dict(table.schema),
+            "arrow_bytes": self.path(dataset).stat().st_size
+        }
+
+    def evict(self, dataset: Dataset, remove_file: bool):
+        """从缓存中移除；remove_file 为 True 时同时删除 IPC 文件（没有其他数据集引用相同内容时）"""
+        with self._lock:
+            self._tables.pop(self.key(dataset), None)
+        if remove_file:
+            self.path(dataset).unlink(missing_ok=True)
+
+
+def select_columns(table: "pa.Table", columns: Optional[Sequence[str]]) -> "pa.Table":
+    if not columns:
+        return table
+    missing = [column for column in columns if column not in table.column_names]
+    if missing:
+        raise ArrowStoreError(400, f"Unknown columns: {', '.join(missing)}")
+    return table.select(list(columns))
+
+
+def slice_rows(table: "pa.Table", offset: int, limit: int) -> "pa.Table":
+    """按行范围切片（零拷贝）"""
+    if offset < 0 or limit < 0:
+        raise ArrowStoreError(400, "offset and limit must not be negative")
+    return table.slice(offset, min(limit, ARROW_MAX_ROWS))
+
+
+def take_rows(table: "pa.Table", indices: Sequence[int]) -> "pa.Table":
+    """按行号取行"""
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices) > ARROW_MAX_ROWS:
+        raise ArrowStoreError(400, f"At most {ARROW_MAX_ROWS} rows can be read at once")
+    if len(indices) and (indices.min() < 0 or indices.max() >= table.num_rows):
+        raise ArrowStoreError(400, "Row index out of range")
+    return table.take(pa.array(indices))
+
+
+def sample_rows(table: "pa.Table", n: int, seed: Optional[int] = None) -> "pa.Table":
+    """不放回随机抽取 n 行（保持原顺序），相同 seed 结果相同"""
+    if n < 0:
+        raise ArrowStoreError(400, "n must not be negative")
+    n = min(n, table.num_rows, ARROW_MAX_ROWS)
+    indices = np.sort(np.random.default_rng(seed).choice(table.num_rows, size=n, replace=False))
+    return table.take(pa.array(indices))
+
+
+def to_ipc_bytes(table: "pa.Table") -> bytes:
+    """编码为 Arrow IPC 流格式"""
+    sink = pa.BufferOutputStream()
+    with pa_ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# 全局 Arrow 数据集存储实例
+arrow_store = ArrowDatasetStore()
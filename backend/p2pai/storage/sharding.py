@@ -0,0 +1,442 @@
+"""
+联邦学习客户端数据分片
+- 一次顺序扫描数据集，记录每条记录在文件中的偏移（CSV / JSONL）或行号（Parquet），需要时同时读取标签列
+- 按 IID、按标签的 Dirichlet 非 IID 或 Dirichlet 数量倾斜划分给 num_clients 个客户端，划分只用 NumPy 在索引数组上完成
+- 结果写成紧凑的索引文件（.npy 偏移数组 + CSR 形式的客户端行号），不复制数据；
+  下载某个客户端的分片时把连续记录合并成区间，直接从原文件按区间发送
+- 索引以 (数据集内容, 划分参数, 随机种子) 为键缓存，相同参数重复请求直接复用
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from common.storage.artifacts import ArtifactError, resolve_artifact_path
+from common.storage.blobstore import BlobError, BlobReader, blob_store, parse_blob_ref
+from database.p2pai import Dataset
+from .uploads import DATASET_STORAGE_DIR
+from .validation import DATASET_FORMATS, Source, _open_source, _record_ends, pq
+
+logger = logging.getLogger(__name__)
+
+# 分片索引目录
+SHARD_INDEX_DIR = Path(os.getenv("P2PAI_SHARD_INDEX_DIR", "storage/shards"))
+# 扫描时每次读取的字节数
+SHARD_SCAN_BLOCK_SIZE = int(os.getenv("P2PAI_SHARD_SCAN_BLOCK_SIZE", 16 * 1024 * 1024))
+# Dirichlet 划分为满足 min_samples 最多重新抽样的次数
+SHARD_MAX_RESAMPLES = 100
+# 元数据中列出每个客户端标签分布的最大类别数
+SHARD_MAX_REPORTED_LABELS = 100
+
+SHARD_STRATEGIES = {"iid", "dirichlet", "quantity"}
+
+
+class ShardingError(Exception):
+    """分片请求不合法，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+# ===============================
+# 扫描
+# ===============================
+
+@dataclass
+class _ScanResult:
+    count: int
+    starts: Optional[np.ndarray] = None    # 文本格式：记录起始偏移
+    lengths: Optional[np.ndarray] = None   # 文本格式：记录长度（包括换行符）
+    header: Tuple[int, int] = (0, 0)       # CSV 表头的 (偏移, 长度)
+    missing_final_newline: bool = False
+    labels: Optional[np.ndarray] = None    # 类别编号，缺失值为单独的类别
+    classes: Optional[List[str]] = None
+    row_groups: Optional[List[int]] = None  # Parquet：各 row group 的行数
+
+
+def _block_labels(data: bytes, fmt: str, sep: Optional[str], header: bytes, label_column: str) -> List[str]:
+    if fmt == "csv":
+        df = pd.read_csv(io.BytesIO(header + data), sep=sep, usecols=[label_column], dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_json(io.BytesIO(data), lines=True, dtype=False)
+        if label_column not in df.columns:
+            raise ShardingError(400, f"Label column {label_column} not found")
+    return df[label_column].astype(str).tolist()
+
+
+def _encode_labels(parts: List[List[str]]) -> Tuple[np.ndarray, List[str]]:
+    codes, classes = pd.factorize(pd.Series([label for part in parts for label in part], dtype=object), sort=True)
+    return codes.astype(np.int32), [str(label) for label in classes]
+
+
+def _scan_text(source: Source, fmt: str, sep: Optional[str], label_column: Optional[str]) -> _ScanResult:
+    quoted = fmt == "csv"
+    starts_parts, length_parts, label_parts = [], [], []
+    header_range, header = (0, 0), b""
+    base, carry = 0, b""
+    missing_final_newline = False
+    with _open_source(source) as f:
+        while True:
+            block = f.read(SHARD_SCAN_BLOCK_SIZE)
+            data = carry + block if carry else block
+            if not data:
+                break
+            if block:
+                ends = _record_ends(data, quoted)
+                if len(ends) == 0:
+                    if len(data) > 4 * SHARD_SCAN_BLOCK_SIZE:
+                        raise ShardingError(400, "A single record exceeds the scan block size")
+                    carry = data
+                    continue
+            else:
+                # 文件末尾没有换行符的最后一条记录
+                ends = np.array([len(data)], dtype=np.int64)
+                missing_final_newline = True
+
+            used = int(ends[-1])
+            array = np.frombuffer(data, dtype=np.uint8, count=used)
+            starts = np.concatenate(([0], ends[:-1])).astype(np.int64)
+            # 去掉换行符（\n 或 \r\n）后为空的记录
+            content_end = ends - (array[ends - 1] == 10)
+            content_end -= (content_end > starts) & (array[np.maximum(content_end - 1, 0)] == 13)
+            keep = content_end > starts
+            starts, ends = starts[keep], ends[keep]
+
+            if quoted and header_range == (0, 0) and len(starts):
+                header_range = (base + int(starts[0]), int(ends[0] - starts[0]))
+                header = data[int(starts[0]):int(ends[0])]
+                starts, ends = starts[1:], ends[1:]
+                if label_column and label_column not in pd.read_csv(io.BytesIO(header), sep=sep, nrows=0).columns:
+                    raise ShardingError(400, f"Label column {label_column} not found")
+
+            if len(starts):
+                starts_parts.append(starts + base)
+                length_parts.append((ends - starts).astype(np.int32))
+                if label_column:
+                    labels = _block_labels(data[int(starts[0]):int(ends[-1])], fmt, sep, header, label_column)
+                    if len(labels) != len(starts):
+                        raise ShardingError(400, "Could not align labels with records")
+                    label_parts.append(labels)
+
+            base += used
+            carry = data[used:]
+            if not block:
+                break
+
+    result = _ScanResult(
+        count=sum(len(part) for part in starts_parts),
+        starts=np.concatenate(starts_parts) if starts_parts else np.empty(0, np.int64),
+        lengths=np.concatenate(length_parts) if length_parts else np.empty(0, np.int32),
+        header=header_range,
+        missing_final_newline=missing_final_newline
+    )
+    if label_column:
+        result.labels, result.classes = _encode_labels(label_parts)
+    return result
+
+
+def _scan_parquet(source: Source, label_column: Optional[str]) -> _ScanResult:
+    label_parts = []
+    with _open_source(source) as f:
+        parquet = pq.ParquetFile(f)
+        if label_column and label_column not in parquet.schema_arrow.names:
+            raise ShardingError(400, f"Label column {label_column} not found")
+        row_groups = [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)]
+        if label_column:
+            for index in range(parquet.num_row_groups):
+                column = parquet.read_row_group(index, columns=[label_column]).column(0).to_pandas()
+                label_parts.append(column.astype(str).tolist())
+    result = _ScanResult(count=sum(row_groups), row_groups=row_groups)
+    if label_column:
+        result.labels, result.classes = _encode_labels(label_parts)
+    return result
+
+
+# ===============================
+# 划分
+# ===============================
+
+def _split_by_proportions(indices: np.ndarray, proportions: np.ndarray) -> List[np.ndarray]:
+    cuts = (np.cumsum(proportions)[:-1] * len(indices)).astype(np.int64)
+    return np.split(indices, cuts)
+
+
+def partition(
+    count: int,
+    num_clients: int,
+    strategy: str,
+    seed: int,
+    labels: Optional[np.ndarray] = None,
+    alpha: float = 0.5,
+    min_samples: int = 0
+) -> List[np.ndarray]:
+    """
+    把 0..count-1 划分给 num_clients 个客户端，返回每个客户端排好序的行号
+    - iid: 随机打乱后均分
+    - dirichlet: 每个类别按 Dir(alpha) 比例分给各客户端（Hsu et al.），alpha 越小越不均衡
+    - quantity: 客户端数据量按 Dir(alpha) 比例分配，标签分布保持 IID
+    dirichlet / quantity 抽样结果中有客户端少于 min_samples 条时重新抽样
+    """
+    rng = np.random.default_rng(seed)
+    if strategy == "iid":
+        shards = np.array_split(rng.permutation(count), num_clients)
+    elif strategy == "quantity":
+        permutation = rng.permutation(count)
+        for _ in range(SHARD_MAX_RESAMPLES):
+            shards = _split_by_proportions(permutation, rng.dirichlet(np.full(num_clients, alpha)))
+            if min(len(shard) for shard in shards) >= min_samples:
+                break
+        else:
+            raise ShardingError(400, f"Could not give every client at least {min_samples} samples; increase alpha")
+    elif strategy == "dirichlet":
+        if labels is None:
+            raise ShardingError(400, "Dirichlet sharding requires label_column")
+        # 按类别分组：稳定排序后每段是一个类别的行号
+        order = np.argsort(labels, kind="stable")
+        class_counts = np.bincount(labels, minlength=int(labels.max()) + 1 if len(labels) else 0)
+        by_class = np.split(order, np.cumsum(class_counts)[:-1])
+        for _ in range(SHARD_MAX_RESAMPLES):
+            parts: List[List[np.ndarray]] = [[] for _ in range(num_clients)]
+            for indices in by_class:
+                if not len(indices):
+                    continue
+                for client, piece in enumerate(_split_by_proportions(rng.permutation(indices), rng.dirichlet(np.full(num_clients, alpha)))):
+                    parts[client].append(piece)
+            shards = [np.concatenate(part) if part else np.empty(0, np.int64) for part in parts]
+            if min(len(shard) for shard in shards) >= min_samples:
+                break
+        else:
+            raise ShardingError(400, f"Could not give every client at least {min_samples} samples; increase alpha")
+    else:
+        raise ShardingError(400, f"Unsupported sharding strategy: {strategy}")
+    # 行号排序后相邻记录可以合并成连续区间读取
+    return [np.sort(shard) for shard in shards]
+
+
+# ===============================
+# 索引
+# ===============================
+
+@dataclass
+class ShardIndex:
+    """已构建的分片索引（数组以只读内存映射方式打开）"""
+    key: str
+    directory: Path
+    meta: Dict[str, Any]
+
+    def _array(self, name: str) -> np.ndarray:
+        return np.load(self.directory / f"{name}.npy", mmap_mode="r")
+
+    def client_rows(self, client: int) -> np.ndarray:
+        if not 0 <= client < self.meta["num_clients"]:
+            raise ShardingError(404, f"Client {client} not found (num_clients={self.meta['num_clients']})")
+        indptr = self._array("indptr")
+        return self._array("rows")[int(indptr[client]):int(indptr[client + 1])]
+
+    def client_segments(self, client: int) -> Tuple[np.ndarray, np.ndarray, bytes]:
+        """
+        文本格式：客户端分片对应的 (区间偏移, 区间长度, 结尾补充的字节)，CSV 表头为第一个区间
+        相邻的记录合并成一个区间
+        """
+        rows = np.asarray(self.client_rows(client))
+        record_starts = self._array("starts")[rows]
+        record_ends = record_starts + self._array("lengths")[rows]
+        if len(rows):
+            breaks = record_starts[1:] != record_ends[:-1]
+            offsets = record_starts[np.concatenate(([True], breaks))]
+            lengths = record_ends[np.concatenate((breaks, [True]))] - offsets
+        else:
+            offsets = lengths = np.empty(0, np.int64)
+        header_offset, header_length = self.meta["header"]
+        if header_length:
+            offsets = np.concatenate(([header_offset], offsets))
+            lengths = np.concatenate(([header_length], lengths))
+        # 原文件最后一条记录没有换行符时，分片中它之后不再有记录，补一个换行符
+        suffix = b"\n" if self.meta["missing_final_newline"] and len(rows) and int(rows[-1]) == self.meta["records"] - 1 else b""
+        return offsets, lengths, suffix
+
+    def client_parquet(self, client: int, source: Source) -> bytes:
+        """Parquet：读取分片所在的 row group，取出对应行写成新的 Parquet 文件"""
+        import pyarrow as pa
+
+        rows = np.asarray(self.client_rows(client))
+        bounds = np.concatenate(([0], np.cumsum(self.meta["row_groups"])))
+        with _open_source(source) as f:
+            parquet = pq.ParquetFile(f)
+            tables = []
+            for group in np.unique(np.searchsorted(bounds, rows, side="right") - 1):
+                local = rows[(rows >= bounds[group]) & (rows < bounds[group + 1])] - bounds[group]
+                tables.append(parquet.read_row_group(int(group)).take(pa.array(local)))
+            table = pa.concat_tables(tables) if tables else parquet.schema_arrow.empty_table()
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        return buffer.getvalue()
+
+
+def _dataset_source(db: Session, dataset: Dataset) -> Source:
+    digest = parse_blob_ref(dataset.file_path)
+    try:
+        if digest:
+            return blob_store.open(db, digest)
+        return str(resolve_artifact_path(dataset.file_path, root=DATASET_STORAGE_DIR))
+    except (BlobError, ArtifactError) as e:
+        raise ShardingError(404, f"Dataset file not available: {e}")
+
+
+def dataset_source(db: Session, dataset: Dataset):
+    """下载分片用的数据源：本地文件返回 Path（可以零拷贝发送），内容寻址对象返回 BlobReader"""
+    source = _dataset_source(db, dataset)
+    return source if isinstance(source, BlobReader) else Path(source)
+
+
+class ShardManager:
+    """构建和查找分片索引；同一个键同时只构建一次"""
+
+    def __init__(self, root: Path = SHARD_INDEX_DIR):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def shard_key(dataset: Dataset, params: Dict[str, Any]) -> str:
+        """由数据集内容和划分参数生成缓存键"""
+        content = dataset.sha256 or f"{dataset.file_path}:{dataset.size}"
+        payload = json.dumps({"content": content, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _directory(self, dataset_id: str, key: str) -> Path:
+        return self.root / dataset_id / key
+
+    def get(self, dataset_id: str, key: str) -> ShardIndex:
+        directory = self._directory(dataset_id, key)
+        try:
+            meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise ShardingError(404, "Sharding not found")
+        return ShardIndex(key, directory, meta)
+
+    def list_shardings(self, dataset_id: str) -> List[Dict[str, Any]]:
+        directory = self.root / dataset_id
+        if not directory.is_dir():
+            return []
+        items = []
+        for meta_path in sorted(directory.glob("*/meta.json")):
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta.pop("clients", None)
+            items.append(meta)
+        return items
+
+    def remove_dataset(self, dataset_id: str):
+        shutil.rmtree(self.root / dataset_id, ignore_errors=True)
+
+    def build(self, db: Session, dataset: Dataset, params: Dict[str, Any]) -> Tuple[ShardIndex, bool]:
+        """
+        构建分片索引，已有相同参数的索引时直接返回；返回 (索引, 是否新建)
+        在线程中调用（扫描整个数据集）
+        """
+        fmt, sep = DATASET_FORMATS.get((dataset.format or "").lower(), (None, None))
+        if fmt is None:
+            raise ShardingError(400, f"Unsupported dataset format: {dataset.format}")
+        if fmt == "parquet" and pq is None:
+            raise ShardingError(400, "Parquet sharding requires pyarrow")
+        strategy = params["strategy"]
+        if strategy not in SHARD_STRATEGIES:
+            raise ShardingError(400, f"Unsupported sharding strategy: {strategy}")
+        if params["num_clients"] < 1:
+            raise ShardingError(400, "num_clients must be at least 1")
+        if strategy != "iid" and params["alpha"] <= 0:
+            raise ShardingError(400, "alpha must be positive")
+        label_column = params.get("label_column") if strategy == "dirichlet" else None
+        if strategy == "dirichlet" and not label_column:
+            raise ShardingError(400, "Dirichlet sharding requires label_column")
+        params = {**params, "label_column": label_column}
+        if strategy == "iid":
+            params["alpha"] = None
+
+        key = self.shard_key(dataset, params)
+        with self._lock(key):
+            try:
+                return self.get(dataset.id, key), False
+            except ShardingError:
+                pass
+
+            started = time.time()
+            source = _dataset_source(db, dataset)
+            scan = _scan_parquet(source, label_column) if fmt == "parquet" else _scan_text(source, fmt, sep, label_column)
+            if scan.count < params["num_clients"]:
+                raise ShardingError(400, f"Dataset has {scan.count} records, fewer than num_clients")
+            shards = partition(
+                scan.count,
+                params["num_clients"],
+                strategy,
+                params["seed"],
+                labels=scan.labels,
+                alpha=params["alpha"] or 0.0,
+                min_samples=params["min_samples"]
+            )
+
+            directory = self._directory(dataset.id, key)
+            staging = directory.with_name(f".{key}.{uuid.uuid4().hex[:8]}")
+            staging.mkdir(parents=True)
+            try:
+                row_dtype = np.int32 if scan.count < 2 ** 31 else np.int64
+                np.save(staging / "rows.npy", np.concatenate(shards).astype(row_dtype))
+                np.save(staging / "indptr.npy", np.concatenate(([0], np.cumsum([len(shard) for shard in shards]))).astype(np.int64))
+                if scan.starts is not None:
+                    np.save(staging / "starts.npy", scan.starts)
+                    np.save(staging / "lengths.npy", scan.lengths)
+
+                clients = []
+                for client, shard in enumerate(shards):
+                    info: Dict[str, Any] = {"client": client, "records": len(shard)}
+                    if scan.labels is not None and len(scan.classes) <= SHARD_MAX_REPORTED_LABELS:
+                        counts = np.bincount(scan.labels[shard], minlength=len(scan.classes))
+                        info["label_counts"] = {scan.classes[i]: int(count) for i, count in enumerate(counts) if count}
+                    clients.append(info)
+
+                meta = {
+                    "key": key,
+                    "dataset_id": dataset.id,
+                    "dataset_sha256": dataset.sha256,
+                    "format": fmt,
+                    **params,
+                    "records": scan.count,
+                    "header": list(scan.header),
+                    "missing_final_newline": scan.missing_final_newline,
+                    "row_groups": scan.row_groups,
+                    "num_classes": len(scan.classes) if scan.classes is not None else None,
+                    "clients": clients,
+                    "build_seconds": round(time.time() - started, 3),
+                    "created_at": time.time()
+                }
+                (staging / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+                staging.rename(directory)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            logger.info(f"Built {strategy} sharding {key} for dataset {dataset.id}: {scan.count} records, {params['num_clients']} clients")
+            return ShardIndex(key, directory, meta), True
+
+
+# 全局分片管理实例
+shard_manager = ShardManager()
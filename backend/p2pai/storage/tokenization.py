@@ -0,0 +1,433 @@
+"""
+数据集分词预处理缓存
+- 以 (数据集内容 SHA-256, 分词器指纹, max_length, 文本列等参数) 的哈希为键，同一组参数只分词一次
+- 数据集先转换为 Arrow IPC 文件（见 arrow_store），按行范围切成分片交给进程池，工作进程自己内存映射 Arrow 文件读取文本
+- 每个分片写成两个 .npy：扁平的 token id 数组和每行的起始偏移（CSR），读取时内存映射，命中缓存的训练可以立即开始读数据
+- 缓存目录按最近使用时间做 LRU 淘汰，总大小不超过 P2PAI_TOKEN_CACHE_MAX_BYTES
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pragma: no cover - 可选依赖
+    pa = None
+
+try:
+    from transformers import AutoTokenizer
+except ImportError:  # pragma: no cover - 可选依赖
+    AutoTokenizer = None
+
+from database.p2pai import Dataset
+from .arrow_store import ArrowStoreError, arrow_store
+
+logger = logging.getLogger(__name__)
+
+# 分词缓存目录
+TOKEN_CACHE_DIR = Path(os.getenv("P2PAI_TOKEN_CACHE_DIR", "storage/token_cache"))
+# 缓存总大小上限（字节），超出时淘汰最久未使用的条目
+TOKEN_CACHE_MAX_BYTES = int(os.getenv("P2PAI_TOKEN_CACHE_MAX_BYTES", 20 * 1024 ** 3))
+# 分词进程数
+TOKENIZE_WORKERS = int(os.getenv("P2PAI_TOKENIZE_WORKERS", min(4, os.cpu_count() or 1)))
+# 每个分片的行数
+TOKENIZE_SHARD_ROWS = int(os.getenv("P2PAI_TOKENIZE_SHARD_ROWS", 100_000))
+# 每次交给分词器的行数
+TOKENIZE_BATCH_ROWS = 1000
+# 单次读取返回的最大行数
+TOKENIZED_MAX_ROWS = 10000
+
+# 不依赖第三方库的 UTF-8 字节级分词器：id 0-255 为字节，256 / 257 为 BOS / EOS
+BYTE_TOKENIZER = "bytes"
+_BYTE_BOS, _BYTE_EOS = 256, 257
+# 分词器文件（本地目录时按这些文件的内容计算指纹）
+_TOKENIZER_FILES = ("tokenizer.json", "tokenizer_config.json", "special_tokens_map.json", "added_tokens.json",
+                    "vocab.json", "vocab.txt", "merges.txt", "tokenizer.model", "spiece.model", "sentencepiece.bpe.model")
+_CACHE_FORMAT_VERSION = 1
+
+
+class TokenizationError(Exception):
+    """分词请求不合法，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def tokenizer_fingerprint(name: str) -> str:
+    """分词器指纹：本地目录按分词器文件内容计算，Hub 上的分词器按名称（可带 @revision）"""
+    if name == BYTE_TOKENIZER:
+        return f"{BYTE_TOKENIZER}-v1"
+    path = Path(name)
+    if path.is_dir():
+        digest = hashlib.sha256()
+        for filename in _TOKENIZER_FILES:
+            file_path = path / filename
+            if file_path.is_file():
+                digest.update(filename.encode("utf-8"))
+                digest.update(hashlib.sha256(file_path.read_bytes()).digest())
+        return f"dir:{digest.hexdigest()}"
+    return f"hub:{name}"
+
+
+def cache_key(dataset_sha256: str, params: Dict[str, Any]) -> str:
+    payload = {
+        "version": _CACHE_FORMAT_VERSION,
+        "dataset": dataset_sha256,
+        "tokenizer": tokenizer_fingerprint(params["tokenizer"]),
+        "max_length": params["max_length"],
+        "text_columns": params["text_columns"],
+        "separator": params["separator"],
+        "add_special_tokens": params["add_special_tokens"]
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+# ===============================
+# 工作进程：分词一个分片
+# ===============================
+
+# 每个工作进程缓存已加载的分词器
+_loaded_tokenizers: Dict[str, Any] = {}
+
+
+def _load_tokenizer(name: str):
+    tokenizer = _loaded_tokenizers.get(name)
+    if tokenizer is None:
+        if Path(name).is_dir():
+            tokenizer = AutoTokenizer.from_pretrained(name)
+        else:
+            model, _, revision = name.partition("@")
+            tokenizer = AutoTokenizer.from_pretrained(model, revision=revision or None)
+        _loaded_tokenizers[name] = tokenizer
+    return tokenizer
+
+
+def _encode(name: str, texts: List[str], max_length: int, add_special_tokens: bool) -> List[List[int]]:
+    if name == BYTE_TOKENIZER:
+        budget = max_length - 2 if add_special_tokens else max_length
+        encoded = [list(text.encode("utf-8")[:max(budget, 0)]) for text in texts]
+        if add_special_tokens:
+            encoded = [[_BYTE_BOS, *ids, _BYTE_EOS] for ids in encoded]
+        return encoded
+    tokenizer = _load_tokenizer(name)
+    return tokenizer(texts, add_special_tokens=add_special_tokens, truncation=True, max_length=max_length)["input_ids"]
+
+
+def tokenize_shard(arrow_path: str, start: int, stop: int, params: Dict[str, Any], output_prefix: str) -> Dict[str, Any]:
+    """
+    对 Arrow 文件的 [start, stop) 行分词，写出 {output_prefix}.ids.npy 和 {output_prefix}.offsets.npy
+    token id 小于 65535 时用 uint16 保存
+    """
+    table = pa_ipc.open_file(pa.memory_map(arrow_path, "r")).read_all().slice(start, stop - start)
+    columns, separator = params["text_columns"], params["separator"]
+    lengths_parts, id_parts = [], []
+    for batch_start in range(0, table.num_rows, TOKENIZE_BATCH_ROWS):
+        batch = table.slice(batch_start, TOKENIZE_BATCH_ROWS)
+        values = [batch.column(column).to_pylist() for column in columns]
+        texts = [separator.join("" if value is None else str(value) for value in row) for row in zip(*values)]
+        encoded = _encode(params["tokenizer"], texts, params["max_length"], params["add_special_tokens"])
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        lengths_parts.append(lengths)
+        id_parts.append(np.fromiter(itertools.chain.from_iterable(encoded), dtype=np.uint32, count=int(lengths.sum())))
+
+    lengths = np.concatenate(lengths_parts) if lengths_parts else np.empty(0, np.int64)
+    ids = np.concatenate(id_parts) if id_parts else np.empty(0, np.uint32)
+    max_id = int(ids.max()) if len(ids) else 0
+    if max_id < np.iinfo(np.uint16).max:
+        ids = ids.astype(np.uint16)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    np.save(f"{output_prefix}.ids.npy", ids)
+    np.save(f"{output_prefix}.offsets.npy", offsets)
+    return {
+        "rows": int(len(lengths)),
+        "tokens": int(len(ids)),
+        "max_length_rows": int((lengths >= params["max_length"]).sum()),
+        "bytes": os.path.getsize(f"{output_prefix}.ids.npy") + os.path.getsize(f"{output_prefix}.offsets.npy")
+    }
+
+
+# ===============================
+# 读取
+# ===============================
+
+class TokenizedDataset:
+    """内存映射的分词结果，按全局行号读取 token id"""
+
+    def __init__(self, directory: Path, meta: Dict[str, Any]):
+        self.directory = directory
+        self.meta = meta
+        self._shards: List[Tuple[np.ndarray, np.ndarray]] = [
+            (np.load(directory / f"{name}.ids.npy", mmap_mode="r"), np.load(directory / f"{name}.offsets.npy", mmap_mode="r"))
+            for name in meta["shards"]
+        ]
+        self._row_starts = np.concatenate(([0], np.cumsum([len(offsets) - 1 for _, offsets in self._shards]))).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self._row_starts[-1])
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        shard = int(np.searchsorted(self._row_starts, row, side="right") - 1)
+        ids, offsets = self._shards[shard]
+        local = row - int(self._row_starts[shard])
+        return ids[int(offsets[local]):int(offsets[local + 1])]
+
+    def slice(self, offset: int, limit: int) -> "pa.ListArray":
+        """
+        读取 [offset, offset + limit) 行，返回 Arrow list<uint32> 数组
+        每个分片内的一段直接由内存映射的偏移和 id 数组构造（uint16 分片转换为 uint32）
+        """
+        end = min(offset + min(limit, TOKENIZED_MAX_ROWS), len(self))
+        pieces = []
+        row = offset
+        while row < end:
+            shard = int(np.searchsorted(self._row_starts, row, side="right") - 1)
+            ids, offsets = self._shards[shard]
+            local_start = row - int(self._row_starts[shard])
+            local_end = min(end, int(self._row_starts[shard + 1])) - int(self._row_starts[shard])
+            window = np.asarray(offsets[local_start:local_end + 1])
+            values = np.asarray(ids[int(window[0]):int(window[-1])], dtype=np.uint32)
+            pieces.append(pa.ListArray.from_arrays(pa.array(window - window[0], type=pa.int32()), pa.array(values)))
+            row += local_end - local_start
+        if not pieces:
+            return pa.array([], type=pa.list_(pa.uint32()))
+        return pa.concat_arrays(pieces) if len(pieces) > 1 else pieces[0]
+
+    def slice_table(self, offset: int, limit: int) -> "pa.Table":
+        return pa.table({"input_ids": self.slice(offset, limit)})
+
+
+# ===============================
+# 任务与缓存
+# ===============================
+
+class TokenizationJob:
+    """一次分词任务的状态"""
+
+    def __init__(self, key: str, dataset_id: str, dataset_key: str, total_shards: int):
+        self.key = key
+        self.dataset_id = dataset_id
+        self.dataset_key = dataset_key
+        self.total_shards = total_shards
+        self.task: Optional[asyncio.Task] = None
+        self.snapshot: Dict[str, Any] = {
+            "key": key,
+            "dataset_id": dataset_id,
+            "dataset_key": dataset_key,
+            "status": "running",
+            "shards_done": 0,
+            "total_shards": total_shards,
+            "progress": 0.0,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "error": None
+        }
+
+    @property
+    def done(self) -> bool:
+        return self.snapshot["status"] in ("completed", "failed")
+
+
+class TokenizationManager:
+    """分词缓存：查找、构建（进程池）和 LRU 淘汰"""
+
+    def __init__(self, root: Path = TOKEN_CACHE_DIR, max_bytes: int = TOKEN_CACHE_MAX_BYTES, max_workers: int = TOKENIZE_WORKERS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, TokenizationJob] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn：不复制服务进程中的事件循环、线程和数据库连接
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / key / "meta.json"
+
+    def lookup(self, key: str) -> Optional[TokenizedDataset]:
+        """打开已缓存的分词结果，同时更新最近使用时间"""
+        meta_path = self._meta_path(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            os.utime(meta_path)
+        except FileNotFoundError:
+            return None
+        return TokenizedDataset(meta_path.parent, meta)
+
+    def status(self, key: str) -> Dict[str, Any]:
+        job = self._jobs.get(key)
+        if job is not None and not job.done:
+            return dict(job.snapshot)
+        cached = self.lookup(key)
+        if cached is not None:
+            return {**cached.meta, "status": "completed", "progress": 100.0}
+        if job is not None:
+            return dict(job.snapshot)
+        raise TokenizationError(404, "Tokenized dataset not found")
+
+    @staticmethod
+    def belongs_to(status: Dict[str, Any], dataset: Dataset) -> bool:
+        """缓存条目是否由该数据集（或内容相同的数据集）分词得到"""
+        return status.get("dataset_id") == dataset.id or status.get("dataset_key") == arrow_store.key(dataset)
+
+    @staticmethod
+    def normalize_params(params: Dict[str, Any]) -> Dict[str, Any]:
+        tokenizer = (params.get("tokenizer") or "").strip()
+        if not tokenizer:
+            raise TokenizationError(400, "tokenizer is required")
+        if tokenizer != BYTE_TOKENIZER and AutoTokenizer is None:
+            raise TokenizationError(501, "Tokenizing with Hugging Face tokenizers requires transformers")
+        max_length = int(params.get("max_length") or 512)
+        if max_length < 1:
+            raise TokenizationError(400, "max_length must be positive")
+        return {
+            "tokenizer": tokenizer,
+            "max_length": max_length,
+            "text_columns": list(params.get("text_columns") or []),
+            "separator": params.get("separator") if params.get("separator") is not None else "\n",
+            "add_special_tokens": bool(params.get("add_special_tokens", True))
+        }
+
+    async def prepare(self, db: Session, dataset: Dataset, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        返回分词缓存的状态；缓存命中时 status 为 completed（cache_hit 为 True），
+        否则启动（或复用进行中的）分词任务并返回 running
+        """
+        if pa is None:
+            raise TokenizationError(501, "Tokenization requires pyarrow")
+        params = self.normalize_params(params)
+        try:
+            table = await asyncio.to_thread(arrow_store.open, db, dataset)
+        except ArrowStoreError as e:
+            raise TokenizationError(e.status_code, e.detail)
+        if not params["text_columns"]:
+            params["text_columns"] = ["text"] if "text" in table.column_names else [
+                field.name for field in table.schema if pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+            ]
+        missing = [column for column in params["text_columns"] if column not in table.column_names]
+        if missing or not params["text_columns"]:
+            raise TokenizationError(400, f"Unknown text columns: {', '.join(missing)}" if missing else "Dataset has no text columns")
+
+        key = cache_key(arrow_store.key(dataset), params)
+        job = self._jobs.get(key)
+        if job is not None and not job.done:
+            return {**job.snapshot, "cache_hit": False}
+        cached = await asyncio.to_thread(self.lookup, key)
+        if cached is not None:
+            return {**cached.meta, "status": "completed", "progress": 100.0, "cache_hit": True}
+
+        ranges = [(start, min(start + TOKENIZE_SHARD_ROWS, table.num_rows)) for start in range(0, table.num_rows, TOKENIZE_SHARD_ROWS)]
+        job = TokenizationJob(key, dataset.id, arrow_store.key(dataset), len(ranges))
+        self._jobs[key] = job
+        for finished in [item for item, value in self._jobs.items() if value.done]:
+            del self._jobs[finished]
+        job.task = asyncio.create_task(self._run(job, str(arrow_store.path(dataset)), ranges, params))
+        return {**job.snapshot, "cache_hit": False}
+
+    async def _run(self, job: TokenizationJob, arrow_path: str, ranges: List[Tuple[int, int]], params: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        staging = self.root / f".{job.key}.{uuid.uuid4().hex[:8]}"
+        started = time.time()
+        futures = []
+        try:
+            staging.mkdir(parents=True)
+            pool = self._get_pool()
+            names = [f"shard-{index:05d}" for index in range(len(ranges))]
+            futures = [
+                loop.run_in_executor(pool, tokenize_shard, arrow_path, start, stop, params, str(staging / name))
+                for name, (start, stop) in zip(names, ranges)
+            ]
+            results = []
+            for done, future in enumerate(asyncio.as_completed(futures), start=1):
+                results.append(await future)
+                job.snapshot.update(shards_done=done, progress=round(done / len(futures) * 100, 2))
+
+            meta = {
+                "key": job.key,
+                "dataset_id": job.dataset_id,
+                "dataset_key": job.dataset_key,
+                **params,
+                "shards": names,
+                "rows": sum(result["rows"] for result in results),
+                "tokens": sum(result["tokens"] for result in results),
+                "truncated_rows": sum(result["max_length_rows"] for result in results),
+                "bytes": sum(result["bytes"] for result in results),
+                "build_seconds": round(time.time() - started, 3),
+                "created_at": datetime.now(timezone.utc).isoformat()
+            }
+            (staging / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+            target = self.root / job.key
+            if target.exists():
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                staging.rename(target)
+            job.snapshot.update(status="completed", progress=100.0, finished_at=datetime.now(timezone.utc).isoformat())
+            logger.info(f"Tokenized dataset {job.dataset_id} ({job.key}): {meta['rows']} rows, {meta['tokens']} tokens")
+            await asyncio.to_thread(self.evict, {job.key})
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            logger.error(f"Tokenization failed for dataset {job.dataset_id}: {e}")
+            job.snapshot.update(status="failed", error=str(e), finished_at=datetime.now(timezone.utc).isoformat())
+            shutil.rmtree(staging, ignore_errors=True)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def evict(self, keep: Optional[set] = None) -> List[str]:
+        """按 meta.json 的最近使用时间淘汰缓存条目，直到总大小不超过 max_bytes；返回被删除的键"""
+        keep = set(keep or ()) | {key for key, job in self._jobs.items() if not job.done}
+        entries = []
+        for meta_path in self.root.glob("*/meta.json"):
+            try:
+                entries.append((meta_path.stat().st_mtime, meta_path.parent.name, json.loads(meta_path.read_text(encoding="utf-8"))["bytes"]))
+            except (OSError, ValueError, KeyError):
+                continue
+        total = sum(size for _, _, size in entries)
+        removed = []
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key in keep:
+                continue
+            shutil.rmtree(self.root / key, ignore_errors=True)
+            total -= size
+            removed.append(key)
+        if removed:
+            logger.info(f"Evicted {len(removed)} tokenization cache entries")
+        return removed
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            if job.task is not None and not job.done:
+                job.task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# 全局分词缓存实例
+tokenization_manager = TokenizationManager()
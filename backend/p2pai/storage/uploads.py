@@ -0,0 +1,308 @@
+"""
+数据集断点续传上传（tus 1.0 协议的 core + creation + termination）
+- 请求体按块流式写入磁盘，不在内存中缓存整个文件
+- SHA-256 随写入增量计算；服务重启后从磁盘上已确认的部分重新计算一次哈希状态
+- 已确认的 offset 保存在数据库中，客户端断线后通过 HEAD 获取 offset 继续上传
+- 完成的文件导入内容寻址存储，按服务端计算的 SHA-256 去重（客户端声明的哈希不作为引用内容的依据）
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from common.storage.blobstore import blob_store, blob_ref
+from database.edgeai import BlobObject
+from database.p2pai import Dataset, UploadSession
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = "creation,termination"
+
+# 数据集文件存储目录
+DATASET_STORAGE_DIR = Path(os.getenv("P2PAI_DATASET_DIR", "storage/datasets"))
+# 单个上传的最大字节数（默认 50GB）
+UPLOAD_MAX_SIZE = int(os.getenv("P2PAI_UPLOAD_MAX_SIZE", 50 * 1024 ** 3))
+# 未完成上传的保留时间（小时）
+UPLOAD_EXPIRE_HOURS = int(os.getenv("P2PAI_UPLOAD_EXPIRE_HOURS", 24))
+# 缓冲到该大小后在线程中写盘并更新哈希
+UPLOAD_WRITE_BUFFER = int(os.getenv("P2PAI_UPLOAD_WRITE_BUFFER", 4 * 1024 * 1024))
+# 单次 PATCH 中每写入该字节数把 offset 持久化一次
+UPLOAD_CHECKPOINT_BYTES = int(os.getenv("P2PAI_UPLOAD_CHECKPOINT_BYTES", 64 * 1024 * 1024))
+
+
+class UploadError(Exception):
+    """上传请求不合法，status_code 为应返回的 HTTP 状态码"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def parse_upload_metadata(header: Optional[str]) -> Dict[str, str]:
+    """解析 tus Upload-Metadata: "key base64value,key2 base64value2" """
+    metadata: Dict[str, str] = {}
+    if not header:
+        return metadata
+    for item in header.split(","):
+        key, _, value = item.strip().partition(" ")
+        if not key:
+            continue
+        try:
+            metadata[key] = base64.b64decode(value).decode("utf-8") if value else ""
+        except (ValueError, UnicodeDecodeError):
+            raise UploadError(400, f"Invalid Upload-Metadata value for {key}")
+    return metadata
+
+
+def _safe_filename(filename: str) -> str:
+    name = os.path.basename(filename.replace("\\", "/")).strip()
+    return name or "dataset.bin"
+
+
+@dataclass
+class _UploadState:
+    """进程内的上传状态：哈希对象及其对应的 offset，同一上传同时只允许一个 PATCH"""
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256)
+    hashed_offset: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class UploadManager:
+
+    def __init__(self, storage_dir: Path = DATASET_STORAGE_DIR):
+        self.storage_dir = storage_dir
+        self._states: Dict[str, _UploadState] = {}
+
+    @property
+    def partial_dir(self) -> Path:
+        return self.storage_dir / ".uploads"
+
+    def create(
+        self,
+        db: Session,
+        length: int,
+        metadata: Dict[str, str],
+        dataset: Optional[Dataset] = None
+    ) -> UploadSession:
+        """创建上传会话及对应的数据集记录（状态为 uploading）"""
+        if length < 0:
+            raise UploadError(400, "Invalid Upload-Length")
+        if length > UPLOAD_MAX_SIZE:
+            raise UploadError(413, f"Upload exceeds the maximum size of {UPLOAD_MAX_SIZE} bytes")
+
+        filename = _safe_filename(metadata.get("filename", ""))
+        if dataset is None:
+            dataset = Dataset(
+                id=f"dataset-{uuid.uuid4().hex[:8]}",
+                name=metadata.get("name") or filename,
+                description=metadata.get("description") or f"Uploaded dataset: {filename}",
+                type=metadata.get("type") or "custom",
+                format=filename.rsplit(".", 1)[-1].lower() if "." in filename else "unknown",
+                privacy_level=metadata.get("privacy_level") or "private",
+                project_id=metadata.get("project_id") or None
+            )
+            db.add(dataset)
+        dataset.status = "uploading"
+
+        upload_id = uuid.uuid4().hex
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        temp_path = self.partial_dir / upload_id
+        temp_path.touch()
+
+        upload = UploadSession(
+            id=upload_id,
+            dataset_id=dataset.id,
+            filename=filename,
+            length=length,
+            offset=0,
+            temp_path=str(temp_path),
+            upload_metadata=metadata,
+            expires_at=datetime.now(timezone.utc) + timedelta(hours=UPLOAD_EXPIRE_HOURS)
+        )
+        db.add(upload)
+        db.commit()
+
+        self._states[upload_id] = _UploadState()
+
+        if length == 0:
+            self._complete(db, upload, blob_store.ingest(db, temp_path))
+        return upload
+
+    def get(self, db: Session, upload_id: str) -> UploadSession:
+        upload = db.query(UploadSession).filter(UploadSession.id == upload_id).first()
+        if upload is None:
+            raise UploadError(404, "Upload not found")
+        return upload
+
+    async def _restore_state(self, upload: UploadSession) -> _UploadState:
+        """
+        获取哈希状态；进程重启或上次 PATCH 中断后，截掉未确认的字节并从磁盘重新计算已确认部分的哈希
+        """
+        state = self._states.setdefault(upload.id, _UploadState())
+        if state.hashed_offset == upload.offset and os.path.getsize(upload.temp_path) == upload.offset:
+            return state
+
+        def rebuild():
+            with open(upload.temp_path, "r+b") as f:
+                f.truncate(upload.offset)
+                hasher = hashlib.sha256()
+                remaining = upload.offset
+                while remaining > 0:
+                    chunk = f.read(min(UPLOAD_WRITE_BUFFER, remaining))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+            return hasher
+
+        state.hasher = await run_in_threadpool(rebuild)
+        state.hashed_offset = upload.offset
+        return state
+
+    async def write(self, db: Session, upload: UploadSession, offset: int, chunks: AsyncIterator[bytes]) -> int:
+        """
+        从 offset 处追加请求体；返回新的 offset
+        客户端中途断开时保留已写入的部分（抛出的异常在 offset 持久化之后继续向上传递）
+        """
+        if upload.completed_at is not None:
+            raise UploadError(403, "Upload already completed")
+        if offset != upload.offset:
+            raise UploadError(409, f"Upload-Offset mismatch, current offset is {upload.offset}")
+
+        state = self._states.setdefault(upload.id, _UploadState())
+        if state.lock.locked():
+            raise UploadError(423, "Another request is uploading to this resource")
+
+        async with state.lock:
+            state = await self._restore_state(upload)
+            written = upload.offset
+            checkpoint = written
+            buffer = bytearray()
+
+            f = open(upload.temp_path, "r+b")
+            try:
+                f.seek(written)
+
+                def flush(data: bytes):
+                    f.write(data)
+                    state.hasher.update(data)
+
+                async def write_buffer():
+                    nonlocal written, checkpoint
+                    data = bytes(buffer)
+                    buffer.clear()
+                    await run_in_threadpool(flush, data)
+                    written += len(data)
+                    state.hashed_offset = written
+                    if written - checkpoint >= UPLOAD_CHECKPOINT_BYTES:
+                        await run_in_threadpool(f.flush)
+                        self._save_offset(db, upload, written)
+                        checkpoint = written
+
+                try:
+                    async for chunk in chunks:
+                        if not chunk:
+                            continue
+                        # written 包含已写盘的部分，buffer 为尚未写盘的部分
+                        if len(chunk) > upload.length - written - len(buffer):
+                            raise UploadError(413, "Request body exceeds the declared Upload-Length")
+                        buffer.extend(chunk)
+                        if len(buffer) >= UPLOAD_WRITE_BUFFER:
+                            await write_buffer()
+                finally:
+                    # 正常结束或客户端断开，都把已收到的数据写盘并确认
+                    if buffer:
+                        await write_buffer()
+                    await run_in_threadpool(f.flush)
+                    self._save_offset(db, upload, written)
+            finally:
+                f.close()
+                # 超长的请求体被拒绝时，已收到的部分也可能恰好补齐了整个文件
+                if upload.offset == upload.length:
+                    await self._finalize(db, upload)
+            return upload.offset
+
+    def _save_offset(self, db: Session, upload: UploadSession, offset: int):
+        upload.offset = offset
+        upload.expires_at = datetime.now(timezone.utc) + timedelta(hours=UPLOAD_EXPIRE_HOURS)
+        db.commit()
+
+    async def _finalize(self, db: Session, upload: UploadSession):
+        """上传完成：导入内容寻址存储（相同的块只保存一份），记录大小和校验和"""
+        state = self._states.pop(upload.id, None)
+        sha256 = state.hasher.hexdigest() if state and state.hashed_offset == upload.length else None
+
+        blob = blob_store.add_ref(db, sha256, upload.length) if sha256 else None
+        if blob is None:
+            # 哈希状态丢失（例如并发的重启）时，切块的同时重新计算
+            manifest = await run_in_threadpool(blob_store.store_file, Path(upload.temp_path))
+            blob = blob_store.register(db, manifest)
+        self._complete(db, upload, blob)
+
+    def _complete(self, db: Session, upload: UploadSession, blob: BlobObject):
+        try:
+            os.remove(upload.temp_path)
+        except FileNotFoundError:
+            pass
+        self._states.pop(upload.id, None)
+
+        dataset = upload.dataset
+        dataset.file_path = blob_ref(blob.digest)
+        dataset.size = upload.length
+        dataset.sha256 = blob.digest
+        dataset.status = "ready"
+        dataset.uploaded_at = datetime.now(timezone.utc)
+        upload.offset = upload.length
+        upload.temp_path = dataset.file_path
+        upload.completed_at = datetime.now(timezone.utc)
+        db.commit()
+        logger.info(f"Dataset {dataset.id} uploaded: {upload.length} bytes, sha256={blob.digest}")
+
+    def terminate(self, db: Session, upload: UploadSession):
+        """终止未完成的上传并删除临时文件和数据集记录"""
+        if upload.completed_at is not None:
+            raise UploadError(403, "Upload already completed")
+        state = self._states.get(upload.id)
+        if state is not None and state.lock.locked():
+            raise UploadError(423, "Upload is in progress")
+        self._states.pop(upload.id, None)
+        try:
+            os.remove(upload.temp_path)
+        except FileNotFoundError:
+            pass
+        dataset = upload.dataset
+        db.delete(upload)
+        if dataset is not None and dataset.status == "uploading":
+            db.delete(dataset)
+        db.commit()
+
+    def cleanup_expired(self, db: Session) -> int:
+        """删除过期的未完成上传"""
+        expired = db.query(UploadSession).filter(
+            UploadSession.completed_at.is_(None),
+            UploadSession.expires_at < datetime.now(timezone.utc)
+        ).all()
+        count = 0
+        for upload in expired:
+            try:
+                self.terminate(db, upload)
+                count += 1
+            except UploadError:
+                continue
+        return count
+
+
+# 全局上传管理实例
+upload_manager = UploadManager()
@@ -0,0 +1,621 @@
+"""
+数据集校验与画像
+- CSV / JSONL 由主进程按记录边界切成约 P2PAI_VALIDATION_BLOCK_SIZE 的块，Parquet 按 row group 切分，交给进程池并行解析
+- 每块用 pandas / NumPy 向量化计算行数、空值、列统计、schema 检查和行哈希，主进程只合并这些小结果
+- 同时处理中的块数有上限，内存占用与文件大小无关（重复检测的行哈希每行 8 字节除外）
+- 校验作为后台任务运行，进度和阶段性结果通过版本号通知（状态查询 / SSE）
+"""
+
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 可选依赖
+    pq = None
+
+from common.storage.artifacts import ArtifactError, resolve_artifact_path
+from common.storage.blobstore import BlobError, BlobReader, blob_store, parse_blob_ref
+from database.p2pai import Dataset, SessionLocal
+from .uploads import DATASET_STORAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 解析进程数
+VALIDATION_WORKERS = int(os.getenv("P2PAI_VALIDATION_WORKERS", min(4, os.cpu_count() or 1)))
+# CSV / JSONL 每块的大致字节数
+VALIDATION_BLOCK_SIZE = int(os.getenv("P2PAI_VALIDATION_BLOCK_SIZE", 32 * 1024 * 1024))
+# 每个进程最多排队的块数
+VALIDATION_QUEUE_PER_WORKER = 2
+# 结果中最多列出的问题数
+VALIDATION_MAX_ISSUES = 50
+# 内存中保留的已结束任务数
+VALIDATION_JOB_HISTORY = 100
+
+# 数据集格式（扩展名） -> (解析方式, 分隔符)
+DATASET_FORMATS = {
+    "csv": ("csv", ","),
+    "tsv": ("csv", "\t"),
+    "jsonl": ("jsonl", None),
+    "ndjson": ("jsonl", None),
+    "json": ("jsonl", None),
+    "parquet": ("parquet", None),
+    "pq": ("parquet", None)
+}
+COLUMN_TYPES = {"integer", "number", "boolean", "string", "datetime"}
+_BOOLEAN_VALUES = {"true", "false", "1", "0", "yes", "no", "t", "f", "y", "n"}
+_TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+Source = Union[BlobReader, str]
+
+
+class DatasetValidationError(Exception):
+    """数据集无法校验（格式不支持、文件不存在、参数错误）"""
+
+
+def _open_source(source: Source) -> BinaryIO:
+    return source.open() if isinstance(source, BlobReader) else open(source, "rb")
+
+
+# ===============================
+# 工作进程：单块画像
+# ===============================
+
+def _column_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(series):
+        return "integer"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    return "string"
+
+
+def _column_stats(series: pd.Series) -> Dict[str, Any]:
+    kind = _column_kind(series)
+    present = series.dropna()
+    stats: Dict[str, Any] = {"kind": kind, "nulls": int(len(series) - len(present)), "count": int(len(present))}
+    if kind in ("integer", "number"):
+        values = present.to_numpy(dtype=np.float64)
+        if len(values):
+            mean = values.mean()
+            stats.update(
+                n=int(len(values)),
+                mean=float(mean),
+                m2=float(np.square(values - mean).sum()),
+                min=float(values.min()),
+                max=float(values.max())
+            )
+    elif kind == "boolean":
+        stats["true_count"] = int(present.sum())
+    elif kind == "datetime":
+        if len(present):
+            stats.update(earliest=present.min().isoformat(), latest=present.max().isoformat())
+    elif len(present):
+        lengths = present.astype(str).str.len()
+        stats.update(min_length=int(lengths.min()), max_length=int(lengths.max()))
+    return stats
+
+
+def _type_errors(series: pd.Series, expected: str) -> int:
+    """统计不符合期望类型的非空值个数"""
+    present = series.notna()
+    if expected in ("integer", "number"):
+        if pd.api.types.is_bool_dtype(series):
+            return int(present.sum())
+        values = pd.to_numeric(series, errors="coerce")
+        invalid = present & values.isna()
+        if expected == "integer":
+            invalid |= values.notna() & (values != np.floor(values))
+        return int(invalid.sum())
+    if expected == "boolean":
+        if pd.api.types.is_bool_dtype(series):
+            return 0
+        normalized = series.astype(str).str.strip().str.lower()
+        return int((present & ~normalized.isin(_BOOLEAN_VALUES)).sum())
+    if expected == "datetime":
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return 0
+        values = pd.to_datetime(series, errors="coerce", utc=True, format="mixed")
+        return int((present & values.isna()).sum())
+    return 0
+
+
+def _profile_frame(df: pd.DataFrame, options: Dict[str, Any], hashes: Optional[np.ndarray]) -> Dict[str, Any]:
+    result = {
+        "rows": int(len(df)),
+        "columns": {str(column): _column_stats(df[column]) for column in df.columns},
+        "type_errors": {},
+        "hashes": hashes
+    }
+    for column, expected in (options.get("columns") or {}).items():
+        if column in df.columns:
+            count = _type_errors(df[column], expected)
+            if count:
+                result["type_errors"][column] = count
+    return result
+
+
+def _record_ends(data: bytes, quoted: bool) -> np.ndarray:
+    """
+    记录结束位置（换行符之后的偏移）
+    quoted 为 True 时按 CSV 规则跳过引号内的换行：换行之前的引号数为偶数才是记录边界
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(array == 10)
+    if quoted and b'"' in data:
+        # uint8 累加会回绕，但不影响奇偶性
+        parity = np.cumsum(array == 34, dtype=np.uint8)[newlines] & 1
+        newlines = newlines[parity == 0]
+    return newlines + 1
+
+
+def _split_records(data: bytes, quoted: bool) -> List[bytes]:
+    if quoted and b'"' in data:
+        ends = _record_ends(data, quoted).tolist()
+        starts = [0] + ends
+        records = [data[start:end] for start, end in zip(starts, ends + [len(data)])]
+    else:
+        records = data.split(b"\n")
+    return [record.rstrip(b"\r\n") for record in records if record.strip()]
+
+
+def _record_hashes(records: List[bytes]) -> np.ndarray:
+    """按原始记录内容计算 64 位哈希，不受各块类型推断差异的影响"""
+    if not records:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_array(np.array(records, dtype=object))
+
+
+def _error_result(error: Exception) -> Dict[str, Any]:
+    return {"rows": 0, "columns": {}, "type_errors": {}, "hashes": None, "error": f"{type(error).__name__}: {error}"}
+
+
+def profile_text_block(data: bytes, fmt: str, sep: Optional[str], header: Optional[bytes], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析并画像一块 CSV / JSONL 数据
+    header 为 None 时 data 的第一条记录是表头（第一块）
+    """
+    try:
+        if fmt == "csv":
+            df = pd.read_csv(io.BytesIO(header + data if header else data), sep=sep)
+            records = _split_records(data, quoted=True)
+            if header is None:
+                records = records[1:]
+        else:
+            df = pd.read_json(io.BytesIO(data), lines=True)
+            records = _split_records(data, quoted=False)
+        hashes = _record_hashes(records) if options.get("check_duplicates", True) else None
+        return _profile_frame(df, options, hashes)
+    except Exception as e:
+        return _error_result(e)
+
+
+def profile_parquet_row_group(source: Source, index: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    """读取并画像一个 Parquet row group"""
+    try:
+        with _open_source(source) as f:
+            df = pq.ParquetFile(f).read_row_group(index).to_pandas()
+        hashes = None
+        if options.get("check_duplicates", True):
+            try:
+                hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+            except TypeError:
+                # 列表等不可哈希的列按字符串表示计算
+                hashes = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+        return _profile_frame(df, options, hashes)
+    except Exception as e:
+        return _error_result(e)
+
+
+# ===============================
+# 主进程：切块与合并
+# ===============================
+
+def _text_blocks(source: Source, fmt: str, hasher) -> Iterator[Tuple[bytes, Optional[bytes]]]:
+    """
+    按记录边界切块，产生 (块数据, 表头)；同时计算整个文件的 SHA-256
+    """
+    quoted = fmt == "csv"
+    header: Optional[bytes] = None
+    first = True
+    carry = b""
+    with _open_source(source) as f:
+        while True:
+            block = f.read(VALIDATION_BLOCK_SIZE)
+            hasher.update(block)
+            data = carry + block if carry else block
+            if not block:
+                if data.strip():
+                    yield data, header
+                return
+
+            ends = _record_ends(data, quoted)
+            if len(ends) == 0:
+                if len(data) > 4 * VALIDATION_BLOCK_SIZE:
+                    raise DatasetValidationError("A single record exceeds the validation block size")
+                carry = data
+                continue
+
+            chunk, carry = data[:int(ends[-1])], data[int(ends[-1]):]
+            yield chunk, header
+            if first and quoted:
+                header = chunk[:int(ends[0])]
+            first = False
+
+
+def _parquet_row_groups(source: Source) -> List[Tuple[int, int, int]]:
+    """[(row group 序号, 压缩后字节数, 行数)]"""
+    with _open_source(source) as f:
+        metadata = pq.ParquetFile(f).metadata
+    groups = []
+    for index in range(metadata.num_row_groups):
+        row_group = metadata.row_group(index)
+        size = sum(row_group.column(i).total_compressed_size for i in range(row_group.num_columns))
+        groups.append((index, size, row_group.num_rows))
+    return groups
+
+
+def _finite(value: Optional[float]) -> Optional[float]:
+    return value if value is not None and math.isfinite(value) else None
+
+
+def _merge_stats(a: Optional[Dict[str, Any]], b: Dict[str, Any]) -> Dict[str, Any]:
+    if a is None:
+        return dict(b)
+    if a["kind"] == b["kind"]:
+        kind = a["kind"]
+    elif {a["kind"], b["kind"]} <= {"integer", "number"}:
+        kind = "number"
+    else:
+        kind = "mixed"
+    merged = {"kind": kind, "nulls": a["nulls"] + b["nulls"], "count": a["count"] + b["count"]}
+
+    # 均值和二阶中心矩按 Chan 等人的并行公式合并
+    na, nb = a.get("n", 0), b.get("n", 0)
+    if na and nb:
+        n = na + nb
+        delta = b["mean"] - a["mean"]
+        merged.update(
+            n=n,
+            mean=a["mean"] + delta * nb / n,
+            m2=a["m2"] + b["m2"] + delta * delta * na * nb / n,
+            min=min(a["min"], b["min"]),
+            max=max(a["max"], b["max"])
+        )
+    elif na or nb:
+        source = a if na else b
+        merged.update({key: source[key] for key in ("n", "mean", "m2", "min", "max")})
+
+    for key in ("min_length", "earliest"):
+        values = [stats[key] for stats in (a, b) if key in stats]
+        if values:
+            merged[key] = min(values)
+    for key in ("max_length", "latest"):
+        values = [stats[key] for stats in (a, b) if key in stats]
+        if values:
+            merged[key] = max(values)
+    if "true_count" in a or "true_count" in b:
+        merged["true_count"] = a.get("true_count", 0) + b.get("true_count", 0)
+    return merged
+
+
+class _Profile:
+    """合并各块结果"""
+
+    def __init__(self, options: Dict[str, Any]):
+        self.options = options
+        self.rows = 0
+        self.blocks = 0
+        self.columns: Dict[str, Dict[str, Any]] = {}
+        self.column_rows: Counter = Counter()
+        self.type_errors: Counter = Counter()
+        self.hashes: List[np.ndarray] = []
+        self.errors: List[str] = []
+
+    def add(self, result: Dict[str, Any]):
+        self.blocks += 1
+        if "error" in result:
+            self.errors.append(f"Block {self.blocks}: {result['error']}")
+            return
+        self.rows += result["rows"]
+        for name, stats in result["columns"].items():
+            self.columns[name] = _merge_stats(self.columns.get(name), stats)
+            self.column_rows[name] += result["rows"]
+        self.type_errors.update(result["type_errors"])
+        if result["hashes"] is not None:
+            self.hashes.append(result["hashes"])
+
+    def _column_summary(self, name: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        # 某些块中不存在的列（JSONL 中缺少的键）按空值计
+        nulls = stats["nulls"] + self.rows - self.column_rows[name]
+        summary = {
+            "kind": stats["kind"],
+            "count": stats["count"],
+            "nulls": nulls,
+            "null_ratio": round(nulls / self.rows, 6) if self.rows else 0.0
+        }
+        if stats.get("n"):
+            n = stats["n"]
+            summary.update(
+                mean=_finite(stats["mean"]),
+                std=_finite(math.sqrt(stats["m2"] / (n - 1))) if n > 1 else 0.0,
+                min=_finite(stats["min"]),
+                max=_finite(stats["max"])
+            )
+        for key in ("min_length", "max_length", "true_count", "earliest", "latest"):
+            if key in stats:
+                summary[key] = stats[key]
+        return summary
+
+    def summary(self) -> Dict[str, Any]:
+        expected = self.options.get("columns") or {}
+        observed = list(self.columns)
+        unexpected = [name for name in observed if name not in expected] if expected and not self.options.get("allow_extra_columns", True) else []
+        return {
+            "rows": self.rows,
+            "columns": {name: self._column_summary(name, stats) for name, stats in self.columns.items()},
+            "schema": {
+                "expected": expected,
+                "observed": {name: self.columns[name]["kind"] for name in observed},
+                "missing_columns": [name for name in expected if name not in self.columns],
+                "unexpected_columns": unexpected,
+                "type_errors": dict(self.type_errors)
+            },
+            "errors": self.errors[:VALIDATION_MAX_ISSUES]
+        }
+
+    def duplicate_rows(self) -> Optional[int]:
+        if not self.options.get("check_duplicates", True):
+            return None
+        if not self.hashes:
+            return 0
+        hashes = np.concatenate(self.hashes)
+        return int(len(hashes) - len(np.unique(hashes)))
+
+
+# ===============================
+# 后台任务
+# ===============================
+
+class ValidationJob:
+    """一次校验任务的状态；每次变化版本号加一并唤醒等待者"""
+
+    def __init__(self, dataset_id: str, size: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.dataset_id = dataset_id
+        self.size = size
+        self.version = 0
+        self.snapshot: Dict[str, Any] = {}
+        self.task: Optional[asyncio.Task] = None
+        self._event: Optional[asyncio.Event] = None
+        self.publish(status="pending", bytes_processed=0, progress=0.0, rows=0, blocks=0,
+                     started_at=datetime.now(timezone.utc).isoformat(), finished_at=None, result=None, error=None)
+
+    @property
+    def done(self) -> bool:
+        return self.snapshot["status"] in _TERMINAL_STATUSES
+
+    def publish(self, **changes):
+        self.version += 1
+        self.snapshot = {**self.snapshot, **changes, "job_id": self.id, "dataset_id": self.dataset_id, "version": self.version}
+        if changes.get("status") in _TERMINAL_STATUSES:
+            self.snapshot["finished_at"] = datetime.now(timezone.utc).isoformat()
+        event, self._event = self._event, None
+        if event is not None:
+            event.set()
+
+    async def wait(self, since_version: int, timeout: float) -> bool:
+        """等待版本号超过 since_version，超时返回 False"""
+        if self.version != since_version or self.done:
+            return True
+        if self._event is None:
+            self._event = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class ValidationManager:
+
+    def __init__(self, max_workers: int = VALIDATION_WORKERS):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ValidationJob] = {}
+        self._active: Dict[str, ValidationJob] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn：不复制服务进程中的事件循环、线程和数据库连接
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def active_job(self, dataset_id: str) -> Optional[ValidationJob]:
+        return self._active.get(dataset_id)
+
+    def get(self, job_id: str) -> Optional[ValidationJob]:
+        return self._jobs.get(job_id)
+
+    def start(self, db: Session, dataset: Dataset, options: Dict[str, Any]) -> ValidationJob:
+        """启动校验；同一数据集已有进行中的任务时返回该任务"""
+        job = self._active.get(dataset.id)
+        if job is not None:
+            return job
+
+        fmt, sep = DATASET_FORMATS.get((dataset.format or "").lower(), (None, None))
+        if fmt is None:
+            raise DatasetValidationError(f"Unsupported dataset format: {dataset.format}")
+        if fmt == "parquet" and pq is None:
+            raise DatasetValidationError("Parquet validation requires pyarrow")
+        unknown = {value for value in (options.get("columns") or {}).values()} - COLUMN_TYPES
+        if unknown:
+            raise DatasetValidationError(f"Unknown column types: {', '.join(sorted(unknown))}")
+
+        digest = parse_blob_ref(dataset.file_path)
+        try:
+            source: Source = blob_store.open(db, digest) if digest else str(resolve_artifact_path(dataset.file_path, root=DATASET_STORAGE_DIR))
+        except (BlobError, ArtifactError) as e:
+            raise DatasetValidationError(f"Dataset file not available: {e}")
+
+        job = ValidationJob(dataset.id, dataset.size or 0)
+        self._jobs[job.id] = job
+        self._active[dataset.id] = job
+        finished = [job_id for job_id, item in self._jobs.items() if item.done]
+        for job_id in finished[:max(len(self._jobs) - VALIDATION_JOB_HISTORY, 0)]:
+            del self._jobs[job_id]
+        job.task = asyncio.create_task(self._run(job, source, fmt, sep, options, dataset.sha256))
+        return job
+
+    def cancel(self, dataset_id: str):
+        job = self._active.get(dataset_id)
+        if job is not None and job.task is not None:
+            job.task.cancel()
+
+    async def _run(self, job: ValidationJob, source: Source, fmt: str, sep: Optional[str], options: Dict[str, Any], sha256: Optional[str]):
+        loop = asyncio.get_running_loop()
+        profile = _Profile(options)
+        pending: Dict[asyncio.Future, int] = {}
+        limit = self.max_workers * VALIDATION_QUEUE_PER_WORKER
+        total = job.size
+        processed = 0
+
+        async def drain(max_pending: int):
+            nonlocal processed
+            while len(pending) > max_pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    processed += pending.pop(future)
+                    profile.add(future.result())
+                job.publish(
+                    status="running",
+                    bytes_processed=processed,
+                    progress=round(min(processed / total, 1.0) * 100, 2) if total else 0.0,
+                    rows=profile.rows,
+                    blocks=profile.blocks,
+                    result=profile.summary()
+                )
+
+        try:
+            pool = self._get_pool()
+            job.publish(status="running")
+            checks: Dict[str, Optional[bool]] = {}
+
+            if fmt == "parquet":
+                groups = await asyncio.to_thread(_parquet_row_groups, source)
+                total = sum(size for _, size, _ in groups) or 1
+                for index, size, _ in groups:
+                    await drain(limit - 1)
+                    pending[loop.run_in_executor(pool, profile_parquet_row_group, source, index, options)] = size
+                await drain(0)
+                checks["size_verified"] = profile.rows == sum(rows for _, _, rows in groups)
+                checks["checksum_verified"] = None
+            else:
+                hasher = hashlib.sha256()
+                blocks = _text_blocks(source, fmt, hasher)
+                while True:
+                    item = await asyncio.to_thread(next, blocks, None)
+                    if item is None:
+                        break
+                    data, header = item
+                    await drain(limit - 1)
+                    pending[loop.run_in_executor(pool, profile_text_block, data, fmt, sep, header, options)] = len(data)
+                await drain(0)
+                checks["size_verified"] = processed == job.size
+                checks["checksum_verified"] = hasher.hexdigest() == sha256 if sha256 else None
+
+            duplicates = await asyncio.to_thread(profile.duplicate_rows)
+            result = self._result(profile, duplicates, checks)
+            await asyncio.to_thread(_save_result, job.dataset_id, result)
+            job.publish(status="completed", progress=100.0, result=result)
+            logger.info(f"Validated dataset {job.dataset_id}: {profile.rows} rows, valid={result['valid']}")
+
+        except asyncio.CancelledError:
+            job.publish(status="cancelled")
+            raise
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                self._pool = None
+            logger.error(f"Dataset validation failed for {job.dataset_id}: {e}")
+            job.publish(status="failed", error=str(e))
+        finally:
+            for future in pending:
+                future.cancel()
+            if self._active.get(job.dataset_id) is job:
+                del self._active[job.dataset_id]
+
+    def _result(self, profile: _Profile, duplicates: Optional[int], checks: Dict[str, Optional[bool]]) -> Dict[str, Any]:
+        summary = profile.summary()
+        schema = summary["schema"]
+        issues = list(summary["errors"])
+        if schema["missing_columns"]:
+            issues.append(f"Missing columns: {', '.join(schema['missing_columns'])}")
+        if schema["unexpected_columns"]:
+            issues.append(f"Unexpected columns: {', '.join(schema['unexpected_columns'])}")
+        for column, count in schema["type_errors"].items():
+            issues.append(f"Column {column}: {count} values do not match type {schema['expected'][column]}")
+        if duplicates:
+            issues.append(f"{duplicates} duplicate rows")
+        if checks.get("size_verified") is False:
+            issues.append("Processed size does not match the dataset size")
+        if checks.get("checksum_verified") is False:
+            issues.append("Content does not match the recorded SHA-256")
+
+        validation_results = {
+            "format_valid": not profile.errors,
+            "schema_valid": not (schema["missing_columns"] or schema["unexpected_columns"] or schema["type_errors"]),
+            "no_duplicates": None if duplicates is None else duplicates == 0,
+            **checks
+        }
+        valid = validation_results["format_valid"] and validation_results["schema_valid"] and \
+            checks.get("size_verified") is not False and checks.get("checksum_verified") is not False
+
+        return {
+            "valid": valid,
+            "validation_results": validation_results,
+            "issues": issues[:VALIDATION_MAX_ISSUES],
+            "duplicate_rows": duplicates,
+            **summary
+        }
+
+    def shutdown(self):
+        for job in list(self._active.values()):
+            if job.task is not None:
+                job.task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def _save_result(dataset_id: str, result: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        dataset = db.get(Dataset, dataset_id)
+        if dataset is not None:
+            dataset.validation_result = result
+            dataset.validated_at = datetime.now(timezone.utc)
+            db.commit()
+    finally:
+        db.close()
+
+
+# 全局数据集校验实例
+validation_manager = ValidationManager()
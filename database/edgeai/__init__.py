@@ -5,7 +5,7 @@ This module provides database models, connections, and utilities for the EdgeAI
 """
 
 from .database import Base, engine, SessionLocal, get_db, create_tables, drop_tables, get_database_info
-from .models import User, Project, Model, Node, TaskQueue, Cluster
+from .models import User, Project, Model, ModelVersion, Node, TaskQueue, Cluster, Log, LogSegment, TrainingMetric, BlobObject, BlobChunk
 
 __all__ = [
     "Base",
@@ -18,7 +18,13 @@ __all__ = [
     "User",
     "Project",
     "Model",
+    "ModelVersion",
     "Node",
     "TaskQueue",
-    "Cluster"
+    "Cluster",
+    "Log",
+    "LogSegment",
+    "TrainingMetric",
+    "BlobObject",
+    "BlobChunk"
 ]
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""models: artifact checksum columns
+
+为已有数据库的 models 表补充 sha256、artifact_size、artifact_mtime 列
+create_all 不会修改已存在的表；只添加缺少的列，新建的数据库（create_all 已创建完整的表）不做任何修改
+
+Revision ID: 3f2b9c1d0a37
+Revises:
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2b9c1d0a37'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns():
+    return [
+        sa.Column('sha256', sa.String(64), nullable=True),
+        sa.Column('artifact_size', sa.BigInteger(), nullable=True),
+        sa.Column('artifact_mtime', sa.Float(), nullable=True),
+    ]
+
+
+def _existing_columns():
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('models'):
+        return None
+    return {column['name'] for column in inspector.get_columns('models')}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = _existing_columns()
+    if existing is None:
+        return
+    missing = [column for column in _columns() if column.name not in existing]
+    if missing:
+        with op.batch_alter_table('models') as batch_op:
+            for column in missing:
+                batch_op.add_column(column)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    existing = _existing_columns()
+    if existing is None:
+        return
+    present = [column.name for column in _columns() if column.name in existing]
+    if present:
+        with op.batch_alter_table('models') as batch_op:
+            for name in present:
+                batch_op.drop_column(name)
@@ -0,0 +1,83 @@
+"""model_versions table and models.current_version_id
+
+为已有数据库创建 model_versions 表，并给 models 表补充 current_version_id 列及其外键
+只添加缺少的表、列和外键，新建的数据库（create_all 已创建完整的表）不做任何修改
+
+Revision ID: 8d4e6a2b7c49
+Revises: 3f2b9c1d0a37
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4e6a2b7c49'
+down_revision: Union[str, None] = '3f2b9c1d0a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+FK_NAME = 'fk_models_current_version'
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('models'):
+        return
+
+    if not inspector.has_table('model_versions'):
+        op.create_table(
+            'model_versions',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('model_id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('parent_id', sa.Integer(), nullable=True),
+            sa.Column('artifact_digest', sa.String(64), nullable=True),
+            sa.Column('artifact_size', sa.BigInteger(), nullable=True),
+            sa.Column('accuracy', sa.Float(), nullable=True),
+            sa.Column('loss', sa.Float(), nullable=True),
+            sa.Column('metrics', sa.JSON(), nullable=True),
+            sa.Column('description', sa.Text(), nullable=True),
+            sa.Column('created_time', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+            sa.ForeignKeyConstraint(['model_id'], ['models.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['parent_id'], ['model_versions.id'], ondelete='SET NULL'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('model_id', 'version', name='uq_model_versions_model_version')
+        )
+        op.create_index('ix_model_versions_id', 'model_versions', ['id'])
+        op.create_index('idx_model_versions_accuracy', 'model_versions', ['model_id', 'accuracy'])
+        op.create_index('idx_model_versions_loss', 'model_versions', ['model_id', 'loss'])
+        op.create_index('idx_model_versions_parent', 'model_versions', ['parent_id'])
+
+    has_column = 'current_version_id' in {column['name'] for column in inspector.get_columns('models')}
+    has_fk = any(fk['name'] == FK_NAME for fk in inspector.get_foreign_keys('models'))
+    if not (has_column and has_fk):
+        # SQLite 不支持 ALTER TABLE ADD CONSTRAINT，batch 模式下会重建表
+        with op.batch_alter_table('models') as batch_op:
+            if not has_column:
+                batch_op.add_column(sa.Column('current_version_id', sa.Integer(), nullable=True))
+            if not has_fk:
+                batch_op.create_foreign_key(FK_NAME, 'model_versions', ['current_version_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('models'):
+        return
+
+    has_column = 'current_version_id' in {column['name'] for column in inspector.get_columns('models')}
+    has_fk = any(fk['name'] == FK_NAME for fk in inspector.get_foreign_keys('models'))
+    if has_column or has_fk:
+        with op.batch_alter_table('models') as batch_op:
+            if has_fk:
+                batch_op.drop_constraint(FK_NAME, type_='foreignkey')
+            if has_column:
+                batch_op.drop_column('current_version_id')
+
+    if inspector.has_table('model_versions'):
+        op.drop_table('model_versions')
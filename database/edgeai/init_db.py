@@ -11,9 +11,9 @@ sys.path.append(str(current_dir))
 
 from sqlalchemy.exc import IntegrityError
 from .database import engine, SessionLocal, create_tables
-from .models import User, Project, Model, Node, Cluster
+from .models import User, Project, Model, Node, Cluster, Log
 from passlib.context import CryptContext
-from datetime import datetime
+from datetime import datetime, timedelta
 
 # Password hashing
 import hashlib
@@ -286,6 +286,21 @@ def init_database():
                     else:
                         print(f"• Node already exists: {existing_node.name}")
 
+        # Create sample logs
+        if db.query(Log.id).first() is None:
+            now = datetime.now()
+            logs_data = [
+                {"level": "INFO", "message": "Edge node successfully connected to cluster", "category": "node", "node_id": "edge-01", "hours_ago": 30},
+                {"level": "INFO", "message": "Model training initialized for Smart Manufacturing", "category": "training", "node_id": "edge-01", "project_id": "proj-001", "hours_ago": 20},
+                {"level": "WARNING", "message": "Node CPU usage reached 85% - Scaling recommended", "category": "node", "node_id": "edge-02", "hours_ago": 12},
+                {"level": "INFO", "message": "Data preprocessing completed for 12000 samples", "category": "data", "node_id": "edge-02", "project_id": "proj-002", "hours_ago": 6},
+                {"level": "ERROR", "message": "Data validation failed - Schema mismatch detected", "category": "data", "node_id": "edge-03", "project_id": "proj-002", "hours_ago": 3},
+                {"level": "INFO", "message": "Model checkpoint saved successfully", "category": "training", "node_id": "edge-01", "project_id": "proj-001", "hours_ago": 1}
+            ]
+            for log_data in logs_data:
+                hours_ago = log_data.pop("hours_ago")
+                db.add(Log(timestamp=now - timedelta(hours=hours_ago), **log_data))
+            print(f"✓ Created logs: {len(logs_data)}")
 
         # Commit all changes
         db.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, DECIMAL, Index, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Boolean, Float, JSON, DECIMAL, Index, ForeignKey, CheckConstraint, UniqueConstraint
 from sqlalchemy.orm import relationship, foreign
 from sqlalchemy.sql import func
 from .database import Base
@@ -65,6 +65,7 @@ class Project(Base):
     models = relationship("Model", back_populates="project", cascade="all, delete-orphan")
     task_queues = relationship("TaskQueue", back_populates="project", cascade="all, delete-orphan")
     clusters = relationship("Cluster", back_populates="project", cascade="all, delete-orphan")
+    training_metrics = relationship("TrainingMetric", back_populates="project", cascade="all, delete-orphan", passive_deletes=True)
 
     # 添加约束条件
     __table_args__ = (
@@ -88,12 +89,32 @@ class Model(Base):
     progress = Column(DECIMAL(5,2), default=0.00)
     loss = Column(DECIMAL(8,2), default=0.00)
     accuracy = Column(DECIMAL(5,2), default=0.00)
+
+    # 模型文件校验和（登记文件时后台计算一次），及计算时文件的大小和修改时间，用于判断校验和是否仍然有效
+    sha256 = Column(String(64), nullable=True)
+    artifact_size = Column(BigInteger, nullable=True)
+    artifact_mtime = Column(Float, nullable=True)
+
+    # 当前版本（model_versions.id）；回滚只修改这个指针
+    current_version_id = Column(
+        Integer,
+        ForeignKey("model_versions.id", ondelete="SET NULL", use_alter=True, name="fk_models_current_version"),
+        nullable=True
+    )
+
     created_time = Column(DateTime(timezone=True), server_default=func.now())
     updated_time = Column(DateTime(timezone=True), onupdate=func.now())
 
     # 关系定义
     user = relationship("User", back_populates="models")
     project = relationship("Project", back_populates="models")
+    versions = relationship(
+        "ModelVersion",
+        back_populates="model",
+        foreign_keys="ModelVersion.model_id",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
 
     # 添加约束条件
     __table_args__ = (
@@ -103,6 +124,42 @@ class Model(Base):
     )
 
 
+class ModelVersion(Base):
+    """
+    模型版本表 - 每次登记的模型制品一行，版本号在同一模型内从 1 递增
+    parent_id 为派生来源的版本（血缘），artifact_digest 引用内容寻址存储中的对象（每个版本持有一个引用）
+    accuracy / loss 单独成列并建索引，用于按指标查找最优版本；其他指标放在 metrics 中
+    """
+    __tablename__ = "model_versions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model_id = Column(Integer, ForeignKey("models.id", ondelete="CASCADE"), nullable=False)
+    version = Column(Integer, nullable=False)
+    parent_id = Column(Integer, ForeignKey("model_versions.id", ondelete="SET NULL"), nullable=True)
+
+    artifact_digest = Column(String(64), nullable=True)
+    artifact_size = Column(BigInteger, nullable=True)
+
+    accuracy = Column(Float, nullable=True)  # 百分比，与 models.accuracy 一致
+    loss = Column(Float, nullable=True)
+    metrics = Column(JSON, default=dict)
+    description = Column(Text, default="")
+
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 关系定义
+    model = relationship("Model", back_populates="versions", foreign_keys=[model_id])
+
+    __table_args__ = (
+        # 同一模型的版本号唯一；按版本号倒序即可取最新版本
+        UniqueConstraint('model_id', 'version', name='uq_model_versions_model_version'),
+        # 按指标取最优版本
+        Index('idx_model_versions_accuracy', 'model_id', 'accuracy'),
+        Index('idx_model_versions_loss', 'model_id', 'loss'),
+        Index('idx_model_versions_parent', 'parent_id'),
+    )
+
+
 class Node(Base):
     __tablename__ = "nodes"
 
@@ -224,6 +281,117 @@ class Cluster(Base):
     )
 
 
+class Log(Base):
+    """
+    日志表 - 持久化节点与训练日志，支持按时间范围流式导出
+    """
+    __tablename__ = "logs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    level = Column(String(20), default="INFO", nullable=False)
+    message = Column(Text, default="")
+    category = Column(String(50), default="")
+
+    # 来源信息 (与日志接口一致使用字符串ID)
+    node_id = Column(String(100), nullable=True)
+    project_id = Column(String(100), nullable=True)
+
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # 按时间排序导出和按节点/项目过滤的索引
+    __table_args__ = (
+        Index('idx_logs_timestamp', 'timestamp'),
+        Index('idx_logs_node_time', 'node_id', 'timestamp'),
+        Index('idx_logs_project_time', 'project_id', 'timestamp'),
+    )
+
+
+class LogSegment(Base):
+    """
+    日志归档段表 - 记录按天归档到本地列式文件的日志分区
+    min/max 时间与节点列表作为段索引，查询时据此跳过无关的段
+    """
+    __tablename__ = "log_segments"
 
+    id = Column(Integer, primary_key=True, index=True)
+    partition_date = Column(String(10), nullable=False, index=True)  # YYYY-MM-DD，迟到的日志会产生同一天的多个段
+    file_path = Column(String(500), nullable=False)
+    row_count = Column(Integer, default=0, nullable=False)
+    size_bytes = Column(Integer, default=0)
 
+    # 段索引
+    min_time = Column(DateTime(timezone=True), nullable=False)
+    max_time = Column(DateTime(timezone=True), nullable=False)
+    node_ids = Column(JSON, default=list)
 
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_log_segments_time', 'min_time', 'max_time'),
+    )
+
+
+class TrainingMetric(Base):
+    """
+    训练指标表 - 每个训练任务每一轮/步记录一行
+    数据来自 TestAPI 返回的任务状态，用于训练曲线的历史查询
+    """
+    __tablename__ = "training_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
+    task_id = Column(String(100), nullable=False)
+
+    round = Column(Integer, default=0, nullable=False)  # 联邦学习轮次
+    step = Column(Integer, default=0, nullable=False)   # 全局训练步数
+
+    loss = Column(Float, nullable=True)
+    accuracy = Column(Float, nullable=True)
+    extra_metrics = Column(JSON, default=dict)   # 其他标量指标，如 f1_score
+    client_metrics = Column(JSON, default=dict)  # 每个客户端的指标 {client_id: {loss, accuracy, ...}}
+
+    recorded_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 关系定义
+    project = relationship("Project", back_populates="training_metrics")
+
+    __table_args__ = (
+        # 同一任务的同一轮/步只记录一次
+        UniqueConstraint('task_id', 'round', 'step', name='uq_training_metrics_task_step'),
+        # 按项目、任务读取曲线
+        Index('idx_training_metrics_series', 'project_id', 'task_id', 'step'),
+    )
+
+
+class BlobObject(Base):
+    """
+    内容寻址对象表 - 每个不同内容的文件（模型文件、数据集）只保存一份
+    digest 为整个文件的 SHA-256，chunks 为按顺序排列的 [块哈希, 块大小] 清单
+    refcount 为引用该对象的模型/数据集记录数
+    """
+    __tablename__ = "blob_objects"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger, default=0, nullable=False)
+    chunks = Column(JSON, default=list)
+    refcount = Column(Integer, default=0, nullable=False)
+
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class BlobChunk(Base):
+    """
+    内容寻址块表 - 对象按内容切分后的块，相同的块在所有对象之间只存一份
+    refcount 为所有对象清单中引用该块的次数，为 0 的块由垃圾回收删除
+    """
+    __tablename__ = "blob_chunks"
+
+    hash = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, default=0, nullable=False)
+
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_blob_chunks_refcount', 'refcount'),
+    )
@@ -0,0 +1,18 @@
+"""
+P2P AI Database Module
+
+This module provides database models for the P2P AI system.
+"""
+
+from .database import Base, engine, SessionLocal, get_db, create_tables
+from .models import Dataset, UploadSession
+
+__all__ = [
+    "Base",
+    "engine",
+    "SessionLocal",
+    "get_db",
+    "create_tables",
+    "Dataset",
+    "UploadSession"
+]
@@ -0,0 +1,8 @@
+"""
+P2P AI 数据库连接
+P2P AI 的表与 EdgeAI 位于同一个数据库，共用引擎、会话和 Base（用户表等外键可以直接引用）
+"""
+
+from database.edgeai.database import Base, engine, SessionLocal, get_db, create_tables
+
+__all__ = ["Base", "engine", "SessionLocal", "get_db", "create_tables"]
@@ -0,0 +1,63 @@
+from sqlalchemy import Column, BigInteger, String, Text, DateTime, JSON, Index, ForeignKey
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from .database import Base
+
+
+class Dataset(Base):
+    """
+    数据集表 - 联邦学习使用的数据集文件
+    上传完成前 status 为 uploading，完成后为 ready
+    """
+    __tablename__ = "p2pai_datasets"
+
+    id = Column(String(50), primary_key=True)  # dataset-xxxxxxxx
+    name = Column(String(200), nullable=False)
+    description = Column(Text, default="")
+    type = Column(String(50), default="custom")
+    format = Column(String(50), default="unknown")
+    privacy_level = Column(String(50), default="private")
+    project_id = Column(String(100), nullable=True)
+
+    file_path = Column(String(500), default="")
+    size = Column(BigInteger, default=0)        # 文件大小（字节）
+    sha256 = Column(String(64), nullable=True)  # 上传过程中增量计算
+    status = Column(String(20), default="uploading", nullable=False)
+
+    # 最近一次校验与画像的结果
+    validation_result = Column(JSON, nullable=True)
+    validated_at = Column(DateTime(timezone=True), nullable=True)
+
+    uploaded_at = Column(DateTime(timezone=True), nullable=True)
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+
+    # 关系定义
+    upload_sessions = relationship("UploadSession", back_populates="dataset", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('idx_p2pai_datasets_project', 'project_id'),
+    )
+
+
+class UploadSession(Base):
+    """
+    断点续传上传会话表（tus 协议）
+    offset 为服务端已确认写入的字节数，客户端断线后从该位置继续上传
+    """
+    __tablename__ = "p2pai_upload_sessions"
+
+    id = Column(String(64), primary_key=True)
+    dataset_id = Column(String(50), ForeignKey("p2pai_datasets.id", ondelete="CASCADE"), nullable=False)
+    filename = Column(String(255), default="")
+    length = Column(BigInteger, nullable=False)          # 文件总大小（Upload-Length）
+    offset = Column(BigInteger, default=0, nullable=False)
+    temp_path = Column(String(500), nullable=False)
+    upload_metadata = Column(JSON, default=dict)
+
+    created_time = Column(DateTime(timezone=True), server_default=func.now())
+    updated_time = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # 关系定义
+    dataset = relationship("Dataset", back_populates="upload_sessions")
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+进程内测试辅助工具
+在临时目录中创建 SQLite 数据库和各存储目录，用 TestClient 直接调用应用，不需要启动服务器
+必须在导入任何后端模块之前导入
+"""
+import atexit
+import base64
+import io
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+TEST_ROOT = tempfile.mkdtemp(prefix="edgeai-test-")
+atexit.register(shutil.rmtree, TEST_ROOT, ignore_errors=True)
+
+os.environ.update({
+    "EDGEAI_DATABASE_URL": f"sqlite:///{TEST_ROOT}/test.db",
+    "EDGEAI_ARTIFACT_ROOT": os.path.join(TEST_ROOT, "artifacts"),
+    "EDGEAI_BLOB_ROOT": os.path.join(TEST_ROOT, "blobs"),
+    "EDGEAI_EVAL_DATA_DIR": os.path.join(TEST_ROOT, "evaluation"),
+    "EDGEAI_CHECKPOINT_DIR": os.path.join(TEST_ROOT, "checkpoints"),
+    "EDGEAI_LOG_ARCHIVE_DIR": os.path.join(TEST_ROOT, "log_archive"),
+    "P2PAI_DATASET_DIR": os.path.join(TEST_ROOT, "datasets"),
+    "P2PAI_FEDERATED_DIR": os.path.join(TEST_ROOT, "federated"),
+    "P2PAI_SHARD_INDEX_DIR": os.path.join(TEST_ROOT, "shards"),
+    "P2PAI_ARROW_DIR": os.path.join(TEST_ROOT, "arrow"),
+    "P2PAI_TOKEN_CACHE_DIR": os.path.join(TEST_ROOT, "token_cache"),
+})
+
+# 添加项目路径
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [ROOT_DIR, os.path.join(ROOT_DIR, "backend")]
+
+from fastapi.testclient import TestClient
+
+import main
+from common.storage.blobstore import blob_ref, blob_store, parse_blob_ref
+from database.edgeai import Model, User
+from database.edgeai.database import Base, SessionLocal, engine
+from edgeai.serving.inference import InferenceBackend, _predict_batch, inference_manager, register_backend
+
+Base.metadata.create_all(bind=engine)
+
+# 不进入上下文，不触发启动事件（后台同步任务等）
+client = TestClient(main.app, base_url="http://localhost")
+
+
+def register_user(password: str = "test123456") -> dict:
+    """通过注册接口创建用户，返回 {"id", "token", "headers"}"""
+    email = f"testuser{int(time.time() * 1000000)}@example.com"
+    response = client.post("/api/common/auth/register", json={
+        "name": "测试用户",
+        "email": email,
+        "password": password,
+        "confirm_password": password,
+        "module": "edgeai"
+    })
+    data = response.json()
+    assert response.status_code == 200 and data.get("success"), data
+    token = data["token"]
+    return {"id": data["user"]["id"], "token": token, "headers": {"Authorization": f"Bearer {token}"}}
+
+
+def create_model(user_id: int, **fields) -> int:
+    """直接在数据库中创建模型记录（没有创建模型的接口）"""
+    db = SessionLocal()
+    try:
+        model = Model(name=fields.pop("name", "test-model"), user_id=user_id, version="1.0", status=fields.pop("status", "trained"), **fields)
+        db.add(model)
+        db.commit()
+        return model.id
+    finally:
+        db.close()
+
+
+class CheckpointBackend(InferenceBackend):
+    """
+    返回检查点目录中 weights.txt 的内容，用于确认部署或评估加载的是哪个检查点
+    评估时 weights.txt 为 1 则全部预测正确，否则全部错误
+    """
+
+    def __init__(self, model_name_or_path, options):
+        super().__init__(model_name_or_path, options)
+        self.weights = (Path(model_name_or_path) / "weights.txt").read_text()
+
+    def predict(self, inputs, params):
+        return [self.weights for _ in inputs]
+
+    def score(self, inputs, targets):
+        correct = float(self.weights == "1")
+        return {"count": float(len(inputs)), "loss_sum": 0.0, "correct": correct * len(inputs)}
+
+
+register_backend("test-checkpoint", CheckpointBackend)
+
+
+def served_weights(model_id: int) -> str:
+    """
+    已部署模型加载的 weights.txt
+    TestClient 的每个请求使用独立的事件循环，批处理循环不会保留到下一个请求，因此直接在工作进程中执行一批
+    """
+    server = inference_manager.get(f"edgeai:{model_id}")
+    outputs, _ = server._workers[0].submit(_predict_batch, ["x"], [{}]).result()
+    return outputs[0]
+
+
+def checkpoint_archive(weights: str) -> bytes:
+    """只包含 model/weights.txt 的模型目录 tar.gz 归档"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        data = weights.encode()
+        info = tarfile.TarInfo("model/weights.txt")
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def register_artifact(model_id: int, content: bytes) -> str:
+    """把内容导入内容寻址存储并登记为模型的制品（释放模型之前的制品引用），返回 SHA-256"""
+    path = Path(TEST_ROOT) / f"artifact-{uuid.uuid4().hex}"
+    path.write_bytes(content)
+    db = SessionLocal()
+    try:
+        blob = blob_store.ingest(db, path)
+        model = db.get(Model, model_id)
+        previous = parse_blob_ref(model.file_path)
+        if previous:
+            blob_store.release(db, previous)
+        model.file_path = blob_ref(blob.digest)
+        db.commit()
+        return blob.digest
+    finally:
+        db.close()
+
+
+def upload_dataset(content: bytes, filename: str = "data.csv") -> str:
+    """通过 tus 接口一次上传完整的数据集，返回数据集 ID（状态为 ready）"""
+    headers = {"Tus-Resumable": "1.0.0"}
+    response = client.post("/api/p2pai/datasets/uploads", headers={
+        **headers,
+        "Upload-Length": str(len(content)),
+        "Upload-Metadata": f"filename {base64.b64encode(filename.encode()).decode()}"
+    })
+    assert response.status_code == 201, response.text
+    dataset_id = response.headers["X-Dataset-Id"]
+    response = client.patch(response.headers["Location"], content=content, headers={
+        **headers,
+        "Upload-Offset": "0",
+        "Content-Type": "application/offset+octet-stream"
+    })
+    assert response.status_code == 204, response.text
+    return dataset_id
+
+
+def run_tests(namespace: dict) -> bool:
+    """按定义顺序运行 namespace 中的 test_* 函数并打印结果（直接运行测试文件时使用）"""
+    tests = [(name, func) for name, func in namespace.items() if name.startswith("test_") and callable(func)]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"✅ PASS {name}")
+        except Exception:
+            failed += 1
+            print(f"❌ FAIL {name}")
+            traceback.print_exc()
+    print(f"\n{len(tests) - failed}/{len(tests)} tests passed")
+    return failed == 0
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Arrow 数据集存储测试
+按行范围、行号和抽样读取，单次读取的行数上限，内容相同的数据集共用 IPC 文件，
+删除其中一个数据集时保留共用的文件，最后一个删除时才删除，以及已打开表的 LRU 缓存
+"""
+import os
+import sys
+
+import pyarrow as pa
+import pyarrow.ipc as pa_ipc
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import client, run_tests, upload_dataset
+
+from database.p2pai import Dataset, SessionLocal
+from p2pai.storage.arrow_store import ARROW_MAX_ROWS, ArrowDatasetStore, arrow_store
+
+ROWS = 300
+
+
+def _csv(rows: int = ROWS, tag: str = "") -> bytes:
+    lines = ["id,text,score"] + [f'{index},"line {index}{tag}\nsecond",{index * 0.5}' for index in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _url(dataset_id: str) -> str:
+    return f"/api/p2pai/datasets/{dataset_id}"
+
+
+def _dataset(dataset_id: str) -> Dataset:
+    db = SessionLocal()
+    try:
+        return db.get(Dataset, dataset_id)
+    finally:
+        db.close()
+
+
+def test_rows_and_sample():
+    dataset_id = upload_dataset(_csv())
+    response = client.get(f"{_url(dataset_id)}/rows", params={"offset": 10, "limit": 5, "columns": "id,text"})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["total_rows"] == ROWS and data["num_rows"] == 5
+    # 引号内的换行属于同一行
+    assert data["rows"][0] == {"id": 10, "text": "line 10\nsecond"}
+
+    rows = client.get(f"{_url(dataset_id)}/rows", params={"indices": "299,0,5"}).json()["rows"]
+    assert [row["id"] for row in rows] == [299, 0, 5]
+
+    response = client.get(f"{_url(dataset_id)}/rows", params={"limit": 3, "format": "arrow"})
+    table = pa_ipc.open_stream(pa.py_buffer(response.content)).read_all()
+    assert table.num_rows == 3 and table.column_names == ["id", "text", "score"]
+
+    first = client.get(f"{_url(dataset_id)}/sample", params={"n": 20, "seed": 3}).json()["rows"]
+    second = client.get(f"{_url(dataset_id)}/sample", params={"n": 20, "seed": 3}).json()["rows"]
+    ids = [row["id"] for row in first]
+    assert first == second and ids == sorted(ids) and len(set(ids)) == 20
+
+
+def test_read_limits():
+    dataset_id = upload_dataset(_csv())
+    url = _url(dataset_id)
+    assert client.get(f"{url}/rows", params={"limit": ARROW_MAX_ROWS + 1}).status_code == 422
+    assert client.get(f"{url}/sample", params={"n": ARROW_MAX_ROWS + 1}).status_code == 422
+    assert client.get(f"{url}/rows", params={"limit": -1}).status_code == 422
+    assert client.get(f"{url}/rows", params={"indices": f"0,{ROWS}"}).status_code == 400
+    assert client.get(f"{url}/rows", params={"indices": "a,b"}).status_code == 400
+    assert client.get(f"{url}/rows", params={"columns": "missing"}).status_code == 400
+    assert client.get(f"{url}/sample", params={"n": ROWS * 2}).json()["num_rows"] == ROWS
+
+
+def test_shared_content_survives_delete():
+    content = _csv(tag="-shared")
+    first, second = upload_dataset(content), upload_dataset(content)
+    assert client.post(f"{_url(first)}/arrow").status_code == 200
+    assert client.post(f"{_url(second)}/arrow").status_code == 200
+    path = arrow_store.path(_dataset(first))
+    assert path == arrow_store.path(_dataset(second)) and path.exists()
+
+    assert client.delete(_url(first)).status_code == 200
+    assert path.exists()
+    response = client.get(f"{_url(second)}/rows", params={"limit": 1})
+    assert response.status_code == 200 and response.json()["total_rows"] == ROWS
+
+    assert client.delete(_url(second)).status_code == 200
+    assert not path.exists()
+
+
+def test_open_tables_are_lru_cached():
+    store = ArrowDatasetStore(root=arrow_store.root / "lru", cache_size=2)
+    datasets = [_dataset(upload_dataset(_csv(rows=5, tag=f"-lru{index}"))) for index in range(3)]
+    db = SessionLocal()
+    try:
+        tables = [store.open(db, dataset) for dataset in datasets[:2]]
+        # 命中缓存时返回同一个表，并移到最近使用的位置
+        assert store.open(db, datasets[0]) is tables[0]
+        store.open(db, datasets[2])
+        assert list(store._tables) == [store.key(datasets[0]), store.key(datasets[2])]
+        assert store.open(db, datasets[1]) is not tables[1]
+
+        store.evict(datasets[1], remove_file=True)
+        assert store.key(datasets[1]) not in store._tables
+        assert not store.path(datasets[1]).exists()
+    finally:
+        db.close()
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
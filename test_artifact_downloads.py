@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+文件下载响应测试
+内容寻址对象和本地文件的 Range / If-None-Match / 416 处理，以及未实现 read 的范围响应子类不能实例化
+"""
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import client, run_tests, upload_dataset
+
+from common.storage.artifacts import _RangeResponse
+from database.p2pai import Dataset, SessionLocal
+from p2pai.storage.uploads import DATASET_STORAGE_DIR
+
+CONTENT = os.urandom(5000)
+
+
+def _check_ranges(url: str):
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == CONTENT
+    etag = full.headers["etag"]
+
+    response = client.get(url, headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206 and response.content == CONTENT[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert client.get(url, headers={"Range": "bytes=-10"}).content == CONTENT[-10:]
+    # If-Range 不匹配时返回完整内容
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'}).status_code == 200
+    assert client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.head(url).content == b""
+
+
+def test_blob_ranges():
+    dataset_id = upload_dataset(CONTENT, "payload.bin")
+    _check_ranges(f"/api/p2pai/datasets/{dataset_id}/file")
+
+
+def test_file_ranges():
+    dataset_id = f"dataset-{uuid.uuid4().hex[:8]}"
+    path = DATASET_STORAGE_DIR / dataset_id / "payload.bin"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(CONTENT)
+    db = SessionLocal()
+    try:
+        db.add(Dataset(id=dataset_id, name="payload.bin", file_path=f"{dataset_id}/payload.bin", size=len(CONTENT), status="ready"))
+        db.commit()
+    finally:
+        db.close()
+    _check_ranges(f"/api/p2pai/datasets/{dataset_id}/file")
+
+
+def test_range_response_requires_read():
+    class Incomplete(_RangeResponse):
+        pass
+
+    try:
+        Incomplete(0, 9, 200, {})
+        raise AssertionError("expected TypeError")
+    except TypeError:
+        pass
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+内容寻址存储测试
+相同内容只保存一份；引用计数归零后块由垃圾回收删除，仍被其他对象引用的块保留
+"""
+import hashlib
+import os
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, SessionLocal, run_tests
+
+from common.storage.blobstore import BlobStore
+from database.edgeai import BlobChunk, BlobObject
+
+store = BlobStore(root=Path(TEST_ROOT) / "blobstore-test")
+
+
+def _file(data: bytes) -> Path:
+    path = Path(TEST_ROOT) / f"blob-{uuid.uuid4().hex}"
+    path.write_bytes(data)
+    return path
+
+
+def _chunk_refcounts(db, blob: BlobObject) -> dict:
+    hashes = {chunk_hash for chunk_hash, _ in blob.chunks}
+    return {chunk.hash: chunk.refcount for chunk in db.query(BlobChunk).filter(BlobChunk.hash.in_(hashes))}
+
+
+def test_identical_content_is_stored_once():
+    db = SessionLocal()
+    try:
+        data = os.urandom(3 * 1024 * 1024)
+        first = store.ingest(db, _file(data))
+        manifest = store.store_file(_file(data))
+        assert manifest.new_bytes == 0
+        second = store.register(db, manifest)
+
+        assert first.digest == second.digest == hashlib.sha256(data).hexdigest()
+        assert db.get(BlobObject, first.digest).refcount == 2
+        assert all(count == 1 for count in _chunk_refcounts(db, first).values())
+        assert store.open(db, first.digest).read(0, len(data)) == data
+    finally:
+        db.close()
+
+
+def test_add_ref_requires_existing_object():
+    db = SessionLocal()
+    try:
+        data = os.urandom(1024)
+        blob = store.ingest(db, _file(data))
+        assert store.add_ref(db, "0" * 64) is None
+        assert store.add_ref(db, blob.digest, size=len(data) + 1) is None
+        assert store.add_ref(db, blob.digest, size=len(data)).refcount == 2
+
+        store.release(db, blob.digest)
+        store.release(db, blob.digest)
+        assert db.get(BlobObject, blob.digest) is None
+        # 引用计数归零后不能再通过 add_ref 复活
+        assert store.add_ref(db, blob.digest) is None
+        store.release(db, blob.digest)
+    finally:
+        db.close()
+
+
+def test_garbage_collection_keeps_shared_chunks():
+    db = SessionLocal()
+    try:
+        shared = os.urandom(3 * 1024 * 1024)
+        a = store.ingest(db, _file(shared + os.urandom(512 * 1024)))
+        b = store.ingest(db, _file(shared + os.urandom(512 * 1024)))
+        a_chunks = {chunk_hash for chunk_hash, _ in a.chunks}
+        b_chunks = {chunk_hash for chunk_hash, _ in b.chunks}
+        common = a_chunks & b_chunks
+        assert common, "files with a common prefix should share chunks"
+
+        store.release(db, a.digest)
+        refcounts = {chunk.hash: chunk.refcount for chunk in db.query(BlobChunk).filter(BlobChunk.hash.in_(a_chunks))}
+        assert all(refcounts[chunk_hash] == 1 for chunk_hash in common)
+        assert all(refcounts[chunk_hash] == 0 for chunk_hash in a_chunks - b_chunks)
+
+        # 闲置时间不足时不删除（数据库与应用的存储共用，只检查本测试的块）
+        store.collect_garbage(db, grace_seconds=3600)
+        assert all(store.chunk_path(chunk_hash).exists() for chunk_hash in a_chunks)
+        assert db.query(BlobChunk).filter(BlobChunk.hash.in_(a_chunks)).count() == len(a_chunks)
+        result = store.collect_garbage(db, grace_seconds=0)
+        assert result["removed_chunks"] >= len(a_chunks - b_chunks)
+        assert db.query(BlobChunk).filter(BlobChunk.hash.in_(a_chunks - b_chunks)).count() == 0
+        assert all(not store.chunk_path(chunk_hash).exists() for chunk_hash in a_chunks - b_chunks)
+        assert all(store.chunk_path(chunk_hash).exists() for chunk_hash in b_chunks)
+
+        reader = store.open(db, b.digest)
+        assert reader.read(0, len(shared)) == shared
+    finally:
+        db.close()
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+联邦学习数据分片测试
+iid / dirichlet / quantity 划分覆盖全部记录且互不重叠，min_samples 约束，
+JSONL、CSV（引号内换行）和 Parquet 分片下载后的记录数与 X-Shard-Records、索引中的总数一致
+"""
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import client, run_tests, upload_dataset
+
+from p2pai.storage.sharding import ShardingError, partition
+
+NUM_CLIENTS = 4
+
+
+def _expect_error(status_code: int, func, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except ShardingError as e:
+        assert e.status_code == status_code, e.detail
+        return
+    raise AssertionError("expected ShardingError")
+
+
+def _check_partition(shards, count: int):
+    assert len(shards) == NUM_CLIENTS
+    assert all((np.diff(shard) > 0).all() for shard in shards)
+    np.testing.assert_array_equal(np.sort(np.concatenate(shards)), np.arange(count))
+
+
+def test_iid_partition():
+    shards = partition(1001, NUM_CLIENTS, "iid", seed=1)
+    _check_partition(shards, 1001)
+    assert max(map(len, shards)) - min(map(len, shards)) <= 1
+    # 相同种子结果相同
+    again = partition(1001, NUM_CLIENTS, "iid", seed=1)
+    assert all(np.array_equal(a, b) for a, b in zip(shards, again))
+    _expect_error(400, partition, 10, 2, "round-robin", seed=0)
+
+
+def test_quantity_partition_and_min_samples():
+    shards = partition(1000, NUM_CLIENTS, "quantity", seed=3, alpha=0.3, min_samples=50)
+    _check_partition(shards, 1000)
+    assert min(map(len, shards)) >= 50
+    assert max(map(len, shards)) - min(map(len, shards)) > 10
+    _expect_error(400, partition, 100, NUM_CLIENTS, "quantity", seed=0, alpha=0.5, min_samples=30)
+
+
+def test_dirichlet_partition_skews_labels():
+    labels = np.repeat(np.arange(5, dtype=np.int32), 200)
+    shards = partition(len(labels), NUM_CLIENTS, "dirichlet", seed=0, labels=labels, alpha=0.1, min_samples=10)
+    _check_partition(shards, len(labels))
+    assert min(map(len, shards)) >= 10
+    # alpha 很小时每个客户端大部分样本集中在少数类别
+    dominant = [np.bincount(labels[shard], minlength=5).max() / len(shard) for shard in shards]
+    assert np.mean(dominant) > 0.5
+    iid = partition(len(labels), NUM_CLIENTS, "iid", seed=0)
+    assert max(np.bincount(labels[shard], minlength=5).max() / len(shard) for shard in iid) < 0.3
+    _expect_error(400, partition, len(labels), NUM_CLIENTS, "dirichlet", seed=0)
+
+
+def _shard(dataset_id: str, expected_status: int = 201, **options) -> dict:
+    response = client.post(f"/api/p2pai/datasets/{dataset_id}/shards", json={"num_clients": NUM_CLIENTS, **options})
+    assert response.status_code == expected_status, response.text
+    return response.json()
+
+
+def _download(sharding: dict, client_id: int):
+    response = client.get(sharding["client_url"].format(client=client_id))
+    assert response.status_code == 200, response.text
+    return response.content, int(response.headers["X-Shard-Records"])
+
+
+def test_jsonl_shards():
+    records = [{"id": index, "label": f"class-{index % 3}"} for index in range(120)]
+    # 最后一条记录没有换行符，中间有空行
+    content = "\n".join(json.dumps(record) for record in records[:60]) + "\n\n" + "\n".join(json.dumps(record) for record in records[60:])
+    dataset_id = upload_dataset(content.encode(), "records.jsonl")
+
+    sharding = _shard(dataset_id, strategy="dirichlet", label_column="label", alpha=1.0, seed=5)
+    assert sharding["records"] == 120 and sharding["num_classes"] == 3
+    assert _shard(dataset_id, 200, strategy="dirichlet", label_column="label", alpha=1.0, seed=5)["key"] == sharding["key"]
+
+    seen = []
+    for info in sharding["clients"]:
+        data, header_count = _download(sharding, info["client"])
+        rows = [json.loads(line) for line in data.decode().splitlines()]
+        assert data.endswith(b"\n") and len(rows) == header_count == info["records"]
+        labels = pd.Series([row["label"] for row in rows]).value_counts().to_dict()
+        assert labels == info["label_counts"]
+        seen.extend(row["id"] for row in rows)
+    assert sorted(seen) == list(range(120))
+    assert client.get(sharding["client_url"].format(client=NUM_CLIENTS)).status_code == 404
+
+    listing = client.get(f"/api/p2pai/datasets/{dataset_id}/shards").json()
+    assert [item["key"] for item in listing] == [sharding["key"]] and "clients" not in listing[0]
+
+
+def test_csv_shards_keep_header_and_quoted_newlines():
+    rows = [f'{index},"note {index}\nline two",{index % 2}' for index in range(50)]
+    dataset_id = upload_dataset(("id,note,label\r\n" + "\r\n".join(rows) + "\r\n").encode(), "notes.csv")
+    sharding = _shard(dataset_id, strategy="quantity", alpha=2.0, min_samples=5)
+    assert sharding["records"] == 50
+
+    seen = []
+    for info in sharding["clients"]:
+        data, header_count = _download(sharding, info["client"])
+        frame = pd.read_csv(io.BytesIO(data))
+        assert list(frame.columns) == ["id", "note", "label"]
+        assert len(frame) == header_count == info["records"] >= 5
+        assert all(note.endswith("\nline two") for note in frame["note"])
+        seen.extend(frame["id"])
+    assert sorted(seen) == list(range(50))
+
+
+def test_parquet_shards():
+    table = pa.table({"id": np.arange(90), "label": [f"c{index % 3}" for index in range(90)]})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, row_group_size=25)
+    dataset_id = upload_dataset(buffer.getvalue(), "table.parquet")
+
+    sharding = _shard(dataset_id, strategy="dirichlet", label_column="label", alpha=0.5)
+    assert sharding["records"] == 90 and sharding["row_groups"] == [25, 25, 25, 15]
+    seen = []
+    for info in sharding["clients"]:
+        data, header_count = _download(sharding, info["client"])
+        shard = pq.read_table(io.BytesIO(data))
+        assert shard.num_rows == header_count == info["records"]
+        seen.extend(shard.column("id").to_pylist())
+    assert sorted(seen) == list(range(90))
+
+
+def test_invalid_requests():
+    dataset_id = upload_dataset(b"a,b\n1,2\n3,4\n", "tiny.csv")
+    _shard(dataset_id, 400)
+    _shard(dataset_id, 400, num_clients=2, strategy="dirichlet")
+    _shard(dataset_id, 400, num_clients=2, strategy="dirichlet", label_column="missing")
+    _shard(dataset_id, 400, num_clients=2, strategy="quantity", alpha=0)
+    _shard(dataset_id, 400, num_clients=2, strategy="stratified")
+    assert client.get(f"/api/p2pai/datasets/{dataset_id}/shards/unknown").status_code == 404
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
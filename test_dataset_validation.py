@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+数据集校验与画像测试
+按记录边界切块（跳过 CSV 引号内的换行）、按 Chan 公式合并各块的均值和方差、跨块的重复行检测，
+以及通过 SSE 推送进度和结果
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, client, run_tests, upload_dataset
+
+from main import app
+from p2pai.storage import validation
+from p2pai.storage.validation import _Profile, _column_stats, _merge_stats, _record_ends, _text_blocks, profile_text_block
+
+
+def _csv(rows: int = 200, duplicates: int = 0) -> bytes:
+    lines = ["id,note,value"] + [f'{index},"note ""{index}""\nsecond line",{index * 0.25}' for index in range(rows)]
+    # 重复行放在文件末尾，和原行不在同一块
+    lines += lines[1:duplicates + 1]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _small_blocks(size: int):
+    original = validation.VALIDATION_BLOCK_SIZE
+    validation.VALIDATION_BLOCK_SIZE = size
+    return original
+
+
+def test_record_ends_skip_quoted_newlines():
+    data = b'a,b\n1,"x\ny"\n2,"say ""hi""\nagain"\n3,z'
+    ends = _record_ends(data, quoted=True)
+    assert [data[start:end] for start, end in zip([0, *ends[:-1]], ends)] == [b'a,b\n', b'1,"x\ny"\n', b'2,"say ""hi""\nagain"\n']
+    # JSONL 不处理引号
+    assert len(_record_ends(b'{"a": "x"}\n{"a": "y"}\n', quoted=False)) == 2
+
+
+def test_text_blocks_split_at_record_boundaries():
+    content = _csv(rows=100)
+    path = Path(TEST_ROOT) / "blocks.csv"
+    path.write_bytes(content)
+    original = _small_blocks(97)
+    try:
+        hasher = hashlib.sha256()
+        blocks = list(_text_blocks(str(path), "csv", hasher))
+    finally:
+        validation.VALIDATION_BLOCK_SIZE = original
+
+    assert len(blocks) > 10
+    assert b"".join(data for data, _ in blocks) == content
+    assert hasher.hexdigest() == hashlib.sha256(content).hexdigest()
+    assert blocks[0][1] is None and all(header == b"id,note,value\n" for _, header in blocks[1:])
+    # 每块都能单独解析，行数之和等于总行数
+    results = [profile_text_block(data, "csv", ",", header, {}) for data, header in blocks]
+    assert all("error" not in result for result in results)
+    assert sum(result["rows"] for result in results) == 100
+    assert all(len(result["hashes"]) == result["rows"] for result in results)
+
+
+def test_merged_mean_and_variance():
+    rng = np.random.default_rng(0)
+    values = rng.normal(1e6, 3.0, size=1000)
+    merged = None
+    for part in np.array_split(values, [3, 4, 500, 501, 900]):
+        merged = _merge_stats(merged, _column_stats(pd.Series(part)))
+    assert merged["n"] == 1000
+    np.testing.assert_allclose(merged["mean"], values.mean(), rtol=1e-12)
+    np.testing.assert_allclose(merged["m2"] / 999, values.var(ddof=1), rtol=1e-8)
+    assert (merged["min"], merged["max"]) == (values.min(), values.max())
+
+    # 整数块和小数块合并为 number，与字符串块合并为 mixed
+    numbers = _merge_stats(_column_stats(pd.Series([1, 2, 3])), _column_stats(pd.Series([0.5, None])))
+    assert numbers["kind"] == "number" and numbers["n"] == 4 and numbers["nulls"] == 1
+    np.testing.assert_allclose(numbers["mean"], 1.625)
+    mixed = _merge_stats(numbers, _column_stats(pd.Series(["a", "bcd"])))
+    assert mixed["kind"] == "mixed" and mixed["max_length"] == 3 and mixed["n"] == 4
+
+    profile = _Profile({})
+    profile.add({"rows": 2, "columns": {"x": _column_stats(pd.Series([1.0, 3.0]))}, "type_errors": {}, "hashes": None})
+    profile.add({"rows": 1, "columns": {}, "type_errors": {}, "hashes": None})
+    summary = profile.summary()["columns"]["x"]
+    # 某块中缺少的列按空值计
+    assert summary["nulls"] == 1 and summary["mean"] == 2.0 and summary["std"] == np.sqrt(2.0)
+
+
+def test_duplicates_across_blocks():
+    blocks = [b'{"a": 1}\n{"a": 2}\n', b'{"a": 1.0}\n{"a": 2}\n', b'{"a": 3}\n']
+    profile = _Profile({})
+    for block in blocks:
+        profile.add(profile_text_block(block, "jsonl", None, None, {}))
+    # 按原始记录内容比较：{"a": 1.0} 与 {"a": 1} 不同
+    assert profile.rows == 5 and profile.duplicate_rows() == 1
+    assert _Profile({"check_duplicates": False}).duplicate_rows() is None
+
+
+async def _validate(dataset_id: str, body: dict):
+    """在同一个事件循环中启动校验并读取 SSE 直到 result 事件（TestClient 的每个请求使用独立的事件循环）"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+        response = await http.post(f"/api/p2pai/datasets/{dataset_id}/validate", json=body)
+        assert response.status_code == 200, response.text
+        response = await http.get(response.json()["stream_url"])
+        assert response.headers["content-type"].startswith("text/event-stream")
+        return _events(response.text)
+
+
+def _events(text: str):
+    events = []
+    for message in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields["event"], int(fields["id"]) if "id" in fields else None, json.loads(fields["data"])))
+    return events
+
+
+def test_validation_stream():
+    dataset_id = upload_dataset(_csv(rows=300, duplicates=3), "profile.csv")
+    original = _small_blocks(1024)
+    try:
+        events = asyncio.run(_validate(dataset_id, {"columns": {"id": "integer", "value": "number", "missing": "string"}}))
+    finally:
+        validation.VALIDATION_BLOCK_SIZE = original
+
+    names = [name for name, _, _ in events]
+    assert names[-1] == "result" and names.count("result") == 1 and "progress" in names
+    versions = [version for _, version, _ in events]
+    assert versions == sorted(versions)
+
+    snapshot = events[-1][2]
+    assert snapshot["status"] == "completed", snapshot
+    result = snapshot["result"]
+    assert result["rows"] == 303 and result["duplicate_rows"] == 3
+    assert result["validation_results"]["size_verified"] and result["validation_results"]["checksum_verified"]
+    assert result["schema"]["missing_columns"] == ["missing"] and not result["valid"]
+    np.testing.assert_allclose(result["columns"]["value"]["mean"], np.mean([index * 0.25 for index in [*range(300), 0, 1, 2]]))
+
+    # 没有进行中的任务时直接推送保存的结果
+    response = client.get(f"/api/p2pai/datasets/{dataset_id}/validation/stream")
+    events = _events(response.text)
+    assert [name for name, _, _ in events] == ["result"] and events[0][2]["result"]["rows"] == 303
+    unvalidated = upload_dataset(b"a\n1\n", "new.csv")
+    assert client.get(f"/api/p2pai/datasets/{unvalidated}/validation/stream").status_code == 404
+    assert client.post(f"/api/p2pai/datasets/{dataset_id}/validate", json={"columns": {"id": "uuid"}}).status_code == 400
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
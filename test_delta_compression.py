@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+模型增量压缩测试
+encode_delta / decode_delta 在各种配置下往返，误差反馈的残差补上未发送的部分，截断或越界的输入被拒绝
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, run_tests
+
+from p2pai.federated.aggregation import AggregationError, open_update
+from p2pai.federated.compression import CompressionConfig, decode_delta, encode_delta, read_delta_header
+
+SIZE = 10_000
+
+
+def _path(suffix: str) -> Path:
+    return Path(tempfile.mkstemp(suffix=suffix, dir=TEST_ROOT)[1])
+
+
+def _model(values: np.ndarray) -> Path:
+    path = _path(".npy")
+    np.save(path, values.astype(np.float32))
+    return path
+
+
+def _round_trip(base: np.ndarray, update: np.ndarray, residual=None, **options):
+    config = CompressionConfig.from_dict(options)
+    base_path, delta_path, out_path = _model(base), _path(".p2pd"), _path(".npy")
+    stats = encode_delta(open_update(_model(update)), open_update(base_path), delta_path, config, 3, residual)
+    decoded = decode_delta(delta_path, open_update(base_path), out_path)
+    assert stats["base_round"] == decoded["base_round"] == 3
+    return np.load(out_path), stats, delta_path
+
+
+def _expect_error(status_code: int, func, *args):
+    try:
+        func(*args)
+    except AggregationError as e:
+        assert e.status_code == status_code, e.detail
+        return
+    raise AssertionError("expected AggregationError")
+
+
+def _arrays(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal(SIZE).astype(np.float32)
+    return base, base + (rng.standard_normal(SIZE) * 0.01).astype(np.float32)
+
+
+def test_lossless_and_fp16_round_trip():
+    base, update = _arrays()
+    decoded, stats, _ = _round_trip(base, update)
+    np.testing.assert_array_equal(decoded, update)
+    assert stats["relative_error"] == 0.0 and stats["density"] == 1.0
+
+    decoded, stats, _ = _round_trip(base, update, quantization="fp16")
+    # fp16 的相对精度为 2^-11
+    assert (np.abs(decoded - update) <= np.abs(update - base) * 2 ** -10 + 1e-6).all()
+    assert stats["compression_ratio"] > 1.9
+
+
+def test_int8_error_is_bounded_by_block_scale():
+    base, update = _arrays()
+    decoded, stats, _ = _round_trip(base, update, quantization="int8", block_size=250)
+    # 每个块的误差不超过该块的半个量化步长
+    scales = np.abs(update - base).reshape(-1, 250).max(axis=1) / 127.0
+    errors = np.abs(decoded - update).reshape(-1, 250).max(axis=1)
+    assert (errors <= scales / 2 + 1e-6).all()
+    assert stats["compression_ratio"] > 3.5
+
+
+def test_topk_keeps_largest_entries():
+    base, update = _arrays()
+    decoded, stats, _ = _round_trip(base, update, topk_ratio=0.1)
+    delta = update - base
+    changed = np.flatnonzero(decoded != base)
+    assert stats["kept"] == len(changed) == SIZE // 10
+    threshold = np.sort(np.abs(delta))[-SIZE // 10]
+    assert (np.abs(delta[changed]) >= threshold).all()
+    np.testing.assert_allclose(decoded[changed], update[changed], atol=1e-6)
+
+
+def test_error_feedback_sends_the_remainder():
+    """相对发送端上一轮的精确模型编码、接收端累加增量时，接收端模型与真实模型之差等于残差"""
+    rng = np.random.default_rng(1)
+    truth = rng.standard_normal(SIZE).astype(np.float32)
+    previous, received = truth.copy(), truth.copy()
+    residual = np.zeros(SIZE, dtype=np.float32)
+    direction = (rng.standard_t(2, SIZE) * 0.01).astype(np.float32)
+    for _ in range(4):
+        truth = truth + direction
+        config = CompressionConfig.from_dict({"quantization": "int8", "topk_ratio": 0.05})
+        delta_path, out_path = _path(".p2pd"), _path(".npy")
+        encode_delta(open_update(_model(truth)), open_update(_model(previous)), delta_path, config, 0, residual)
+        decode_delta(delta_path, open_update(_model(received)), out_path)
+        received, previous = np.load(out_path), truth.copy()
+        np.testing.assert_allclose(received + residual, truth, atol=1e-4)
+
+    # 关闭误差反馈时不修改残差
+    before = residual.copy()
+    _round_trip(previous, truth + direction, residual, topk_ratio=0.05, error_feedback=False)
+    np.testing.assert_array_equal(residual, before)
+
+
+def test_malformed_deltas_are_rejected():
+    base, update = _arrays()
+    _, _, delta_path = _round_trip(base, update, quantization="int8", topk_ratio=0.1)
+    base_model = open_update(_model(base))
+    data = delta_path.read_bytes()
+    header = read_delta_header(delta_path)
+
+    truncated = _path(".p2pd")
+    truncated.write_bytes(data[:-64])
+    _expect_error(400, decode_delta, truncated, base_model, _path(".npy"))
+
+    trailing = _path(".p2pd")
+    trailing.write_bytes(data + b"\0" * 8)
+    _expect_error(400, decode_delta, trailing, base_model, _path(".npy"))
+
+    # 第一个分块的第一个下标改为越界值
+    out_of_range = _path(".p2pd")
+    position = header["data_offset"]
+    out_of_range.write_bytes(data[:position] + np.uint32(SIZE).tobytes() + data[position + 4:])
+    _expect_error(400, decode_delta, out_of_range, base_model, _path(".npy"))
+
+    bad_magic = _path(".p2pd")
+    bad_magic.write_bytes(b"NOTDELTA" + data[8:])
+    _expect_error(400, decode_delta, bad_magic, base_model, _path(".npy"))
+    _expect_error(400, decode_delta, delta_path, open_update(_model(base[:-1])), _path(".npy"))
+    _expect_error(400, CompressionConfig.from_dict, {"topk_ratio": 0})
+    _expect_error(400, CompressionConfig.from_dict, {"quantization": "int4"})
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
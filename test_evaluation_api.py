@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+离线模型评估接口测试
+评估任务只允许创建者查看、订阅和取消；后端只能从已注册的名称中选择
+登记了制品的模型解压为检查点目录后评估
+"""
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, checkpoint_archive, client, create_model, register_artifact, register_user, run_tests
+
+from main import app
+
+from edgeai.serving.inference import InferenceBackend, register_backend
+
+EVALUATIONS_URL = "/api/edgeai/evaluations/"
+
+
+class ConstantBackend(InferenceBackend):
+    """不加载模型的评估后端"""
+
+    def predict(self, inputs, params):
+        return [None for _ in inputs]
+
+    def score(self, inputs, targets):
+        return {"count": float(len(inputs)), "loss_sum": 0.0, "correct": float(len(inputs))}
+
+
+register_backend("test-constant", ConstantBackend)
+
+
+def _start(user: dict, **fields) -> dict:
+    body = {
+        "model_ids": [create_model(user["id"])],
+        "dataset_path": "missing.csv",
+        "backend": "test-constant",
+        **fields
+    }
+    return client.post(EVALUATIONS_URL, json=body, headers=user["headers"])
+
+
+def test_evaluation_requires_auth():
+    owner = register_user()
+    job_id = _start(owner).json()["jobs"][0]["job_id"]
+    assert client.post(EVALUATIONS_URL, json={"model_ids": [1], "dataset_path": "x.csv"}).status_code == 401
+    assert client.get(EVALUATIONS_URL).status_code == 401
+    assert client.get(f"{EVALUATIONS_URL}{job_id}").status_code == 401
+    assert client.get(f"{EVALUATIONS_URL}{job_id}/stream").status_code == 401
+    assert client.delete(f"{EVALUATIONS_URL}{job_id}").status_code == 401
+
+
+def test_evaluation_is_scoped_to_owner():
+    owner, other = register_user(), register_user()
+    response = _start(owner)
+    assert response.status_code == 202, response.text
+    job = response.json()["jobs"][0]
+
+    headers = other["headers"]
+    assert client.get(f"{EVALUATIONS_URL}{job['job_id']}", headers=headers).status_code == 404
+    assert client.get(f"{EVALUATIONS_URL}{job['job_id']}/stream", headers=headers).status_code == 404
+    assert client.delete(f"{EVALUATIONS_URL}{job['job_id']}", headers=headers).status_code == 404
+    assert client.get(EVALUATIONS_URL, headers=headers).json()["jobs"] == []
+    assert client.get(EVALUATIONS_URL, params={"model_id": job["model_id"]}, headers=headers).json()["jobs"] == []
+
+    response = client.get(f"{EVALUATIONS_URL}{job['job_id']}", headers=owner["headers"])
+    assert response.status_code == 200
+    assert response.json()["model_id"] == job["model_id"]
+    assert [item["job_id"] for item in client.get(EVALUATIONS_URL, headers=owner["headers"]).json()["jobs"]] == [job["job_id"]]
+
+
+def test_cannot_evaluate_other_users_model():
+    owner, other = register_user(), register_user()
+    model_id = create_model(owner["id"])
+    response = client.post(EVALUATIONS_URL, json={"model_ids": [model_id], "dataset_path": "x.csv", "backend": "test-constant"}, headers=other["headers"])
+    assert response.status_code == 404
+
+
+def test_backend_must_be_registered():
+    owner = register_user()
+    for backend in ("os:system", "edgeai.serving.inference:CausalLMBackend", "unknown"):
+        response = _start(owner, backend=backend)
+        assert response.status_code == 400, response.text
+        assert "Unknown inference backend" in response.json()["detail"]
+
+
+def _dataset() -> str:
+    path = Path(os.environ["EDGEAI_ARTIFACT_ROOT"]) / f"eval-{uuid.uuid4().hex}.csv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("text\n" + "".join(f"sample {index}\n" for index in range(20)))
+    return path.name
+
+
+async def _evaluate(user: dict, body: dict) -> dict:
+    """在同一个事件循环中创建任务并长轮询到结束（TestClient 的每个请求使用独立的事件循环）"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", headers=user["headers"]) as http:
+        response = await http.post(EVALUATIONS_URL, json=body)
+        assert response.status_code == 202, response.text
+        job = response.json()["jobs"][0]
+        while job["status"] not in ("completed", "failed", "cancelled"):
+            response = await http.get(f"{EVALUATIONS_URL}{job['job_id']}", params={"since_version": job["version"]})
+            job = response.json()
+        return job
+
+
+def test_evaluates_registered_checkpoint():
+    owner = register_user()
+    model_id = create_model(owner["id"])
+    digest = register_artifact(model_id, checkpoint_archive("1"))
+    # 请求不能覆盖模型登记的检查点
+    body = {"model_ids": [model_id], "dataset_path": _dataset(), "backend": "test-checkpoint", "test_fraction": 1.0, "model_name_or_path": "/etc"}
+
+    job = asyncio.run(_evaluate(owner, body))
+    assert job["status"] == "completed", job["error"]
+    assert job["checkpoint"].startswith(str(Path(TEST_ROOT) / "checkpoints" / digest))
+    assert job["metrics"]["accuracy"] == 1.0 and job["metrics"]["samples"] == 20
+
+    # 重新登记制品后评估新的检查点
+    register_artifact(model_id, checkpoint_archive("0"))
+    job = asyncio.run(_evaluate(owner, body))
+    assert job["status"] == "completed", job["error"]
+    assert job["metrics"]["accuracy"] == 0.0
+
+
+def test_unsupported_artifact_fails_job():
+    owner = register_user()
+    model_id = create_model(owner["id"])
+    register_artifact(model_id, b"not an archive")
+    job = asyncio.run(_evaluate(owner, {"model_ids": [model_id], "dataset_path": _dataset(), "backend": "test-checkpoint"}))
+    assert job["status"] == "failed"
+    assert "tar or zip archive" in job["error"]
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
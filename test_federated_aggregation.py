@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+联邦学习服务端聚合测试
+FedAvg 按样本数加权平均；样本数必须是有限正数；达到 min_clients 时并发的提交只聚合一次
+"""
+import io
+import os
+import sys
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, client, run_tests
+
+from p2pai.federated.aggregation import AggregationError, aggregation_engine
+
+
+def _update(values) -> Path:
+    path = Path(tempfile.mkstemp(suffix=".npy", dir=TEST_ROOT)[1])
+    np.save(path, np.asarray(values, dtype=np.float32))
+    return path
+
+
+def _session(**config):
+    return aggregation_engine.create_session(f"federated_test-{uuid.uuid4().hex[:8]}", config)
+
+
+def test_fedavg_weights_by_num_samples():
+    session = _session(algorithm="fedavg")
+    session.submit(_update([1.0, 2.0, 3.0, 4.0]), 1, "client-a")
+    session.submit(_update([5.0, 6.0, 7.0, 8.0]), 3, "client-b")
+    record = session.aggregate()
+
+    assert record["round"] == 1 and record["num_samples"] == 4.0
+    weights = session.open_global_model().tensors["weights"][0]
+    np.testing.assert_allclose(weights, [4.0, 5.0, 6.0, 7.0], rtol=1e-6)
+
+    # 下一轮重新累加，与上一轮的权重无关
+    session.submit(_update([0.0, 0.0, 0.0, 0.0]), 2, "client-a")
+    session.submit(_update([2.0, 2.0, 2.0, 2.0]), 2, "client-b")
+    session.aggregate()
+    np.testing.assert_allclose(session.open_global_model().tensors["weights"][0], [1.0, 1.0, 1.0, 1.0], rtol=1e-6)
+
+
+def test_num_samples_must_be_positive_and_finite():
+    session = _session()
+    path = _update([1.0, 2.0])
+    for num_samples in (0, -1, float("nan"), float("inf")):
+        try:
+            session.submit(path, num_samples, "client-a")
+            raise AssertionError(f"num_samples={num_samples} was accepted")
+        except AggregationError as e:
+            assert e.status_code == 400
+    assert session.status()["pending_clients"] == []
+
+    project_id = session.session_id[len("federated_"):]
+    for num_samples in ("nan", "inf", "0"):
+        response = client.post(
+            f"/api/p2pai/training/federated/{project_id}/updates",
+            data={"client_id": "client-a", "num_samples": num_samples},
+            files={"file": ("update.npy", io.BytesIO(path.read_bytes()))}
+        )
+        assert response.status_code == 400, response.text
+
+
+def test_concurrent_submissions_aggregate_once():
+    session = _session(min_clients=4)
+    paths = [_update([float(i)] * 1024) for i in range(4)]
+    barrier = threading.Barrier(len(paths))
+    results, errors = [], []
+
+    def submit(index: int):
+        try:
+            session.submit(paths[index], 1, f"client-{index}")
+            barrier.wait()
+            results.append(session.aggregate_if_ready())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(index,)) for index in range(len(paths))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    aggregated = [result for result in results if result is not None]
+    assert len(aggregated) == 1 and session.round == 1
+    np.testing.assert_allclose(session.open_global_model().tensors["weights"][0], 1.5, rtol=1e-6)
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
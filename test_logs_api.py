@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+日志接口测试
+写入的日志对列表、统计、详情、实时、搜索和导出接口都可见
+"""
+import json
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import client, run_tests
+
+LOGS_URL = "/api/edgeai/logs"
+
+
+def _ingest(node_id: str) -> list:
+    response = client.post(f"{LOGS_URL}/", json=[
+        {"level": "info", "message": f"training started on {node_id}", "category": "training", "node_id": node_id},
+        {"level": "ERROR", "message": f"training failed on {node_id}", "category": "training", "node_id": node_id}
+    ])
+    assert response.status_code == 201, response.text
+    assert response.json()["created"] == 2
+    return response.json()["ids"]
+
+
+def test_ingested_logs_are_visible_everywhere():
+    node_id = f"edge-{uuid.uuid4().hex[:8]}"
+    ids = _ingest(node_id)
+
+    items = client.get(f"{LOGS_URL}/", params={"node_id": node_id}).json()["items"]
+    assert sorted(item["id"] for item in items) == sorted(ids)
+    assert client.get(f"{LOGS_URL}/", params={"node_id": node_id, "level": "error"}).json()["total"] == 1
+
+    stats = client.get(f"{LOGS_URL}/stats/summary", params={"node_id": node_id}).json()
+    assert stats["total_logs"] == 2
+    assert stats["level_distribution"] == {"INFO": 1, "ERROR": 1}
+    assert stats["error_rate"] == 50.0
+
+    assert client.get(f"{LOGS_URL}/{ids[0]}").json()["message"] == f"training started on {node_id}"
+    realtime = [log["id"] for log in client.get(f"{LOGS_URL}/realtime").json()["logs"]]
+    assert set(ids) <= set(realtime)
+
+    search = client.get(f"{LOGS_URL}/search", params={"query": "failed", "node_id": node_id}).json()
+    assert [log["id"] for log in search["results"]] == [ids[1]]
+
+    export = client.get(f"{LOGS_URL}/export", params={"node_id": node_id})
+    assert export.status_code == 200
+    assert sorted(str(json.loads(line)["id"]) for line in export.text.splitlines()) == sorted(ids)
+
+
+def test_invalid_logs_are_rejected():
+    assert client.post(f"{LOGS_URL}/", json=[{"level": "LOUD", "message": "x"}]).status_code == 400
+    assert client.get(f"{LOGS_URL}/999999999").status_code == 404
+    assert client.get(f"{LOGS_URL}/log-001").status_code == 404
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+模型制品登记测试
+登记的文件导入内容寻址存储后默认保留；只有当前用户暂存目录中的文件可以在导入后删除
+"""
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import SessionLocal, client, create_model, register_user, run_tests
+
+from common.storage.blobstore import blob_store, parse_blob_ref
+from database.edgeai import Model
+
+ARTIFACT_ROOT = Path(os.environ["EDGEAI_ARTIFACT_ROOT"])
+
+
+def _file(relative: str) -> Path:
+    path = ARTIFACT_ROOT / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(4096))
+    return path
+
+
+def _register(user: dict, model_id: int, file_path: str, **fields):
+    response = client.post(f"/api/edgeai/models/{model_id}/artifact", json={"file_path": file_path, **fields}, headers=user["headers"])
+    deadline = time.time() + 30
+    while blob_store.is_pending(("model", model_id)) and time.time() < deadline:
+        time.sleep(0.05)
+    return response
+
+
+def _file_path(model_id: int) -> str:
+    db = SessionLocal()
+    try:
+        return db.get(Model, model_id).file_path
+    finally:
+        db.close()
+
+
+def test_source_is_kept_by_default():
+    owner = register_user()
+    model_id = create_model(owner["id"])
+    name = f"shared/{uuid.uuid4().hex}.bin"
+    path = _file(name)
+
+    assert _register(owner, model_id, name).status_code == 200
+    assert parse_blob_ref(_file_path(model_id))
+    assert path.exists()
+
+
+def test_cannot_delete_files_outside_own_staging():
+    owner, other = register_user(), register_user()
+    model_id = create_model(other["id"])
+    for name in (f"shared/{uuid.uuid4().hex}.bin", f"staging/{owner['id']}/{uuid.uuid4().hex}.bin"):
+        path = _file(name)
+        response = _register(other, model_id, name, keep_source=False)
+        assert response.status_code == 400, response.text
+        assert path.exists()
+
+
+def test_staging_file_is_removed_after_ingest():
+    owner = register_user()
+    first, second = create_model(owner["id"]), create_model(owner["id"])
+    name = f"staging/{owner['id']}/{uuid.uuid4().hex}.bin"
+    path = _file(name)
+
+    # 另一个模型仍登记着同一文件（导入尚未完成）时不删除
+    db = SessionLocal()
+    try:
+        db.get(Model, second).file_path = name
+        db.commit()
+    finally:
+        db.close()
+    assert _register(owner, first, name, keep_source=False).status_code == 200
+    assert parse_blob_ref(_file_path(first))
+    assert path.exists()
+
+    path = _file(f"staging/{owner['id']}/{uuid.uuid4().hex}.bin")
+    assert _register(owner, first, str(path.relative_to(ARTIFACT_ROOT)), keep_source=False).status_code == 200
+    assert parse_blob_ref(_file_path(first))
+    assert not path.exists()
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
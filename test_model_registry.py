@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+模型版本注册表测试
+版本号递增、血缘（含跨模型派生）、最新和最优版本、回滚后重新部署加载回滚的版本，
+以及并发登记撞上唯一约束重试时对象引用计数不重复增加
+"""
+import os
+import sys
+
+from sqlalchemy.exc import IntegrityError
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import SessionLocal, checkpoint_archive, client, create_model, register_artifact, register_user, run_tests, served_weights
+
+from database.edgeai import BlobObject, Model
+from edgeai.serving.registry import RegistryError, model_registry
+
+
+def _url(model_id: int) -> str:
+    return f"/api/edgeai/models/{model_id}"
+
+
+def _create_version(user: dict, model_id: int, **body) -> dict:
+    response = client.post(f"{_url(model_id)}/versions", json=body, headers=user["headers"])
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def _refcount(digest: str) -> int:
+    db = SessionLocal()
+    try:
+        blob = db.get(BlobObject, digest)
+        return blob.refcount if blob else 0
+    finally:
+        db.close()
+
+
+def test_versions_and_lineage():
+    owner = register_user()
+    model_id, derived_id = create_model(owner["id"]), create_model(owner["id"])
+    register_artifact(model_id, checkpoint_archive("v1"))
+    first = _create_version(owner, model_id, metrics={"accuracy": 80.0, "loss": 0.5, "f1": 0.7})
+    register_artifact(model_id, checkpoint_archive("v2"))
+    second = _create_version(owner, model_id, metrics={"accuracy": 90.0, "loss": 0.7})
+
+    assert (first["version"], second["version"]) == (1, 2)
+    assert second["parent_id"] == first["id"] and second["is_current"]
+    assert first["metrics"] == {"f1": 0.7}
+
+    # 跨模型派生（如微调）
+    register_artifact(derived_id, checkpoint_archive("derived"))
+    derived = _create_version(owner, derived_id, parent_id=second["id"])
+
+    lineage = client.get(f"{_url(derived_id)}/versions/1/lineage", headers=owner["headers"]).json()
+    assert [(item["id"], item["depth"]) for item in lineage["ancestors"]] == [(second["id"], 1), (first["id"], 2)]
+    children = client.get(f"{_url(model_id)}/versions/2/lineage", headers=owner["headers"]).json()["children"]
+    assert [child["id"] for child in children] == [derived["id"]]
+
+    headers = owner["headers"]
+    assert client.get(f"{_url(model_id)}/versions/latest", headers=headers).json()["version"] == 2
+    assert client.get(f"{_url(model_id)}/versions/best", params={"metric": "accuracy"}, headers=headers).json()["version"] == 2
+    assert client.get(f"{_url(model_id)}/versions/best", params={"metric": "loss"}, headers=headers).json()["version"] == 1
+    listing = client.get(f"{_url(model_id)}/versions", params={"limit": 1}, headers=headers).json()
+    assert listing["total"] == 2 and [item["version"] for item in listing["versions"]] == [2]
+    assert client.get(f"{_url(model_id)}/versions", params={"before": 2}, headers=headers).json()["versions"][0]["version"] == 1
+
+    # 其他用户看不到版本
+    other = register_user()
+    assert client.get(f"{_url(model_id)}/versions", headers=other["headers"]).status_code == 404
+
+
+def test_rollback_changes_what_is_deployed():
+    owner = register_user()
+    headers = owner["headers"]
+    model_id = create_model(owner["id"])
+    v1 = register_artifact(model_id, checkpoint_archive("v1"))
+    _create_version(owner, model_id)
+    v2 = register_artifact(model_id, checkpoint_archive("v2"))
+    _create_version(owner, model_id)
+    # 模型记录和两个版本各持有一个引用（v1 的模型引用已随重新登记释放）
+    assert (_refcount(v1), _refcount(v2)) == (1, 2)
+
+    response = client.post(f"{_url(model_id)}/rollback", json={"version": 1}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["current_version"]["version"] == 1
+    assert (_refcount(v1), _refcount(v2)) == (2, 1)
+    assert client.post(f"{_url(model_id)}/rollback", json={"version": 9}, headers=headers).status_code == 404
+
+    response = client.post(f"{_url(model_id)}/deploy", json={"backend": "test-checkpoint"}, headers=headers)
+    assert response.status_code == 200, response.text
+    try:
+        assert served_weights(model_id) == "v1"
+        assert client.post(f"{_url(model_id)}/rollback", json={"version": 2}, headers=headers).json()["redeploy_required"]
+        assert client.post(f"{_url(model_id)}/deploy", json={"backend": "test-checkpoint"}, headers=headers).status_code == 200
+        assert served_weights(model_id) == "v2"
+    finally:
+        client.post(f"{_url(model_id)}/undeploy", headers=headers)
+
+
+def _conflicting_flush(db, failures: int):
+    """前 failures 次 flush 模拟并发登记撞上 (model_id, version) 唯一约束"""
+    flush = db.flush
+    state = {"failures": failures}
+
+    def conflicting(*args, **kwargs):
+        if state["failures"] > 0:
+            state["failures"] -= 1
+            raise IntegrityError("INSERT INTO model_versions", {}, Exception("UNIQUE constraint failed"))
+        return flush(*args, **kwargs)
+
+    db.flush = conflicting
+
+
+def test_create_version_retry_keeps_refcount():
+    owner = register_user()
+    model_id = create_model(owner["id"])
+    digest = register_artifact(model_id, checkpoint_archive("retry"))
+
+    db = SessionLocal()
+    try:
+        _conflicting_flush(db, 2)
+        record = model_registry.create_version(db, db.get(Model, model_id))
+        assert record.version == 1 and record.artifact_digest == digest
+    finally:
+        db.close()
+    assert _refcount(digest) == 2
+
+    db = SessionLocal()
+    try:
+        _conflicting_flush(db, 3)
+        try:
+            model_registry.create_version(db, db.get(Model, model_id))
+            raise AssertionError("expected RegistryError")
+        except RegistryError as e:
+            assert e.status_code == 409
+    finally:
+        db.close()
+    # 放弃登记时没有残留的引用
+    assert _refcount(digest) == 2
+    assert model_registry.count(SessionLocal(), model_id) == 1
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+MPC 训练会话测试
+流水线深度限制模型版本的滞后、停止会话后各阶段线程退出、份额系数不可预测而训练结果可由 seed 复现，
+以及超出上限或类型不符的选项被拒绝
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import run_tests
+
+from p2pai.federated import mpc
+from p2pai.federated.aggregation import AggregationError
+from p2pai.federated.mpc import MPCConfig, MPCSession
+
+PARTIES = ["party-1", "party-2", "party-3"]
+CLIENTS = ["client-1", "client-2", "client-3"]
+
+
+def _session(**options) -> MPCSession:
+    config = MPCConfig.from_dict({"num_features": 8, "batch_size": 32, "eval_samples": 64, **options})
+    return MPCSession(f"test-{time.time_ns()}", PARTIES, CLIENTS, config)
+
+
+def _expect_error(status_code: int, func, *args):
+    try:
+        func(*args)
+    except AggregationError as e:
+        assert e.status_code == status_code, e.detail
+        return
+    raise AssertionError("expected AggregationError")
+
+
+def test_pipeline_depth_bounds_staleness():
+    session = _session(rounds=6, pipeline_depth=0)
+    snapshot = session.run()
+    assert snapshot["status"] == "completed" and snapshot["summary"]["rounds_completed"] == 6
+    assert [entry["staleness"] for entry in session.timeline] == [0] * 6
+
+    # 模拟延迟让分发阶段跑在重构前面
+    session = _session(rounds=12, pipeline_depth=2, latency_ms=10)
+    session.run()
+    snapshot = session.snapshot(timeline=True)
+    timeline = snapshot["timeline"]
+    assert snapshot["status"] == "completed"
+    assert [entry["round"] for entry in timeline] == list(range(12))
+    assert all(entry["round"] - entry["model_version"] == entry["staleness"] <= 2 for entry in timeline)
+    assert 1 <= snapshot["summary"]["max_staleness"] <= 2
+
+
+def test_stop_ends_all_stages():
+    session = _session(rounds=mpc.MPC_MAX_ROUNDS, latency_ms=50)
+    session.start()
+    time.sleep(0.2)
+    assert session.stop()
+    assert session.join(5)
+    assert session.status == "stopped" and session.version < session.config.rounds
+    assert not session.stop()
+
+
+def test_shares_are_unpredictable_and_seed_fixes_data():
+    assert MPCConfig().seed is None
+    session = _session(seed=7)
+    client = session.clients[0]
+    weights = np.zeros(9, dtype=np.float32)
+    first, second = client.share(session.scheme, 0, weights), client.share(session.scheme, 0, weights)
+    # 同一种子、同一轮的份额每次不同，但重构出相同的梯度
+    assert not np.array_equal(first, second)
+    restored = [session.scheme.reconstruct({1: shares[0], 3: shares[2]}) for shares in (first, second)]
+    np.testing.assert_array_equal(restored[0], restored[1])
+
+    # 流水线时各轮基于的模型版本取决于线程调度，逐轮同步时结果才可复现
+    results = [_session(rounds=4, seed=7, pipeline_depth=0).run()["metrics"] for _ in range(2)]
+    assert results[0] == results[1]
+
+
+def test_invalid_options_are_rejected():
+    config = MPCConfig.from_dict({"rounds": "5", "learning_rate": 1, "seed": None, "latency_ms": "2.5"})
+    assert (config.rounds, config.learning_rate, config.seed, config.latency_ms) == (5, 1.0, None, 2.5)
+
+    for options in (
+        {"rounds": 0},
+        {"rounds": mpc.MPC_MAX_ROUNDS + 1},
+        {"num_features": mpc.MPC_MAX_FEATURES + 1},
+        {"batch_size": mpc.MPC_MAX_BATCH_SIZE + 1},
+        {"num_clients": mpc.MPC_MAX_CLIENTS + 1},
+        {"eval_samples": 0},
+        {"pipeline_depth": -1},
+        {"pipeline_depth": mpc.MPC_MAX_PIPELINE_DEPTH + 1},
+        {"latency_ms": mpc.MPC_MAX_LATENCY_MS + 1},
+        {"learning_rate": float("nan")},
+        {"bandwidth_mbps": "inf"},
+        {"clip": 0},
+        {"l2": -0.1},
+        {"seed": -1},
+        {"rounds": True},
+        {"rounds": 2.5},
+        {"rounds": "many"},
+        {"rounds": None},
+        {"unknown": 1}
+    ):
+        _expect_error(400, MPCConfig.from_dict, options)
+
+    config = MPCConfig()
+    _expect_error(400, MPCSession, "dup", ["a", "a"], CLIENTS, config)
+    _expect_error(400, MPCSession, "threshold", ["a"], CLIENTS, config)
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Shamir 门限安全聚合测试
+任意 threshold 台计算方的份额都能重构出秘密，少于 threshold 台时拒绝；各计算方的份额和重构出更新之和
+"""
+import itertools
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import run_tests
+
+from p2pai.federated import secure_aggregation
+from p2pai.federated.aggregation import AggregationError
+from p2pai.federated.secure_aggregation import FIELD_PRIME, PartyAccumulator, ShamirScheme
+
+
+def _expect_error(status_code: int, func, *args):
+    try:
+        func(*args)
+    except AggregationError as e:
+        assert e.status_code == status_code, e.detail
+        return
+    raise AssertionError("expected AggregationError")
+
+
+def test_any_threshold_subset_reconstructs():
+    scheme = ShamirScheme(num_parties=5, threshold=3)
+    rng = np.random.default_rng(0)
+    secret = rng.integers(0, FIELD_PRIME, size=1000, dtype=np.uint64)
+    shares = scheme.split(secret, rng)
+
+    assert shares.shape == (5, 1000)
+    assert (shares < FIELD_PRIME).all()
+    for party_ids in itertools.combinations(range(1, 6), 3):
+        restored = scheme.reconstruct({party_id: shares[party_id - 1] for party_id in party_ids})
+        np.testing.assert_array_equal(restored, secret)
+    # 多于 threshold 台时同样正确
+    np.testing.assert_array_equal(scheme.reconstruct(dict(enumerate(shares, start=1))), secret)
+
+
+def test_split_spans_chunks():
+    chunk = secure_aggregation.AGGREGATION_CHUNK
+    secure_aggregation.AGGREGATION_CHUNK = 64
+    try:
+        scheme = ShamirScheme(num_parties=4, threshold=2)
+        secret = np.arange(1000, dtype=np.uint64) * 7919 % FIELD_PRIME
+        shares = scheme.split(secret)
+        np.testing.assert_array_equal(scheme.reconstruct({2: shares[1], 4: shares[3]}), secret)
+    finally:
+        secure_aggregation.AGGREGATION_CHUNK = chunk
+
+
+def test_fewer_than_threshold_is_rejected():
+    scheme = ShamirScheme(num_parties=5, threshold=3)
+    shares = scheme.split(scheme.quantize(np.ones(8)))
+    _expect_error(409, scheme.reconstruct, {1: shares[0], 2: shares[1]})
+    _expect_error(400, scheme.lagrange_coefficients, [1, 1, 2])
+    _expect_error(400, scheme.lagrange_coefficients, [1, 2, 6])
+    _expect_error(400, ShamirScheme, 3, 4)
+    _expect_error(400, ShamirScheme, 3, 2, 16, 0.0)
+
+
+def test_party_sums_reconstruct_mean():
+    scheme = ShamirScheme(num_parties=4, threshold=3, clip=4.0)
+    rng = np.random.default_rng(1)
+    updates = [rng.uniform(-2.0, 2.0, size=257) for _ in range(6)]
+    accumulators = [PartyAccumulator(party_id, 257) for party_id in range(1, 5)]
+    for index, update in enumerate(updates):
+        shares = scheme.share_update(update)
+        for accumulator in accumulators:
+            accumulator.add(f"client-{index}", shares[accumulator.party_id - 1])
+
+    _expect_error(409, accumulators[0].add, "client-0", np.zeros(257, dtype=np.uint64))
+    _expect_error(400, accumulators[0].add, "client-new", np.zeros(3, dtype=np.uint64))
+
+    sums = {accumulator.party_id: accumulator.total for accumulator in accumulators[1:]}
+    mean = scheme.reconstruct_sum(sums, divisor=len(updates))
+    # 每个更新的量化误差不超过 2^-(frac_bits+1)
+    np.testing.assert_allclose(mean, np.mean(updates, axis=0), atol=1.0 / scheme.scale)
+
+
+def test_quantize_clips_and_keeps_sign():
+    scheme = ShamirScheme(num_parties=3, threshold=1, frac_bits=8, clip=1.0)
+    field = scheme.quantize(np.array([-5.0, -0.5, 0.0, 0.25, 5.0]))
+    np.testing.assert_array_equal(scheme.dequantize(field), [-1.0, -0.5, 0.0, 0.25, 1.0])
+    # threshold 为 1 时每份都是秘密本身
+    shares = scheme.split(field)
+    assert all((share == field).all() for share in shares)
+    assert scheme.max_clients == (FIELD_PRIME // 2) // 256
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+模型推理服务接口测试
+部署、推理、取消和指标接口只允许模型所有者访问；后端只能从已注册的名称中选择，工作进程数和批大小有上限
+部署加载模型当前登记的制品，请求不能指定任意的模型路径
+"""
+import io
+import os
+import sys
+import tarfile
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, checkpoint_archive, client, create_model, register_artifact, register_user, run_tests, served_weights
+
+from edgeai.serving.inference import SERVING_BATCH_SIZE_LIMIT, SERVING_WORKERS_LIMIT, CausalLMBackend, InferenceBackend, register_backend
+
+
+class UnavailableBackend(CausalLMBackend):
+    """缺少依赖的后端：部署应返回 501"""
+
+    @classmethod
+    def unavailable_reason(cls):
+        return "test backend is not installed"
+
+
+register_backend("test-unavailable", UnavailableBackend)
+
+
+def _setup():
+    owner = register_user()
+    other = register_user()
+    return owner, other, f"/api/edgeai/models/{create_model(owner['id'])}"
+
+
+def test_serving_requires_auth():
+    _, _, url = _setup()
+    assert client.post(f"{url}/deploy", json={}).status_code == 401
+    assert client.post(f"{url}/undeploy").status_code == 401
+    assert client.post(f"{url}/predict", json={"inputs": "x"}).status_code == 401
+    assert client.delete(f"{url}/predict/abc").status_code == 401
+    assert client.get(f"{url}/serving/metrics").status_code == 401
+
+
+def test_serving_is_scoped_to_owner():
+    owner, other, url = _setup()
+    headers = other["headers"]
+    assert client.post(f"{url}/deploy", json={}, headers=headers).status_code == 404
+    assert client.post(f"{url}/undeploy", headers=headers).status_code == 404
+    assert client.post(f"{url}/predict", json={"inputs": "x"}, headers=headers).status_code == 404
+    assert client.delete(f"{url}/predict/abc", headers=headers).status_code == 404
+    assert client.get(f"{url}/serving/metrics", headers=headers).status_code == 404
+    # 所有者访问未部署的模型
+    assert client.post(f"{url}/predict", json={"inputs": "x"}, headers=owner["headers"]).status_code == 503
+
+
+def test_backend_must_be_registered():
+    owner, _, url = _setup()
+    for backend in ("os:system", "edgeai.serving.inference:ModelServer", "unknown"):
+        response = client.post(f"{url}/deploy", json={"backend": backend}, headers=owner["headers"])
+        assert response.status_code == 400, response.text
+        assert "Unknown inference backend" in response.json()["detail"]
+
+
+def test_incomplete_backend_cannot_be_registered():
+    class PredictOnly(InferenceBackend):
+        def predict(self, inputs, params):
+            return inputs
+
+    for backend in (PredictOnly, object):
+        try:
+            register_backend("test-incomplete", backend)
+            raise AssertionError("expected TypeError")
+        except TypeError:
+            pass
+
+
+def test_deployment_limits():
+    owner, _, url = _setup()
+    for config in (
+        {"num_workers": SERVING_WORKERS_LIMIT + 1},
+        {"max_batch_size": SERVING_BATCH_SIZE_LIMIT + 1},
+        {"num_workers": 0},
+        {"timeout": "nan"},
+        {"bogus": 1}
+    ):
+        response = client.post(f"{url}/deploy", json=config, headers=owner["headers"])
+        assert response.status_code == 400, (config, response.text)
+
+
+def test_unavailable_backend_is_http_error():
+    owner, _, url = _setup()
+    response = client.post(f"{url}/deploy", json={"backend": "test-unavailable"}, headers=owner["headers"])
+    assert response.status_code == 501, response.text
+    assert response.json()["detail"] == "test backend is not installed"
+
+
+def test_deploy_loads_registered_checkpoint():
+    owner, _, url = _setup()
+    headers = owner["headers"]
+    model_id = int(url.rsplit("/", 1)[1])
+    digest = register_artifact(model_id, checkpoint_archive(f"weights-{model_id}"))
+
+    response = client.post(f"{url}/deploy", json={"backend": "test-checkpoint"}, headers=headers)
+    assert response.status_code == 200, response.text
+    try:
+        assert digest in response.json()["data"]["config"]["model_name_or_path"]
+        assert served_weights(model_id) == f"weights-{model_id}"
+    finally:
+        client.post(f"{url}/undeploy", headers=headers)
+
+
+def test_deploy_rejects_model_path_override():
+    owner, _, url = _setup()
+    for path in ("/etc", "gpt2", "../../model"):
+        response = client.post(f"{url}/deploy", json={"backend": "test-checkpoint", "model_name_or_path": path}, headers=owner["headers"])
+        assert response.status_code == 400, response.text
+
+
+def test_deploy_rejects_unsupported_artifacts():
+    owner, _, url = _setup()
+    model_id = int(url.rsplit("/", 1)[1])
+    register_artifact(model_id, b"not an archive")
+    response = client.post(f"{url}/deploy", json={"backend": "test-checkpoint"}, headers=owner["headers"])
+    assert response.status_code == 422, response.text
+
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo("../escape.txt")
+        archive.addfile(info, io.BytesIO(b""))
+    register_artifact(model_id, buffer.getvalue())
+    response = client.post(f"{url}/deploy", json={"backend": "test-checkpoint"}, headers=owner["headers"])
+    assert response.status_code == 422, response.text
+    assert not (Path(TEST_ROOT) / "escape.txt").exists()
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+分词预处理缓存测试
+缓存键只由数据集内容和分词参数决定，内容相同的数据集命中同一缓存，其他数据集的路径下读不到该缓存，
+单次读取的行数上限，以及按最近使用时间的 LRU 淘汰
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import TEST_ROOT, client, run_tests, upload_dataset
+
+from main import app
+from p2pai.storage.tokenization import TOKENIZED_MAX_ROWS, TokenizationManager, cache_key, tokenizer_fingerprint
+
+TEXTS = ["hello", "世界", "", "a longer line of text"]
+
+
+def _jsonl(texts, extra: str = "") -> bytes:
+    return "".join(json.dumps({"text": text, "label": extra}) + "\n" for text in texts).encode()
+
+
+def _params(**overrides) -> dict:
+    return {"tokenizer": "bytes", "max_length": 16, "text_columns": ["text"], "separator": "\n", "add_special_tokens": True, **overrides}
+
+
+async def _tokenize(dataset_id: str, body: dict) -> dict:
+    """在同一个事件循环中启动分词并轮询到结束（TestClient 的每个请求使用独立的事件循环）"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost") as http:
+        response = await http.post(f"/api/p2pai/datasets/{dataset_id}/tokenize", json=body)
+        assert response.status_code in (200, 202), response.text
+        status = response.json()
+        deadline = time.time() + 120
+        while status["status"] == "running" and time.time() < deadline:
+            await asyncio.sleep(0.1)
+            status = (await http.get(status["status_url"])).json()
+        return status
+
+
+def test_cache_key():
+    params = _params()
+    assert cache_key("a" * 64, params) == cache_key("a" * 64, dict(params))
+    assert cache_key("a" * 64, params) != cache_key("b" * 64, params)
+    for change in ({"max_length": 32}, {"text_columns": ["other"]}, {"separator": " "}, {"add_special_tokens": False}):
+        assert cache_key("a" * 64, params) != cache_key("a" * 64, _params(**change))
+
+    # 本地分词器目录按文件内容计算指纹
+    directory = Path(TEST_ROOT) / "tokenizer"
+    directory.mkdir(exist_ok=True)
+    (directory / "vocab.txt").write_text("a\nb\n")
+    first = tokenizer_fingerprint(str(directory))
+    (directory / "vocab.txt").write_text("a\nc\n")
+    assert tokenizer_fingerprint(str(directory)) != first
+
+
+def test_tokenize_and_cache_hit():
+    content = _jsonl(TEXTS)
+    dataset_id = upload_dataset(content, "texts.jsonl")
+    body = {"tokenizer": "bytes", "max_length": 8}
+    status = asyncio.run(_tokenize(dataset_id, body))
+    assert status["status"] == "completed", status
+    assert status["rows"] == len(TEXTS) and status["truncated_rows"] == 2
+
+    rows = client.get(status["rows_url"], params={"offset": 1, "limit": 2}).json()
+    assert rows["total_rows"] == len(TEXTS)
+    assert rows["input_ids"] == [[256, *"世界".encode()[:6], 257], [256, 257]]
+
+    # 第二次请求和内容相同的另一个数据集都命中缓存
+    response = client.post(f"/api/p2pai/datasets/{dataset_id}/tokenize", json=body)
+    assert response.status_code == 200 and response.json()["cache_hit"]
+    copy_id = upload_dataset(content, "copy.jsonl")
+    response = client.post(f"/api/p2pai/datasets/{copy_id}/tokenize", json=body)
+    assert response.status_code == 200 and response.json()["key"] == status["key"]
+    assert client.get(response.json()["rows_url"]).json()["total_rows"] == len(TEXTS)
+
+
+def test_key_is_scoped_to_dataset():
+    dataset_id = upload_dataset(_jsonl(TEXTS, "scoped"), "scoped.jsonl")
+    status = asyncio.run(_tokenize(dataset_id, {"tokenizer": "bytes"}))
+    assert status["status"] == "completed", status
+    key = status["key"]
+
+    other = upload_dataset(_jsonl(["unrelated"]), "other.jsonl")
+    for url in (f"/api/p2pai/datasets/{other}/tokenized/{key}", f"/api/p2pai/datasets/{other}/tokenized/{key}/rows"):
+        assert client.get(url).status_code == 404
+    assert client.get(f"/api/p2pai/datasets/missing/tokenized/{key}").status_code == 404
+
+    rows_url = f"/api/p2pai/datasets/{dataset_id}/tokenized/{key}/rows"
+    assert client.get(rows_url, params={"limit": TOKENIZED_MAX_ROWS + 1}).status_code == 422
+    assert client.get(rows_url, params={"limit": TOKENIZED_MAX_ROWS}).status_code == 200
+
+
+def _entry(root: Path, key: str, size: int, mtime: float):
+    (root / key).mkdir(parents=True)
+    meta_path = root / key / "meta.json"
+    meta_path.write_text(json.dumps({"key": key, "bytes": size, "shards": []}))
+    os.utime(meta_path, (mtime, mtime))
+
+
+def test_lru_eviction():
+    root = Path(TEST_ROOT) / "token_cache_lru"
+    manager = TokenizationManager(root=root, max_bytes=250, max_workers=1)
+    now = time.time()
+    for index, key in enumerate(("oldest", "older", "newer", "newest")):
+        _entry(root, key, 100, now - 100 + index)
+
+    # 读取会更新最近使用时间
+    assert manager.lookup("oldest") is not None
+    assert manager.evict(keep={"older"}) == ["newer", "newest"]
+    assert sorted(path.name for path in root.iterdir()) == ["older", "oldest"]
+    assert manager.lookup("newer") is None
+    assert manager.evict() == []
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+数据集断点续传上传（tus）接口测试
+创建、HEAD 查询进度、PATCH 追加、断线续传以及超过 Upload-Length 的请求体
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__)))
+
+from test_app_helper import SessionLocal, client, run_tests
+
+from p2pai.storage import uploads
+from p2pai.storage.uploads import UploadError, upload_manager
+
+UPLOADS_URL = "/api/p2pai/datasets/uploads"
+TUS_HEADERS = {"Tus-Resumable": "1.0.0"}
+
+
+def _metadata(**values) -> str:
+    return ",".join(f"{key} {base64.b64encode(value.encode()).decode()}" for key, value in values.items())
+
+
+def _create(length: int, filename: str = "data.csv") -> str:
+    response = client.post(UPLOADS_URL, headers={
+        **TUS_HEADERS,
+        "Upload-Length": str(length),
+        "Upload-Metadata": _metadata(filename=filename)
+    })
+    assert response.status_code == 201, response.text
+    assert response.headers["Upload-Offset"] == "0"
+    return response.headers["Location"]
+
+
+def _offset(location: str) -> int:
+    response = client.head(location, headers=TUS_HEADERS)
+    assert response.status_code == 200
+    return int(response.headers["Upload-Offset"])
+
+
+def _patch(location: str, offset: int, body: bytes):
+    return client.patch(location, content=body, headers={
+        **TUS_HEADERS,
+        "Upload-Offset": str(offset),
+        "Content-Type": "application/offset+octet-stream"
+    })
+
+
+def _dataset(dataset_id: str) -> dict:
+    response = client.get(f"/api/p2pai/datasets/{dataset_id}")
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_create_head_patch():
+    content = b"a,b\n1,2\n3,4\n"
+    location = _create(len(content))
+    assert _offset(location) == 0
+
+    response = _patch(location, 0, content)
+    assert response.status_code == 204, response.text
+    assert response.headers["Upload-Offset"] == str(len(content))
+    assert response.headers["X-Dataset-Sha256"] == hashlib.sha256(content).hexdigest()
+    assert _offset(location) == len(content)
+
+    # 完成后不能继续追加
+    assert _patch(location, len(content), b"x").status_code == 403
+
+
+def test_resume_upload():
+    content = os.urandom(4096)
+    response = client.post(UPLOADS_URL, headers={**TUS_HEADERS, "Upload-Length": str(len(content))})
+    location, dataset_id = response.headers["Location"], response.headers["X-Dataset-Id"]
+
+    assert _patch(location, 0, content[:1000]).status_code == 204
+    # offset 不一致时拒绝，客户端通过 HEAD 获取 offset 后继续
+    assert _patch(location, 0, content[1000:]).status_code == 409
+    offset = _offset(location)
+    assert offset == 1000
+    assert _dataset(dataset_id)["status"] == "uploading"
+
+    assert _patch(location, offset, content[offset:]).status_code == 204
+    dataset = _dataset(dataset_id)
+    assert dataset["status"] == "ready"
+    assert dataset["sha256"] == hashlib.sha256(content).hexdigest()
+
+
+def test_overflow_is_rejected():
+    location = _create(10)
+    response = _patch(location, 0, b"x" * 11)
+    assert response.status_code == 413, response.text
+    assert _offset(location) == 0
+    # 被拒绝后仍可以正常完成
+    assert _patch(location, 0, b"y" * 10).status_code == 204
+    assert _offset(location) == 10
+
+
+def test_overflow_after_buffer_flush():
+    """请求体分多块到达并多次写盘后，超出 Upload-Length 的部分仍被拒绝"""
+
+    async def chunks(count: int, size: int):
+        for _ in range(count):
+            yield b"z" * size
+
+    db = SessionLocal()
+    buffer_size = uploads.UPLOAD_WRITE_BUFFER
+    uploads.UPLOAD_WRITE_BUFFER = 8
+    try:
+        upload = upload_manager.create(db, 20, {"filename": "stream.bin"})
+        try:
+            asyncio.run(upload_manager.write(db, upload, 0, chunks(10, 4)))
+            raise AssertionError("expected UploadError")
+        except UploadError as e:
+            assert e.status_code == 413
+        # 已收到的 20 字节被确认，文件没有超过声明的长度
+        assert upload.offset == 20
+        assert upload.completed_at is not None
+        assert upload.dataset.sha256 == hashlib.sha256(b"z" * 20).hexdigest()
+    finally:
+        uploads.UPLOAD_WRITE_BUFFER = buffer_size
+        db.close()
+
+
+def test_declared_sha256_is_not_trusted():
+    """客户端声明已存在内容的哈希时仍需上传内容，完成后按服务端计算的哈希去重"""
+    content = b"shared dataset content"
+    digest = hashlib.sha256(content).hexdigest()
+    assert _patch(_create(len(content)), 0, content).status_code == 204
+
+    response = client.post(UPLOADS_URL, headers={
+        **TUS_HEADERS,
+        "Upload-Length": str(len(content)),
+        "Upload-Metadata": _metadata(filename="copy.csv", sha256=digest)
+    })
+    assert response.status_code == 201
+    assert response.headers["Upload-Offset"] == "0"
+    location, dataset_id = response.headers["Location"], response.headers["X-Dataset-Id"]
+    assert _dataset(dataset_id)["status"] == "uploading"
+
+    assert _patch(location, 0, content).status_code == 204
+    assert _dataset(dataset_id)["sha256"] == digest
+
+
+def test_terminate_upload():
+    location = _create(100)
+    assert _patch(location, 0, b"x" * 10).status_code == 204
+    assert client.delete(location, headers=TUS_HEADERS).status_code == 204
+    assert client.head(location, headers=TUS_HEADERS).status_code == 404
+
+
+def main():
+    return run_tests(globals())
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)